@@ -0,0 +1,185 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Chunk checkpoints for resuming a source (Config.checkpoint_dir).
+
+A rate-limit or partial-data abort in ``_site_wrapper`` rolls the source back,
+so it never contributes partial records, and the next attempt would start over
+from its first chunk. With a checkpoint directory, each chunk's read results
+are also written to a SQLite file once they are persisted; the next attempt
+with the same run key reads those chunks back instead of fetching them, and
+only fetches from the first incomplete chunk on. A source that finishes drops
+its checkpoints.
+
+The run key covers everything that shapes a chunk's records: the source, the
+parameter, the spatial scope, the date window, the output mode and units. A
+chunk is keyed by its site ids, so a rediscovered site list that shifts chunk
+boundaries reuses whichever chunks are unchanged. Results are stored in the
+plain form transform workers return (transform_stage.pack_results).
+
+Checkpoints expire with the date window: while the window is open (no end
+date, or one not yet past) a provider can still add observations, so a
+checkpoint is good until the end of the day it was written; for a closed
+window, until Config.checkpoint_max_age_hours.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+
+FILENAME = "checkpoints.sqlite"
+
+# bump when the stored form changes, so old checkpoints are never read back
+FORMAT = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    run TEXT NOT NULL,
+    chunk TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (run, chunk)
+)
+"""
+
+
+def run_key(config, site_source, parameter_source, use_summarize: bool, combined: bool) -> str:
+    mode = "both" if combined else ("summary" if use_summarize else "timeseries")
+    parts = {
+        "format": FORMAT,
+        "source": [type(site_source).__name__, type(parameter_source).__name__],
+        "parameter": config.parameter,
+        "scope": [config.bbox, config.county, config.wkt],
+        "window": [config.start_date, config.end_date],
+        "mode": mode,
+        "latest_only": bool(getattr(config, "latest_only", False)),
+        "units": [
+            config.analyte_output_units,
+            config.waterlevel_output_units,
+            config.output_elevation_units,
+            config.output_well_depth_units,
+            config.output_horizontal_datum,
+        ],
+    }
+    return _digest(json.dumps(parts, sort_keys=True, default=str))
+
+
+def chunk_key(site_record) -> str:
+    sites = site_record if isinstance(site_record, list) else [site_record]
+    return _digest("\n".join(str(s.id) for s in sites))
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def expires_at(config, now: Optional[float] = None) -> float:
+    """When a checkpoint written at *now* stops being read back."""
+    now = time.time() if now is None else now
+    written = datetime.fromtimestamp(now)
+    max_age = float(getattr(config, "checkpoint_max_age_hours", 168) or 0) * 3600
+    end = config.end_dt
+    if end is None or end.date() >= written.date():
+        midnight = datetime.combine(written.date() + timedelta(days=1), datetime.min.time())
+        return min(midnight.timestamp(), now + max_age)
+    return now + max_age
+
+
+class ChunkCheckpoints:
+    """The checkpointed chunks of one source's run, in ``directory``.
+
+    ``load`` may be called from fetch threads: every call opens its own
+    connection. ``save``, ``completed`` and ``clear`` are for the consumer
+    thread that persists the chunks.
+    """
+
+    def __init__(self, directory: str, run: str, expires: float):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, FILENAME)
+        self.run = run
+        self.expires = expires
+        with self._session() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.execute("DELETE FROM chunks WHERE expires <= ?", (time.time(),))
+
+    @classmethod
+    def for_run(cls, config, site_source, parameter_source, use_summarize: bool, combined: bool) -> Optional["ChunkCheckpoints"]:
+        directory = getattr(config, "checkpoint_dir", "")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            run_key(config, site_source, parameter_source, use_summarize, combined),
+            expires_at(config),
+        )
+
+    @contextmanager
+    def _session(self):
+        # concurrent sources share the file; wait out each other's writes
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def completed(self) -> set:
+        """Chunk keys of this run with a live checkpoint."""
+        with self._session() as conn:
+            rows = conn.execute(
+                "SELECT chunk FROM chunks WHERE run = ? AND expires > ?",
+                (self.run, time.time()),
+            ).fetchall()
+        return {chunk for (chunk,) in rows}
+
+    def load(self, key: str):
+        """The packed results saved for chunk *key*. Raises KeyError when
+        there is no live checkpoint."""
+        with self._session() as conn:
+            row = conn.execute(
+                "SELECT payload FROM chunks WHERE run = ? AND chunk = ? AND expires > ?",
+                (self.run, key, time.time()),
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def save(self, key: str, packed) -> None:
+        payload = pickle.dumps(packed, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._session() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chunks (run, chunk, payload, expires) VALUES (?, ?, ?, ?)",
+                (self.run, key, payload, self.expires),
+            )
+
+    def clear(self, keys: Optional[list] = None) -> None:
+        """Drop this run's checkpoints, or only those of chunks *keys*."""
+        with self._session() as conn:
+            if keys is None:
+                conn.execute("DELETE FROM chunks WHERE run = ?", (self.run,))
+            else:
+                conn.executemany(
+                    "DELETE FROM chunks WHERE run = ? AND chunk = ?",
+                    [(self.run, key) for key in keys],
+                )
+
+
+# ============= EOF =============================================
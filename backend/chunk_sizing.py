@@ -0,0 +1,236 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Adaptive chunk sizing (Config.adaptive_chunks).
+
+A site source's chunk_size is a fixed guess at how many sites one request can
+carry; NMBGMR's went from 100 to 10 by hand after read timeouts. With adaptive
+chunks the unifier still plans chunks (the unit of ordering, checkpoints and
+site_limit), but fetches each as requests of a learned size:
+
+- a request that times out (ChunkTimeoutError) is split in half and both
+  halves retried, and the learned size drops to the half; a single site that
+  times out is an error as before;
+- after GROW_AFTER full-size requests in a row that would stay within
+  Config.chunk_target_seconds and chunk_target_records at GROWTH times the
+  size, the size grows by GROWTH, up to MAX_GROWTH times the source's
+  chunk_size and, for the rest of the run, below the smallest request that
+  timed out.
+
+Chunks are planned at the size learned so far, so growth applies to the next
+run; a smaller size applies at once, to every request still to be made.
+Learned sizes are kept per source and parameter in Config.chunk_sizes_path
+between runs. Splitting a chunk by sites does not change its output: each
+site's records come from exactly one request, and the requests' results are
+concatenated in site order.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from backend.exceptions import ChunkTimeoutError
+
+GROWTH = 1.5
+GROW_AFTER = 3
+MAX_GROWTH = 4
+
+# counts of the request being measured on this thread (see note_fetched)
+_meter = threading.local()
+
+
+def note_fetched(records) -> None:
+    """Count *records* just fetched from the provider against the request
+    being measured on this thread, if any."""
+    counts = getattr(_meter, "counts", None)
+    if counts is not None and records:
+        counts["records"] += len(records)
+
+
+@contextmanager
+def _measure():
+    prior = getattr(_meter, "counts", None)
+    counts = _meter.counts = {"records": 0}
+    try:
+        yield counts
+    finally:
+        _meter.counts = prior
+
+
+def size_key(config, parameter_source) -> str:
+    cls = type(parameter_source)
+    return f"{cls.__module__}.{cls.__qualname__}:{config.parameter}"
+
+
+# one writer at a time per process for the JSON files below
+_file_lock = threading.Lock()
+
+
+def read_json_map(path: str, keep: Callable[[object], bool]) -> dict:
+    """The entries of the JSON object in *path* whose values *keep* accepts;
+    empty if there is no such file or it is unreadable."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as rfile:
+            entries = json.load(rfile)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(entries, dict):
+        return {}
+    return {k: v for k, v in entries.items() if keep(v)}
+
+
+def save_json_map(path: str, key: str, value, keep: Callable[[object], bool]) -> None:
+    """Set *key* to *value* in the JSON object in *path*, atomically."""
+    # re-read first: other sources (or processes) share the file
+    with _file_lock:
+        entries = read_json_map(path, keep)
+        entries[key] = value
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as wfile:
+            json.dump(entries, wfile, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+
+def _is_size(value) -> bool:
+    return isinstance(value, int) and value > 0
+
+
+class ChunkSizes:
+    """Learned sites per request, by size_key, optionally kept in a JSON
+    file."""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.sizes = read_json_map(path, _is_size)
+
+    def get(self, key: str) -> Optional[int]:
+        return self.sizes.get(key)
+
+    def save(self, key: str, size: int) -> None:
+        self.sizes[key] = size
+        if self.path:
+            save_json_map(self.path, key, size, _is_size)
+
+
+class AdaptiveChunks:
+    """One source's request size for a run: plan() chunks its sites, fetch()
+    reads each planned chunk."""
+
+    def __init__(self, config, site_source, parameter_source, sizes: Optional[ChunkSizes] = None):
+        self.sizes = sizes if sizes is not None else ChunkSizes(config.chunk_sizes_path)
+        self.key = size_key(config, parameter_source)
+        self.default = site_source.chunk_size
+        self.ceiling = max(self.default * MAX_GROWTH, 1)
+        learned = self.sizes.get(self.key)
+        self.size = min(learned or self.default, self.ceiling)
+        self.target_seconds = config.chunk_target_seconds
+        self.target_records = config.chunk_target_records
+        self.stats = {"requests": 0, "timeouts": 0}
+        self._healthy = 0
+        # the smallest request that timed out this run; not grown back to
+        self._timed_out = self.ceiling + 1
+        self._lock = threading.Lock()
+
+    def plan(self, sites: list) -> list:
+        """*sites* as chunks of the size learned so far."""
+        return self._split(sites)
+
+    def fetch(self, site_records: list, fetch: Callable) -> list:
+        """``fetch(part)`` for consecutive parts of *site_records* of at most
+        the current size, in order; a part that times out is fetched again as
+        two halves, and the parts still to fetch at the smaller size."""
+        parts = self._split(site_records)
+        results = []
+        while parts:
+            part = parts.pop(0)
+            try:
+                results.append(self._timed(part, fetch))
+            except ChunkTimeoutError:
+                if len(part) == 1:
+                    raise
+                half = (len(part) + 1) // 2
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                    self.size = min(self.size, half)
+                    self._timed_out = min(self._timed_out, len(part))
+                    self._healthy = 0
+                # the rest of the chunk is likely as slow: re-split it too
+                parts = [sub for p in (part[:half], part[half:], *parts) for sub in self._split(p)]
+        return results
+
+    def shrink(self) -> None:
+        """Halve the size of the requests still to be made, and do not grow
+        back past it this run, as after a timeout (memory.MemoryBudget)."""
+        with self._lock:
+            self.size = max(self.size // 2, 1)
+            self._timed_out = min(self._timed_out, self.size + 1)
+            self._healthy = 0
+
+    def save(self) -> None:
+        """Keep the learned size for the next run."""
+        self.sizes.save(self.key, self.size)
+
+    def _split(self, site_records: list) -> list:
+        size = self.size
+        return [site_records[i:i + size] for i in range(0, len(site_records), size)]
+
+    def _timed(self, part: list, fetch: Callable):
+        started = time.monotonic()
+        with _measure() as counts:
+            result = fetch(part)
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.stats["requests"] += 1
+            # only a full-size request says anything about a larger one
+            if len(part) < self.size:
+                return result
+            if elapsed * GROWTH <= self.target_seconds and counts["records"] * GROWTH <= self.target_records:
+                self._healthy += 1
+                if self._healthy >= GROW_AFTER:
+                    grown = max(int(self.size * GROWTH), self.size + 1)
+                    self.size = max(min(grown, self.ceiling, self._timed_out - 1), self.size)
+                    self._healthy = 0
+            else:
+                self._healthy = 0
+        return result
+
+
+def merge_results(results: list, combined: bool):
+    """One chunk's read results from its parts' (see AdaptiveChunks.fetch):
+    summaries and timeseries concatenated in part order, None if every part
+    had none."""
+    if combined:
+        return (
+            _concat([r[0] for r in results]),
+            _concat([r[1] for r in results]),
+        )
+    return _concat(results)
+
+
+def _concat(results: list) -> Optional[list]:
+    parts = [r for r in results if r is not None]
+    if not parts:
+        return None
+    return [item for part in parts for item in part]
+
+
+# ============= EOF =============================================
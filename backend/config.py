@@ -18,6 +18,7 @@ import shapely.wkt
 
 from .exceptions import ConfigError
 from .bounding_polygons import get_county_polygon
+from .spatial_pushdown import plan_pushdown
 from .connectors.nmbgmr.source import (
     NMBGMRSiteSource,
     NMBGMRWaterLevelSource,
@@ -146,6 +147,9 @@ def get_source(source):
 
 
 class Config:
+    # Stop a source once this many of its sites have records (0 = no limit).
+    # Only the chunks needed to reach it are fetched; the sites kept are the
+    # first ones in chunk order, as if every chunk had been read.
     site_limit: int = 0
 
     # Number of chunks fetched concurrently per source (network-bound I/O).
@@ -154,6 +158,121 @@ class Config:
     # limits (e.g. USGS) — tune down if you see 429s.
     fetch_workers: int = 4
 
+    # Chunks a source may have in flight — fetching, transforming, or done and
+    # waiting for an earlier chunk — before the unifier persists them in
+    # order. Bounds the raw/transformed results held at once. 0 = twice
+    # fetch_workers (a smaller value also caps concurrent fetches).
+    pipeline_depth: int = 0
+
+    # Number of site sources collect_sites discovers concurrently. Each source
+    # is isolated, so one provider's failure or rate limit does not affect the
+    # others. 1 = one after another.
+    site_source_workers: int = 8
+
+    # Worker processes a source's chunks are split across by
+    # unify_source_sharded, by a stable hash of each chunk's site ids (see
+    # backend/sharding.py); the merged output is that of one process. 0/1 =
+    # one process. shard_workers caps the processes run at once (0 = shards).
+    shards: int = 0
+    shard_workers: int = 0
+
+    # Budget, in bytes, of the process-wide cache through which source
+    # instances share their fetches (site lists, observation chunks, counts)
+    # when their shared-fetch cache is on, as in unify_source_both; e.g. two
+    # assets of the same source in one process fetch once. 0 = off (see
+    # backend/fetch_cache.py).
+    fetch_cache_bytes: int = 256 * 1024 * 1024
+
+    # Memory, in bytes, a persister may hold before it spills its records to
+    # Arrow IPC files in spill_dir ("" = the system temp directory) and reads
+    # them back lazily (see backend/persisters/spill.py). 0 = keep everything
+    # in memory.
+    spill_bytes: int = 0
+    spill_dir: str = ""
+
+    # Seconds between memory samples of a source's run, reported per stage
+    # (discover, prefilter, fetch) as peak and steady-state RSS in the
+    # persisters' stats["memory"]; with memory_tracemalloc, traced Python
+    # memory too, at some cost in speed (see backend/memory.py). 0 = off.
+    memory_sample_seconds: float = 0
+    memory_tracemalloc: bool = False
+
+    # Soft limit, in bytes of process RSS, on a source's run: past it the run
+    # spills its records to disk (pyarrow permitting), then makes smaller
+    # requests, then fetches fewer chunks at once — before the process is
+    # killed. Same output either way. 0 = no limit.
+    memory_budget_bytes: int = 0
+
+    # JSON file of each source's last finished run — the requests, pages,
+    # records and bytes its chunks cost — that backend/planner.py estimates a
+    # run's cost from ("" = not kept; see backend/fetch_history.py).
+    fetch_history_path: str = ""
+
+    # Records per time window when fetching a chunk's history: a chunk of a
+    # source that supports it (NWIS, WQP, SensorThings) expected to hold more
+    # is fetched as that many date windows, time_window_workers at a time, and
+    # concatenated in time order (see backend/time_windows.py). Windows are
+    # sized from the records per year fetch_history_path kept from the
+    # source's last run with this set, so the first such run fetches whole.
+    # At most time_window_max windows per chunk; each chunk's fetch thread
+    # runs its own windows. 0 = off.
+    time_window_records: int = 0
+    time_window_max: int = 8
+    time_window_workers: int = 4
+
+    # A plan from backend.planner.plan_fetch (load_plan). Sources it has an
+    # entry for are fetched in exactly its chunks, without pre-filtering
+    # again. None = every source is planned as it runs.
+    fetch_plan: dict | None = None
+
+    # Probe each source's count/summary endpoint before fetching and drop sites
+    # with no observations for the parameter/date window, so empty sites never
+    # cost a chunk fetch. Sources without a cheap probe are fetched as before
+    # (see BaseParameterSource.count_records).
+    prefilter_sites: bool = False
+
+    # Where fetched chunks are transformed. "threads": each fetch worker
+    # transforms the chunk it fetched (legacy); the GIL serializes those
+    # transforms, so more fetch workers stop helping once they dominate.
+    # "processes": fetch_workers threads only fetch, and a pool of
+    # transform_workers processes transforms (see backend/transform_stage.py).
+    transform_layout: str = "threads"
+
+    # Size of the transform process pool; 0 = one per CPU.
+    transform_workers: int = 0
+
+    # Directory for chunk checkpoints ("" = off). A source aborted by a rate
+    # limit or partial data resumes from its first unfinished chunk on the
+    # next run with the same source/parameter/scope/window (see
+    # backend/checkpoint.py). Checkpoints of an open date window last until
+    # the end of the day; of a closed one, checkpoint_max_age_hours.
+    checkpoint_dir: str = ""
+    checkpoint_max_age_hours: float = 168
+
+    # Directory of the snapshots unify_source_incremental (and so an unsharded
+    # unify_source_sharded) continues from ("" = every run is a full one): each run fetches only what is newer than
+    # the previous run's snapshot and merges it in (see
+    # backend/incremental.py).
+    snapshot_dir: str = ""
+
+    # Directory of the site catalog ("" = off): discovered sites are kept per
+    # source and site id, and a later run of the same site query reads them
+    # from the catalog instead of discovering them again, until they are
+    # site_catalog_ttl_hours old; then they are rediscovered and the changes
+    # logged (see backend/site_catalog.py).
+    site_catalog_dir: str = ""
+    site_catalog_ttl_hours: float = 24
+
+    # Adapt each source's sites per request instead of using its fixed
+    # chunk_size (see backend/chunk_sizing.py): a request that times out is
+    # split in half and retried, and the size grows while requests stay
+    # within chunk_target_seconds and chunk_target_records. Learned sizes are
+    # kept in chunk_sizes_path (a JSON file; "" = learned per run only).
+    adaptive_chunks: bool = False
+    chunk_sizes_path: str = ""
+    chunk_target_seconds: float = 60
+    chunk_target_records: int = 50000
+
     # date
     start_date: str = ""
     end_date: str = ""
@@ -163,6 +282,27 @@ class Config:
     county: str = ""
     wkt: str = ""
 
+    # Size budget, in WKT characters, for the spatial filter sent to providers
+    # (see Config.pushdown_wkt). Larger scopes are sent as a simplified
+    # covering polygon and refined locally against the exact one.
+    pushdown_wkt_chars: int = 2000
+
+    # Site discovery as an N x N grid of tiles over the scope (or the source's
+    # bounding polygon), queried concurrently with fetch_workers threads,
+    # instead of one long paginated stream. 0 = a single query. Applies to
+    # sources with supports_tiles (NWIS, OSE PODs, NMED DWB).
+    site_tiles: int = 0
+    # Tiles whose probed site count exceeds tile_max_sites are split into
+    # quadrants, at most tile_max_depth times (see backend/tiling.py).
+    tile_max_sites: int = 2000
+    tile_max_depth: int = 3
+    # Start fetching parameter chunks while later pages of the site query are
+    # still downloading, for sources with streams_sites (NWIS, OSE PODs, WQP).
+    # Chunks are the same as after full discovery. Not with sites_only,
+    # prefilter_sites, a fetch_plan, sharding, tiles or a site catalog, which
+    # need every site first.
+    stream_sites: bool = False
+
     sites_only = False
 
     # sources
@@ -183,13 +323,21 @@ class Config:
     parameter: str = ""
 
     # output — transform-facing units/datum + summary-vs-timeseries mode.
-    # output_summary is toggled by unify_source_both and read live by the
-    # transformer to pick SummaryRecord vs ParameterRecord.
+    # output_summary is read live by the transformer to pick SummaryRecord vs
+    # ParameterRecord; read_both overrides it per thread (output_mode).
     output_horizontal_datum: str = WGS84
     output_elevation_units: str = FEET
     output_well_depth_units: str = FEET
     output_summary: bool = False
 
+    # Latest-only fetch plan for summary output: each source pulls just the
+    # observations a well's latest value can come from (get_latest_records)
+    # instead of its full history. latest_* fields are unchanged; nrecords,
+    # min/max/mean and earliest_* would describe only the fetched window, so
+    # they are left blank (source.LATEST_ONLY_BLANK). Enable this only for
+    # consumers that read latest values alone (the pivot products).
+    latest_only: bool = False
+
     analyte_output_units: str = MILLIGRAMS_PER_LITER
     waterlevel_output_units: str = FEET
 
@@ -212,6 +360,13 @@ class Config:
                 if attr in payload:
                     setattr(self, attr, payload[attr])
 
+    def __getstate__(self):
+        # sources carry their config into transform worker processes (see
+        # backend/transform_stage.py); the run's persister stays behind
+        state = self.__dict__.copy()
+        state.pop("_persister", None)
+        return state
+
     def _build_source_pair(self, site_klass, param_klass):
         s, ss = site_klass(), param_klass()
         s.set_config(self)
@@ -305,6 +460,26 @@ class Config:
         elif self.county:
             return get_county_polygon(self.county, as_wkt=as_wkt)
 
+    def pushdown_wkt(self, geom=None) -> str:
+        """The spatial filter to send to a provider for *geom* (default: the
+        configured scope): the exact WKT when it fits ``pushdown_wkt_chars``,
+        otherwise a covering of it (backend/spatial_pushdown.py). Sites the
+        covering lets through are dropped by BaseTransformer.contained."""
+        if geom is None:
+            geom = self.bounding_wkt(as_wkt=False)
+        if not isinstance(geom, str):
+            geom = geom.wkt
+
+        cache = self.__dict__.setdefault("_pushdown_cache", {})
+        if geom not in cache:
+            wkt, kind = plan_pushdown(geom, self.pushdown_wkt_chars)
+            self.log(
+                f"spatial pushdown: {kind} filter, {len(wkt)} WKT chars "
+                f"(exact scope {len(geom)} chars)"
+            )
+            cache[geom] = wkt
+        return cache[geom]
+
     def has_bounds(self):
         return self.bbox or self.county or self.wkt
 
@@ -19,13 +19,27 @@ exactly as today and delegate the transport here.
 Requires the optional ``dlt`` extra.
 """
 
-from typing import Optional
+from typing import Iterator, Optional, cast
 
 import requests
 from dlt.sources.helpers.rest_client import RESTClient
 from dlt.sources.helpers.rest_client.paginators import BasePaginator
 
-from backend.exceptions import PartialOrNoDataError, USGSRateLimitError
+from urllib3.exceptions import ReadTimeoutError
+
+from backend.exceptions import ChunkTimeoutError, PartialOrNoDataError, USGSRateLimitError
+
+
+def _request_error(url: str, e: requests.RequestException) -> PartialOrNoDataError:
+    """The error a failed request raises: ``ChunkTimeoutError`` for a timeout
+    (so adaptive chunk sizing can retry smaller), else ``PartialOrNoDataError``."""
+    # a read timeout while streaming a body surfaces as a ConnectionError
+    # wrapping urllib3's ReadTimeoutError
+    if isinstance(e, requests.Timeout) or (
+        isinstance(e, requests.ConnectionError) and e.args and isinstance(e.args[0], ReadTimeoutError)
+    ):
+        return ChunkTimeoutError(f"Request timed out for {url}: {e}")
+    return PartialOrNoDataError(f"Request failed for {url}: {e}")
 
 
 def fetch_text(url: str, params: Optional[dict] = None, timeout: int = 30) -> str:
@@ -42,10 +56,31 @@ def fetch_text(url: str, params: Optional[dict] = None, timeout: int = 30) -> st
         resp = client.get(url, params=params, timeout=timeout)
         resp.raise_for_status()
     except requests.RequestException as e:
-        raise PartialOrNoDataError(f"Request failed for {url}: {e}")
+        raise _request_error(url, e)
     return resp.text
 
 
+def iter_text(url: str, params: Optional[dict] = None, timeout: int = 30, chunk_size: int = 1 << 16) -> Iterator[str]:
+    """``fetch_text`` as a stream: yields the decoded body in chunks as it
+    arrives instead of buffering the whole response, so a large TSV download
+    can be parsed while it is still coming in. Decoded with the same encoding
+    ``resp.text`` would use when the server declares one. Failures — including
+    a connection dropped mid-body — raise ``PartialOrNoDataError``."""
+    client = RESTClient(base_url="")
+    try:
+        resp = client.get(url, params=params, timeout=timeout, stream=True)
+        try:
+            resp.raise_for_status()
+            if resp.encoding is None:
+                resp.encoding = "utf-8"
+            # with an encoding set, decode_unicode yields str chunks only
+            yield from cast(Iterator[str], resp.iter_content(chunk_size=chunk_size, decode_unicode=True))
+        finally:
+            resp.close()
+    except requests.RequestException as e:
+        raise _request_error(url, e)
+
+
 def fetch_json(
     url: str,
     params: Optional[dict] = None,
@@ -64,7 +99,7 @@ def fetch_json(
         resp.raise_for_status()
         obj = resp.json()
     except requests.RequestException as e:
-        raise PartialOrNoDataError(f"Request failed for {url}: {e}")
+        raise _request_error(url, e)
     except ValueError as e:  # includes requests' JSONDecodeError
         raise PartialOrNoDataError(f"Invalid JSON from {url}: {e}")
     if tag and isinstance(obj, dict):
@@ -72,7 +107,7 @@ def fetch_json(
     return obj
 
 
-def fetch_json_records(
+def iter_json_pages(
     url: str,
     params: Optional[dict] = None,
     json_data: Optional[dict] = None,
@@ -80,21 +115,21 @@ def fetch_json_records(
     data_selector: Optional[str] = None,
     paginator: Optional[BasePaginator] = None,
     headers: Optional[dict] = None,
-) -> list:
-    """Fetch **all** records from a paginated JSON endpoint, following the
-    paginator across every page, and return them as one flat list.
+) -> Iterator[list]:
+    """Yield the records of a paginated JSON endpoint one page at a time,
+    following the paginator, so a caller can process a page before the next
+    one is requested (see BaseParameterSource.iter_records).
 
-    This is where dlt earns its keep: ``paginator`` (e.g. a ``JSONLinkPaginator``
-    on the OGC ``rel=next`` link) makes the client *follow* pagination instead of
-    the old code refusing a truncated response. ``data_selector`` picks the
-    records array (e.g. ``"features"``). ``method="POST"`` with ``json_data``
-    carries a CQL body (USGS complex queries).
+    ``paginator`` (e.g. a ``JSONLinkPaginator`` on the OGC ``rel=next`` link)
+    makes the client *follow* pagination instead of the old code refusing a
+    truncated response. ``data_selector`` picks the records array (e.g.
+    ``"features"``). ``method="POST"`` with ``json_data`` carries a CQL body
+    (USGS complex queries).
 
     Error mapping matches the connectors' expectations so the unifier degrades
     gracefully: a 429 → ``USGSRateLimitError``, any other request failure →
     ``PartialOrNoDataError``."""
     client = RESTClient(base_url="")
-    records: list = []
     try:
         for page in client.paginate(
             url,
@@ -105,12 +140,37 @@ def fetch_json_records(
             paginator=paginator,
             headers=headers,
         ):
-            records.extend(page)
+            yield list(page)
     except requests.HTTPError as e:
         status = e.response.status_code if e.response is not None else None
         if status == 429:
             raise USGSRateLimitError("Rate limit exceeded")
         raise PartialOrNoDataError(f"Request failed for {url}: {e}")
     except requests.RequestException as e:
-        raise PartialOrNoDataError(f"Request failed for {url}: {e}")
+        raise _request_error(url, e)
+
+
+def fetch_json_records(
+    url: str,
+    params: Optional[dict] = None,
+    json_data: Optional[dict] = None,
+    method: str = "GET",
+    data_selector: Optional[str] = None,
+    paginator: Optional[BasePaginator] = None,
+    headers: Optional[dict] = None,
+) -> list:
+    """Fetch **all** records from a paginated JSON endpoint, following the
+    paginator across every page, and return them as one flat list (see
+    ``iter_json_pages`` for the paging and error mapping)."""
+    records: list = []
+    for page in iter_json_pages(
+        url,
+        params=params,
+        json_data=json_data,
+        method=method,
+        data_selector=data_selector,
+        paginator=paginator,
+        headers=headers,
+    ):
+        records.extend(page)
     return records
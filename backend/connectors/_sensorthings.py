@@ -20,7 +20,7 @@ thin convenience over that; here the connectors read the JSON dicts directly.
 Retry/backoff + connection pooling now come from dlt's session (frost used bare
 ``requests.request`` with neither)."""
 
-from typing import Optional
+from typing import Iterator, Optional
 
 from dlt.sources.helpers.rest_client.paginators import (
     JSONLinkPaginator,
@@ -28,14 +28,14 @@ from dlt.sources.helpers.rest_client.paginators import (
 )
 from jsonpath_ng.ext import parse
 
-from backend.connectors._dlt import fetch_json_records
+from backend.connectors._dlt import fetch_json, iter_json_pages
 
 # SensorThings exposes the next page as a top-level "@iot.nextLink" URL; the key
 # has an "@" and a ".", so it needs bracket-quoting in the JSONPath.
 _NEXT_LINK = parse("'@iot.nextLink'")
 
 
-def sta_query(
+def sta_pages(
     base_url: str,
     path: str,
     *,
@@ -43,9 +43,9 @@ def sta_query(
     filter: Optional[str] = None,  # noqa: A002 - mirrors OData $filter
     top: Optional[int] = None,
     orderby: Optional[str] = None,
-) -> list:
-    """Return the ``value`` items of a SensorThings collection at
-    ``{base_url}/{path}``, following ``@iot.nextLink`` across all pages.
+) -> Iterator[list]:
+    """Yield the ``value`` items of a SensorThings collection at
+    ``{base_url}/{path}`` one page at a time, following ``@iot.nextLink``.
 
     When *top* is given it is treated as a **limit**: only the first page is
     fetched (``$top`` caps it) and pagination is not followed — matching the
@@ -65,6 +65,48 @@ def sta_query(
         paginator = JSONLinkPaginator(next_url_path=_NEXT_LINK)
 
     url = f"{base_url.rstrip('/')}/{path}"
-    return fetch_json_records(
+    yield from iter_json_pages(
         url, params=params, data_selector="value", paginator=paginator
     )
+
+
+def sta_query(
+    base_url: str,
+    path: str,
+    *,
+    expand: Optional[str] = None,
+    filter: Optional[str] = None,  # noqa: A002 - mirrors OData $filter
+    top: Optional[int] = None,
+    orderby: Optional[str] = None,
+) -> list:
+    """All the items of ``sta_pages`` as one list."""
+    items: list = []
+    for page in sta_pages(
+        base_url, path, expand=expand, filter=filter, top=top, orderby=orderby
+    ):
+        items.extend(page)
+    return items
+
+
+def sta_count(
+    base_url: str,
+    path: str,
+    *,
+    filter: Optional[str] = None,  # noqa: A002 - mirrors OData $filter
+) -> int:
+    """Return the number of entities in a SensorThings collection matching
+    *filter* without transferring any of them.
+
+    ``$count=true`` makes the server report the full match count as
+    ``@iot.count`` and ``$top=0`` empties the ``value`` array, so this is one
+    small request regardless of how many observations the collection holds —
+    cheap enough to probe a site before paging through its data."""
+    params: dict = {"$count": "true", "$top": 0}
+    if filter:
+        params["$filter"] = filter
+
+    url = f"{base_url.rstrip('/')}/{path}"
+    obj = fetch_json(url, params=params)
+    if isinstance(obj, dict):
+        return int(obj.get("@iot.count") or 0)
+    return 0
@@ -59,6 +59,10 @@ def parse_dt(dt):
 
 class BORAnalyteSource(BaseAnalyteSource):
     _catalog_item_idx = None
+    site_id_field = staticmethod(lambda r: r["attributes"]["locationId"])
+    # set by get_records' catalog lookup, read by the extract methods
+    transform_state = ("_source_parameter_name",)
+    terminal_key = "attributes.dateTime"
 
     def __init__(self):
         super().__init__(transformer=BORAnalyteTransformer())
@@ -90,7 +94,7 @@ class BORAnalyteSource(BaseAnalyteSource):
         return [self._source_parameter_name for ri in records]
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, "attributes.dateTime", position=position)
+        record = get_terminal_record(records, self.terminal_key, position=position)
         return {
             "value": record["attributes"]["result"],
             "datetime": parse_dt(record["attributes"]["dateTime"]),
@@ -98,11 +102,6 @@ class BORAnalyteSource(BaseAnalyteSource):
             "source_parameter_name": self._source_parameter_name,
         }
 
-    def _extract_site_records(self, records, site_record):
-        return [
-            ri for ri in records if ri["attributes"]["locationId"] == site_record.id
-        ]
-
     def _reorder_catalog_items(self, items):
         if self._catalog_item_idx:
             # rotate list so catalog_item_idx is the first item
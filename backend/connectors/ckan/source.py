@@ -116,6 +116,8 @@ class OSERoswellSiteSource(OSERoswellSource, BaseSiteSource):
 
 
 class OSERoswellWaterLevelSource(OSERoswellSource, BaseWaterLevelSource):
+    terminal_key = "Date"
+
     def __init__(self, resource_id=None, **kw):
         kw.setdefault("transformer", OSERoswellWaterLevelTransformer())
         super().__init__(resource_id, **kw)
@@ -131,7 +133,7 @@ class OSERoswellWaterLevelSource(OSERoswellSource, BaseWaterLevelSource):
         return [float(r["DTWGS"]) for r in records]
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, tag="Date", position=position)
+        record = get_terminal_record(records, tag=self.terminal_key, position=position)
         return {
             "value": record["DTWGS"],
             "datetime": record["Date"],
@@ -87,6 +87,9 @@ class ISCSevenRiversSiteSource(BaseSiteSource):
 class ISCSevenRiversAnalyteSource(BaseAnalyteSource):
     _analyte_ids = None
     _source_parameter_name = None
+    # set by get_records' analyte lookup, read by the extract methods
+    transform_state = ("_source_parameter_name",)
+    terminal_key = "dateTime"
 
     def __init__(self):
         super().__init__(transformer=ISCSevenRiversAnalyteTransformer())
@@ -118,7 +121,7 @@ class ISCSevenRiversAnalyteSource(BaseAnalyteSource):
         return record
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, "dateTime", position=position)
+        record = get_terminal_record(records, self.terminal_key, position=position)
 
         return {
             "value": record["result"],
@@ -165,6 +168,7 @@ class ISCSevenRiversAnalyteSource(BaseAnalyteSource):
 
 class ISCSevenRiversWaterLevelSource(BaseWaterLevelSource):
     _source_parameter_name = "depthToWaterFeet"
+    terminal_key = "dateTime"
 
     def __init__(self):
         super().__init__(transformer=ISCSevenRiversWaterLevelTransformer())
@@ -213,7 +217,7 @@ class ISCSevenRiversWaterLevelSource(BaseWaterLevelSource):
         return [self._source_parameter_units for r in records]
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, "dateTime", position=position)
+        record = get_terminal_record(records, self.terminal_key, position=position)
         t = get_datetime(record)
         return {
             "value": record["depthToWaterFeet"],
@@ -62,6 +62,7 @@ def _make_url(endpoint):
 class NMBGMRSiteSource(BaseSiteSource):
     chunk_size = 10
     bounding_polygon = NM_STATE_BOUNDING_POLYGON
+    sites_by_parameter = True
 
     def __init__(self):
         super().__init__(transformer=NMBGMRSiteTransformer())
@@ -79,7 +80,7 @@ class NMBGMRSiteSource(BaseSiteSource):
         config = self.config
         params = {"site_type": "Groundwater other than spring (well)", "expand": False}
         if config.has_bounds():
-            params["wkt"] = config.bounding_wkt()
+            params["wkt"] = config.pushdown_wkt()
 
         if not config.sites_only:
 
@@ -118,6 +119,8 @@ class NMBGMRSiteSource(BaseSiteSource):
 
 
 class NMBGMRAnalyteSource(BaseAnalyteSource):
+    terminal_key = "info.CollectionDate"
+
     def __init__(self):
         super().__init__(transformer=NMBGMRAnalyteTransformer())
 
@@ -149,7 +152,7 @@ class NMBGMRAnalyteSource(BaseAnalyteSource):
         return [r["Units"] for r in records]
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, "info.CollectionDate", position=position)
+        record = get_terminal_record(records, self.terminal_key, position=position)
         return {
             "value": record["SampleValue"],
             "datetime": record["info"]["CollectionDate"],
@@ -182,6 +185,9 @@ class NMBGMRAnalyteSource(BaseAnalyteSource):
 
 
 class NMBGMRWaterLevelSource(BaseWaterLevelSource):
+    site_id_field = "PointID"
+    terminal_key = "DateMeasured"
+
     def __init__(self):
         super().__init__(transformer=NMBGMRWaterLevelTransformer())
 
@@ -207,7 +213,7 @@ class NMBGMRWaterLevelSource(BaseWaterLevelSource):
         return record
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, "DateMeasured", position=position)
+        record = get_terminal_record(records, self.terminal_key, position=position)
         return {
             "value": record["DepthToWaterBGS"],
             "datetime": (record["DateMeasured"], record["TimeMeasured"]),
@@ -221,9 +227,6 @@ class NMBGMRWaterLevelSource(BaseWaterLevelSource):
     def _extract_source_parameter_results(self, records):
         return [r["DepthToWaterBGS"] for r in records]
 
-    def _extract_site_records(self, records, site_record):
-        return [ri for ri in records if ri["PointID"] == site_record.id]
-
     def _extract_source_parameter_names(self, records):
         return ["DepthToWaterBGS" for r in records]
 
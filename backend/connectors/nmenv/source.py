@@ -14,13 +14,17 @@
 # limitations under the License.
 # ===============================================================================
 from backend.connectors import NM_STATE_BOUNDING_POLYGON
-from backend.connectors._sensorthings import sta_query
+from backend.connectors._sensorthings import sta_count, sta_pages, sta_query
 from backend.connectors.mappings import DWB_ANALYTE_MAPPING
 from backend.connectors.nmenv.transformer import (
     DWBSiteTransformer,
     DWBAnalyteTransformer,
 )
-from backend.connectors.st_connector import STSiteSource, STAnalyteSource
+from backend.connectors.st_connector import (
+    STSiteSource,
+    STAnalyteSource,
+    count_observations,
+)
 from backend.constants import (
     PARAMETER_NAME,
     PARAMETER_VALUE,
@@ -31,6 +35,8 @@ from backend.constants import (
     TDS,
 )
 from backend.source import get_analyte_search_param, get_terminal_record
+from backend.tiling import tile_wkt
+from backend.transformer import is_summary_output
 
 URL = "https://nmenv.newmexicowaterdata.org/FROST-Server/v1.1/"
 
@@ -38,6 +44,8 @@ URL = "https://nmenv.newmexicowaterdata.org/FROST-Server/v1.1/"
 class DWBSiteSource(STSiteSource):
     url = URL
     bounding_polygon = NM_STATE_BOUNDING_POLYGON
+    supports_tiles = True
+    sites_by_parameter = True
 
     def __init__(self):
         super().__init__(transformer=DWBSiteTransformer())
@@ -49,7 +57,37 @@ class DWBSiteSource(STSiteSource):
         except Exception:
             return False
             
-    def get_records(self, *args, **kw):
+    def _site_query(self, analyte, tile=None) -> tuple | None:
+        """``(path, expand, filter)`` of the site query, or None when the
+        analyte has no DWB observed property."""
+        if self.config.sites_only:
+            path, expand, location = "Things", "Locations", "Locations/location"
+            fs = []
+        else:
+            analyte = get_analyte_search_param(analyte, DWB_ANALYTE_MAPPING)
+            if analyte is None:
+                return None
+            path, expand, location = "Datastreams", "Thing/Locations", "Thing/Location/location"
+            fs = [f"ObservedProperty/id eq {analyte}"]
+
+        if self.config.has_bounds():
+            fs.append(f"st_within({location}, geography'{self.config.pushdown_wkt()}')")
+        if tile is not None:
+            # st_intersects keeps sites on a tile edge (st_within would drop
+            # them from both neighbours); the repeats are deduped by id
+            fs.append(f"st_intersects({location}, geography'{tile_wkt(tile)}')")
+        return path, expand, " and ".join(fs) if fs else None
+
+    def count_tile_records(self, tile) -> int | None:
+        query = self._site_query(self.config.parameter, tile)
+        if query is None:
+            return 0
+        path, _, fs = query
+        # a location with several datastreams for the analyte counts more than
+        # once; over-counting only makes tiles smaller
+        return sta_count(self.url, path, filter=fs)
+
+    def get_records(self, *args, tile=None, **kw):
 
         analyte = None
         if "analyte" in kw:
@@ -57,38 +95,22 @@ class DWBSiteSource(STSiteSource):
         elif self.config:
             analyte = self.config.parameter
 
+        query = self._site_query(analyte, tile)
+        if query is None:
+            return []
+        path, expand, fs = query
+        entities = sta_query(
+            self.url,
+            path,
+            expand=expand,
+            filter=fs,
+            top=kw.get("top"),
+        )
+
         if self.config.sites_only:
-            fs = []
-            if self.config.has_bounds():
-                fs.append(
-                    f"st_within(Locations/location, geography'{self.config.bounding_wkt()}')"
-                )
-            things = sta_query(
-                self.url,
-                "Things",
-                expand="Locations",
-                filter=" and ".join(fs) if fs else None,
-                top=kw.get("top"),
-            )
-            return [t["Locations"][0] for t in things if t.get("Locations")]
+            return [t["Locations"][0] for t in entities if t.get("Locations")]
         else:
-            analyte = get_analyte_search_param(analyte, DWB_ANALYTE_MAPPING)
-            if analyte is None:
-                return []
-
-            fs = [f"ObservedProperty/id eq {analyte}"]
-            if self.config and self.config.has_bounds():
-                fs.append(
-                    f"st_within(Thing/Location/location, geography'{self.config.bounding_wkt()}')"
-                )
-
-            datastreams = sta_query(
-                self.url,
-                "Datastreams",
-                expand="Thing/Locations",
-                filter=" and ".join(fs),
-                top=kw.get("top"),
-            )
+            datastreams = entities
 
             # NM ENV has multiple datastreams per parameter per location (e.g. id 8 and arsenic)
             # because of this duplicative site information is retrieved (we operated under the assumption one datastream per location per parameter)
@@ -111,6 +133,19 @@ class DWBSiteSource(STSiteSource):
 
 class DWBAnalyteSource(STAnalyteSource):
     url = URL
+    # observations are handed on one SensorThings page at a time
+    streams_records = True
+    # the datastream's expanded Thing/Locations are not read after the fetch
+    record_fields = {
+        "location": None,
+        "datastream": {
+            "@iot.id": None,
+            "name": None,
+            "unitOfMeasurement": ("symbol",),
+            "ObservedProperty": ("name",),
+        },
+        "observation": ("@iot.id", "phenomenonTime", "result"),
+    }
 
     def __init__(self):
         super().__init__(transformer=DWBAnalyteTransformer())
@@ -119,7 +154,7 @@ class DWBAnalyteSource(STAnalyteSource):
         self, result, result_dt=None, result_id=None, result_location=None
     ):
         if "< mrl" in result.lower() or "< mdl" in result.lower():
-            if self.config.output_summary:
+            if is_summary_output(self.config):
                 self.warn(
                     f"Non-detect found: {result} for {result_location} on {result_dt} (observation {result_id}). Setting to 0 for summary."
                 )
@@ -130,7 +165,29 @@ class DWBAnalyteSource(STAnalyteSource):
         else:
             return float(result.split(" ")[0])
 
+    def count_records(self, site_records):
+        # Same scope as get_records: every datastream of the analyte at the site.
+        analyte = get_analyte_search_param(self.config.parameter, DWB_ANALYTE_MAPPING)
+
+        def make_filter(site):
+            return (
+                f"Datastream/Thing/Locations/id eq {site.id} "
+                f"and Datastream/ObservedProperty/id eq {analyte}"
+            )
+
+        return count_observations(self, site_records, make_filter)
+
     def get_records(self, site, *args, **kw):
+        return [r for page in self.iter_records(site) for r in page]
+
+    def get_latest_records(self, site, *args, **kw):
+        # newest observation of each datastream; the summary's latest value is
+        # the newest of those
+        return [r for page in self.iter_records(site, latest=True) for r in page]
+
+    def iter_records(self, site, latest=False):
+        """One page of records per Observations page of each of the site's
+        datastreams for the analyte."""
         analyte = get_analyte_search_param(self.config.parameter, DWB_ANALYTE_MAPPING)
         datastreams = sta_query(
             self.url,
@@ -140,21 +197,27 @@ class DWBAnalyteSource(STAnalyteSource):
         )
 
         # NMED DWB has multiple datastreams per parameter per location (e.g. id 8 and arsenic)
-        rs = []
         for datastream in datastreams:
-            obs_list = sta_query(
-                self.url, f"Datastreams({datastream['@iot.id']})/Observations"
-            )
-            for obs in obs_list:
-                rs.append(
+            if latest:
+                obs_pages = sta_pages(
+                    self.url,
+                    f"Datastreams({datastream['@iot.id']})/Observations",
+                    orderby="phenomenonTime desc",
+                    top=1,
+                )
+            else:
+                obs_pages = sta_pages(
+                    self.url, f"Datastreams({datastream['@iot.id']})/Observations"
+                )
+            for obs_list in obs_pages:
+                yield [
                     {
                         "location": site,
                         "datastream": datastream,
                         "observation": obs,
                     }
-                )
-
-        return rs
+                    for obs in obs_list
+                ]
 
     def _extract_parameter_record(self, record):
         # this is only used for time series
@@ -190,9 +253,7 @@ class DWBAnalyteSource(STAnalyteSource):
 
     def _extract_terminal_record(self, records, position):
         # this is only used in summary output
-        record = get_terminal_record(
-            records, tag=lambda x: x["observation"]["phenomenonTime"], position=position
-        )
+        record = get_terminal_record(records, tag=self.terminal_key, position=position)
 
         return {
             "value": self._parse_result(
@@ -1,5 +1,5 @@
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, cast
 
 from shapely import wkt
 from backend.connectors import NM_STATE_BOUNDING_POLYGON
@@ -10,8 +10,9 @@ from backend.source import BaseSiteSource
 def wkt_to_arcgis_json(obj):
     if isinstance(obj, str):
         obj = wkt.loads(obj)
-    coords = [[coord[0], coord[1]] for coord in obj.exterior.coords]
-    return {"rings": [coords], "spatialReference": {"wkid": 4326}}
+    polygons = getattr(obj, "geoms", [obj])
+    rings = [[[coord[0], coord[1]] for coord in p.exterior.coords] for p in polygons]
+    return {"rings": rings, "spatialReference": {"wkid": 4326}}
 
 
 class NMOSEPODSiteSource(BaseSiteSource):
@@ -29,10 +30,51 @@ class NMOSEPODSiteSource(BaseSiteSource):
     chunk_size: int = 2000
     bounding_polygon = NM_STATE_BOUNDING_POLYGON
 
+    # The OSE POD FeatureServer was renamed from "OSE_PODs" to
+    # "OSE_Points_of_Diversion" (the old name now 400s "Invalid URL").
+    url: str = (
+        "https://services2.arcgis.com/qXZbWTdPDbTjl7Dy/arcgis/rest/services/"
+        "OSE_Points_of_Diversion/FeatureServer/0/query"
+    )
+    supports_tiles = True
+    # each OBJECTID-ordered offset page is handed on as it arrives
+    streams_sites = True
+
     def __init__(self):
         super().__init__(transformer=NMOSEPODSiteTransformer())
 
-    def get_records(self, *args, **kw) -> List[Dict]:
+    def count_tile_records(self, tile) -> int | None:
+        # ArcGIS answers returnCountOnly with {"count": n} and no features
+        params = self._query_params(tile)
+        for k in ("outFields", "outSR", "resultRecordCount", "resultOffset"):
+            params.pop(k)
+        params["returnCountOnly"] = "true"
+        obj = self._execute_json_request(self.url, params)
+        n = obj.get("count") if isinstance(obj, dict) else None
+        return int(n) if n is not None else None
+
+    def get_records(self, *args, tile=None, **kw) -> List[Dict]:
+        records: List = []
+        for rs in self.iter_site_records(tile):
+            records.extend(rs)
+        return records
+
+    def iter_site_records(self, tile=None) -> Iterator[List[Dict]]:
+        url = self.url
+        params = self._query_params(tile)
+
+        while 1:
+            # with a tag the request returns that member, the features list
+            rs = cast(List[Dict], self._execute_json_request(url, params, tag="features"))
+            if rs is None:
+                continue
+            elif rs:
+                yield rs
+            params["resultOffset"] += self.chunk_size
+            if len(rs) < self.chunk_size:
+                break
+
+    def _query_params(self, tile=None) -> Dict[str, Any]:
         config = self.config
         params: Dict[str, Any] = {}
         # if config.has_bounds():
@@ -46,13 +88,6 @@ class NMOSEPODSiteSource(BaseSiteSource):
         # if config.end_date:
         #     params["endDt"] = config.end_dt.date().isoformat()
 
-        # The OSE POD FeatureServer was renamed from "OSE_PODs" to
-        # "OSE_Points_of_Diversion" (the old name now 400s "Invalid URL").
-        url: str = (
-            "https://services2.arcgis.com/qXZbWTdPDbTjl7Dy/arcgis/rest/services/"
-            "OSE_Points_of_Diversion/FeatureServer/0/query"
-        )
-
         params["where"] = "pod_status = 'ACT' AND pod_basin NOT IN ('SP', 'SD', 'LWD')"
         # start_date/finish_dat carry the well drilling start/completion dates
         # (epoch ms); finish_dat is what the POD-age products bin by year. The
@@ -69,24 +104,19 @@ class NMOSEPODSiteSource(BaseSiteSource):
         params["resultOffset"] = 0
 
         if config.has_bounds():
-            wkt = config.bounding_wkt()
+            wkt = config.pushdown_wkt()
             # ArcGIS expects the geometry as a JSON *string*. httpx used to
             # serialize a dict param value into acceptable JSON; requests (via
             # dlt's RESTClient) does not, so encode it explicitly.
             params["geometry"] = json.dumps(wkt_to_arcgis_json(wkt))
             params["geometryType"] = "esriGeometryPolygon"
 
-        records: List = []
-        i = 1
-        while 1:
-            rs = self._execute_json_request(url, params, tag="features")
-            if rs is None:
-                continue
-            else:
-                records.extend(rs)
-            params["resultOffset"] += self.chunk_size
-            if len(rs) < self.chunk_size:
-                break
-            i += 1
+        if tile is not None:
+            # the tile envelope replaces the scope polygon; sites in the tile
+            # but outside the scope are dropped by the transformer's
+            # containment check
+            params["geometry"] = ",".join([str(b) for b in tile])
+            params["geometryType"] = "esriGeometryEnvelope"
+            params["inSR"] = 4326
 
-        return records
+        return params
@@ -33,10 +33,12 @@ from backend.connectors.st2.transformer import (
     CABQSiteTransformer,
     CABQWaterLevelTransformer,
 )
-from backend.connectors._sensorthings import sta_query
+from backend.connectors._sensorthings import sta_pages, sta_query
+from backend.incremental import fetch_start_dt, fetch_until
 from backend.connectors.st_connector import (
     STSiteSource,
     STWaterLevelSource,
+    count_observations,
     make_dt_filter,
 )
 from backend.constants import (
@@ -103,7 +105,18 @@ CABQSiteSource = partial(
 
 
 class ST2WaterLevelSource(STWaterLevelSource):
+    # observations are handed on one SensorThings page at a time
+    streams_records = True
+    # the phenomenonTime filter follows fetch_start_dt / fetch_until; a
+    # reading at a window's edge overlaps both windows and is deduplicated
+    supports_time_windows = True
     url = URL
+    # "thing" is only needed to pick Water Well things during the fetch
+    record_fields = {
+        "location": None,
+        "datastream": {"@iot.id": None, "name": None, "unitOfMeasurement": ("symbol",)},
+        "observation": ("@iot.id", "phenomenonTime", "result"),
+    }
 
     def __init__(self, transformer=None):
         super().__init__(transformer=transformer)
@@ -148,32 +161,76 @@ class ST2WaterLevelSource(STWaterLevelSource):
     def _clean_records(self, records: list) -> list:
         return [r for r in records if r["observation"]["result"] is not None]
 
+    def count_records(self, site_records):
+        # Same scope as get_records: "Water Well" things, phenomenonTime window.
+        fi = make_dt_filter("phenomenonTime", self.config.start_dt, self.config.end_dt)
+
+        def make_filter(site):
+            fs = [
+                f"Datastream/Thing/Locations/id eq {site.id}",
+                "Datastream/Thing/name eq 'Water Well'",
+            ]
+            if fi:
+                fs.append(fi)
+            return " and ".join(fs)
+
+        return count_observations(self, site_records, make_filter)
+
     def get_records(self, site_record, *args, **kw):
+        return [r for page in self.iter_records(site_record) for r in page]
+
+    def get_latest_records(self, site_record, *args, **kw):
+        # newest observation of each datastream; the summary's latest value is
+        # the newest of those
+        return [r for page in self.iter_records(site_record, latest=True) for r in page]
+
+    def iter_records(self, site_record, latest=False):
+        """One page of records per Observations page of each water-well
+        datastream."""
         config = self.config
 
-        records = []
         for t in self.client._get_things(site_record):
             if t.get("name") == "Water Well":
                 for di in t.get("Datastreams", []):
                     fi = make_dt_filter(
-                        "phenomenonTime", config.start_dt, config.end_dt
+                        "phenomenonTime", fetch_start_dt(config), fetch_until() or config.end_dt
                     )
-                    obs_list = sta_query(
-                        self.url,
-                        f"Datastreams({di['@iot.id']})/Observations",
-                        filter=fi or None,
-                        orderby="phenomenonTime desc",
-                    )
-                    for obs in obs_list:
-                        records.append(
+                    path = f"Datastreams({di['@iot.id']})/Observations"
+                    if latest:
+                        obs_list = sta_query(
+                            self.url,
+                            path,
+                            filter=fi or None,
+                            orderby="phenomenonTime desc",
+                            top=1,
+                        )
+                        if obs_list and obs_list[0].get("result") is None:
+                            # _clean_records drops a null result, so the newest
+                            # usable reading is older: page this datastream in full
+                            obs_list = sta_query(
+                                self.url,
+                                path,
+                                filter=fi or None,
+                                orderby="phenomenonTime desc",
+                            )
+                        obs_pages = [obs_list]
+                    else:
+                        obs_pages = sta_pages(
+                            self.url,
+                            path,
+                            filter=fi or None,
+                            orderby="phenomenonTime desc",
+                        )
+                    for obs_list in obs_pages:
+                        yield [
                             {
                                 "thing": t,
                                 "location": site_record,
                                 "datastream": di,
                                 "observation": obs,
                             }
-                        )
-        return records
+                            for obs in obs_list
+                        ]
 
 
 class NMOSERoswellWaterLevelSource(ST2WaterLevelSource):
@@ -13,13 +13,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional
 
 from shapely import MultiPolygon, unary_union
 
 from backend.bounding_polygons import get_state_polygon
-from backend.connectors._sensorthings import sta_query
+from backend.connectors._sensorthings import sta_count, sta_query
 from backend.source import (
     BaseSiteSource,
     BaseWaterLevelSource,
@@ -59,6 +60,33 @@ def make_dt_filter(tag, start, end):
     return ""
 
 
+def count_observations(source, site_records, make_filter) -> dict:
+    """Per-site Observation counts for *source*'s pre-filter.
+
+    SensorThings has no grouped count, so each site is one ``$count=true&$top=0``
+    probe (``make_filter(site)`` scopes it to the site's observations). A probe
+    is far cheaper than the fetch it replaces — a Things query plus a paged
+    Observations query per datastream — and the probes run on the same worker
+    count as the chunk fetches."""
+    sites = site_records if isinstance(site_records, list) else [site_records]
+
+    def _count(site):
+        return sta_count(source.url, "Observations", filter=make_filter(site))
+
+    workers = max(int(getattr(source.config, "fetch_workers", 1) or 1), 1)
+    if workers > 1 and len(sites) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(sites))) as executor:
+            counts = list(executor.map(_count, sites))
+    else:
+        counts = [_count(site) for site in sites]
+    source.count_requests += len(sites)
+    return {str(site.id): n for site, n in zip(sites, counts)}
+
+
+def _phenomenon_time(record):
+    return record["observation"]["phenomenonTime"]
+
+
 class STSiteSource(BaseSiteSource):
     url: Optional[str] = None
 
@@ -89,7 +117,9 @@ class STSiteSource(BaseSiteSource):
                                 poly = geom
                                 break
 
-                fs.append(f"st_within(location, geography'{poly}')")
+                # a covering within the size budget; the transformer refines
+                # to the exact scope (check_contained)
+                fs.append(f"st_within(location, geography'{config.pushdown_wkt(poly)}')")
 
             fi = make_dt_filter(
                 "Things/Datastreams/phenomenonTime", config.start_dt, config.end_dt
@@ -112,6 +142,7 @@ class STSiteSource(BaseSiteSource):
 
 class STWaterLevelSource(BaseWaterLevelSource):
     url: Optional[str] = None
+    terminal_key = staticmethod(_phenomenon_time)
 
     def __init__(self, transformer=None):
         super().__init__(transformer=transformer)
@@ -121,9 +152,7 @@ class STWaterLevelSource(BaseWaterLevelSource):
         return result
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(
-            records, tag=lambda x: x["observation"]["phenomenonTime"], position=position
-        )
+        record = get_terminal_record(records, tag=self.terminal_key, position=position)
         return {
             "value": self._parse_result(record["observation"]["result"]),
             "datetime": record["observation"]["phenomenonTime"],
@@ -134,6 +163,7 @@ class STWaterLevelSource(BaseWaterLevelSource):
 
 class STAnalyteSource(BaseAnalyteSource):
     url: Optional[str] = None
+    terminal_key = staticmethod(_phenomenon_time)
 
     def __init__(self, transformer=None):
         super().__init__(transformer=transformer)
@@ -143,9 +173,7 @@ class STAnalyteSource(BaseAnalyteSource):
         return result
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(
-            records, tag=lambda x: x["observation"]["phenomenonTime"], position=position
-        )
+        record = get_terminal_record(records, tag=self.terminal_key, position=position)
         return {
             "value": self._parse_result(record["observation"]["result"]),
             "datetime": record["observation"]["phenomenonTime"],
@@ -156,7 +184,9 @@ class STAnalyteSource(BaseAnalyteSource):
 
 class STSiteTransformer(SiteTransformer):
     source_id: str
-    check_contained = False
+    # the server filters by a simplified covering (Config.pushdown_wkt), so
+    # sites are checked against the exact scope locally
+    check_contained = True
 
     def _transform_elevation(self, elevation, record):
         return elevation
@@ -14,6 +14,8 @@
 # limitations under the License.
 # ===============================================================================
 import os
+from typing import Optional
+from datetime import timedelta
 
 from backend.connectors import NM_STATE_BOUNDING_POLYGON
 from backend.constants import (
@@ -37,7 +39,8 @@ from dlt.sources.helpers.rest_client.paginators import (
 )
 from jsonpath_ng.ext import parse
 
-from backend.connectors._dlt import fetch_json_records
+from backend.connectors._dlt import fetch_json, fetch_json_records, iter_json_pages
+from backend.incremental import fetch_start_dt, fetch_until
 from backend.source import (
     BaseWaterLevelSource,
     BaseSiteSource,
@@ -46,6 +49,10 @@ from backend.source import (
 )
 
 LIMIT = 50000
+# Page size of a latest-only query. Its pages run newest first across a batch
+# of sites and stop once every site has its latest row, so most batches are
+# one page; a full-history page would mostly be read for nothing.
+LATEST_LIMIT = 5000
 
 # The USGS OGC API paginates with a cursor exposed as a `rel="next"` link.
 # dlt's JSONLinkPaginator follows it across every page — this is what fixes the
@@ -73,6 +80,9 @@ def _usgs_headers(extra: dict | None = None) -> dict:
 
 class NWISSiteSource(BaseSiteSource):
     chunk_size = 500
+    supports_tiles = True
+    # each OGC page of locations is handed on as it arrives
+    streams_sites = True
 
     def __init__(self):
         super().__init__(transformer=NWISSiteTransformer())
@@ -96,7 +106,7 @@ class NWISSiteSource(BaseSiteSource):
         except Exception:
             return False
 
-    def get_records(self):
+    def _site_params(self, tile=None) -> dict:
         params: dict = {
             "limit": LIMIT,
             "site_type_code": "GW",
@@ -107,6 +117,10 @@ class NWISSiteSource(BaseSiteSource):
             params["bbox"] = ",".join([str(b) for b in bbox])
         else:
             params["state_code"] = "35"
+        if tile is not None:
+            # tiles lie inside the scope bbox; statewide tiles keep state_code
+            # so tiles over neighbouring states add nothing
+            params["bbox"] = ",".join([str(b) for b in tile])
 
         if self.config.start_date:
             begin: str = self.config.start_dt.date().isoformat()
@@ -119,6 +133,19 @@ class NWISSiteSource(BaseSiteSource):
 
         if not self.config.sites_only:
             params["parameter_code"] = "72019"
+        return params
+
+    def count_tile_records(self, tile) -> int | None:
+        # OGC API Features reports the full match count as numberMatched; one
+        # feature per time series, so this over-counts sites (harmless here)
+        params = self._site_params(tile)
+        params["limit"] = 1
+        obj = fetch_json(self.sites_url, params=params, headers=_usgs_headers())
+        n = obj.get("numberMatched") if isinstance(obj, dict) else None
+        return int(n) if n is not None else None
+
+    def get_records(self, tile=None):
+        params = self._site_params(tile)
 
         # dlt follows the OGC `rel=next` cursor across every page, so the full
         # result set is returned instead of the old first-page-then-refuse.
@@ -138,20 +165,43 @@ class NWISSiteSource(BaseSiteSource):
         # readings once per series, producing exact-duplicate observations
         # downstream. Keep the first feature per location; readings come only
         # from the field-measurements collection regardless of series.
-        deduped: list = []
+        deduped = self._unique_locations(records, set())
+        self._warn_duplicates(len(records) - len(deduped), len(deduped))
+        return deduped
+
+    def iter_site_records(self, tile=None):
+        # get_records one OGC page at a time; a location's first feature is
+        # kept across pages, as get_records keeps it
         seen: set = set()
-        for feature in records:
+        removed = kept = 0
+        for page in iter_json_pages(
+            self.sites_url,
+            params=self._site_params(tile),
+            data_selector="features",
+            paginator=_new_paginator(),
+            headers=_usgs_headers(),
+        ):
+            deduped = self._unique_locations(page, seen)
+            removed += len(page) - len(deduped)
+            kept += len(deduped)
+            if deduped:
+                yield deduped
+        self._warn_duplicates(removed, kept)
+
+    @staticmethod
+    def _unique_locations(features: list, seen: set) -> list:
+        deduped: list = []
+        for feature in features:
             site_id = feature.get("properties", {}).get("monitoring_location_id")
             if site_id in seen:
                 continue
             seen.add(site_id)
             deduped.append(feature)
+        return deduped
 
-        removed = len(records) - len(deduped)
+    def _warn_duplicates(self, removed: int, kept: int) -> None:
         if removed:
-            self.warn(f"Dropped {removed} duplicate site time-series features ({len(deduped)} unique locations)")
-
-        return deduped
+            self.warn(f"Dropped {removed} duplicate site time-series features ({kept} unique locations)")
 
 
 class NWISWaterLevelSource(BaseWaterLevelSource):
@@ -160,73 +210,152 @@ class NWISWaterLevelSource(BaseWaterLevelSource):
     # USGS complex queries allow up to 250 sites to be queried at once
     # https://api.waterdata.usgs.gov/docs/ogcapi/complex-queries
     num_sites = 250
+    site_id_field = "site_id"
+    terminal_key: Optional[str] = "datetime_measured"
+    # the timeseries value is the summary value: float(value), converted
+    summary_from_timeseries = True
+    # _standardize_record already keeps only these; slimming still collapses
+    # the repeated site id/unit/status strings across a batch
+    record_fields = (
+        "site_id",
+        "source_parameter_name",
+        "value",
+        "datetime_measured",
+        "source_parameter_units",
+        "approval_status",
+        "qualifier",
+    )
     field_measurements_url = "https://api.waterdata.usgs.gov/ogcapi/v0/collections/field-measurements/items"
+    # field measurements are read page by page off the rel=next cursor
+    streams_records = True
+    # the datetime interval follows fetch_start_dt / fetch_until
+    supports_time_windows = True
 
     def get_records(self, site_record):
+        return [r for page in self._iter_records(site_record) for r in page]
+
+    def get_latest_records(self, site_record):
+        """Each site's most recent field measurement: the chunk's batched
+        query sorted newest first (``sortby=-time``), read until every site
+        has its first, latest, row. A site whose latest reading is unusable is
+        refetched in full by read_summary."""
+        return [r for page in self._iter_latest_records(site_record) for r in page]
+
+    def iter_records(self, site_record, latest=False):
+        if latest:
+            return self._iter_latest_records(site_record)
+        return self._iter_records(site_record)
+
+    def _iter_records(self, site_record):
         params: dict = {
             "limit": LIMIT,
             "parameter_code": "72019",
         }
+        params.update(self._datetime_param())
 
-        begin: str = ""
-        end: str = ""
+        n: int = 0
+        for json_data in self._site_batches(site_record):
+            # POST CQL complex query, paginated: dlt follows the `rel=next`
+            # cursor across every page per batch (the old code refused a paged
+            # response, truncating large batches).
+            for features in iter_json_pages(
+                self.field_measurements_url,
+                params=params,
+                json_data=json_data,
+                method="POST",
+                data_selector="features",
+                paginator=_new_paginator(),
+                headers=_usgs_headers({"Content-Type": "application/query-cql-json"}),
+            ):
+                n += len(features)
+                yield [self._standardize_record(feature) for feature in features]
 
-        if self.config.start_date:
-            begin = self.config.start_dt.date().isoformat()
-            begin = f"{begin}T00:00:00Z"
-        if self.config.end_date:
-            end = self.config.end_dt.date().isoformat()
-            end = f"{end}T23:59:59Z"
+        self.log(f"Retrieved {n} records")
 
-        if begin and end:
-            params["datetime"] = f"{begin}/{end}"
-        elif begin:
-            params["datetime"] = f"{begin}/.."
-        elif end:
-            params["datetime"] = f"../{end}"
+    def _iter_latest_records(self, site_record):
+        params: dict = {
+            "limit": LATEST_LIMIT,
+            "parameter_code": "72019",
+            "sortby": "-time",
+        }
+        params.update(self._datetime_param())
 
-        records: list = []
+        n: int = 0
+        for json_data in self._site_batches(site_record):
+            wanted = set(json_data["args"][1])
+            pages = iter_json_pages(
+                self.field_measurements_url,
+                params=params,
+                json_data=json_data,
+                method="POST",
+                data_selector="features",
+                paginator=_new_paginator(),
+                headers=_usgs_headers({"Content-Type": "application/query-cql-json"}),
+            )
+            try:
+                for features in pages:
+                    latest = []
+                    for feature in features:
+                        site_id = feature["properties"]["monitoring_location_id"]
+                        if site_id in wanted:
+                            wanted.discard(site_id)
+                            latest.append(feature)
+                    n += len(latest)
+                    yield [self._standardize_record(feature) for feature in latest]
+                    if not wanted:
+                        # every site has its latest row: no more pages
+                        break
+            finally:
+                pages.close()
+
+        self.log(f"Retrieved {n} latest records")
+
+    def _site_batches(self, site_record):
+        """The CQL ``monitoring_location_id in [...]`` filters of the chunk's
+        sites, ``num_sites`` at a time (USGS complex queries allow up to 250
+        sites at once)."""
         sites: list = make_site_list(site_record)
 
         # if make_site_list returns a site id as a string, convert to list for consistency with the batch processing logic below
         if isinstance(sites, str):
             sites = [sites]
 
-        # group sites into batches of num_sites to pass to the API
-        # USGS APIs allow up to 250 sites to be queried at once with complex queries
-        list_of_lists_of_sites: list = []
         for i in range(0, len(sites), self.num_sites):
-            list_of_lists_of_sites.append(sites[i:i + self.num_sites]) 
-
-        for list_of_sites in list_of_lists_of_sites:
-            json_data: dict = {
+            yield {
                 "op": "in",
                 "args": [
                     {"property": "monitoring_location_id"},
-                    list_of_sites
+                    sites[i:i + self.num_sites]
                 ]
             }
 
-            # POST CQL complex query, paginated: dlt follows the `rel=next`
-            # cursor across every page per batch (the old code refused a paged
-            # response, truncating large batches).
-            features: list[dict] = fetch_json_records(
-                self.field_measurements_url,
-                params=params,
-                json_data=json_data,
-                method="POST",
-                data_selector="features",
-                paginator=_new_paginator(),
-                headers=_usgs_headers({"Content-Type": "application/query-cql-json"}),
-            )
+    def _datetime_param(self) -> dict:
+        params: dict = {}
+        begin: str = ""
+        end: str = ""
 
-            standard_features: list[dict] = [self._standardize_record(feature) for feature in features]
-            records.extend(standard_features)
+        # an incremental read starts after the snapshot (backend/incremental.py)
+        start = fetch_start_dt(self.config)
+        if start is not None:
+            begin = start.date().isoformat()
+            begin = f"{begin}T00:00:00Z"
+        # a time window ends the day before its (exclusive) end
+        until = fetch_until()
+        if until is not None:
+            end = (until - timedelta(days=1)).date().isoformat()
+            end = f"{end}T23:59:59Z"
+        elif self.config.end_date:
+            end = self.config.end_dt.date().isoformat()
+            end = f"{end}T23:59:59Z"
 
-        self.log(f"Retrieved {len(records)} records")
+        if begin and end:
+            params["datetime"] = f"{begin}/{end}"
+        elif begin:
+            params["datetime"] = f"{begin}/.."
+        elif end:
+            params["datetime"] = f"../{end}"
+        return params
 
-        return records
-    
     def _standardize_record(self, record: dict) -> dict:
         props = record["properties"]
         return {
@@ -243,9 +372,6 @@ class NWISWaterLevelSource(BaseWaterLevelSource):
             "qualifier": ", ".join(q) if isinstance((q := props.get("qualifier")), list) else q,
         }
 
-    def _extract_site_records(self, records, site_record):
-        return [ri for ri in records if ri["site_id"] == site_record.id]
-
     def _clean_records(self, records):
         return [
             r
@@ -266,7 +392,7 @@ class NWISWaterLevelSource(BaseWaterLevelSource):
         return [r["source_parameter_units"] for r in records]
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, "datetime_measured", position=position)
+        record = get_terminal_record(records, self.terminal_key, position=position)
         return {
             "value": float(record["value"]),
             # "datetime": (record["date_measured"], record["time_measured"]),
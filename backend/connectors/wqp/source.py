@@ -13,11 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
-
+import csv
+import io
+import threading
+from datetime import datetime, timedelta
 
 from backend.connectors import NM_STATE_BOUNDING_POLYGON
-from backend.connectors._dlt import fetch_text
+from backend.connectors._dlt import fetch_text, iter_text
 from backend.connectors.mappings import WQP_ANALYTE_MAPPING
+from backend.incremental import fetch_start_dt, fetch_until
 from backend.constants import (
     PARAMETER_NAME,
     PARAMETER_VALUE,
@@ -58,6 +62,34 @@ def parse_tsv(text):
     return [dict(zip(header, row.split("\t"))) for row in rows[1:]]
 
 
+# rows per page when a Result download is parsed as it streams in
+TSV_PAGE_ROWS = 5000
+
+
+def iter_tsv_pages(chunks, page_rows=TSV_PAGE_ROWS):
+    """parse_tsv over a text stream: yields the rows in pages of up to
+    *page_rows* while the body is still arriving. Lines are split exactly as
+    parse_tsv splits them, so the rows are the same; a body without a header
+    line yields nothing."""
+    header = None
+    buf = ""
+    page = []
+    for chunk in chunks:
+        lines = (buf + chunk).split("\n")
+        buf = lines.pop()
+        for line in lines:
+            if header is None:
+                header = line.split("\t")
+                continue
+            page.append(dict(zip(header, line.split("\t"))))
+            if len(page) >= page_rows:
+                yield page
+                page = []
+    if header is not None:
+        page.append(dict(zip(header, buf.split("\t"))))
+        yield page
+
+
 def _wqp_characteristic_names(parameters) -> list:
     """The WQP CharacteristicName values for a list of DIE analytes (an analyte
     can map to several names; conductivity and specific_conductance share
@@ -77,6 +109,8 @@ class _WQPMultiAnalyte:
     ``_parameters is None`` keeps the original single-analyte behavior."""
 
     _parameters = None  # list[str] of DIE analytes when in multi mode
+    # a multi-analyte fetch is a different query from a single-analyte one
+    fetch_state = ("_parameters",)
 
     def set_parameters(self, parameters) -> None:
         self._parameters = list(parameters)
@@ -85,6 +119,9 @@ class _WQPMultiAnalyte:
         return self._parameters if self._parameters is not None else [self.config.parameter]
 
 
+_UNSET = object()  # sentinel: summary service not yet queried
+
+
 def get_date_range(config):
     params = {}
     if config.start_date:
@@ -97,6 +134,9 @@ def get_date_range(config):
 class WQPSiteSource(_WQPMultiAnalyte, BaseSiteSource):
     chunk_size = 50
     bounding_polygon = NM_STATE_BOUNDING_POLYGON
+    sites_by_parameter = True
+    # the Station TSV is parsed and handed on page by page as it downloads
+    streams_sites = True
 
     def __init__(self):
         super().__init__(transformer=WQPSiteTransformer())
@@ -112,8 +152,22 @@ class WQPSiteSource(_WQPMultiAnalyte, BaseSiteSource):
             return False
 
     def get_records(self):
+        text = fetch_text(
+            "https://www.waterqualitydata.us/data/Station/search", self._station_params(), timeout=30
+        )
+        if text:
+            return parse_tsv(text)
+
+    def iter_site_records(self, tile=None):
+        # the Station TSV parsed page by page as it downloads
+        chunks = iter_text(
+            "https://www.waterqualitydata.us/data/Station/search", self._station_params(), timeout=30
+        )
+        return iter_tsv_pages(chunks, TSV_PAGE_ROWS)
+
+    def _station_params(self) -> dict:
         config = self.config
-        params = {
+        params: dict = {
             "mimeType": "tsv",
             "siteType": "Well",
             "sampleMedia": "Water",
@@ -135,15 +189,39 @@ class WQPSiteSource(_WQPMultiAnalyte, BaseSiteSource):
                 params["pCode"] = USGS_PCODE_30210
 
         params.update(get_date_range(config))
-
-        text = fetch_text(
-            "https://www.waterqualitydata.us/data/Station/search", params, timeout=30
-        )
-        if text:
-            return parse_tsv(text)
+        return params
 
 
 class WQPParameterSource(_WQPMultiAnalyte, BaseParameterSource):
+    # the Result TSV carries ~80 columns per row; these are the ones read
+    record_fields = (
+        "MonitoringLocationIdentifier",
+        "ActivityIdentifier",
+        "ActivityStartDate",
+        "ActivityStartTime/Time",
+        "CharacteristicName",
+        "USGSPCode",
+        "ResultMeasureValue",
+        "ResultMeasure/MeasureUnitCode",
+        "ResultTemperatureBasisText",
+        "ResultStatusIdentifier",
+        "MeasureQualifierCode",
+    )
+    site_id_field = "MonitoringLocationIdentifier"
+    terminal_key = "ActivityStartDate"
+    # the Result TSV is parsed and handed on page by page as it downloads
+    streams_records = True
+    # the Result query's dates follow fetch_start_dt / fetch_until
+    supports_time_windows = True
+    # TDS cleaning keeps one record per activity out of the site's whole set
+    record_local_clean = False
+    # ResultMeasureValue parses and converts the same way for both outputs;
+    # one that does not parse is kept in timeseries and skipped in summaries
+    summary_from_timeseries = True
+    # summary-service period of record, shared by the pre-filter and the
+    # latest-only plan (see _period_of_record)
+    _por_cache = _UNSET
+    _por_lock = threading.Lock()
 
     def _extract_parameter_record(self, record):
         record[PARAMETER_NAME] = self.config.parameter
@@ -161,9 +239,7 @@ class WQPParameterSource(_WQPMultiAnalyte, BaseParameterSource):
         return record
 
     def _extract_site_records(self, records, site_record):
-        matched = [
-            ri for ri in records if ri["MonitoringLocationIdentifier"] == site_record.id
-        ]
+        matched = super()._extract_site_records(records, site_record)
         if self._parameters is not None:
             # multi-analyte fetch returns every analyte's rows; keep only the
             # ones for the analyte this pass is unifying (config.parameter).
@@ -238,7 +314,7 @@ class WQPParameterSource(_WQPMultiAnalyte, BaseParameterSource):
         return [ri["CharacteristicName"] for ri in records]
 
     def _extract_terminal_record(self, records, position):
-        record = get_terminal_record(records, "ActivityStartDate", position=position)
+        record = get_terminal_record(records, self.terminal_key, position=position)
         return {
             "value": record["ResultMeasureValue"],
             "datetime": record["ActivityStartDate"],
@@ -246,7 +322,146 @@ class WQPParameterSource(_WQPMultiAnalyte, BaseParameterSource):
             "source_parameter_name": record["CharacteristicName"],
         }
 
+    def _period_of_record(self):
+        """``[(site id, CharacteristicName, year, result count)]`` from the WQP
+        summary service, or None when the summary can't scope this query.
+
+        One ``summary/monitoringLocation`` request scoped like the station query
+        (state/bBox, characteristic names) returns a row per site, year and
+        characteristic, covering every site at once. Rows outside the date
+        window's years are dropped; years are compared whole, so a boundary
+        year can only over-count. Water levels are selected by pCode, which the
+        summary rows do not carry, so they get None. Fetched once per instance
+        (chunks call in from several threads)."""
+        with self._por_lock:
+            if self._por_cache is _UNSET:
+                self._por_cache = self._fetch_period_of_record()
+            return self._por_cache
+
+    def _fetch_period_of_record(self):
+        config = self.config
+        if self._parameters is None and config.parameter.lower() == WATERLEVELS:
+            return None
+
+        # in multi-analyte mode cover every analyte so all passes see the same
+        # sites (and reuse the same cached chunk fetches)
+        names = set(_wqp_characteristic_names(self._active_parameters()))
+        params = {
+            "mimeType": "csv",
+            "dataProfile": "periodOfRecord",
+            "summaryYears": "all",
+            "siteType": "Well",
+            "sampleMedia": "Water",
+            "statecode": "US:35",
+            "characteristicName": sorted(names),
+        }
+        if config.has_bounds():
+            params["bBox"] = ",".join([str(b) for b in config.bbox_bounding_points()])
+
+        text = fetch_text(
+            "https://www.waterqualitydata.us/data/summary/monitoringLocation/search",
+            params,
+            timeout=30,
+        )
+        self.count_requests += 1
+
+        reader = csv.DictReader(io.StringIO(text or ""))
+        if "MonitoringLocationIdentifier" not in (reader.fieldnames or []):
+            # unexpected payload: don't guess, fetch every site in full
+            self.warn("Unrecognized WQP summary response; ignoring it")
+            return None
+
+        start_year = config.start_dt.year if config.start_date else None
+        end_year = config.end_dt.year if config.end_date else None
+        rows = []
+        for row in reader:
+            name = row.get("CharacteristicName")
+            if name is not None and name not in names:
+                continue
+            try:
+                year = int(row.get("YearSummarized") or 0)
+            except ValueError:
+                year = 0
+            if year and start_year and year < start_year:
+                continue
+            if year and end_year and year > end_year:
+                continue
+            # a missing or unparseable count still marks the site as present
+            try:
+                n = int(row["ResultCount"])
+            except (KeyError, TypeError, ValueError):
+                n = 1
+            rows.append((row.get("MonitoringLocationIdentifier"), name, year, n))
+        return rows
+
+    def count_records(self, site_records):
+        rows = self._period_of_record()
+        if rows is None:
+            return None
+        counts: dict = {}
+        for site_id, _name, _year, n in rows:
+            counts[site_id] = counts.get(site_id, 0) + n
+        return counts
+
+    def _latest_years(self) -> dict | None:
+        """``{site id: year}`` — the earliest of the site's per-characteristic
+        latest years, so a window starting then holds every characteristic's
+        most recent results. A site with an unknown year is left out."""
+        rows = self._period_of_record()
+        if rows is None:
+            return None
+        latest: dict = {}
+        for site_id, name, year, n in rows:
+            if n and year:
+                key = (site_id, name)
+                latest[key] = max(latest.get(key, 0), year)
+        years: dict = {}
+        for (site_id, _name), year in latest.items():
+            years[site_id] = min(years.get(site_id, year), year)
+        return years
+
+    def get_latest_records(self, site_record):
+        """Results from each site's most recent active year onward.
+
+        The Result service has no per-site "latest", so the summary service
+        supplies each site's last year with results and the chunk is fetched
+        from the earliest of those instead of from the start of its history. A
+        chunk with any site of unknown period is fetched in full."""
+        return [r for page in self.iter_records(site_record, latest=True) for r in page]
+
     def get_records(self, site_record):
+        return [r for page in self.iter_records(site_record) for r in page]
+
+    def iter_records(self, site_record, latest=False):
+        params = self._latest_params(site_record) if latest else None
+        if params is None:
+            params = self._result_params(site_record)
+        chunks = iter_text(
+            "https://www.waterqualitydata.us/data/Result/search", params, timeout=30
+        )
+        return iter_tsv_pages(chunks, TSV_PAGE_ROWS)
+
+    def _latest_params(self, site_record) -> dict | None:
+        """Result query params for get_latest_records, or None to fetch the
+        chunk's full history."""
+        years = self._latest_years()
+        sites = make_site_list(site_record)
+        if isinstance(sites, str):
+            sites = [sites]
+        chunk_years = [years.get(str(s)) for s in sites] if years else [None]
+        known = [y for y in chunk_years if y is not None]
+        if len(known) < len(chunk_years):
+            return None
+
+        params = self._result_params(site_record)
+        lo = datetime(min(known), 1, 1)
+        config = self.config
+        if config.start_date and config.start_dt > lo:
+            lo = config.start_dt
+        params["startDateLo"] = lo.strftime("%m-%d-%Y")
+        return params
+
+    def _result_params(self, site_record) -> dict:
         config = self.config
         sites = make_site_list(site_record)
 
@@ -268,12 +483,16 @@ class WQPParameterSource(_WQPMultiAnalyte, BaseParameterSource):
             params["pCode"] = "30210"
 
         params.update(get_date_range(config))
-
-        text = fetch_text(
-            "https://www.waterqualitydata.us/data/Result/search", params, timeout=30
-        )
-        if text:
-            return parse_tsv(text)
+        # an incremental read starts after the snapshot (backend/incremental.py)
+        start = fetch_start_dt(config)
+        if start is not None:
+            params["startDateLo"] = start.strftime("%m-%d-%Y")
+        # a time window (backend/time_windows.py) ends the day before its
+        # exclusive end; startDateHi is inclusive
+        until = fetch_until()
+        if until is not None:
+            params["startDateHi"] = (until - timedelta(days=1)).strftime("%m-%d-%Y")
+        return params
 
     def _parameter_units_hook(self):
         raise NotImplementedError(
@@ -6,6 +6,13 @@ class PartialOrNoDataError(Exception):
     pass
 
 
+class ChunkTimeoutError(PartialOrNoDataError):
+    """A request timed out. Callers that give up on a source on partial data
+    still do; adaptive chunk sizing (backend/chunk_sizing.py) retries the
+    chunk in smaller requests instead."""
+    pass
+
+
 class ConfigError(Exception):
     """Invalid configuration (bad bbox/county/date/parameter). Raised by
     Config.validate() so callers decide how to fail — the CLI turns it into a
@@ -0,0 +1,173 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Process-wide fetch cache shared by source instances.
+
+A source's shared-fetch cache (BaseSource._fetch_cache_enabled) lives on the
+instance, but Config.source_pair and unify_source_multi's per-analyte fallback
+build fresh instances, so two assets unified in one process fetch the same
+site catalog and overlapping observations twice. With Config.fetch_cache_bytes
+set, those fetches also go through this cache, keyed by the source class, the
+config fields that shape its queries (CONFIG_FIELDS), its own query state
+(BaseSource.fetch_state) and the request (site ids, ...).
+
+Entries are evicted least recently used first once their retained size
+(memory.deep_sizeof) passes the budget; one larger than the whole budget is
+not kept. An entry older than ``max_age`` is fetched again, so a long-lived
+process does not serve one run's fetch to a much later one. A fetch already
+in flight for a key is waited on rather than issued again. The instance caches
+still hold what their source fetched, so eviction here never makes a source
+refetch within its own run.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from backend.memory import deep_sizeof
+
+# Config fields a fetch depends on. The output units and datum shape the
+# transformed site records cached by BaseSiteSource.read.
+CONFIG_FIELDS = (
+    "parameter",
+    "start_date",
+    "end_date",
+    "bbox",
+    "county",
+    "wkt",
+    "site_tiles",
+    "tile_max_sites",
+    "tile_max_depth",
+    "output_horizontal_datum",
+    "output_elevation_units",
+    "output_well_depth_units",
+    "analyte_output_units",
+    "waterlevel_output_units",
+)
+
+
+def config_fingerprint(config) -> tuple:
+    return tuple(repr(getattr(config, name, None)) for name in CONFIG_FIELDS)
+
+
+class FetchCache:
+    """A thread-safe LRU of fetch results bounded by retained bytes."""
+
+    def __init__(self, max_bytes: int = 0, max_age: float = 3600.0):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, nbytes, fetched at)
+        self._pending: dict = {}  # key -> Event set when its fetch ends
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable, max_bytes: Optional[int] = None):
+        """The cached value for *key*, or ``fetch()``'s, which is cached.
+        *max_bytes* resizes the budget first (each run passes its config's)."""
+        while True:
+            with self._lock:
+                if max_bytes is not None and max_bytes != self.max_bytes:
+                    self.max_bytes = max_bytes
+                    self._evict()
+                entry = self._entries.get(key)
+                if entry is not None and time.monotonic() - entry[2] > self.max_age:
+                    self._discard(key)
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # another thread is fetching this key; take its result, or fetch
+            # here if it failed or was too large to keep
+            event.wait()
+
+        try:
+            value = fetch()
+        except BaseException:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+            raise
+
+        # sized outside the lock; it walks the whole fetch
+        nbytes = deep_sizeof(value)
+        with self._lock:
+            del self._pending[key]
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (value, nbytes, time.monotonic())
+                self.nbytes += nbytes
+                self._evict()
+        event.set()
+        return value
+
+    def get(self, key: Hashable):
+        """The cached value for *key*, or None; nothing is fetched."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.max_age:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value, max_bytes: Optional[int] = None) -> None:
+        """Cache *value*, fetched without get_or_fetch (e.g. streamed), for
+        *key*."""
+        nbytes = deep_sizeof(value)
+        with self._lock:
+            if max_bytes is not None and max_bytes != self.max_bytes:
+                self.max_bytes = max_bytes
+                self._evict()
+            if key in self._entries:
+                self._discard(key)
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (value, nbytes, time.monotonic())
+                self.nbytes += nbytes
+                self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and self.nbytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key) -> None:
+        _value, nbytes, _at = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = self.misses = 0
+
+
+_cache = FetchCache()
+
+
+def shared_fetch_cache() -> FetchCache:
+    """The process's fetch cache."""
+    return _cache
+
+
+# ============= EOF =============================================
@@ -0,0 +1,73 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Fetch history (Config.fetch_history_path).
+
+What a source's last finished run cost: the sites and chunks it fetched and
+the provider requests, pages, records and approximate bytes that took (from
+the parameter source's fetch_stats). The planner (backend/planner.py) scales
+these by a new run's chunks and sites to estimate what it will cost. With
+Config.time_window_records a run also keeps its records per year (``years``),
+which backend/time_windows.py sizes time windows from. Kept per
+source and parameter (chunk_sizing.size_key) in a JSON file shared by every
+source and process.
+"""
+from typing import Optional
+
+from backend.chunk_sizing import read_json_map, save_json_map, size_key
+
+FIELDS = ("sites", "chunks", "requests", "pages", "records", "bytes")
+
+
+def _is_run(value) -> bool:
+    return isinstance(value, dict) and all(isinstance(value.get(f), int) for f in FIELDS)
+
+
+class FetchHistory:
+    """The last finished run of each source, by size_key, in a JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.runs = read_json_map(path, _is_run)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.runs.get(key)
+
+    def save(self, key: str, run: dict) -> None:
+        self.runs[key] = run
+        save_json_map(self.path, key, run, _is_run)
+
+
+def record_run(config, parameter_source, sites: int, chunks: int, before: dict) -> None:
+    """Keep what *parameter_source* fetched since its fetch_stats were
+    *before*, for *chunks* chunks of *sites* sites. A run whose chunks all
+    came from a cache or checkpoints says nothing about the provider and is
+    not kept."""
+    path = getattr(config, "fetch_history_path", "")
+    if not path or not chunks:
+        return
+    run: dict = {"sites": sites, "chunks": chunks}
+    for name, value in parameter_source.fetch_stats.items():
+        run[name] = value - before.get(name, 0)
+    if run["requests"] <= 0:
+        return
+    # a source is read once per run, so its fetch_years are this run's
+    years = getattr(parameter_source, "fetch_years", None)
+    if years:
+        run["years"] = dict(sorted(years.items()))
+    FetchHistory(path).save(size_key(config, parameter_source), run)
+
+
+# ============= EOF =============================================
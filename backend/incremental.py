@@ -0,0 +1,225 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Incremental unification (unifier.unify_source_incremental).
+
+A daily run of a source mostly refetches histories that have not changed.
+With Config.snapshot_dir, each run leaves a snapshot of what it read, per site
+with data: its timeseries rows and its SummaryAccumulator (the folded summary
+state, including the earliest/latest source records and the running sum). The
+next run fetches each chunk only from its sites' watermark — the date of the
+latest record folded in, less a day for providers whose dates are local — and
+BaseParameterSource.read_both (its *resume*) drops the fetched records whose
+rows are already in the snapshot, matched on the whole row (source, site,
+date and time, parameter, value; see record.row_key), folds the rest into the
+snapshot accumulator and returns only their rows. A terminal key that only
+holds a date (WQP's) is fine: new records on the watermark date are kept.
+
+Output is rebuilt for every site in the order of a full run: rows are the
+snapshot's followed by the new ones, sorted like a fresh read; summaries are
+finished from the accumulators, which is constant work per site, against the
+current site records. It is identical to a full rebuild for sources whose
+summary is folded from the timeseries rows (BaseParameterSource.
+supports_resume) and whose providers add records in time order, each dated no
+earlier than the day before the site's latest: a record dated before that,
+added after the snapshot, is not fetched, and a full rebuild is needed to pick
+it up (a new snapshot_dir, or a different window). Other sources, latest-only
+and site_limit runs are unified in full.
+"""
+import os
+import pickle
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+
+from backend.record import ParameterRecord, row_key
+from backend.transformer import output_mode
+
+# bump when the stored form changes, so an old snapshot means a full run
+FORMAT = 2
+
+# A thread's fetch start while an incremental read fetches a chunk (see
+# fetch_since), like transformer.output_mode for the output mode.
+_since = threading.local()
+# ... and its end while a time window of a chunk is fetched (fetch_window)
+_until = threading.local()
+
+_ACC_FIELDS = ("n", "min", "max", "mean", "total", "comp", "earliest", "latest", "extra")
+
+
+@contextmanager
+def fetch_since(start: Optional[datetime]):
+    """Fetches on this thread start no earlier than *start* (None: the
+    config's start date), whatever config.start_date says."""
+    prior = getattr(_since, "value", None)
+    _since.value = start
+    try:
+        yield
+    finally:
+        _since.value = prior
+
+
+@contextmanager
+def fetch_window(start: Optional[datetime], until: Optional[datetime]):
+    """Fetches on this thread cover [*start*, *until*): a time window of a
+    chunk's history (see backend/time_windows.py). None leaves that side to
+    the config."""
+    prior = getattr(_until, "value", None)
+    _until.value = until
+    try:
+        with fetch_since(start):
+            yield
+    finally:
+        _until.value = prior
+
+
+def fetch_until() -> Optional[datetime]:
+    """The exclusive end of this thread's time window (a midnight), or None:
+    fetch to the config's end date."""
+    return getattr(_until, "value", None)
+
+
+def fetch_start_dt(config) -> Optional[datetime]:
+    """The start of the fetch window: config.start_dt, or the later start an
+    incremental read set for this thread."""
+    start = config.start_dt if config.start_date else None
+    since = getattr(_since, "value", None)
+    if since is not None and (start is None or since > start):
+        return since
+    return start
+
+
+def supports_incremental(config, parameter_source) -> bool:
+    return (
+        parameter_source.supports_resume()
+        and not config.site_limit
+        and not getattr(config, "latest_only", False)
+    )
+
+
+class Snapshot:
+    """What a run read, per site id: ``(rows, accumulator state)``, the rows
+    as ParameterRecord payloads."""
+
+    def __init__(self, sites: Optional[dict] = None):
+        self.sites = sites if sites is not None else {}
+
+    @classmethod
+    def load(cls, path: str) -> "Snapshot":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as rfile:
+            data = pickle.load(rfile)
+        if data.get("format") != FORMAT:
+            return cls()
+        return cls(data["sites"])
+
+    def save(self, path: str) -> None:
+        # written aside and moved into place, so an interrupted write leaves
+        # the previous snapshot
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as wfile:
+            pickle.dump({"format": FORMAT, "sites": self.sites}, wfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+
+class IncrementalRead:
+    """Reads chunks of *parameter_source* on from *snapshot*; read() returns
+    a chunk's ``(summaries, timeseries)`` as a full read would."""
+
+    def __init__(self, parameter_source, snapshot: Snapshot):
+        self._source = parameter_source
+        self._snapshot = snapshot
+        self._summarizer = parameter_source._summarizer
+        self._lock = threading.Lock()
+        self.sites: dict = {}  # the next snapshot's sites
+        self.touched = 0
+
+    def read(self, site_record, start_ind: int, end_ind: int) -> tuple:
+        """read_both's ``(summaries, timeseries)`` for a chunk, continued from
+        the snapshot (see unifier._site_wrapper's *read*)."""
+        source = self._source
+        sites = site_record if isinstance(site_record, list) else [site_record]
+        previous = {s.id: self._snapshot.sites[s.id] for s in sites if s.id in self._snapshot.sites}
+
+        resume = {sid: self._accumulator(state) for sid, (_rows, state) in previous.items()}
+        latest = {sid: acc.latest for sid, acc in resume.items()}
+        rows_read = {sid: [ParameterRecord(p) for p in payloads] for sid, (payloads, _state) in previous.items()}
+        seen = {sid: Counter(row_key(r) for r in rows) for sid, rows in rows_read.items()}
+        with fetch_since(self._start(sites, resume)):
+            _summaries, timeseries = source.read_both(site_record, start_ind, end_ind, resume=resume, seen=seen)
+        new_rows = {site.id: rows for site, rows in timeseries or []}
+
+        summaries = []
+        results = []
+        chunk_state = {}
+        touched = 0
+        for site in sites:
+            acc = resume.get(site.id)
+            if acc is None:
+                continue
+            rows = rows_read.get(site.id, [])
+            if site.id in new_rows or acc.latest is not latest.get(site.id):
+                touched += 1
+            if site.id in new_rows:
+                # stable, so rows of one date keep fetch order, the earlier
+                # run's first
+                rows = sorted(rows + new_rows[site.id], key=source._sort_func)
+            with output_mode(True):
+                summary = self._summarizer.finish(site, acc)
+            if summary is not None:
+                summaries.append(summary)
+            if rows:
+                results.append((site, rows))
+            chunk_state[site.id] = ([r._payload for r in rows], self._state(acc))
+
+        with self._lock:
+            self.sites.update(chunk_state)
+            self.touched += touched
+        return summaries, results
+
+    def snapshot(self) -> Snapshot:
+        return Snapshot(self.sites)
+
+    def _start(self, sites: list, resume: dict) -> Optional[datetime]:
+        """The chunk's fetch start: a day before its earliest watermark, or
+        None (the whole window) when a site has none."""
+        starts = []
+        for site in sites:
+            acc = resume.get(site.id)
+            if acc is None or acc.latest is None:
+                return None
+            try:
+                value = self._source._extract_latest_record([acc.latest])["datetime"]
+                starts.append(datetime.fromisoformat(str(value)[:10]))
+            except (KeyError, TypeError, ValueError):
+                return None
+        return min(starts) - timedelta(days=1) if starts else None
+
+    def _accumulator(self, state: dict):
+        acc = self._summarizer.start()
+        for name in _ACC_FIELDS:
+            setattr(acc, name, state[name])
+        return acc
+
+    @staticmethod
+    def _state(acc) -> dict:
+        # skipped results were warned about when they were read
+        return {name: getattr(acc, name) for name in _ACC_FIELDS}
+
+
+# ============= EOF =============================================
@@ -0,0 +1,265 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Memory accounting helpers for in-flight records.
+
+``sys.getsizeof`` reports only an object's own header, not what it points to,
+so it says nothing about what a list of provider payloads actually retains.
+``deep_sizeof`` walks the containers instead and counts every reachable object
+once — shared objects (a datastream dict referenced by every observation, a
+deduplicated unit string) are counted a single time, which is exactly the
+saving record slimming is meant to show.
+
+For a run as a whole, ``MemorySampler`` samples the process's resident set
+size (and, optionally, tracemalloc's traced Python memory) on a background
+thread and reports each stage's peak and steady-state (median) use, and
+``MemoryBudget`` relieves memory pressure on a soft budget before the process
+is killed. Both see the whole process: sources unified at the same time in
+one process show up in each other's numbers.
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+
+
+def deep_sizeof(obj) -> int:
+    """Bytes retained by *obj* and everything reachable from it through dicts,
+    lists, tuples, sets and instance ``__dict__``s, each object counted once."""
+    seen: set = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        oid = id(o)
+        if oid in seen:
+            continue
+        seen.add(oid)
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, "__dict__") and not isinstance(o, type):
+            stack.append(o.__dict__)
+    return total
+
+
+def sampled_sizeof(items: list, samples: int = 8) -> int:
+    """deep_sizeof of *items*' elements, estimated from up to *samples* of
+    them spread over the list."""
+    n = len(items)
+    if not n:
+        return 0
+    step = max(n // samples, 1)
+    picked = items[::step][:samples]
+    return sum(deep_sizeof(item) for item in picked) * n // len(picked)
+
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def rss_bytes() -> int:
+    """The process's resident set size; its peak where the current size is
+    not available (no /proc), 0 where neither is."""
+    try:
+        with open("/proc/self/statm") as rfile:
+            return int(rfile.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# tracemalloc is process-wide: it is started by the first sampler that traces
+# and stopped by the last, unless something else had started it
+_trace_lock = threading.Lock()
+_tracers = 0
+_started_tracing = False
+
+
+def _start_tracing() -> None:
+    global _tracers, _started_tracing
+    with _trace_lock:
+        if not _tracers and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracers += 1
+
+
+def _stop_tracing() -> None:
+    global _tracers, _started_tracing
+    with _trace_lock:
+        _tracers -= 1
+        if not _tracers and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class MemorySampler:
+    """Samples memory every *interval* seconds while running (and at every
+    stage change), attributing each sample to the stage entered last.
+    With *trace*, tracemalloc's traced Python memory is sampled too."""
+
+    def __init__(self, interval: float = 0.5, trace: bool = False):
+        self.interval = interval
+        self.trace = trace
+        self._stage: Optional[str] = None
+        self._samples: dict = {}  # stage -> [(rss, traced)]
+        self._seconds: dict = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MemorySampler":
+        if self.trace:
+            _start_tracing()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.sample()
+        if self.trace:
+            _stop_tracing()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Attribute the samples taken inside the block to stage *name*."""
+        prior = self._stage
+        self._stage = name
+        started = time.monotonic()
+        self.sample()
+        try:
+            yield
+        finally:
+            self.sample()
+            with self._lock:
+                self._seconds[name] = self._seconds.get(name, 0) + time.monotonic() - started
+            self._stage = prior
+
+    def sample(self) -> None:
+        stage = self._stage
+        if stage is None:
+            return
+        traced = tracemalloc.get_traced_memory()[0] if self.trace and tracemalloc.is_tracing() else None
+        with self._lock:
+            self._samples.setdefault(stage, []).append((rss_bytes(), traced))
+
+    def report(self) -> dict:
+        """Per stage, the peak and steady-state (median) RSS and traced
+        memory sampled, and the overall peak RSS."""
+        report: dict = {"stages": {}}
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+            seconds = dict(self._seconds)
+        for stage, values in samples.items():
+            rss = [r for r, _t in values]
+            entry = {
+                "peak_rss": max(rss),
+                "steady_rss": int(statistics.median(rss)),
+                "samples": len(values),
+                "seconds": round(seconds.get(stage, 0), 3),
+            }
+            traced = [t for _r, t in values if t is not None]
+            if traced:
+                entry["peak_traced"] = max(traced)
+                entry["steady_traced"] = int(statistics.median(traced))
+            report["stages"][stage] = entry
+        report["peak_rss"] = max((e["peak_rss"] for e in report["stages"].values()), default=0)
+        return report
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+
+class MemoryBudget:
+    """A soft budget on the process's RSS for one source's run.
+
+    check() is called as each chunk is persisted. While RSS is over *limit*
+    it spills the *persisters*' records to disk (those with a spill() method)
+    — cheap, and done at every check over the limit. If RSS is still over at
+    the next check, the memory is in the fetching, and it takes one step
+    there: halve the size of the requests still to be made (*adaptive*, a
+    chunk_sizing.AdaptiveChunks), then, once they are single sites, halve
+    the chunks allowed in flight (``in_flight``, read by the fetch pipeline)
+    down to one. After each step it waits for that many chunks to be
+    persisted before taking another. None of it changes the output.
+    """
+
+    def __init__(self, limit: int, persisters: list, adaptive=None, in_flight: int = 1, log=None):
+        self.limit = limit
+        self.persisters = [p for p in persisters if hasattr(p, "spill")]
+        self.adaptive = adaptive
+        self.in_flight = max(in_flight, 1)
+        self.events: list = []
+        self.spills = 0
+        self._log = log
+        self._over = False
+        self._wait = 0
+
+    def check(self) -> None:
+        rss = rss_bytes()
+        if rss <= self.limit:
+            self._over = False
+            return
+        if any(p.memory_bytes for p in self.persisters):
+            for p in self.persisters:
+                p.spill()
+            self.spills += 1
+            # reported once; a run over its budget spills at every chunk
+            if self.spills == 1:
+                self._event("spill", rss, None)
+        over, self._over = self._over, True
+        if not over:
+            return
+        if self._wait:
+            self._wait -= 1
+            return
+        if self.adaptive is not None and self.adaptive.size > 1:
+            self.adaptive.shrink()
+            self._event("smaller_requests", rss, self.adaptive.size)
+            self._wait = self.in_flight
+        elif self.in_flight > 1:
+            self.in_flight = max(self.in_flight // 2, 1)
+            self._event("fewer_in_flight", rss, self.in_flight)
+            self._wait = self.in_flight
+
+    def _event(self, action: str, rss: int, value) -> None:
+        self.events.append({"action": action, "rss": rss, "value": value})
+        if self._log is not None:
+            self._log(f"memory over budget ({rss} > {self.limit} bytes): {action}" + (f" -> {value}" if value is not None else ""))
+
+
+# ============= EOF =============================================
@@ -29,6 +29,7 @@ class BasePersister:
         self.records = []      # SummaryRecord (summary mode)
         self.sites = []        # SiteRecord (timeseries mode)
         self.timeseries = []   # list[list[ParameterRecord]], aligned with sites
+        self.stats = {}        # per-stage run statistics (e.g. "prefilter")
 
 
 # ============= EOF =============================================
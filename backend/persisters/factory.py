@@ -3,5 +3,18 @@ from backend.persister import BasePersister
 
 def make_persister(config) -> BasePersister:
     # Single in-memory accumulator; the cloud/GeoServer/CSV write strategies went
-    # with the CLI/worker output path.
+    # with the CLI/worker output path. With Config.spill_bytes, one that spills
+    # to Arrow IPC files past that much memory (backend/persisters/spill.py,
+    # needs the parquet extra). With Config.memory_budget_bytes alone, one
+    # that spills when the budget is passed, if pyarrow is installed.
+    if getattr(config, "spill_bytes", 0):
+        from backend.persisters.spill import SpillingPersister
+
+        return SpillingPersister(config)
+    if getattr(config, "memory_budget_bytes", 0):
+        try:
+            from backend.persisters.spill import SpillingPersister
+        except ImportError:
+            return BasePersister(config)
+        return SpillingPersister(config)
     return BasePersister(config)
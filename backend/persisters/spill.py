@@ -0,0 +1,336 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Spill-to-disk persister (Config.spill_bytes).
+
+BasePersister holds every record of a run as Python objects until the run
+ends; a statewide timeseries run holds every observation that way. A
+SpillingPersister has the same ``records`` / ``sites`` / ``timeseries``
+interface, but each is a SpillList: once the items held in memory across the
+three pass the budget, they are written to an Arrow IPC file in the
+persister's spill directory and dropped. Reading a SpillList (iterating it,
+or its batches()) reads the spilled files back one at a time, so a consumer
+that goes batch by batch never holds more than one file's records.
+
+Each spill file is one record batch with a column per payload key. A column
+whose values are all of one of bool/int/float/str is stored natively; any
+other column (mixed types, nested values) is pickled per value, so records
+come back with exactly the values they were written with. Requires the
+optional ``parquet`` extra (pyarrow).
+
+With spill_bytes 0 (Config.memory_budget_bytes without Config.spill_bytes) a
+SpillingPersister spills only when told to (spill()), by the run's memory
+budget (backend/memory.py:MemoryBudget).
+
+The files are removed when the persister is closed or garbage collected.
+"""
+import itertools
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from backend.memory import deep_sizeof
+from backend.persister import BasePersister
+from backend.record import ParameterRecord, SiteRecord, SummaryRecord
+
+# an item's retained size is measured for one item in this many; the rest are
+# assumed to be the same size
+SAMPLE_EVERY = 32
+
+_NATIVE = (bool, int, float, str)
+_PICKLED = {b"encoding": b"pickle"}
+_CLASS = "__class"
+_ABSENT = "__absent"
+_CHUNK_SIZE = "__chunk_size"
+_RECORD_CLASSES = {cls.__name__: cls for cls in (ParameterRecord, SiteRecord, SummaryRecord)}
+
+
+class SpillList:
+    """A list of records (with *nested*, of record lists) whose older items
+    may live in spill files. Supports what the unifier and the source assets
+    do with a persister's lists: append/extend, len, iteration, indexing and
+    ``lst[:n]`` (a SpillList sharing the spilled files)."""
+
+    def __init__(self, owner: "SpillingPersister", name: str, nested: bool = False):
+        self._owner = owner
+        self._name = name
+        self._nested = nested
+        self._segments: list = []  # (path, items used)
+        self._tail: list = []
+        self._sample_bytes = 0
+        self._samples = 0
+
+    def __len__(self) -> int:
+        return sum(n for _path, n in self._segments) + len(self._tail)
+
+    def __iter__(self) -> Iterator:
+        for batch in self.batches():
+            yield from batch
+
+    def __eq__(self, other):
+        if isinstance(other, (list, SpillList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"SpillList({self._name}, len={len(self)}, spilled={len(self._segments)})"
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.start in (None, 0) and index.step in (None, 1):
+                stop = len(self) if index.stop is None else index.stop
+                if stop < 0:
+                    stop = max(len(self) + stop, 0)
+                return self._prefix(stop)
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SpillList index out of range")
+        for path, n in self._segments:
+            if index < n:
+                return _read_segment(path, n, self._nested)[index]
+            index -= n
+        return self._tail[index]
+
+    def append(self, item) -> None:
+        self._add(item)
+        self._owner._check_budget()
+
+    def extend(self, items) -> None:
+        for item in items:
+            self._add(item)
+        self._owner._check_budget()
+
+    def batches(self) -> Iterator[list]:
+        """The items as consecutive lists: each spill file's, read when it is
+        reached, then those still in memory."""
+        for path, n in self._segments:
+            yield _read_segment(path, n, self._nested)
+        if self._tail:
+            yield list(self._tail)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated bytes retained by the items held in memory."""
+        if not self._samples:
+            return 0
+        return len(self._tail) * self._sample_bytes // self._samples
+
+    @property
+    def spilled(self) -> int:
+        return sum(n for _path, n in self._segments)
+
+    def spill(self) -> None:
+        """Write the items held in memory to a spill file."""
+        if not self._tail:
+            return
+        path = self._owner._spill_path(self._name)
+        _write_segment(path, self._tail, self._nested)
+        self._segments.append((path, len(self._tail)))
+        self._tail = []
+        self._sample_bytes = self._samples = 0
+
+    def _add(self, item) -> None:
+        if len(self._tail) % SAMPLE_EVERY == 0:
+            self._sample_bytes += deep_sizeof(item)
+            self._samples += 1
+        self._tail.append(item)
+
+    def _prefix(self, n: int) -> "SpillList":
+        prefix = SpillList(self._owner, self._name, self._nested)
+        for path, count in self._segments:
+            if n <= 0:
+                break
+            prefix._segments.append((path, min(count, n)))
+            n -= count
+        if n > 0:
+            prefix._tail = self._tail[:n]
+            prefix._sample_bytes, prefix._samples = self._sample_bytes, self._samples
+        return prefix
+
+
+def _spill_list(name: str, nested: bool = False) -> property:
+    """A SpillingPersister list attribute. The unifier reassigns the lists
+    (rollback, site_limit truncation); a plain list assigned is taken into a
+    SpillList."""
+
+    def getter(self):
+        return self._lists[name]
+
+    def setter(self, value):
+        if not isinstance(value, SpillList):
+            lst = SpillList(self, name, nested)
+            lst.extend(value)
+            value = lst
+        self._lists[name] = value
+
+    return property(getter, setter)
+
+
+class SpillingPersister(BasePersister):
+    """BasePersister whose lists spill to Arrow IPC files past *spill_bytes*
+    of estimated memory (Config.spill_bytes), in *directory*
+    (Config.spill_dir; "" = the system temp directory)."""
+
+    def __init__(self, config=None, spill_bytes: Optional[int] = None, directory: Optional[str] = None):
+        if spill_bytes is None:
+            spill_bytes = getattr(config, "spill_bytes", 0)
+        if directory is None:
+            directory = getattr(config, "spill_dir", "")
+        self.spill_bytes = spill_bytes
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix="die-spill-", dir=directory or None)
+        self._files = itertools.count()
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+        self._lists: dict = {}
+        # BasePersister's empty lists become SpillLists (see _spill_list)
+        super().__init__(config)
+
+    records = _spill_list("records")
+    sites = _spill_list("sites")
+    timeseries = _spill_list("timeseries", nested=True)
+
+    def close(self) -> None:
+        """Remove the spill files; the lists' spilled items go with them."""
+        self._finalizer()
+
+    def _spill_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}-{next(self._files):06d}.arrow")
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated memory of the items not spilled yet."""
+        return sum(lst.memory_bytes for lst in self._lists.values())
+
+    def spill(self) -> None:
+        """Spill every list's in-memory items now (memory.MemoryBudget)."""
+        lists = self._lists.values()
+        for lst in lists:
+            lst.spill()
+        stats = self.stats.setdefault("spill", {"files": 0})
+        stats["files"] = sum(len(lst._segments) for lst in lists)
+        stats["items"] = sum(lst.spilled for lst in lists)
+        stats["bytes"] = sum(os.path.getsize(p) for lst in lists for p, _n in lst._segments)
+
+    def _check_budget(self) -> None:
+        # spill_bytes 0: spill only when asked to (Config.memory_budget_bytes)
+        if not self.spill_bytes or self.memory_bytes <= self.spill_bytes:
+            return
+        self.spill()
+
+
+def _write_segment(path: str, items: list, nested: bool) -> None:
+    metadata = {}
+    if nested:
+        metadata[b"items"] = json.dumps([len(rows) for rows in items]).encode()
+        records = [r for rows in items for r in rows]
+    else:
+        records = items
+
+    # first appearance order, deduplicated
+    seen: dict = {}
+    for record in records:
+        for key in record._payload:
+            seen.setdefault(key, None)
+    keys = list(seen)
+
+    names, arrays, fields = [], [], []
+    for key in keys:
+        array, field_metadata = _encode([record._payload.get(key) for record in records])
+        names.append(key)
+        arrays.append(array)
+        fields.append(pa.field(key, array.type, metadata=field_metadata))
+
+    extras = {
+        _CLASS: pa.array([type(r).__name__ for r in records]).dictionary_encode(),
+        _ABSENT: pa.array(
+            [[i for i, key in enumerate(keys) if key not in r._payload] or None for r in records],
+            pa.list_(pa.int32()),
+        ),
+    }
+    if any("chunk_size" in r.__dict__ for r in records):
+        extras[_CHUNK_SIZE] = pa.array([r.__dict__.get("chunk_size") for r in records], pa.int64())
+    for name, array in extras.items():
+        arrays.append(array)
+        fields.append(pa.field(name, array.type))
+
+    batch = pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
+    with pa.OSFile(path, "wb") as sink:
+        with ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+
+
+def _encode(values: list):
+    types = {type(v) for v in values if v is not None}
+    if len(types) <= 1 and all(t in _NATIVE for t in types):
+        try:
+            return pa.array(values), None
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            pass
+    pickled = [None if v is None else pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL) for v in values]
+    return pa.array(pickled, pa.binary()), _PICKLED
+
+
+def _read_segment(path: str, limit: int, nested: bool) -> list:
+    """The first *limit* items written to *path*."""
+    with pa.memory_map(path) as source:
+        reader = ipc.open_file(source)
+        schema = reader.schema
+        table = reader.read_all()
+
+    columns = {}
+    keys = []
+    for field in schema:
+        column = table.column(field.name).to_pylist()
+        if field.metadata == _PICKLED:
+            column = [None if v is None else pickle.loads(v) for v in column]
+        columns[field.name] = column
+        if not field.name.startswith("__"):
+            keys.append(field.name)
+
+    counts: list = json.loads(schema.metadata[b"items"]) if nested else []
+    n_records = sum(counts[:limit]) if nested else limit
+    classes, absent = columns[_CLASS], columns[_ABSENT]
+    chunk_sizes = columns.get(_CHUNK_SIZE)
+
+    records = []
+    for i in range(n_records):
+        skip = absent[i] or ()
+        payload = {key: columns[key][i] for j, key in enumerate(keys) if j not in skip}
+        record = _RECORD_CLASSES[classes[i]](payload)
+        if chunk_sizes is not None and chunk_sizes[i] is not None:
+            record.chunk_size = chunk_sizes[i]
+        records.append(record)
+
+    if not nested:
+        return records
+    items = []
+    start = 0
+    for count in counts[:limit]:
+        items.append(records[start:start + count])
+        start += count
+    return items
+
+
+# ============= EOF =============================================
@@ -0,0 +1,201 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Dry-run fetch planning (plan_fetch, Config.fetch_plan).
+
+plan_fetch discovers each source's sites, pre-filters them when
+Config.prefilter_sites is on and chunks them as _site_wrapper would, without
+fetching any observations, and estimates what fetching the chunks will cost:
+
+- requests and pages, from the source's last finished run in
+  Config.fetch_history_path (backend/fetch_history.py) scaled to this run's
+  chunks; without history, one request and one page per chunk, a floor;
+- records, from the source's count probe (count_records) when it has one,
+  else from history scaled to this run's sites;
+- bytes, the records' approximate retained size, from history.
+
+Each estimate names its basis ("probe", "history", "chunks"). Discovery and
+the probe go through the process-wide fetch cache, so a run in the same
+process does not repeat them.
+
+The plan is plain JSON (save_plan / load_plan). Set as Config.fetch_plan, it
+is executed by the unifier: a source with a plan entry for the run (same
+source, parameter, scope, window and units) is fetched in exactly the planned
+chunks, without pre-filtering again. A plan whose sites are no longer all
+discovered is stale; the source is then planned afresh.
+"""
+import json
+import math
+from datetime import datetime
+from typing import Optional
+
+from backend.chunk_sizing import size_key
+from backend.config import ANALYTE_SOURCE_PAIRS, WATERLEVEL_SOURCE_PAIRS
+from backend.constants import WATERLEVELS
+from backend.exceptions import PartialOrNoDataError, USGSRateLimitError
+from backend.fetch_history import FetchHistory
+from backend.unifier import _adaptive_chunks, _plan_key
+
+# bump when the plan's form changes
+PLAN_FORMAT = 1
+
+
+def estimate(chunks: int, sites: int, history: Optional[dict] = None, records: Optional[int] = None) -> dict:
+    """Requests, pages, records and bytes of fetching *chunks* chunks of
+    *sites* sites, given the source's last run (*history*) and the records
+    its count probe reported (*records*)."""
+    basis = []
+    if records is not None:
+        basis.append("probe")
+    if history:
+        basis.append("history")
+        requests = _scale(chunks, history["requests"], history["chunks"])
+        if records is None:
+            records = _scale(sites, history["records"], history["sites"])
+        if history["records"]:
+            pages = _scale(records, history["pages"], history["records"])
+            size = _scale(records, history["bytes"], history["records"])
+        else:
+            pages = _scale(chunks, history["pages"], history["chunks"])
+            size = 0
+    else:
+        basis.append("chunks")
+        requests = pages = chunks
+        size = None
+    return {
+        "requests": requests,
+        # every request returns at least one page
+        "pages": max(pages, requests),
+        "records": records,
+        "bytes": size,
+        "basis": basis,
+    }
+
+
+def _scale(n: int, measured: int, per: int) -> int:
+    return math.ceil(n * measured / per) if per else 0
+
+
+def plan_source(config, source_key: str) -> Optional[dict]:
+    """The plan entry of one source, or None when it does not provide
+    config.parameter. A discovery failure is reported in the entry's
+    ``error``; the unifier then plans the source itself."""
+    pair = config.source_pair(source_key)
+    if pair is None:
+        return None
+    site_source, parameter_source = pair
+    site_source._fetch_cache_enabled = True
+    parameter_source._fetch_cache_enabled = True
+
+    entry: dict = {
+        "source": source_key,
+        "key": _plan_key(config, site_source, parameter_source),
+        "site_source": repr(site_source),
+        "parameter_source": repr(parameter_source),
+    }
+    try:
+        sites = site_source.read() or []
+    except (USGSRateLimitError, PartialOrNoDataError) as e:
+        entry["error"] = f"site discovery failed: {e}"
+        return entry
+
+    kept = sites
+    counts = None
+    probe_before = parameter_source.count_requests
+    if sites:
+        try:
+            counts = parameter_source._count_records(sites)
+        except (USGSRateLimitError, PartialOrNoDataError):
+            counts = None
+        # the unifier's pre-filter (_prefilter_sites) keeps the same sites
+        if counts is not None and getattr(config, "prefilter_sites", False):
+            kept = [s for s in sites if counts.get(str(s.id), 0) > 0]
+
+    adaptive = _adaptive_chunks(config, site_source, parameter_source)
+    chunks = adaptive.plan(kept) if adaptive else site_source.chunks(kept)
+    records = None
+    if counts is not None:
+        records = sum(counts.get(str(s.id), 0) for s in kept)
+
+    path = getattr(config, "fetch_history_path", "")
+    history = FetchHistory(path).get(size_key(config, parameter_source)) if path else None
+    entry.update(
+        sites=len(sites),
+        sites_kept=len(kept),
+        probe_requests=parameter_source.count_requests - probe_before,
+        # a chunk of one site record is planned as its id alone
+        chunks=[[str(s.id) for s in c] if isinstance(c, list) else str(c.id) for c in chunks],
+        estimate=estimate(len(chunks), len(kept), history, records),
+    )
+    return entry
+
+
+def plan_fetch(config, source_keys: Optional[list] = None) -> dict:
+    """A fetch plan for *source_keys* (default: every enabled source that
+    provides config.parameter), with per-source and total estimates."""
+    config.validate()
+    if source_keys is None:
+        table = WATERLEVEL_SOURCE_PAIRS if config.parameter == WATERLEVELS else ANALYTE_SOURCE_PAIRS
+        source_keys = [k for k in table if getattr(config, f"use_source_{k}", True)]
+
+    sources = []
+    for source_key in source_keys:
+        entry = plan_source(config, source_key)
+        if entry is None:
+            continue
+        sources.append(entry)
+        if "estimate" in entry:
+            e = entry["estimate"]
+            config.log(
+                f"{source_key}: {entry['sites_kept']}/{entry['sites']} sites in {len(entry['chunks'])} chunks, "
+                f"~{e['requests']} requests, ~{e['pages']} pages, records={e['records']}, bytes={e['bytes']} "
+                f"({'+'.join(e['basis'])})"
+            )
+        else:
+            config.warn(f"{source_key}: {entry['error']}")
+
+    estimates = [e["estimate"] for e in sources if "estimate" in e]
+    totals = {
+        "requests": sum(e["requests"] for e in estimates),
+        "pages": sum(e["pages"] for e in estimates),
+        "records": sum(e["records"] or 0 for e in estimates),
+        "bytes": sum(e["bytes"] or 0 for e in estimates),
+        # sources whose records / bytes are not estimated (no probe or history)
+        "unestimated": [e["source"] for e in sources if "estimate" not in e or e["estimate"]["bytes"] is None],
+    }
+    return {
+        "format": PLAN_FORMAT,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "parameter": config.parameter,
+        "sources": sources,
+        "totals": totals,
+    }
+
+
+def save_plan(plan: dict, path: str) -> None:
+    with open(path, "w") as wfile:
+        json.dump(plan, wfile, indent=2)
+
+
+def load_plan(path: str) -> dict:
+    """A plan written by save_plan, for Config.fetch_plan."""
+    with open(path) as rfile:
+        plan = json.load(rfile)
+    if plan.get("format") != PLAN_FORMAT:
+        raise ValueError(f"{path} is not a fetch plan of format {PLAN_FORMAT}")
+    return plan
+
+
+# ============= EOF =============================================
@@ -119,6 +119,13 @@ class ParameterRecord(BaseRecord):
     defaults: dict = {}
 
 
+def row_key(record: BaseRecord) -> tuple:
+    """A timeseries row as a hashable key: every field, so two rows have the
+    same key only if they are the same observation (source, site, date and
+    time, parameter) with the same value."""
+    return tuple(record._payload.get(k) for k in record.keys)
+
+
 class SummaryRecord(BaseRecord):
     keys: tuple = (
         "source",
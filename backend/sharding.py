@@ -0,0 +1,290 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Sharded unification of one source (Config.shards).
+
+unify_source_both reads all of a source's chunks in one process. A sharded
+run splits the same chunk plan N ways by a stable hash of each chunk's site
+ids (checkpoint.chunk_key): shard i reads only the chunks that hash to i, in
+its own process (unify_source_sharded) or its own Dagster op (unify_shard),
+and returns their results as plain data. merge_shards puts the chunks back in
+plan order, drops duplicates (a chunk delivered by both a retried shard and
+the original) and persists them through the same in-order sinks as a
+single-process run, so the output — site_limit truncation included — is
+exactly that of unify_source_both.
+
+The chunks themselves are those of the single-process plan, so every chunk is
+fetched and transformed exactly as it would have been there. unify_source_sharded
+discovers (and pre-filters) the sites once and hands each shard its selected
+chunk specs; a shard run on its own (unify_shard without a planned Shard)
+discovers the sites itself and must arrive at the same plan. The merge checks
+the shards' plan keys and, like an abort of a single-process run, saves
+nothing for the source when a shard aborted, is missing, or planned
+differently.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from backend.checkpoint import _digest, chunk_key
+from backend.exceptions import PartialOrNoDataError, USGSRateLimitError
+from backend.persisters.factory import make_persister
+from backend.record import SiteRecord
+from backend.transform_stage import unpack_results
+from backend.unifier import (
+    _ChunkSink,
+    _chunk_sites,
+    _site_wrapper,
+    plan_chunk_specs,
+    unify_source_both,
+    unify_source_incremental,
+)
+
+
+def shard_of(site_records, shards: int) -> int:
+    """The shard (of *shards*) a chunk of *site_records* belongs to."""
+    return int(chunk_key(site_records)[:16], 16) % shards
+
+
+class Shard:
+    """Shard *index* of *count* of one source's run. _site_wrapper reads the
+    chunks select() keeps and hands each chunk's packed results to add().
+    Once select() has run, ``specs`` are those chunks and _site_wrapper
+    reads them without discovering the sites."""
+
+    def __init__(self, index: int, count: int):
+        if not 0 <= index < count:
+            raise ValueError(f"shard {index} is not one of {count}")
+        self.index = index
+        self.count = count
+        self.total = 0
+        self.plan_key = ""
+        self.positions: list = []
+        self.chunks: list = []  # (position in the plan, site payloads, site chunk sizes, packed results)
+        self.specs: Optional[list] = None
+        self.aborted = False
+
+    def select(self, chunk_specs: list) -> list:
+        """This shard's chunk specs of the source's full plan *chunk_specs*."""
+        keys = [chunk_key(spec[0]) for spec in chunk_specs]
+        self.total = len(keys)
+        self.plan_key = _digest("\n".join(keys))
+        self.positions = [i for i, key in enumerate(keys) if int(key[:16], 16) % self.count == self.index]
+        self.specs = [chunk_specs[i] for i in self.positions]
+        return self.specs
+
+    def add(self, k: int, site_records, packed) -> None:
+        """The results of the *k*-th selected chunk."""
+        sites = _chunk_sites(site_records)
+        self.chunks.append((self.positions[k], [s._payload for s in sites], [s.chunk_size for s in sites], packed))
+
+    def abort(self) -> None:
+        self.chunks = []
+        self.aborted = True
+
+
+def unify_shard(config, source_key: str, index: int, count: int, shard: Optional[Shard] = None) -> dict:
+    """Read shard *index* of *count* of unify_source_both(config, source_key).
+
+    *shard*, if given, is that shard with its chunks already selected from
+    the parent's plan (see unify_source_sharded); otherwise the shard
+    discovers the sites and plans the chunks itself.
+
+    Returns plain (picklable) data for merge_shards. Unexpected errors
+    propagate, as from unify_source_both; a rate-limit / partial-data abort
+    returns an incomplete shard.
+    """
+    config.validate()
+    if config.sites_only:
+        raise ValueError("sites_only runs are not sharded")
+
+    if shard is None:
+        shard = Shard(index, count)
+    combined = not config.latest_only
+    output = {"index": index, "count": count, "combined": combined, "stats": {}}
+    started = time.monotonic()
+
+    pair = config.source_pair(source_key)
+    if pair is None:
+        config.warn(
+            f"Source {source_key!r} does not provide parameter {config.parameter!r}"
+        )
+    else:
+        site_source, parameter_source = pair
+        site_source._fetch_cache_enabled = True
+        parameter_source._fetch_cache_enabled = config.latest_only or not parameter_source.summary_from_timeseries
+
+        # the persisters only collect stats (e.g. the pre-filter's); the
+        # results go to the shard
+        persister = make_persister(config)
+        config._persister = persister
+        if combined:
+            _site_wrapper(
+                site_source,
+                parameter_source,
+                persister,
+                config,
+                raise_errors=True,
+                summary_persister=make_persister(config),
+                shard=shard,
+            )
+        else:
+            config.output_summary = True
+            _site_wrapper(site_source, parameter_source, persister, config, raise_errors=True, shard=shard)
+        output["stats"] = dict(persister.stats)
+
+    output.update(
+        total=shard.total,
+        plan_key=shard.plan_key,
+        complete=not shard.aborted,
+        chunks=shard.chunks,
+        seconds=round(time.monotonic() - started, 3),
+    )
+    return output
+
+
+def merge_shards(config, source_key: str, outputs: list):
+    """Merge unify_shard *outputs* into ``(summary_persister,
+    timeseries_persister)`` as unify_source_both would have returned them.
+
+    Outputs may repeat a shard (e.g. a retried op): a shard's complete
+    output is used and each chunk is taken once.
+    """
+    summary_persister = make_persister(config)
+    timeseries_persister = make_persister(config)
+    config._persister = summary_persister
+    config.output_summary = True
+    summary_persister.stats["shards"] = [
+        {
+            "index": o["index"],
+            "chunks": len(o["chunks"]),
+            "seconds": o["seconds"],
+            "complete": o["complete"],
+            # each shard's process has its own memory (Config.memory_sample_seconds)
+            "peak_rss": o["stats"].get("memory", {}).get("peak_rss"),
+        }
+        for o in sorted(outputs, key=lambda o: o["index"])
+    ]
+    if not outputs:
+        return summary_persister, timeseries_persister
+
+    for name, value in outputs[0]["stats"].items():
+        # one shard's memory is not the run's; see stats["shards"]
+        if name != "memory":
+            summary_persister.stats.setdefault(name, value)
+
+    complete = {o["index"] for o in outputs if o["complete"]}
+    plans = {(o["count"], o["total"], o["plan_key"]) for o in outputs if o["complete"]}
+    count = outputs[0]["count"]
+    if complete != set(range(count)) or len(plans) != 1:
+        config.warn(
+            f"Shards of {source_key!r} are incomplete or planned different chunks. "
+            f"No records will be saved for this source."
+        )
+        return summary_persister, timeseries_persister
+
+    (_count, total, _plan_key), = plans
+    chunks: dict = {}
+    for output in outputs:
+        if output["complete"]:
+            for chunk in output["chunks"]:
+                chunks.setdefault(chunk[0], chunk)
+
+    combined = outputs[0]["combined"]
+    site_limit = config.site_limit
+    if combined:
+        sinks = [
+            _ChunkSink(summary_persister, True, site_limit),
+            _ChunkSink(timeseries_persister, False, site_limit),
+        ]
+    else:
+        sinks = [_ChunkSink(summary_persister, True, site_limit)]
+
+    for position in range(total):
+        _position, payloads, chunk_sizes, packed = chunks[position]
+        sites = []
+        for payload, chunk_size in zip(payloads, chunk_sizes):
+            site = SiteRecord(payload)
+            if chunk_size is not None:
+                site.chunk_size = chunk_size
+            sites.append(site)
+        results = unpack_results(packed, sites, True, combined)
+        if combined:
+            sinks[0].add(results[0])
+            sinks[1].add(results[1])
+        else:
+            sinks[0].add(results)
+        if all(sink.done for sink in sinks):
+            break
+    return summary_persister, timeseries_persister
+
+
+def _executor(workers: int):
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def unify_source_sharded(config, source_key: str, shards: int = 0):
+    """unify_source_both in *shards* (default Config.shards) worker
+    processes. With fewer than two shards, or a sites_only run, this is
+    unify_source_both, or unify_source_incremental with a
+    Config.snapshot_dir; sharded runs are always full ones."""
+    shards = int(shards or getattr(config, "shards", 0) or 0)
+    if shards < 2 or config.sites_only:
+        if getattr(config, "snapshot_dir", "") and not config.sites_only:
+            return unify_source_incremental(config, source_key)
+        return unify_source_both(config, source_key)
+    if getattr(config, "snapshot_dir", ""):
+        config.log(f"{source_key}: sharded run, snapshot_dir is not used")
+
+    config.validate()
+    pair = config.source_pair(source_key)
+    if pair is None:
+        config.warn(
+            f"Source {source_key!r} does not provide parameter {config.parameter!r}"
+        )
+        return make_persister(config), make_persister(config)
+
+    # discovered and pre-filtered here, once, rather than by every shard
+    site_source, parameter_source = pair
+    site_source._fetch_cache_enabled = True
+    stats = make_persister(config)
+    try:
+        plan = plan_chunk_specs(config, site_source, parameter_source, stats)
+    except (USGSRateLimitError, PartialOrNoDataError):
+        config.warn(
+            f"Failed to retrieve complete site records for {site_source}. No records will be saved for this source."
+        )
+        return make_persister(config), make_persister(config)
+    planned = [Shard(i, shards) for i in range(shards)]
+    for shard in planned:
+        shard.select(plan)
+
+    workers = min(int(getattr(config, "shard_workers", 0) or 0) or shards, shards)
+    with _executor(workers) as executor:
+        futures = [executor.submit(unify_shard, config, source_key, s.index, shards, s) for s in planned]
+        outputs = [future.result() for future in futures]
+
+    summary_persister, timeseries_persister = merge_shards(config, source_key, outputs)
+    for name, value in stats.stats.items():
+        summary_persister.stats.setdefault(name, value)
+    config.log(
+        f"{source_key}: merged {shards} shards, "
+        f"{sum(len(o['chunks']) for o in outputs)} chunks, "
+        f"slowest {max(o['seconds'] for o in outputs):.1f}s"
+    )
+    return summary_persister, timeseries_persister
+
+
+# ============= EOF =============================================
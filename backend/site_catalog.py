@@ -0,0 +1,238 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Persistent site catalog (Config.site_catalog_dir).
+
+Site metadata changes rarely, but every run of every parameter discovers a
+source's sites again: the site query, _transform_sites, the datum transform
+and the in-state filter. With a catalog directory, BaseSiteSource.read keeps
+what discovery returned in a SQLite file:
+
+- ``sites``: each transformed SiteRecord, keyed by source and site id. The
+  source is the site source class and the config fields the site transform
+  depends on (datum and units), so every discovery of a source's wells —
+  whatever the parameter or scope — shares one row per well;
+- ``discoveries``: the ordered site ids a discovery query returned, keyed by
+  the source and the config fields its query depends on (scope, dates,
+  sites_only, the site tiling, and the parameter for a source with
+  ``sites_by_parameter``).
+
+A later read of the same query within Config.site_catalog_ttl_hours reads its
+sites from the catalog instead of discovering them. After that the query is
+discovered again, and the result is compared with the catalog: sites added,
+changed (a different payload) and removed are counted in the source's
+``catalog_stats`` and logged, and the catalog is updated.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+FILENAME = "sites.sqlite"
+
+# bump when the stored form changes, so old entries are never read back
+FORMAT = 1
+
+# Config fields a site record's transform depends on
+TRANSFORM_FIELDS = ("output_horizontal_datum", "output_elevation_units", "output_well_depth_units")
+
+# Config fields a discovery query depends on, beyond the parameter
+QUERY_FIELDS = (
+    "start_date",
+    "end_date",
+    "bbox",
+    "county",
+    "wkt",
+    "sites_only",
+    "site_tiles",
+    "tile_max_sites",
+    "tile_max_depth",
+)
+
+# site ids bound per ``IN (...)`` query: under SQLite's default limit of 999
+# host parameters, with room for the source
+ID_BATCH = 900
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS sites (
+        source TEXT NOT NULL,
+        site_id TEXT NOT NULL,
+        record BLOB NOT NULL,
+        digest TEXT NOT NULL,
+        updated REAL NOT NULL,
+        PRIMARY KEY (source, site_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS discoveries (
+        query TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        site_ids TEXT NOT NULL,
+        fetched REAL NOT NULL
+    )
+    """,
+)
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(value if isinstance(value, bytes) else value.encode("utf-8")).hexdigest()
+
+
+def _fields(config, names) -> list:
+    return [repr(getattr(config, name, None)) for name in names]
+
+
+def _rows_for(conn, columns: str, source: str, site_ids: list):
+    """The ``sites`` rows (*columns*) of *site_ids* in *source*, looked up
+    by primary key a batch at a time rather than by scanning the source."""
+    for start in range(0, len(site_ids), ID_BATCH):
+        batch = site_ids[start:start + ID_BATCH]
+        marks = ", ".join("?" * len(batch))
+        yield from conn.execute(
+            f"SELECT {columns} FROM sites WHERE source = ? AND site_id IN ({marks})", [source, *batch]
+        )
+
+
+def source_key(site_source) -> str:
+    """The catalog's key for *site_source*'s site records."""
+    cls = type(site_source)
+    parts = [FORMAT, f"{cls.__module__}.{cls.__qualname__}", _fields(site_source.config, TRANSFORM_FIELDS)]
+    return _digest(json.dumps(parts))
+
+
+def query_key(site_source) -> str:
+    """The catalog's key for *site_source*'s discovery query."""
+    config = site_source.config
+    names = QUERY_FIELDS + (("parameter",) if site_source.sites_by_parameter else ())
+    parts = [
+        source_key(site_source),
+        _fields(config, names),
+        [repr(getattr(site_source, name, None)) for name in site_source.fetch_state],
+    ]
+    return _digest(json.dumps(parts))
+
+
+class SiteCatalog:
+    """The site catalog in ``directory``; safe to share between threads and
+    processes (each call opens its own connection)."""
+
+    def __init__(self, directory: str, ttl_hours: float = 24):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, FILENAME)
+        self.ttl = float(ttl_hours) * 3600
+        with self._session() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    @classmethod
+    def for_source(cls, site_source) -> Optional["SiteCatalog"]:
+        config = getattr(site_source, "config", None)
+        directory = getattr(config, "site_catalog_dir", "") if config is not None else ""
+        if not directory:
+            return None
+        return cls(directory, getattr(config, "site_catalog_ttl_hours", 24))
+
+    @contextmanager
+    def _session(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def read(self, site_source, discover: Callable[[], Optional[list]]) -> Optional[list]:
+        """*site_source*'s sites: from the catalog while its discovery is
+        fresh, else ``discover()``'s, which are stored."""
+        query = query_key(site_source)
+        source = source_key(site_source)
+        sites = self.lookup(query, source)
+        if sites is not None:
+            for site in sites:
+                site.chunk_size = site_source.chunk_size
+            site_source.catalog_stats = {"hit": True, "sites": len(sites)}
+            site_source.log(f"read {len(sites)} sites from the site catalog")
+            return sites
+
+        sites = discover()
+        if sites and len({str(s.id) for s in sites}) < len(sites):
+            # one row per site id could not give back repeated ids
+            site_source.log("discovery repeated site ids; not kept in the site catalog")
+        elif sites:
+            stats = self.store(query, source, sites)
+            site_source.catalog_stats = dict(stats, hit=False, sites=len(sites))
+            site_source.log(
+                f"site catalog updated: {stats['added']} added, {stats['changed']} changed, "
+                f"{stats['removed']} removed"
+            )
+        return sites
+
+    def lookup(self, query: str, source: str) -> Optional[List]:
+        """The sites of a fresh discovery *query*, or None."""
+        with self._session() as conn:
+            row = conn.execute(
+                "SELECT site_ids FROM discoveries WHERE query = ? AND fetched > ?",
+                (query, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            site_ids = json.loads(row[0])
+            sites = {}
+            for site_id, record in _rows_for(conn, "site_id, record", source, site_ids):
+                sites[site_id] = pickle.loads(record)
+        if len(sites) < len(site_ids):
+            # a site row went missing; discover again
+            return None
+        return [sites[site_id] for site_id in site_ids]
+
+    def store(self, query: str, source: str, sites: list) -> dict:
+        """Keep *sites* as discovery *query*'s; returns the sites added,
+        changed and removed since the query was last stored."""
+        now = time.time()
+        rows = []
+        for site in sites:
+            record = pickle.dumps(site, protocol=pickle.HIGHEST_PROTOCOL)
+            # the payload alone decides whether a site changed
+            digest = _digest(pickle.dumps(site._payload, protocol=pickle.HIGHEST_PROTOCOL))
+            rows.append((source, str(site.id), record, digest, now))
+        site_ids = [row[1] for row in rows]
+
+        with self._session() as conn:
+            previous = conn.execute("SELECT site_ids FROM discoveries WHERE query = ?", (query,)).fetchone()
+            known = dict(_rows_for(conn, "site_id, digest", source, site_ids))
+            conn.executemany(
+                "INSERT OR REPLACE INTO sites (source, site_id, record, digest, updated) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO discoveries (query, source, site_ids, fetched) VALUES (?, ?, ?, ?)",
+                (query, source, json.dumps(site_ids), now),
+            )
+
+        previous_ids = set(json.loads(previous[0])) if previous else set()
+        return {
+            "added": sum(1 for _s, site_id, _r, _d, _n in rows if site_id not in known),
+            "changed": sum(1 for _s, site_id, _r, digest, _n in rows if known.get(site_id, digest) != digest),
+            "removed": len(previous_ids - set(site_ids)),
+        }
+
+
+# ============= EOF =============================================
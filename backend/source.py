@@ -13,7 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
-from typing import Any, Optional, Union, List, Callable, Dict, cast
+import threading
+import time
+from typing import Any, Optional, Union, List, Callable, Dict, Iterable, Iterator, Tuple, cast
 
 import shapely.wkt
 from shapely import MultiPoint
@@ -36,9 +38,18 @@ from backend.record import (
     ParameterRecord,
     SiteRecord,
     SummaryRecord,
+    row_key,
 )
-from backend.transformer import BaseTransformer
+from backend.transformer import BaseTransformer, output_mode
+from backend.converter import StandardUnitConverter
 from backend.exceptions import PartialOrNoDataError
+from backend.chunk_sizing import note_fetched
+from backend.memory import sampled_sizeof
+from backend.site_catalog import SiteCatalog
+from backend.fetch_cache import config_fingerprint, shared_fetch_cache
+from backend.summary_kernel import SummaryAccumulator, series_stats, terminal_key_func
+from backend.tiling import dedupe_by_id, fetch_tiles, plan_tiles
+from backend.time_windows import count_years, iter_windowed_pages, plan_windows
 
 
 # =============================================================================
@@ -91,49 +102,120 @@ class RecordSummarizer:
         self._source = source
 
     def summarize(self, site, cleaned: list):
+        s = self._source
+        kept_items, skipped_items = self._convert(site, cleaned)
+        if skipped_items:
+            s.warn(f"Skipped results because of formatting: {skipped_items}")
+        if not kept_items:
+            return None
+
+        earliest_result = s._extract_earliest_record(cleaned)
+        latest_result = s._extract_latest_record(cleaned)
+        if not latest_result:
+            return None
+
+        return self._record(site, series_stats(kept_items), earliest_result, latest_result, s._summary_extra(cleaned))
+
+    def start(self) -> SummaryAccumulator:
+        """A new accumulator for one site (see accumulate/finish)."""
+        return SummaryAccumulator(self._source.terminal_key)
+
+    def accumulate(self, acc: SummaryAccumulator, site, cleaned: list) -> None:
+        """Fold a page of a site's cleaned records into *acc*; the records can
+        be dropped afterwards."""
+        kept_items, skipped_items = self._convert(site, cleaned)
+        acc.add_values(kept_items)
+        acc.add_records(cleaned)
+        acc.skipped.extend(skipped_items)
+        if not acc.extra:
+            acc.extra = self._source._summary_extra(cleaned)
+
+    def accumulate_transformed(self, acc: SummaryAccumulator, site, cleaned: list, rows: list) -> None:
+        """accumulate() for a page the timeseries transform has already
+        converted: *rows* are the ParameterRecords of *cleaned*. A row kept
+        unconverted (no conversion_factor) is what _convert skips; a record
+        whose conversion failed has no row, as _convert drops it."""
+        kept_items = []
+        for row in rows:
+            if row.conversion_factor is None:
+                acc.skipped.append((site.id, row.parameter_value, row.source_parameter_units))
+            else:
+                kept_items.append(row.parameter_value)
+        acc.add_values(kept_items)
+        acc.add_records(cleaned)
+        if not acc.extra:
+            acc.extra = self._source._summary_extra(cleaned)
+
+    def finish(self, site, acc: SummaryAccumulator):
+        """The summary record for an accumulated site — what summarize() would
+        return for all of its pages at once."""
+        s = self._source
+        if acc.skipped:
+            s.warn(f"Skipped results because of formatting: {acc.skipped}")
+        if not acc.n:
+            return None
+
+        earliest_result = s._extract_earliest_record([acc.earliest])
+        latest_result = s._extract_latest_record([acc.latest])
+        if not latest_result:
+            return None
+
+        return self._record(site, (acc.n, acc.min, acc.max, acc.sum_mean), earliest_result, latest_result, acc.extra)
+
+    def _convert(self, site, cleaned: list) -> tuple:
+        """``(converted values, skipped items)`` for a site's cleaned records;
+        conversion warnings are emitted as they happen."""
         s = self._source
         source_results = s._extract_source_parameter_results(cleaned)
         source_units = s._extract_source_parameter_units(cleaned)
         dates = s._extract_parameter_dates(cleaned)
         source_names = s._extract_source_parameter_names(cleaned)
 
+        converter = s.transformer.converter
+        output_units = s._get_output_units()
+        parameter = s.config.parameter
+        # StandardUnitConverter's factor depends only on the units and names,
+        # not on the value or date, so it is looked up once per distinct
+        # (unit, name) instead of once per record. Failed conversions are not
+        # cached: each still goes through convert() for its own warning.
+        factors: dict | None = {} if type(converter) is StandardUnitConverter else None
+
         kept_items = []
         skipped_items = []
         for source_result, source_unit, date, source_name in zip(
             source_results, source_units, dates, source_names
         ):
             try:
-                converted_result, _factor, warning_msg = s.transformer.converter.convert(
-                    float(source_result),
+                value = float(source_result)
+                factor = factors.get((source_unit, source_name)) if factors is not None else None
+                if factor is not None:
+                    kept_items.append(value * factor)
+                    continue
+                converted_result, factor, warning_msg = converter.convert(
+                    value,
                     source_unit,
-                    s._get_output_units(),
+                    output_units,
                     source_name,
-                    s.config.parameter,
+                    parameter,
                     date,
                 )
                 if warning_msg == "":
                     kept_items.append(converted_result)
+                    if factors is not None and factor:
+                        factors[(source_unit, source_name)] = factor
                 else:
                     s.warn(f"{warning_msg} for {site.id}")
             except (TypeError, ValueError):
                 skipped_items.append((site.id, source_result, source_unit))
+        return kept_items, skipped_items
 
-        if skipped_items:
-            s.warn(f"Skipped results because of formatting: {skipped_items}")
-        if not kept_items:
-            return None
-
-        n = len(kept_items)
-        earliest_result = s._extract_earliest_record(cleaned)
-        latest_result = s._extract_latest_record(cleaned)
-        if not latest_result:
-            return None
-
+    def _record(self, site, stats: tuple, earliest_result: dict, latest_result: dict, extra: dict):
+        n, lo, hi, mean = stats
         rec = {
             "nrecords": n,
-            "min": min(kept_items),
-            "max": max(kept_items),
-            "mean": sum(kept_items) / n,
+            "min": lo,
+            "max": hi,
+            "mean": mean,
             "earliest_datetime": earliest_result["datetime"],
             "earliest_value": earliest_result["value"],
             "earliest_source_units": earliest_result["source_parameter_units"],
@@ -143,8 +225,8 @@ class RecordSummarizer:
             "latest_source_units": latest_result["source_parameter_units"],
             "latest_source_name": latest_result["source_parameter_name"],
         }
-        rec.update(s._summary_extra(cleaned))
-        return s.transformer.do_transform(rec, site)
+        rec.update(extra)
+        return self._source.transformer.do_transform(rec, site)
 
 
 # =============================================================================
@@ -158,24 +240,56 @@ def make_site_list(site_record: list[SiteRecord] | SiteRecord) -> list | str:
 
 
 def get_terminal_record(records: list, tag: Union[str, Callable], position: str) -> dict:
-    if callable(tag):
-        func = tag
-    elif "." in tag:
-        def func(x):
-            for t in tag.split("."):
-                x = x[t]
-            return x
-    else:
-        def func(x):
-            return x[tag]
+    func = terminal_key_func(tag)
 
+    # O(n) equivalents of the stable sorted(...)[0] / [-1]: min() keeps the
+    # first of equal keys, and max() over the reversed list the last one
     if position == EARLIEST:
-        return sorted(records, key=func)[0]
+        return min(records, key=func)
     elif position == LATEST:
-        return sorted(records, key=func)[-1]
+        return max(reversed(records), key=func)
     raise ValueError(f"Invalid position {position}. Must be either {EARLIEST} or {LATEST}")
 
 
+def slim_records(records: list, fields) -> list:
+    """Project raw provider records down to *fields*.
+
+    *fields* is a tuple of keys to keep, or a dict mapping a key to the spec
+    for its (nested dict) value; a ``None`` spec keeps the value as is. Nested
+    dicts are projected once and the copy is shared by every record that
+    referenced the original (a datastream shared by its observations stays
+    shared), and equal strings are collapsed to one object, so repeated unit,
+    name and date strings are stored once per fetch instead of once per row."""
+    memo: dict = {}
+    strings: dict = {}
+
+    def _value(v):
+        if type(v) is str:
+            return strings.setdefault(v, v)
+        return v
+
+    def _project(obj, spec, shared):
+        if shared:
+            key = (id(obj), id(spec))
+            hit = memo.get(key)
+            if hit is not None:
+                return hit
+        items = spec.items() if isinstance(spec, dict) else ((k, None) for k in spec)
+        out = {}
+        for k, sub in items:
+            if k in obj:
+                v = obj[k]
+                if sub is not None and isinstance(v, dict):
+                    out[k] = _project(v, sub, True)
+                else:
+                    out[k] = _value(v)
+        if shared:
+            memo[key] = out
+        return out
+
+    return [_project(r, fields, False) for r in records]
+
+
 def get_analyte_search_param(parameter: str, mapping: dict) -> str:
     try:
         return mapping[parameter]
@@ -191,9 +305,34 @@ def get_analyte_search_param(parameter: str, mapping: dict) -> str:
 
 _FETCH_UNSET = object()  # sentinel: site fetch not yet cached
 
+# guards every source's fetch_stats: fetch workers count concurrently
+_FETCH_STATS_LOCK = threading.Lock()
+
+# SummaryRecord fields a latest-only read cannot vouch for: they would describe
+# only the fetched window, not the site's history, so they are left blank
+LATEST_ONLY_BLANK = (
+    "nrecords",
+    "min",
+    "max",
+    "mean",
+    "earliest_date",
+    "earliest_time",
+    "earliest_value",
+    "earliest_units",
+)
+
 
 class BaseSource:
     transformer_klass = BaseTransformer  # deprecated: pass transformer= to __init__
+    # iter_records yields a fetch page by page as the provider returns it; the
+    # readers then clean/transform each page while the next is in flight
+    # instead of holding the whole chunk's raw records. Opt-in per connector;
+    # the default iter_records yields get_records() as a single page.
+    streams_records = False
+    # Attributes, beyond the config, that shape this source's provider
+    # queries (e.g. WQP's multi-analyte list). Part of the key its fetches
+    # are shared under across instances (see backend/fetch_cache.py).
+    fetch_state: tuple = ()
 
     def __init__(self, transformer: Optional[BaseTransformer] = None, http_client=None):
         self.transformer = transformer if transformer is not None else self.transformer_klass()
@@ -215,21 +354,164 @@ class BaseSource:
         self._fetch_cache_enabled = False
         self._records_cache: dict = {}      # site-id key -> get_records() result
         self._sites_cache = _FETCH_UNSET    # BaseSiteSource.read() result
+        self._counts_cache = _FETCH_UNSET   # BaseParameterSource.count_records() result
+        # What this source fetched from its provider: requests, pages, records
+        # and their approximate retained bytes. A finished run keeps it as
+        # fetch history for cost estimates (see backend/planner.py).
+        self.fetch_stats = {"requests": 0, "pages": 0, "records": 0, "bytes": 0}
+        # ... and their records per year, with Config.time_window_records:
+        # the density later runs size their time windows from
+        self.fetch_years: dict = {}
 
     def __repr__(self):
         return self.__class__.__name__
 
-    def _fetch_records(self, site_record):
+    def __getstate__(self):
+        # A copy of the source is sent to each transform worker process (see
+        # backend/transform_stage.py). It gets the source's settings, not its
+        # HTTP connection or fetch caches, which stay with the fetching process.
+        state = self.__dict__.copy()
+        for key in ("_http_client", "_records_cache", "_sites_cache", "_counts_cache"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._http_client = RESTClient(base_url="")
+        self._records_cache = {}
+        self._sites_cache = _FETCH_UNSET
+        self._counts_cache = _FETCH_UNSET
+
+    def _fetch_records(self, site_record, latest: bool = False):
         """get_records() with optional caching (see _fetch_cache_enabled). Keyed
-        by the site ids requested so repeated chunks reuse the same fetch."""
+        by the site ids requested so repeated chunks reuse the same fetch.
+        *latest* selects the latest-only fetch plan (get_latest_records)."""
+        def fetch():
+            records = self._get_provider_records(site_record, latest)
+            self._note_fetched(records)
+            return self._slim_records(records)
+
         if not self._fetch_cache_enabled:
-            return self.get_records(site_record)
+            return fetch()
         sites = site_record if isinstance(site_record, list) else [site_record]
-        key = tuple(sorted(str(getattr(s, "id", s)) for s in sites))
+        key = (latest,) + tuple(sorted(str(getattr(s, "id", s)) for s in sites))
         if key not in self._records_cache:
-            self._records_cache[key] = self.get_records(site_record)
+            self._records_cache[key] = self._shared_fetch("records", key, fetch)
         return self._records_cache[key]
 
+    def _note_fetched(self, records, request: bool = True) -> None:
+        """Count a page of *records* just fetched from the provider; *request*
+        when it is the first page of a request."""
+        note_fetched(records)
+        n = len(records) if records else 0
+        size = sampled_sizeof(records) if n else 0
+        years = count_years(self, records) if n and self._counts_years() else None
+        with _FETCH_STATS_LOCK:
+            stats = self.fetch_stats
+            stats["requests"] += int(request)
+            stats["pages"] += 1
+            stats["records"] += n
+            stats["bytes"] += size
+            if years:
+                for year, k in years.items():
+                    self.fetch_years[year] = self.fetch_years.get(year, 0) + k
+
+    def _note_requests(self, n: int) -> None:
+        """Count *n* more requests (e.g. time windows of one chunk)."""
+        with _FETCH_STATS_LOCK:
+            self.fetch_stats["requests"] += n
+
+    def _counts_years(self) -> bool:
+        config = getattr(self, "config", None)
+        return (
+            getattr(self, "supports_time_windows", False)
+            and config is not None
+            and bool(getattr(config, "time_window_records", 0))
+        )
+
+    def _iter_provider_pages(self, site_record, latest: bool = False) -> Iterator[list]:
+        """iter_records(), fanned out over time windows where the chunk
+        calls for it (see backend/time_windows.py)."""
+        windows = None if latest else plan_windows(self, site_record)
+        if windows:
+            return iter_windowed_pages(self, site_record, windows)
+        return self.iter_records(site_record, latest=latest)
+
+    def _get_provider_records(self, site_record, latest: bool = False) -> list:
+        """get_records() (get_latest_records() when *latest*), fanned out
+        over time windows like _iter_provider_pages."""
+        windows = None if latest else plan_windows(self, site_record)
+        if windows:
+            return [r for page in iter_windowed_pages(self, site_record, windows) for r in page]
+        return self.get_latest_records(site_record) if latest else self.get_records(site_record)
+
+    def _shared_fetch(self, kind: str, key: tuple, fetch: Callable):
+        """``fetch()`` through the process-wide fetch cache, so another
+        instance of this source with the same query settings reuses it (see
+        backend/fetch_cache.py). The transform_state the fetch sets travels
+        with the cached result."""
+        max_bytes = self._shared_cache_bytes()
+        if not max_bytes:
+            return fetch()
+
+        names = getattr(self, "transform_state", ())
+
+        def _fetch_with_state():
+            value = fetch()
+            return value, {name: getattr(self, name, None) for name in names}
+
+        shared_key = self._shared_key(kind, key)
+        value, state = shared_fetch_cache().get_or_fetch(shared_key, _fetch_with_state, max_bytes)
+        for name, v in state.items():
+            setattr(self, name, v)
+        return value
+
+    def _shared_cache_bytes(self) -> int:
+        config = getattr(self, "config", None)
+        return int(getattr(config, "fetch_cache_bytes", 0) or 0) if config is not None else 0
+
+    def _shared_key(self, kind: str, key: tuple) -> tuple:
+        return (
+            type(self).__module__,
+            type(self).__qualname__,
+            kind,
+            config_fingerprint(self.config),
+            tuple(repr(getattr(self, name, None)) for name in self.fetch_state),
+            key,
+        )
+
+    def _iter_fetched_pages(self, site_record, latest: bool = False, cached: bool = True) -> Iterator[list]:
+        """The chunk's slimmed records as a sequence of non-empty pages.
+
+        Streams iter_records() when the source supports it and the shared-fetch
+        cache is not in play (a cached fetch has to be materialized anyway, so
+        it stays one _fetch_records() list). ``cached=False`` bypasses the
+        cache, as the latest-only full-history refetch does."""
+        if self.streams_records and not self._fetch_cache_enabled:
+            first = True
+            for page in self._iter_provider_pages(site_record, latest=latest):
+                if page:
+                    self._note_fetched(page, request=first)
+                    first = False
+                    yield self._slim_records(page)
+            return
+        if cached:
+            records = self._fetch_records(site_record, latest=latest)
+        else:
+            records = self._get_provider_records(site_record, latest)
+            self._note_fetched(records)
+            records = self._slim_records(records)
+        if records:
+            yield records
+
+    def _slim_records(self, records):
+        """Drop the parts of raw provider payloads nothing downstream reads, as
+        soon as they are fetched (see ``record_fields``)."""
+        fields = getattr(self, "record_fields", None)
+        if fields is None or not isinstance(records, list):
+            return records
+        return slim_records(records, fields)
+
     @property
     def tag(self):
         return self.__class__.__name__.lower()
@@ -271,6 +553,20 @@ class BaseSource:
     def get_records(self, *args, **kw) -> List[Dict]:
         raise NotImplementedError(f"get_records not implemented by {self.__class__.__name__}")
 
+    def get_latest_records(self, *args, **kw) -> List[Dict]:
+        """Latest-only fetch plan (Config.latest_only): the records a site's
+        latest summary value can be picked from, without its full history.
+        Defaults to the full fetch for sources with no cheaper plan."""
+        return self.get_records(*args, **kw)
+
+    def iter_records(self, site_record, latest: bool = False) -> Iterator[List[Dict]]:
+        """get_records() (or get_latest_records() when *latest*) one page at a
+        time. Streaming connectors override this and set ``streams_records``;
+        their get_records() is then the pages concatenated."""
+        records = self.get_latest_records(site_record) if latest else self.get_records(site_record)
+        if records:
+            yield records
+
     def health(self) -> bool:
         raise NotImplementedError(f"test not implemented by {self.__class__.__name__}")
 
@@ -278,6 +574,17 @@ class BaseSource:
 class BaseSiteSource(BaseSource):
     chunk_size = 1
     bounding_polygon = None
+    # get_records accepts ``tile=(x1, y1, x2, y2)`` and restricts the site
+    # query to that bbox, so discovery can be tiled (Config.site_tiles)
+    supports_tiles = False
+    # The site query filters by config.parameter (e.g. WQP's characteristic
+    # names). The site catalog shares the discovery of a source that does not
+    # across parameters (see backend/site_catalog.py).
+    sites_by_parameter = False
+    # iter_site_records yields the site query's pages as they are downloaded,
+    # so discovery can feed the chunk planner before its last page arrives
+    # (Config.stream_sites)
+    streams_sites = False
 
     @property
     def tag(self):
@@ -296,19 +603,140 @@ class BaseSiteSource(BaseSource):
         return True
 
     def read(self, *args, **kw) -> List[SiteRecord] | None:
-        if self._fetch_cache_enabled and self._sites_cache is not _FETCH_UNSET:
-            return self._sites_cache
+        if not self._fetch_cache_enabled:
+            return self._read_sites()
+        if self._sites_cache is _FETCH_UNSET:
+            self._sites_cache = self._shared_fetch("sites", (), self._read_sites)
+        return self._sites_cache
+
+    def _read_sites(self) -> List[SiteRecord] | None:
+        """The discovered sites, through the site catalog when
+        Config.site_catalog_dir is set."""
+        catalog = SiteCatalog.for_source(self)
+        if catalog is None:
+            return self._discover_sites()
+        return catalog.read(self, self._discover_sites)
+
+    def _discover_sites(self) -> List[SiteRecord] | None:
         self.log("Gathering site records")
-        records = self.get_records()
-        if records:
-            self.log(f"total records={len(records)}")
-            result: List[SiteRecord] | None = self._transform_sites(records)
+        st = time.perf_counter()
+        records, tiled = self._get_site_records()
+        # server latency of the site query, to compare spatial filter plans
+        # (see Config.pushdown_wkt)
+        elapsed = time.perf_counter() - st
+        if not records:
+            self.warn("No site records returned")
+            return None
+        self.log(f"total records={len(records)} fetched in {elapsed:.2f}s")
+        result = self._transform_sites(records)
+        if tiled:
+            # a site on a shared tile edge is returned by both tiles
+            n = len(result)
+            result = dedupe_by_id(result, lambda site: site.id)
+            if n != len(result):
+                self.log(f"dropped {n - len(result)} sites repeated across tile edges")
+        return result
+
+    def iter_sites(self) -> Iterator[List[SiteRecord]]:
+        """The sites read() returns, one page of the site query at a time.
+
+        A source with ``streams_sites`` yields each page transformed as soon
+        as it is downloaded. Otherwise — and when the sites are cached, come
+        from the site catalog or are tiled — read()'s sites are one page. The
+        pages concatenated are read()'s sites: _transform_sites keeps or drops
+        each record on its own."""
+        config = getattr(self, "config", None)
+        if (
+            not self.streams_sites
+            or self._sites_cache is not _FETCH_UNSET
+            or bool(getattr(config, "site_catalog_dir", ""))
+            or self._tile_grid()
+        ):
+            whole = self.read()
+            if whole:
+                yield whole
+            return
+
+        max_bytes = self._shared_cache_bytes() if self._fetch_cache_enabled else 0
+        shared_key = self._shared_key("sites", ()) if max_bytes else None
+        if shared_key is not None:
+            cached = shared_fetch_cache().get(shared_key)
+            if cached is not None:
+                self._sites_cache = cached[0]
+                if cached[0]:
+                    yield cached[0]
+                return
+
+        self.log("Gathering site records")
+        st = time.perf_counter()
+        sites: List[SiteRecord] = []
+        nrecords = 0
+        for records in self.iter_site_records():
+            nrecords += len(records)
+            page = self._transform_sites(records)
+            if page:
+                sites.extend(page)
+                yield page
+        if nrecords:
+            self.log(f"total records={nrecords} fetched in {time.perf_counter() - st:.2f}s")
         else:
             self.warn("No site records returned")
-            result = None
+        # only a discovery run to the end is what read() would have returned
         if self._fetch_cache_enabled:
-            self._sites_cache = result
-        return result
+            self._sites_cache = sites if nrecords else None
+            if shared_key is not None:
+                shared_fetch_cache().put(shared_key, (self._sites_cache, {}), max_bytes)
+
+    def iter_site_records(self, tile=None) -> Iterator[List[Dict]]:
+        """get_records() one page at a time. Connectors that page their site
+        query override this and set ``streams_sites``."""
+        records = self.get_records() if tile is None else self.get_records(tile=tile)
+        if records:
+            yield records
+
+    def _tile_grid(self) -> int:
+        """Config.site_tiles when discovery is tiled, else 0."""
+        config = getattr(self, "config", None)
+        n = getattr(config, "site_tiles", 0) if config else 0
+        return n if n and self.supports_tiles and self._tile_bounds() else 0
+
+    def _get_site_records(self) -> tuple:
+        """``(records, tiled)``: the raw site records, fetched as one query or,
+        when Config.site_tiles is set and the source supports it, as a grid of
+        tiles queried concurrently (see backend/tiling.py)."""
+        n = self._tile_grid()
+        bounds = self._tile_bounds() if n else None
+        if not bounds:
+            return self.get_records(), False
+
+        config = self.config
+        workers = max(1, int(config.fetch_workers or 1))
+        tiles, stats = plan_tiles(
+            bounds,
+            n,
+            count=self.count_tile_records,
+            max_count=config.tile_max_sites,
+            max_depth=config.tile_max_depth,
+            workers=workers,
+        )
+        self.log(
+            f"tiled discovery: {stats['tiles']} tiles from a {n}x{n} grid "
+            f"(split depth {stats['depth']}, {stats['probes']} count probes)"
+        )
+        return fetch_tiles(tiles, lambda tile: self.get_records(tile=tile), workers), True
+
+    def _tile_bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        if self.config.has_bounds():
+            return self.config.bbox_bounding_points()
+        if self.bounding_polygon is not None:
+            return self.bounding_polygon.bounds
+        return None
+
+    def count_tile_records(self, tile) -> Optional[int]:
+        """Number of sites ``get_records(tile=tile)`` would return, from a count
+        endpoint, used to size tiles by site density. Over-counting is fine;
+        ``0`` drops the tile. The default None keeps the initial grid."""
+        return None
 
     def _transform_sites(self, records: list) -> List[SiteRecord]:
         transformed_records: List[SiteRecord] = []
@@ -331,11 +759,89 @@ class BaseSiteSource(BaseSource):
 
 class BaseParameterSource(BaseSource):
     name = ""
+    # Fields of a raw get_records() record that the extract/clean/transform
+    # steps read, as a tuple of keys or a {key: nested spec} dict (see
+    # slim_records). Fetched records are projected to these right away, so
+    # unused provider columns/entities are not held until the persister is
+    # flushed. None keeps records whole.
+    record_fields: Union[tuple[str, ...], dict, None] = None
+    # How a fetched record names its site, for splitting a multi-site chunk
+    # into per-site lists: a record key, or a callable taking the record. The
+    # chunk is grouped in one pass (_group_records) instead of being scanned
+    # once per site. None: single-site chunks use every record, larger chunks
+    # need an _extract_site_records override.
+    site_id_field: Union[str, Callable, None] = None
+    # _clean_records keeps or drops each record on its own, so a streamed
+    # chunk can be cleaned page by page. False when cleaning compares records
+    # with each other (e.g. WQP's TDS duplicate activities): the site's raw
+    # records are then gathered from every page and cleaned once.
+    record_local_clean = True
+    # The record key, dotted path or callable that orders records for the
+    # summary's earliest/latest pick (what _extract_terminal_record passes to
+    # get_terminal_record). When set, summary reads fold each page into a
+    # SummaryAccumulator instead of keeping every site's records until the
+    # chunk is read. None keeps the list summarizer (_summarize_records).
+    terminal_key: Union[str, Callable, None] = None
+    # A timeseries record's parameter_value is exactly the converted result
+    # the summary statistics are computed from (same cleaning, same parse, same
+    # conversion), so read_both can summarize the transformed timeseries rows
+    # instead of converting every observation a second time. Needs a
+    # terminal_key. False where the two differ, e.g. nmenv DWB, which counts a
+    # non-detect as 0 in summaries but keeps its text in timeseries.
+    summary_from_timeseries = False
+    # Attributes the fetch sets and the transform reads (e.g. a source
+    # parameter name looked up with the first request). A transform worker
+    # process holds a copy of the source made before any fetch, so these are
+    # sent along with every chunk (see backend/transform_stage.py).
+    transform_state: tuple = ()
+    # The provider query follows incremental.fetch_start_dt and fetch_until,
+    # so a chunk can be fetched as several time windows (see
+    # backend/time_windows.py).
+    supports_time_windows = False
 
     def __init__(self, transformer=None, validator: Optional[RecordValidator] = None, http_client=None):
         super().__init__(transformer=transformer, http_client=http_client)
         self._validator = validator if validator is not None else _SubclassValidatorShim(self)
         self._summarizer = RecordSummarizer(self)
+        # requests issued by count_records, reported by the unifier's pre-filter
+        self.count_requests = 0
+        # per-thread site index of the chunk being read (see _group_records);
+        # fetch workers read different chunks through the same source
+        self._groups = threading.local()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("_groups", None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._groups = threading.local()
+
+    def count_records(self, site_records: list) -> Optional[dict]:
+        """Cheap per-site observation counts used to drop empty sites before
+        fetching (see backend/unifier.py:_prefilter_sites).
+
+        Return ``{str(site id): count}`` from a count/summary endpoint that
+        applies the same parameter and date scope as ``get_records``; a site
+        missing from the dict counts as zero. The default ``None`` means the
+        source has no probe cheaper than its fetch, so every site is fetched as
+        before. Implementations must err toward over-counting: a site dropped
+        here is never fetched."""
+        return None
+
+    def _count_records(self, site_records: list) -> Optional[dict]:
+        """count_records() with optional caching (see _fetch_cache_enabled).
+        Sharing the counts keeps the kept-site list, and so the chunk keys of
+        _records_cache, identical across the passes of a shared fetch."""
+        if not self._fetch_cache_enabled:
+            return self.count_records(site_records)
+        if self._counts_cache is _FETCH_UNSET:
+            key = tuple(str(s.id) for s in site_records)
+            self._counts_cache = self._shared_fetch(
+                "counts", key, lambda: self.count_records(site_records)
+            )
+        return cast(Optional[dict], self._counts_cache)
 
     def _extract_earliest_record(self, records: list) -> dict:
         return self._extract_terminal_record(records, position=EARLIEST)
@@ -350,87 +856,337 @@ class BaseParameterSource(BaseSource):
             return cast("List[ParameterRecord | SummaryRecord] | None", self.read_summary(site_record, start_ind, end_ind))
         return cast("List[ParameterRecord | SummaryRecord] | None", self.read_timeseries(site_record))
 
-    def read_summary(self, site_record: SiteRecord | list, start_ind: int, end_ind: int) -> List[SummaryRecord] | None:
+    def fetch_pages(self, site_record: SiteRecord | list) -> list:
+        """The chunk's fetched pages, for reading them elsewhere: the read_*
+        methods take them as *pages* instead of fetching (see
+        backend/transform_stage.py)."""
+        return list(self._iter_fetched_pages(site_record))
+
+    def read_both(self, site_record: SiteRecord | list, start_ind: int, end_ind: int, pages: Optional[Iterable[list]] = None, resume: Optional[dict] = None, seen: Optional[dict] = None) -> tuple:
+        """``(read_summary(...), read_timeseries(...))`` for a chunk, whatever
+        config.output_summary is set to.
+
+        With ``summary_from_timeseries`` each observation is extracted, cleaned
+        and transformed once: the timeseries rows are kept and folded into the
+        site's SummaryAccumulator as they are made. Otherwise (or for a
+        latest-only summary) the chunk is read twice, once per mode; enable the
+        shared-fetch cache so the second read does not refetch.
+
+        *pages* are the chunk's already fetched pages (fetch_pages); None
+        fetches them.
+
+        *resume* (``{site id: SummaryAccumulator}``, summary_from_timeseries
+        only) continues earlier reads of the sites (see backend/incremental.py):
+        records already read are skipped, the rest are folded into the site's
+        accumulator, and only their rows are returned. Accumulators of sites
+        read for the first time are added to it. *seen* (``{site id:
+        Counter}``) counts the rows already read by row_key; a fetched record
+        whose row is counted there uses up one count and is skipped. A record
+        without a row is skipped unless it sorts after the accumulator's
+        latest."""
+        if resume is not None and not self.supports_resume():
+            raise ValueError(f"{self} cannot resume a read")
+        if not self.summary_from_timeseries or self.terminal_key is None or getattr(self.config, "latest_only", False):
+            kw = {} if pages is None else {"pages": pages}
+            with output_mode(False):
+                series = self.read_timeseries(site_record, **kw)
+            with output_mode(True):
+                return self.read_summary(site_record, start_ind, end_ind, **kw), series
+
+        if isinstance(site_record, list):
+            self.log(f"Gathering {self.name} summary and timeseries for {len(site_record)} sites. {start_ind}-{end_ind}")
+        else:
+            self.log(f"{site_record.id}: Gathering {self.name} data")
+
+        sites = site_record if isinstance(site_record, list) else [site_record]
+        summarizer = self._summarizer
+        transformed: dict = {}
+        pending: dict = {}
+
+        # a resumed site's watermark, taken before anything new is folded in
+        marks: dict = {}
+        if resume:
+            for site in sites:
+                acc = resume.get(site.id)
+                if acc is not None and acc.latest is not None:
+                    marks[id(site)] = acc.key(acc.latest)
+
+        def _transform(site, cleaned):
+            mark = marks.get(id(site))
+            if mark is None:
+                rows = self._transform_parameter_records(site, cleaned)
+            else:
+                cleaned, rows = self._unread(site, cleaned, resume[site.id].key, mark, seen.get(site.id) if seen else None)
+                if not cleaned:
+                    return
+            transformed.setdefault(id(site), []).extend(rows)
+            acc = pending.get(id(site))
+            if acc is None:
+                acc = resume.get(site.id) if resume is not None else None
+                if acc is None:
+                    acc = summarizer.start()
+                    if resume is not None:
+                        resume[site.id] = acc
+                pending[id(site)] = acc
+            summarizer.accumulate_transformed(acc, site, cleaned, rows)
+
+        if pages is None:
+            pages = self._iter_fetched_pages(site_record)
+        with output_mode(False):
+            found = self._consume_pages(pages, sites, _transform)
+        if found is None:
+            names = [str(r.id) for r in sites]
+            self.warn(f"{','.join(names)}: No records found")
+            return None, None
+
+        summaries: list = []
+        timeseries: list = []
+        with output_mode(True):
+            for site in sites:
+                if id(site) not in found:
+                    self.warn(f"{site.id}: No records found")
+                    continue
+                if id(site) not in pending:
+                    if id(site) not in marks:
+                        self.warn(f"{site.id} No clean records found")
+                    continue
+                summary = summarizer.finish(site, pending[id(site)])
+                if summary is not None:
+                    summaries.append(summary)
+                rows = transformed[id(site)]
+                if not rows:
+                    self.warn(f"{site.id}: No clean records found")
+                    continue
+                timeseries.append((site, sorted(rows, key=self._sort_func)))
+        return summaries, timeseries
+
+    def _unread(self, site, cleaned: list, key: Callable, mark, seen) -> tuple:
+        """``(records, rows)`` of a resumed site's *cleaned* records that are
+        not yet read (see read_both's *resume*). Terminal keys can be coarser
+        than the records (WQP's is a date), so records are matched on their
+        rows, not skipped by the watermark *mark*."""
+        transformer = self.transformer
+        records = []
+        rows = []
+        for record in cleaned:
+            row = transformer.do_transform(self._extract_parameter(record), site)
+            if row is None:
+                if key(record) > mark:
+                    records.append(record)
+                continue
+            if seen:
+                k = row_key(row)
+                if seen.get(k):
+                    seen[k] -= 1
+                    continue
+            records.append(record)
+            rows.append(row)
+        return records, rows
+
+    def supports_resume(self) -> bool:
+        """Whether read_both can continue from earlier reads (its *resume*):
+        the summary has to be folded from the timeseries rows."""
+        return (
+            self.summary_from_timeseries
+            and self.terminal_key is not None
+            and not getattr(self.config, "latest_only", False)
+        )
+
+    def read_summary(self, site_record: SiteRecord | list, start_ind: int, end_ind: int, pages: Optional[Iterable[list]] = None) -> List[SummaryRecord] | None:
         if isinstance(site_record, list):
             self.log(f"Gathering {self.name} summary for {len(site_record)} sites. {start_ind}-{end_ind}")
         else:
             self.log(f"{site_record.id}: Gathering {self.name} data")
 
-        all_records = self._fetch_records(site_record)
-        if not all_records:
-            names = [str(r.id) for r in site_record] if isinstance(site_record, list) else [str(site_record.id)]
+        latest = bool(getattr(self.config, "latest_only", False))
+        is_list = isinstance(site_record, list)
+        sites: list = site_record if isinstance(site_record, list) else [site_record]
+
+        if pages is None:
+            pages = self._iter_fetched_pages(site_record, latest=latest)
+        found, pending = self._summarize_pages(pages, sites)
+        if found is None:
+            names = [str(r.id) for r in sites]
             self.warn(f"{','.join(names)}: No records found")
             return None
 
-        if not isinstance(site_record, list):
-            site_record = [site_record]
-
-        ret = []
-        for site in site_record:
-            site_records = self._extract_site_records(all_records, site)
-            if not site_records:
+        results = {}
+        retry = []
+        for site in sites:
+            if id(site) not in found:
                 self.warn(f"{site.id}: No records found")
                 continue
-            cleaned = self._clean_records(site_records)
-            if not cleaned:
-                self.warn(f"{site.id} No clean records found")
-                continue
-            result = self._summarize_records(site, cleaned)
+            cleaned = pending.get(id(site))
+            result = self._finish_summary(site, cleaned) if cleaned is not None else None
             if result is not None:
-                ret.append(result)
-        return ret
+                results[id(site)] = result
+            elif latest:
+                # the latest observations had no usable value; an older one may,
+                # so summarize this site from its full history instead
+                retry.append(site)
+            elif cleaned is None:
+                self.warn(f"{site.id} No clean records found")
 
-    def read_timeseries(self, site_record: SiteRecord | list) -> List[ParameterRecord] | None:
+        if retry:
+            self.log(f"Latest-only fetch unusable for {len(retry)} sites; fetching full history")
+            _, pending = self._summarize_pages(self._iter_fetched_pages(retry if is_list else retry[0], cached=False), retry)
+            for site in retry:
+                cleaned = pending.get(id(site))
+                if cleaned is None:
+                    self.warn(f"{site.id} No clean records found")
+                    continue
+                result = self._finish_summary(site, cleaned)
+                if result is not None:
+                    results[id(site)] = result
+
+        if latest:
+            for result in results.values():
+                if isinstance(result, SummaryRecord):
+                    result.update(**dict.fromkeys(LATEST_ONLY_BLANK))
+        return [results[id(site)] for site in sites if id(site) in results]
+
+    def _summarize_pages(self, pages, sites: list) -> tuple:
+        """``(found, pending)``: consume a chunk's pages for a summary read.
+        *found* is as for _consume_pages; *pending* maps the ``id()`` of each
+        site with clean records to what _finish_summary turns into its summary.
+
+        With a ``terminal_key`` that is a SummaryAccumulator fed page by page,
+        so observations are dropped as soon as they are folded in and memory
+        scales with the number of sites; otherwise the site's cleaned records,
+        summarized as one list."""
+        pending: dict = {}
+        if self.terminal_key is None:
+            def _collect(site, cleaned):
+                pending.setdefault(id(site), []).extend(cleaned)
+
+            return self._consume_pages(pages, sites, _collect), pending
+
+        summarizer = self._summarizer
+
+        def _accumulate(site, cleaned):
+            acc = pending.get(id(site))
+            if acc is None:
+                acc = pending[id(site)] = summarizer.start()
+            summarizer.accumulate(acc, site, cleaned)
+
+        return self._consume_pages(pages, sites, _accumulate), pending
+
+    def _finish_summary(self, site, pending):
+        if isinstance(pending, SummaryAccumulator):
+            return self._summarizer.finish(site, pending)
+        return self._summarize_records(site, pending)
+
+    def read_timeseries(self, site_record: SiteRecord | list, pages: Optional[Iterable[list]] = None) -> Optional[list]:
         if isinstance(site_record, list):
             self.log(f"Gathering {self.name} timeseries for {len(site_record)} sites")
         else:
             self.log(f"{site_record.id}: Gathering {self.name} data")
 
-        all_records = self._fetch_records(site_record)
-        if not all_records:
-            names = [str(r.id) for r in site_record] if isinstance(site_record, list) else [str(site_record.id)]
+        sites = site_record if isinstance(site_record, list) else [site_record]
+
+        # records are transformed page by page, so only the transformed rows
+        # of a streamed chunk are held until the sites are sorted
+        transformed: dict = {}
+
+        def _transform(site, cleaned):
+            transformed.setdefault(id(site), []).extend(self._transform_parameter_records(site, cleaned))
+
+        if pages is None:
+            pages = self._iter_fetched_pages(site_record)
+        found = self._consume_pages(pages, sites, _transform)
+        if found is None:
+            names = [str(r.id) for r in sites]
             self.warn(f"{','.join(names)}: No records found")
             return None
 
-        if not isinstance(site_record, list):
-            site_record = [site_record]
-
         ret = []
-        for site in site_record:
-            site_records = self._extract_site_records(all_records, site)
-            if not site_records:
+        for site in sites:
+            if id(site) not in found:
                 self.warn(f"{site.id}: No records found")
                 continue
-            cleaned = self._clean_records(site_records)
-            if not cleaned:
+            if id(site) not in transformed:
                 self.warn(f"{site.id} No clean records found")
                 continue
-            result = self._build_timeseries_records(site, cleaned)
-            if result is not None:
-                ret.append(result)
+            rows = transformed[id(site)]
+            if not rows:
+                self.warn(f"{site.id}: No clean records found")
+                continue
+            ret.append((site, sorted(rows, key=self._sort_func)))
         return ret
 
+    def _consume_pages(self, pages, sites: list, sink: Callable) -> Optional[set]:
+        """Split each fetched page by site and hand every site's cleaned
+        records to ``sink(site, cleaned)`` — once per page, or once at the end
+        when cleaning is not record-local (see ``record_local_clean``).
+
+        Returns the ``id()`` of every site that had any records, or None when
+        no page had any records at all."""
+        found: set = set()
+        deferred: Optional[dict] = None if self.record_local_clean else {}
+        any_page = False
+        try:
+            for page in pages:
+                any_page = True
+                for site in sites:
+                    site_records = self._extract_site_records(page, site)
+                    if not site_records:
+                        continue
+                    found.add(id(site))
+                    if deferred is not None:
+                        deferred.setdefault(id(site), []).extend(site_records)
+                        continue
+                    cleaned = self._clean_records(site_records)
+                    if cleaned:
+                        sink(site, cleaned)
+                self._forget_groups()
+        finally:
+            self._forget_groups()
+        if deferred:
+            for site in sites:
+                held = deferred.get(id(site))
+                if held:
+                    cleaned = self._clean_records(held)
+                    if cleaned:
+                        sink(site, cleaned)
+        return found if any_page else None
+
     def _summarize_records(self, site, cleaned: list):
         return self._summarizer.summarize(site, cleaned)
 
-    def _build_timeseries_records(self, site, cleaned: list):
+    def _transform_parameter_records(self, site, cleaned: list) -> list:
         records = []
         for record in cleaned:
             transformed = self.transformer.do_transform(self._extract_parameter(record), site)
             if transformed is not None:
                 records.append(transformed)
-        if not records:
-            self.warn(f"{site.id}: No clean records found")
-            return None
-        return (site, sorted(records, key=self._sort_func))
+        return records
 
     def _get_output_units(self) -> str:
         raise NotImplementedError(f"{self.__class__.__name__} Must implement _get_output_units")
 
     def _extract_site_records(self, records: list[dict], site_record) -> list:
+        if self.site_id_field is not None:
+            return self._group_records(records).get(site_record.id, [])
         if site_record.chunk_size == 1:
             return records
-        raise NotImplementedError(f"{self.__class__.__name__} Must implement _extract_site_records")
+        raise NotImplementedError(f"{self.__class__.__name__} Must implement _extract_site_records or set site_id_field")
+
+    def _group_records(self, records: list) -> dict:
+        """``{site id: [records]}`` for a fetched chunk, in fetch order, built
+        in one pass and reused for every site of the chunk."""
+        groups = self._groups
+        if getattr(groups, "records", None) is not records:
+            key = self.site_id_field
+            get_id = key if callable(key) else (lambda r: r[key])
+            index: dict = {}
+            for record in records:
+                index.setdefault(get_id(record), []).append(record)
+            groups.records, groups.index = records, index
+        return groups.index
+
+    def _forget_groups(self) -> None:
+        # drop the chunk's index so its records are not kept alive past the read
+        self._groups.__dict__.clear()
 
     def _clean_records(self, records: list) -> list:
         return records
@@ -438,7 +1194,8 @@ class BaseParameterSource(BaseSource):
     def _summary_extra(self, cleaned: list) -> dict:
         """Extra fields to merge into a site's summary record. Default none;
         sources with a non-normalized source-series link (e.g. st2 SensorThings)
-        override to add a source_datastream_link."""
+        override to add a source_datastream_link. An accumulated summary keeps
+        the first page's non-empty result."""
         return {}
 
     def _extract_terminal_record(self, records, position: str):
@@ -0,0 +1,95 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Spatial filter pushdown planning.
+
+County and user-supplied WKT scopes come from full-resolution boundaries
+(``bounding_polygons._make_shape`` deliberately never simplifies them), so a
+county filter can run to tens of thousands of WKT characters. Sent verbatim it
+bloats every site query URL and makes the provider evaluate an expensive
+point-in-polygon test per candidate row.
+
+The planner instead sends the server a *covering* of the scope — a
+simplified polygon guaranteed to contain the exact one, small enough to fit a
+character budget — and leaves exactness to the local containment check in
+``BaseTransformer.contained``, which tests every site against the exact
+polygon. The server may return a few extra sites just outside the boundary;
+it can never drop one inside it.
+
+Covering construction: Douglas-Peucker simplification at tolerance ``t`` moves
+the boundary by at most ``t`` (Hausdorff distance), so buffering the simplified
+polygon outward by ``t`` contains the original. Mitred joins keep the buffer
+from adding arc vertices. Coordinates are written rounded to
+``PRECISION`` decimals, so the buffer also absorbs the rounding error.
+Tolerances are tried finest first; if none fits, the envelope (five points) is
+sent.
+"""
+import shapely
+import shapely.wkt
+from shapely.geometry import box
+
+# Decimal places written to the pushed-down WKT (~1 m at NM latitudes).
+PRECISION = 5
+# Simplification tolerances tried in order, in degrees (~100 m .. ~11 km).
+TOLERANCES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+# Slack for the rounding of the written coordinates.
+_ROUNDING_SLACK = 10 ** -PRECISION
+
+
+def to_wkt(geom) -> str:
+    return shapely.wkt.dumps(geom, rounding_precision=PRECISION, trim=True)
+
+
+def covering_geometry(geom, tolerance: float):
+    """A polygon containing *geom*, simplified at *tolerance* degrees."""
+    simplified = geom.simplify(tolerance, preserve_topology=True)
+    return simplified.buffer(
+        tolerance + _ROUNDING_SLACK, join_style="mitre", mitre_limit=2.0
+    )
+
+
+def plan_pushdown(geom, max_chars: int) -> tuple:
+    """Return ``(wkt, kind)`` for the spatial filter to send for *geom*.
+
+    *kind* is ``"exact"`` when the exact WKT already fits *max_chars*,
+    ``"simplified"`` for a simplified covering and ``"envelope"`` for the
+    bounding-box fallback. Every non-exact result contains *geom*.
+    """
+    if isinstance(geom, str):
+        geom = shapely.wkt.loads(geom)
+
+    exact = geom.wkt
+    if len(exact) <= max_chars:
+        return exact, "exact"
+
+    for tolerance in TOLERANCES:
+        wkt = to_wkt(covering_geometry(geom, tolerance))
+        if len(wkt) <= max_chars:
+            return wkt, "simplified"
+
+    x1, y1, x2, y2 = geom.bounds
+    s = _ROUNDING_SLACK
+    return to_wkt(box(x1 - s, y1 - s, x2 + s, y2 + s)), "envelope"
+
+
+def prepared(geom):
+    """*geom* with a prepared spatial index, for repeated point containment
+    tests (each ``contains`` is then O(log n) in the vertex count instead of
+    a full ring scan)."""
+    shapely.prepare(geom)
+    return geom
+
+
+# ============= EOF =============================================
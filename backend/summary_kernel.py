@@ -0,0 +1,184 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Summary statistics kernel for RecordSummarizer.
+
+Summary records are compared byte for byte between runs and products, so the
+kernel must return exactly what the original ``min(values)``, ``max(values)``
+and ``sum(values) / n`` returned — the same float objects, including which of
+``0.0`` / ``-0.0`` wins a tie. It uses those builtins (C loops, no per-record
+Python code); what made summaries linear is picking the earliest/latest
+records without sorting (source.get_terminal_record).
+
+``SummaryAccumulator`` is the streaming form, for summary reads that fold a
+site's records in page by page and drop them (see
+BaseParameterSource.terminal_key). Count, min, max and the earliest/latest
+records are exactly what the list kernel picks, and so is ``sum_mean``: the
+accumulator carries the running state of the builtin ``sum`` across pages
+(see running_sum), so summaries stay byte-identical to a list read. A
+Welford/Chan ``mean`` rides alongside for merging accumulators of separately
+summed parts, where it can differ from ``sum(values) / n`` in the last bits.
+"""
+import math
+import sys
+from typing import Callable, List, Optional, Tuple, Union
+
+# From 3.12 the builtin sum of floats is compensated (Neumaier), and its
+# compensation is not carried from one sum(page, start) call to the next
+_COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+
+def series_stats(values: List[float]) -> Tuple[int, float, float, float]:
+    """``(n, min, max, mean)`` of a non-empty list of floats."""
+    n = len(values)
+    return n, min(values), max(values), sum(values) / n
+
+
+def running_sum(total: Union[int, float], comp: float, values: list) -> Tuple[Union[int, float], float]:
+    """Fold *values* into the state ``(total, comp)`` of a builtin ``sum``
+    started at ``(0, 0.0)``, so that ``sum_result(*state)`` of the pages fed in
+    order is ``sum(all values)``, the same float object bits included."""
+    if not _COMPENSATED_SUM:
+        return sum(values, total), comp
+    # mirrors CPython's sum: ints are added exactly until the first float,
+    # later ints are added without compensation
+    for x in values:
+        if type(total) is int:
+            total = total + x
+        elif type(x) is int:
+            total += float(x)
+        else:
+            t = total + x
+            if abs(total) >= abs(x):
+                comp += (total - t) + x
+            else:
+                comp += (x - t) + total
+            total = t
+    return total, comp
+
+
+def sum_result(total: Union[int, float], comp: float) -> Union[int, float]:
+    """The value ``sum`` returns for the running state ``(total, comp)``."""
+    if comp and math.isfinite(comp):
+        return total + comp
+    return total
+
+
+def terminal_key_func(tag: Union[str, Callable]) -> Callable:
+    """Sort key for a terminal-record tag: a callable, a record key, or a
+    dotted path into nested dicts (``"attributes.dateTime"``)."""
+    if callable(tag):
+        return tag
+    if "." in tag:
+        path = tag.split(".")
+
+        def by_path(x):
+            for t in path:
+                x = x[t]
+            return x
+
+        return by_path
+
+    def by_key(x):
+        return x[tag]
+
+    return by_key
+
+
+class SummaryAccumulator:
+    """Running summary of one site's series that can be fed page by page and
+    merged with the accumulator of a later part of the same series.
+
+    Values (converted results) and records (cleaned source records, for the
+    earliest/latest pick) are folded separately, since a record whose result
+    fails to convert still counts for earliest/latest. Ties follow the list
+    kernel: the first of equal minima/maxima and earliest records, the last of
+    equal latest records. Pages must be added, and accumulators merged, in
+    series order.
+
+    ``sum_mean`` is ``sum(values) / n`` exactly; ``mean`` is the Welford
+    mean, which ``merge`` combines.
+
+    ``skipped`` (results that failed to convert) and ``extra`` (the first
+    non-empty ``_summary_extra``) ride along for RecordSummarizer.finish."""
+
+    __slots__ = ("key", "n", "min", "max", "mean", "total", "comp", "earliest", "latest", "skipped", "extra")
+
+    def __init__(self, key: Union[str, Callable]):
+        self.key = terminal_key_func(key)
+        self.n = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.mean = 0.0
+        self.total: Union[int, float] = 0
+        self.comp = 0.0
+        self.earliest = None
+        self.latest = None
+        self.skipped: list = []
+        self.extra: dict = {}
+
+    def add_values(self, values: List[float]) -> None:
+        if values:
+            self.total, self.comp = running_sum(self.total, self.comp, values)
+            self._combine(*series_stats(values))
+
+    @property
+    def sum_mean(self) -> float:
+        """``sum(values) / n`` of every value added, as the list kernel has it."""
+        return sum_result(self.total, self.comp) / self.n
+
+    def add_records(self, records: list) -> None:
+        if records:
+            key = self.key
+            self._terminals(min(records, key=key), max(reversed(records), key=key))
+
+    def merge(self, other: "SummaryAccumulator") -> "SummaryAccumulator":
+        """Fold in *other*, which summarizes records that come after this
+        one's."""
+        if other.n:
+            # other's sum was started at 0, so the running sum is only
+            # approximately that of the concatenated series
+            self.total, self.comp = running_sum(self.total, self.comp, [sum_result(other.total, other.comp)])
+            assert other.min is not None and other.max is not None
+            self._combine(other.n, other.min, other.max, other.mean)
+        if other.earliest is not None:
+            self._terminals(other.earliest, other.latest)
+        self.skipped.extend(other.skipped)
+        if not self.extra:
+            self.extra = other.extra
+        return self
+
+    def _combine(self, n: int, lo: float, hi: float, mean: float) -> None:
+        if self.min is None or self.max is None:
+            self.n, self.min, self.max, self.mean = n, lo, hi, mean
+            return
+        total = self.n + n
+        # Chan et al. pairwise update of Welford's running mean
+        self.mean += (mean - self.mean) * n / total
+        self.n = total
+        if lo < self.min:
+            self.min = lo
+        if hi > self.max:
+            self.max = hi
+
+    def _terminals(self, earliest, latest) -> None:
+        key = self.key
+        if self.earliest is None or key(earliest) < key(self.earliest):
+            self.earliest = earliest
+        if self.latest is None or key(latest) >= key(self.latest):
+            self.latest = latest
+
+
+# ============= EOF =============================================
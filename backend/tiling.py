@@ -0,0 +1,150 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Spatial tiling for site discovery (Config.site_tiles).
+
+Statewide site discovery is otherwise one long paginated stream per provider
+(NWIS cursor pages, OSE POD offsets, SensorThings ``@iot.nextLink``), fetched
+strictly page after page. Splitting the scope into a grid of tiles turns it
+into independent queries that run concurrently.
+
+Tile sizes adapt to site density: when the source can count the sites in a
+tile cheaply (BaseSiteSource.count_tile_records), tiles above
+``max_count`` are split into quadrants, level by level, and empty tiles are
+dropped — sparse desert tiles stay large, dense urban ones get small.
+
+A tile is an ``(x1, y1, x2, y2)`` lon/lat bbox. Neighbouring tiles share their
+edges and providers treat bbox filters as inclusive, so a site on an edge can
+come back from both; callers dedupe by site id, keeping the first occurrence
+in tile order. Tile order is deterministic (row-major grid, then quadrant
+order within a split tile) and does not depend on which request finishes
+first.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from backend.exceptions import PartialOrNoDataError
+
+Tile = Tuple[float, float, float, float]
+
+
+def grid_tiles(bounds: Tile, n: int) -> List[Tile]:
+    """Split *bounds* into an ``n`` x ``n`` grid, row-major from the south-west
+    corner."""
+    x1, y1, x2, y2 = bounds
+    dx = (x2 - x1) / n
+    dy = (y2 - y1) / n
+    tiles = []
+    for j in range(n):
+        for i in range(n):
+            # snap the last row/column to the exact bounds so float error never
+            # leaves a sliver uncovered
+            tx2 = x2 if i == n - 1 else x1 + (i + 1) * dx
+            ty2 = y2 if j == n - 1 else y1 + (j + 1) * dy
+            tiles.append((x1 + i * dx, y1 + j * dy, tx2, ty2))
+    return tiles
+
+
+def split_tile(tile: Tile) -> List[Tile]:
+    return grid_tiles(tile, 2)
+
+
+def tile_wkt(tile: Tile) -> str:
+    x1, y1, x2, y2 = tile
+    return f"POLYGON(({x1} {y1},{x1} {y2},{x2} {y2},{x2} {y1},{x1} {y1}))"
+
+
+def _map(fn: Callable, items: list, workers: int) -> list:
+    if workers > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            return list(pool.map(fn, items))
+    return [fn(item) for item in items]
+
+
+def plan_tiles(
+    bounds: Tile,
+    n: int,
+    count: Optional[Callable[[Tile], Optional[int]]] = None,
+    max_count: int = 2000,
+    max_depth: int = 3,
+    workers: int = 1,
+) -> Tuple[List[Tile], dict]:
+    """Return ``(tiles, stats)`` covering *bounds*.
+
+    Starts from an ``n`` x ``n`` grid. With a *count* probe, tiles with no sites
+    are dropped and tiles with more than *max_count* are split into quadrants,
+    at most *max_depth* times. A probe that returns None or fails keeps the
+    tile as is (it is fetched, never dropped)."""
+    # each tile carries its path in the split tree so the result can be put
+    # back in deterministic order after concurrent probing
+    level = [((k,), t) for k, t in enumerate(grid_tiles(bounds, n))]
+    kept = []
+    probes = 0
+    depth = 0
+    while level:
+        if count is None:
+            kept.extend(level)
+            break
+
+        def _probe(item):
+            try:
+                return count(item[1])
+            except PartialOrNoDataError:
+                return None
+
+        counts = _map(_probe, level, workers)
+        probes += len(level)
+        nxt: List[Tuple[tuple, Tile]] = []
+        for (path, tile), c in zip(level, counts):
+            if c == 0:
+                continue
+            if c is not None and c > max_count and depth < max_depth:
+                nxt.extend((path + (q,), sub) for q, sub in enumerate(split_tile(tile)))
+            else:
+                kept.append((path, tile))
+        level = nxt
+        depth += 1
+
+    kept.sort(key=lambda item: item[0])
+    tiles = [tile for _, tile in kept]
+    stats = {"grid": n * n, "tiles": len(tiles), "probes": probes, "depth": depth}
+    return tiles, stats
+
+
+def fetch_tiles(tiles: List[Tile], fetch: Callable[[Tile], list], workers: int = 1) -> list:
+    """Fetch every tile (concurrently with *workers* threads) and return the
+    records concatenated in tile order."""
+    records = []
+    for rs in _map(fetch, tiles, workers):
+        if rs:
+            records.extend(rs)
+    return records
+
+
+def dedupe_by_id(records: list, key: Callable) -> list:
+    """Drop repeats of a site returned by more than one tile, keeping the first
+    occurrence."""
+    seen = set()
+    out = []
+    for r in records:
+        k = key(r)
+        if k in seen:
+            continue
+        seen.add(k)
+        out.append(r)
+    return out
+
+
+# ============= EOF =============================================
@@ -0,0 +1,230 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Temporal fan-out of a chunk's fetch (Config.time_window_records).
+
+A chunk of long-record sites is one provider query over the whole date range,
+one stream that cannot be fetched in parallel however large it is. With
+Config.time_window_records, a source that can restrict its query to a time
+window (``supports_time_windows``: it reads incremental.fetch_start_dt and
+fetch_until) fetches a chunk expected to hold more records than that as
+several windows, Config.time_window_workers at a time, and hands their pages
+on in time order.
+
+The windows are sized from the source's observed data density: the records
+per year its last run fetched, kept in Config.fetch_history_path
+(backend/fetch_history.py) by runs with time windows on. Window edges fall on
+the quantiles of that density within the run's dates, so each window holds
+about as many records. The first window is open at the start and the last at
+the end (unless the config has dates), so the windows cover exactly what the
+chunk's single query did. A source without density history is fetched whole
+and its density recorded.
+
+Windows meet at midnight. A record the provider returns on both sides of an
+edge (e.g. SensorThings' overlaps() is inclusive) is dropped from the later
+window when it is exactly equal to one of the earlier window's records from
+its last day. Records are otherwise those of the single query, in window
+order, so a chunk's timeseries are the same. So are its summaries when the
+provider returns records in time order; otherwise a summary mean, summed in
+a different order, can differ in the last bits.
+"""
+import math
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from backend.chunk_sizing import size_key
+from backend.fetch_history import FetchHistory
+from backend.incremental import fetch_start_dt, fetch_window
+
+Window = Tuple[Optional[datetime], Optional[datetime]]
+
+_ISO_DAY = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def count_years(source, records) -> dict:
+    """*records* (raw, as fetched) per year, ``{"YYYY": n}``: the density a
+    later run sizes its windows from (see BaseSource.fetch_years)."""
+    try:
+        dates = source._extract_parameter_dates(records)
+    except (KeyError, TypeError, AttributeError, NotImplementedError):
+        return {}
+    years: dict = {}
+    for d in dates:
+        year = _day(d)[:4]
+        if year.isdigit():
+            years[year] = years.get(year, 0) + 1
+    return years
+
+
+def _day(d) -> str:
+    """``YYYY-MM-DD`` of a provider date, or what of it there is."""
+    if isinstance(d, (tuple, list)):
+        d = d[0] if d else ""
+    if isinstance(d, datetime):
+        return d.date().isoformat()
+    return str(d)[:10]
+
+
+def _density(source) -> Optional[tuple]:
+    """``(records per year, sites)`` of the source's last run with time
+    windows on, or None."""
+    config = source.config
+    path = getattr(config, "fetch_history_path", "")
+    if not path:
+        return None
+    cached = getattr(source, "_window_density", None)
+    if cached is None:
+        run = FetchHistory(path).get(size_key(config, source))
+        years = run.get("years") if run else None
+        cached = (years, run["sites"]) if run and years and run["sites"] else ()
+        source._window_density = cached
+    return cached or None
+
+
+def _year_span(year: int, start: Optional[datetime], until: Optional[datetime]) -> float:
+    """The fraction of *year* within [start, until)."""
+    lo, hi = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    a = max(lo, start) if start else lo
+    b = min(hi, until) if until else hi
+    return max((b - a) / (hi - lo), 0.0)
+
+
+def plan_windows(source, site_record) -> Optional[List[Window]]:
+    """The time windows to fetch *site_record*'s chunk in, or None to fetch
+    it whole: windows are off or not supported, there is no density history,
+    or the chunk is expected to fit in one window."""
+    config = getattr(source, "config", None)
+    if config is None:
+        return None
+    target = int(getattr(config, "time_window_records", 0) or 0)
+    if target <= 0 or not getattr(source, "supports_time_windows", False):
+        return None
+    density = _density(source)
+    if density is None:
+        return None
+    years, sites_run = density
+
+    start = fetch_start_dt(config)
+    until = config.end_dt + timedelta(days=1) if config.end_date else None
+    per_year = sorted(
+        (int(y), n * _year_span(int(y), start, until)) for y, n in years.items()
+    )
+    per_year = [(y, n) for y, n in per_year if n > 0]
+    total = sum(n for _y, n in per_year)
+    if not total:
+        return None
+
+    sites = site_record if isinstance(site_record, list) else [site_record]
+    expected = total * len(sites) / sites_run
+    n = min(math.ceil(expected / target), max(int(getattr(config, "time_window_max", 8) or 1), 1))
+    if n < 2:
+        return None
+
+    # window edges at the density's quantiles, on midnights strictly inside
+    # the run's dates
+    edges = []
+    cumulative = 0.0
+    quantiles = iter(total * k / n for k in range(1, n))
+    q = next(quantiles)
+    for year, count in per_year:
+        lo = max(datetime(year, 1, 1), start) if start else datetime(year, 1, 1)
+        hi = min(datetime(year + 1, 1, 1), until) if until else datetime(year + 1, 1, 1)
+        while q is not None and cumulative + count >= q:
+            edge = lo + (hi - lo) * ((q - cumulative) / count)
+            edge = datetime(edge.year, edge.month, edge.day)
+            if (start is None or edge > start) and (until is None or edge < until) and edge not in edges:
+                edges.append(edge)
+            q = next(quantiles, None)
+        cumulative += count
+    if not edges:
+        return None
+    bounds = [start] + edges + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_windowed_pages(source, site_record, windows: List[Window]) -> Iterator[list]:
+    """*site_record*'s pages, fetched as *windows* (plan_windows) on a thread
+    pool and yielded in window order, edge duplicates dropped.
+
+    At most Config.time_window_workers windows are fetched or waiting to be
+    taken at once; a window's pages are held until every earlier window's
+    are taken."""
+    workers = max(int(getattr(source.config, "time_window_workers", 4) or 1), 1)
+
+    def fetch(window):
+        with fetch_window(*window):
+            return [page for page in source.iter_records(site_record) if page]
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures: List[Optional[Future]] = []
+    try:
+        pending = iter(windows)
+        for window in pending:
+            futures.append(executor.submit(fetch, window))
+            if len(futures) >= workers:
+                break
+        # records of the previous window from the day before the edge
+        edge_records: set = set()
+        for k, window in enumerate(windows):
+            # taken futures are dropped, so their pages can be freed
+            future, futures[k] = futures[k], None
+            assert future is not None
+            pages = future.result()
+            nxt = next(pending, None)
+            if nxt is not None:
+                futures.append(executor.submit(fetch, nxt))
+            if k:
+                # each window past the first is a request of its own
+                source._note_requests(1)
+
+            start, until = window
+            # records from the day on either side of an edge are compared
+            first_day = start.date().isoformat() if start else None
+            last_day = (until - timedelta(days=1)).date().isoformat() if until else None
+            next_edge: set = set()
+            for page in pages:
+                days = _days(source, page)
+                if edge_records:
+                    kept = [
+                        (r, d) for r, d in zip(page, days)
+                        if (d is not None and d > first_day) or repr(r) not in edge_records
+                    ]
+                    page = [r for r, _d in kept]
+                    days = [d for _r, d in kept]
+                if last_day is not None:
+                    next_edge.update(repr(r) for r, d in zip(page, days) if d is None or d >= last_day)
+                if page:
+                    yield page
+            edge_records = next_edge
+    finally:
+        for future in futures:
+            if future is not None:
+                future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _days(source, page) -> list:
+    """Each record's ``YYYY-MM-DD``; None where the source's date cannot be
+    read off the raw record (it is then compared at every edge)."""
+    try:
+        dates = source._extract_parameter_dates(page)
+    except (KeyError, TypeError, AttributeError, NotImplementedError):
+        return [None] * len(page)
+    return [d if _ISO_DAY.fullmatch(d) else None for d in map(_day, dates)]
+
+
+# ============= EOF =============================================
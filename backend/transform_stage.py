@@ -0,0 +1,168 @@
+# ===============================================================================
+# Copyright 2024 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""Process-pool transform stage (``Config.transform_layout = "processes"``).
+
+With the default layout each fetch thread of ``_site_wrapper`` also extracts,
+cleans and transforms the chunk it fetched. That work — datetime parsing, unit
+conversion, the summary kernel — holds the GIL, so once it dominates, more
+fetch threads only wait on each other. Here the threads only fetch
+(BaseParameterSource.fetch_pages) and hand each chunk to a pool of worker
+processes, which run the usual read_* methods over the fetched pages.
+
+Each worker gets a copy of the parameter source when the pool starts (its
+settings and config, not its HTTP client or caches; see
+BaseSource.__getstate__). A chunk travels as plain data both ways: the site
+payloads and the slimmed pages out, the records' payload dicts back, rebuilt
+into records against the caller's own SiteRecords.
+"""
+import os
+import pickle
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from backend.record import ParameterRecord, SiteRecord, SummaryRecord
+
+# The worker process's copy of the parameter source (see _init_worker).
+_source = None
+
+
+def _init_worker(source_bytes: bytes) -> None:
+    global _source
+    _source = pickle.loads(source_bytes)
+
+
+def _transform_chunk(sites: list, is_list: bool, state: dict, pages: list, use_summarize: bool, combined: bool, start_ind: int, end_ind: int):
+    """Runs in a worker: read the chunk's pages and return its results as
+    payload dicts (see _pack_summaries/_pack_timeseries)."""
+    source = _source
+    assert source is not None, "transform worker was not initialized"
+    for name, value in state.items():
+        setattr(source, name, value)
+    site_records = []
+    for payload, chunk_size in sites:
+        site = SiteRecord(payload)
+        site.chunk_size = chunk_size
+        site_records.append(site)
+    site_record = site_records if is_list else site_records[0]
+
+    if combined:
+        results = source.read_both(site_record, start_ind, end_ind, pages=pages)
+    elif use_summarize:
+        results = source.read_summary(site_record, start_ind, end_ind, pages=pages)
+    else:
+        results = source.read_timeseries(site_record, pages=pages)
+    return pack_results(results, site_records, use_summarize, combined)
+
+
+def pack_results(results, sites: list, use_summarize: bool, combined: bool):
+    """A chunk's read results (see TransformStage.result) as plain data: the
+    records' payload dicts, and each timeseries site as its index in *sites*.
+    Also the form chunk checkpoints are stored in (backend/checkpoint.py)."""
+    if combined:
+        return _pack_summaries(results[0]), _pack_timeseries(results[1], sites)
+    if use_summarize:
+        return _pack_summaries(results)
+    return _pack_timeseries(results, sites)
+
+
+def unpack_results(packed, sites: list, use_summarize: bool, combined: bool):
+    """The inverse of pack_results, against the chunk's own *sites*."""
+    if combined:
+        return _unpack_summaries(packed[0]), _unpack_timeseries(packed[1], sites)
+    if use_summarize:
+        return _unpack_summaries(packed)
+    return _unpack_timeseries(packed, sites)
+
+
+def _pack_summaries(records: Optional[list]) -> Optional[list]:
+    if records is None:
+        return None
+    return [r._payload for r in records]
+
+
+def _pack_timeseries(results: Optional[list], sites: list) -> Optional[list]:
+    # sites go back as their index in the chunk, not as records
+    if results is None:
+        return None
+    index = {id(s): i for i, s in enumerate(sites)}
+    return [(index[id(site)], [r._payload for r in rows]) for site, rows in results]
+
+
+def _unpack_summaries(packed: Optional[list]) -> Optional[list]:
+    if packed is None:
+        return None
+    return [SummaryRecord(p) for p in packed]
+
+
+def _unpack_timeseries(packed: Optional[list], sites: list) -> Optional[list]:
+    if packed is None:
+        return None
+    return [(sites[i], [ParameterRecord(p) for p in rows]) for i, rows in packed]
+
+
+class TransformStage:
+    """A pool of transform worker processes for one parameter source.
+
+    submit() runs on a fetch thread: it fetches the chunk there and queues its
+    transform. result() waits for the transform and returns what
+    ``parameter_source.read`` (or ``read_both`` when *combined*) would have.
+    """
+
+    def __init__(self, parameter_source, workers: int = 0, combined: bool = False):
+        self._source = parameter_source
+        self._combined = combined
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            initializer=_init_worker,
+            initargs=(pickle.dumps(parameter_source),),
+        )
+
+    def submit(self, site_record, use_summarize: bool, start_ind: int, end_ind: int) -> tuple:
+        source = self._source
+        pages = source.fetch_pages(site_record)
+        is_list = isinstance(site_record, list)
+        sites = site_record if is_list else [site_record]
+        state = {name: getattr(source, name) for name in source.transform_state}
+        future = self._executor.submit(
+            _transform_chunk,
+            [(s._payload, s.chunk_size) for s in sites],
+            is_list,
+            state,
+            pages,
+            use_summarize,
+            self._combined,
+            start_ind,
+            end_ind,
+        )
+        return future, sites, use_summarize
+
+    def restore(self, site_record, use_summarize: bool, packed) -> tuple:
+        """A submit() handle for a chunk whose packed results are already
+        known (a checkpoint), so result() takes it like any other."""
+        future: Future = Future()
+        future.set_result(packed)
+        sites = site_record if isinstance(site_record, list) else [site_record]
+        return future, sites, use_summarize
+
+    def result(self, submitted: tuple):
+        future, sites, use_summarize = submitted
+        return unpack_results(future.result(), sites, use_summarize, self._combined)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+# ============= EOF =============================================
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
+import threading
+from contextlib import contextmanager
 from datetime import datetime, date, timedelta
 
 import shapely
@@ -29,12 +31,50 @@ from backend.constants import (
 )
 from backend.geo_utils import datum_transform, ALLOWED_DATUMS
 from backend.logger import make_logger
+from backend.spatial_pushdown import prepared
 from backend.record import (
     ParameterRecord,
     SiteRecord,
     SummaryRecord,
 )
 
+# Per-thread override of config.output_summary (see output_mode). The unifier's
+# fetch workers share one config, so a combined summary + timeseries read
+# cannot flip the config itself without racing the other workers.
+_output_mode = threading.local()
+
+
+@contextmanager
+def output_mode(summary: bool):
+    """
+    Transform parameter records as summary (True) or timeseries (False) records
+    on the current thread, whatever config.output_summary says. Used by
+    BaseParameterSource.read_both, which produces both from one read.
+
+    Parameters
+    --------
+    summary: bool
+        True for SummaryRecords, False for ParameterRecords
+    """
+    previous = getattr(_output_mode, "summary", None)
+    _output_mode.summary = summary
+    try:
+        yield
+    finally:
+        _output_mode.summary = previous
+
+
+def is_summary_output(config) -> bool:
+    """
+    Returns True if parameter records are being transformed into summary
+    records on this thread: the output_mode override if one is active,
+    otherwise config.output_summary.
+    """
+    summary = getattr(_output_mode, "summary", None)
+    if summary is None:
+        return bool(config.output_summary)
+    return summary
+
 
 def transform_horizontal_datum(
     x: int | float, y: int | float, in_datum: str, out_datum: str
@@ -338,7 +378,9 @@ class BaseTransformer:
         if config and config.has_bounds() and self.check_contained:
             wkt = config.bounding_wkt()
             if wkt not in BaseTransformer._polygon_cache:
-                BaseTransformer._polygon_cache[wkt] = shapely.wkt.loads(wkt)
+                # exact scope, prepared once: every site of every source is
+                # tested against it (the server only filtered by a covering)
+                BaseTransformer._polygon_cache[wkt] = prepared(shapely.wkt.loads(wkt))
             poly = BaseTransformer._polygon_cache[wkt]
             return poly.contains(Point(lng, lat))
 
@@ -455,7 +497,7 @@ class ParameterTransformer(BaseTransformer):
 
         rec = {}
 
-        if self.config.output_summary:
+        if is_summary_output(self.config):
             self._transform_earliest_record(record, site_record.id)
             self._transform_latest_record(record, site_record.id)
 
@@ -533,7 +575,7 @@ class ParameterTransformer(BaseTransformer):
 
 class WaterLevelTransformer(ParameterTransformer):
     def _get_record_klass(self) -> type[ParameterRecord] | type[SummaryRecord]:
-        return SummaryRecord if self.config.output_summary else ParameterRecord
+        return SummaryRecord if is_summary_output(self.config) else ParameterRecord
 
     def _get_record_type(self) -> str:
         return "waterlevels"
@@ -552,7 +594,7 @@ class WaterLevelTransformer(ParameterTransformer):
 
 class AnalyteTransformer(ParameterTransformer):
     def _get_record_klass(self) -> type[ParameterRecord] | type[SummaryRecord]:
-        return SummaryRecord if self.config.output_summary else ParameterRecord
+        return SummaryRecord if is_summary_output(self.config) else ParameterRecord
 
     def _get_record_type(self) -> str:
         return "analytes"
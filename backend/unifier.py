@@ -13,134 +13,345 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, nullcontext
 
 from backend.persisters.factory import make_persister
 from backend.exceptions import USGSRateLimitError, PartialOrNoDataError
+from backend.checkpoint import ChunkCheckpoints, chunk_key, run_key
+from backend.chunk_sizing import AdaptiveChunks, merge_results
+from backend.fetch_history import record_run
+from backend.incremental import IncrementalRead, Snapshot, supports_incremental
+from backend.memory import MemoryBudget, MemorySampler
+from backend.transform_stage import TransformStage, pack_results, unpack_results
 
 
-def _site_wrapper(site_source, parameter_source, persister, config, raise_errors=False):
+def _prefilter_sites(site_source, parameter_source, sites, persister, config):
+    """Drop sites the parameter source reports as empty before chunking.
+
+    ``count_records`` returns per-site observation counts from a count/summary
+    endpoint, or None when the source has no probe (every site is kept). A
+    failed probe also keeps every site — the pre-filter only ever saves work,
+    it never decides the output. Stats land on ``persister.stats["prefilter"]``.
+    """
+    requests_before = parameter_source.count_requests
+    try:
+        counts = parameter_source._count_records(sites)
+    except Exception as e:
+        # any probe failure (rate limit, bad response, a parse error) keeps
+        # every site: the fetch itself decides what the source returns
+        config.warn(f"Site pre-filter probe failed for {site_source} ({e!r}); fetching all sites")
+        return sites
+    if counts is None:
+        return sites
+
+    kept = [s for s in sites if counts.get(str(s.id), 0) > 0]
+    chunks_in = len(site_source.chunks(sites))
+    chunks_kept = len(site_source.chunks(kept)) if kept else 0
+    probe_requests = parameter_source.count_requests - requests_before
+    # every chunk fetch is at least one request, so chunks saved net of the
+    # probes is a lower bound on the requests saved
+    stats = {
+        "sites_in": len(sites),
+        "sites_kept": len(kept),
+        "chunks_in": chunks_in,
+        "chunks_kept": chunks_kept,
+        "chunks_saved": chunks_in - chunks_kept,
+        "probe_requests": probe_requests,
+        "requests_saved": chunks_in - chunks_kept - probe_requests,
+    }
+    persister.stats["prefilter"] = stats
+    config.log(
+        f"{site_source} pre-filter kept {len(kept)}/{len(sites)} sites, "
+        f"chunks {chunks_in}->{chunks_kept}, probe requests={probe_requests}, "
+        f"requests saved>={stats['requests_saved']}"
+    )
+    return kept
+
+
+def _site_wrapper(site_source, parameter_source, persister, config, raise_errors=False, summary_persister=None, shard=None, read=None):
+    """Read *site_source*'s sites and their *parameter_source* records into
+    *persister* — summaries or timeseries per ``config.output_summary``.
+
+    With *summary_persister* both are produced from one read of each chunk
+    (``parameter_source.read_both``): timeseries go to *persister*, summaries
+    to *summary_persister*, and config.output_summary is ignored.
+
+    With *shard* (a backend.sharding.Shard) only the shard's chunks are read,
+    and their results go to the shard instead of the persisters.
+
+    *read*, with *summary_persister*, reads a chunk ``(records, start_ind,
+    end_ind)`` in place of ``parameter_source.read_both`` (see
+    unify_source_incremental). It runs on the fetch threads, so the process
+    transform layout does not apply to it.
+
+    Returns whether every chunk was read: False without sites, or after an
+    abort rolled the persisters back.
+    """
+    combined = summary_persister is not None
+    persisters = [persister, summary_persister] if combined else [persister]
+    sampler = _memory_sampler(config)
+    budget = None
+    completed = False
 
     try:
         # snapshot lengths to roll back to on a rate-limit / partial-data abort,
         # so a source never contributes partial records
-        initial_sites_len = len(persister.sites)
-        initial_timeseries_len = len(persister.timeseries)
-        initial_records_len = len(persister.records)
+        initial_lens = [(len(p.sites), len(p.timeseries), len(p.records)) for p in persisters]
 
         incomplete_sites_record_msg = f"Failed to retrieve complete site records for {site_source}. No records will be saved for this source."
         incomplete_parameter_record_msg = f"Failed to retrieve complete parameter records for {site_source}. No records will be saved for this source."
 
         use_summarize = config.output_summary
-        site_limit = config.site_limit
-
+        # a shard reads all of its chunks; merge_shards applies the limit
+        site_limit = config.site_limit if shard is None else 0
+
+        # With Config.stream_sites the chunks are planned from the site
+        # query's pages as they arrive (BaseSiteSource.iter_sites), so the
+        # first chunks are fetched while later pages are still downloading.
+        pages = site_source.iter_sites() if _streams_sites(config, shard) else None
+        # a shard's chunks may have been planned by the parent process
+        # (sharding.unify_source_sharded), which discovered the sites once
+        planned = shard.specs if shard is not None else None
+        discovery = {"failed": False}
         try:
-            sites = site_source.read()
+            with _memory_stage(sampler, "discover"):
+                if planned is not None:
+                    sites = [s for spec in planned for s in _chunk_sites(spec[0])]
+                else:
+                    sites = site_source.read() if pages is None else next(pages, None)
         except (USGSRateLimitError, PartialOrNoDataError):
             config.warn(incomplete_sites_record_msg)
             sites = []
 
         if not sites:
-            return
-
-        sites_with_records_count = 0
-        start_ind = 0
-        end_ind = 0
-        first_flag = True
+            return completed
 
         if config.sites_only:
             persister.sites.extend(sites)
         else:
+            # a fetch plan (backend/planner.py) has already pre-filtered and
+            # chunked the sites
+            plan = None if planned is not None else _planned_chunks(config, site_source, parameter_source, sites)
+            if plan is None and planned is None and getattr(config, "prefilter_sites", False):
+                with _memory_stage(sampler, "prefilter"):
+                    sites = _prefilter_sites(
+                        site_source, parameter_source, sites, persister, config
+                    )
+                if combined and "prefilter" in persister.stats:
+                    summary_persister.stats["prefilter"] = persister.stats["prefilter"]
+
             # Build the chunk list up front with each chunk's advisory log
             # indices (start_ind/end_ind feed only log messages downstream).
+            # Adaptive chunks are planned at the learned size and fetched as
+            # requests of the current one (see backend/chunk_sizing.py).
+            # Shards plan at the source's chunk_size: every shard must arrive
+            # at the same plan, and the learned size may change under them.
+            adaptive = _adaptive_chunks(config, site_source, parameter_source)
             chunk_specs = []
-            for site_records in site_source.chunks(sites):
-                if type(site_records) == list:
-                    n = len(site_records)
-                    if first_flag:
-                        first_flag = False
-                    else:
-                        start_ind = end_ind + 1
-                    end_ind += n
-                chunk_specs.append((site_records, start_ind, end_ind))
-
-            # Fetch chunks concurrently (network-bound), but keep results in
-            # chunk order so output and site_limit stay deterministic. The
-            # persister is mutated only below, on this thread.
+            if pages is not None:
+                # planned as the sites arrive, at the size read() would have
+                # been chunked at
+                size = adaptive.size if adaptive else site_source.chunk_size
+                plan = _streamed_chunks(sites, pages, size, adaptive is not None or size > 1, discovery)
+            elif planned is not None:
+                plan = []
+            elif plan is None:
+                plan = adaptive.plan(sites) if adaptive and shard is None else site_source.chunks(sites)
+
+            # chunk_specs holds the specs planned so far, in chunk order
+            def _plan_specs():
+                for spec in _indexed_chunks(plan):
+                    chunk_specs.append(spec)
+                    yield spec
+
+            specs = _plan_specs()
+            if planned is not None:
+                chunk_specs = specs = list(planned)
+            elif pages is None:
+                specs = list(specs)
+                if shard is not None:
+                    chunk_specs = specs = shard.select(chunk_specs)
+
+            # With the process layout the fetch threads only fetch; each
+            # chunk is transformed in a worker process and collected below.
+            # A latest-only summary may refetch while it transforms, so it
+            # stays on the fetch threads.
+            stage = None
+            processes = getattr(config, "transform_layout", "threads") == "processes"
+            if processes and read is not None:
+                config.log(f"{parameter_source}: chunks are read by the run's reader, transforming on the fetch threads")
+            elif (
+                processes
+                and chunk_specs
+                and not getattr(config, "latest_only", False)
+            ):
+                stage = TransformStage(
+                    parameter_source,
+                    int(getattr(config, "transform_workers", 0) or 0),
+                    combined=combined,
+                )
+
+            # Chunks checkpointed by an earlier, aborted attempt are read
+            # back instead of fetched (see backend/checkpoint.py).
+            checkpoints = ChunkCheckpoints.for_run(
+                config, site_source, parameter_source, use_summarize, combined
+            )
+            restorable = set()
+            if checkpoints is not None:
+                restorable = checkpoints.completed()
+                if restorable and pages is not None:
+                    config.log(f"{site_source} resuming: {len(restorable)} chunks checkpointed")
+                elif restorable:
+                    n = sum(chunk_key(spec[0]) in restorable for spec in chunk_specs)
+                    config.log(
+                        f"{site_source} resuming: {n}/{len(chunk_specs)} chunks restored from checkpoints"
+                    )
+
+            def _read(records, s_ind, e_ind):
+                if stage is not None:
+                    return stage.submit(records, use_summarize, s_ind, e_ind)
+                if read is not None:
+                    return read(records, s_ind, e_ind)
+                if combined:
+                    return parameter_source.read_both(records, s_ind, e_ind)
+                return parameter_source.read(records, use_summarize, s_ind, e_ind)
+
             def _fetch(spec):
                 records, s_ind, e_ind = spec
-                return parameter_source.read(records, use_summarize, s_ind, e_ind)
+                if restorable and chunk_key(records) in restorable:
+                    packed = checkpoints.load(chunk_key(records))
+                    if stage is not None:
+                        submitted = stage.restore(records, use_summarize, packed)
+                        return [submitted] if adaptive else submitted
+                    return unpack_results(packed, _chunk_sites(records), use_summarize, combined)
+                if adaptive is None:
+                    return _read(records, s_ind, e_ind)
+                parts = adaptive.fetch(records, lambda part: _read(part, s_ind, e_ind))
+                if stage is not None:
+                    # the parts' transforms are collected by _finish
+                    return parts
+                return merge_results(parts, combined)
+
+            def _finish(submitted):
+                if adaptive is None:
+                    return stage.result(submitted)
+                return merge_results([stage.result(part) for part in submitted], combined)
 
             workers = max(int(getattr(config, "fetch_workers", 1) or 1), 1)
-            workers = min(workers, len(chunk_specs)) if chunk_specs else 1
-
-            results_by_chunk = [None] * len(chunk_specs)
-            aborted = False
-            if workers > 1:
-                with ThreadPoolExecutor(max_workers=workers) as executor:
-                    futures = {executor.submit(_fetch, spec): i for i, spec in enumerate(chunk_specs)}
-                    for future in as_completed(futures):
-                        try:
-                            results_by_chunk[futures[future]] = future.result()
-                        except (USGSRateLimitError, PartialOrNoDataError):
-                            aborted = True
-                            break
+            if pages is None:
+                workers = min(workers, len(chunk_specs)) if chunk_specs else 1
+            depth = int(getattr(config, "pipeline_depth", 0) or 0) or 2 * workers
+
+            if combined:
+                sinks = [
+                    _ChunkSink(summary_persister, True, site_limit),
+                    _ChunkSink(persister, False, site_limit),
+                ]
             else:
-                for i, spec in enumerate(chunk_specs):
-                    try:
-                        results_by_chunk[i] = _fetch(spec)
-                    except (USGSRateLimitError, PartialOrNoDataError):
-                        aborted = True
-                        break
-
-            if aborted:
+                sinks = [_ChunkSink(persister, use_summarize, site_limit)]
+
+            def _rollback():
                 # remove partial records to prevent incomplete data from being saved
-                persister.sites = persister.sites[:initial_sites_len]
-                persister.timeseries = persister.timeseries[:initial_timeseries_len]
-                persister.records = persister.records[:initial_records_len]
-                config.warn(incomplete_parameter_record_msg)
-            else:
-                for results in results_by_chunk:
-                    if use_summarize:
-                        if results:
-                            persister.records.extend(results)
-                            sites_with_records_count += len(results)
+                for p, (sites_len, timeseries_len, records_len) in zip(persisters, initial_lens):
+                    p.sites = p.sites[:sites_len]
+                    p.timeseries = p.timeseries[:timeseries_len]
+                    p.records = p.records[:records_len]
+
+            # Chunks are fetched (and transformed) concurrently and persisted
+            # here, on this thread, in chunk order as soon as each is ready,
+            # so output and site_limit stay deterministic while later chunks
+            # are still downloading.
+            #
+            # With a site_limit, a chunk is started only while the chunks in
+            # flight hold fewer sites than are still missing: a chunk of n
+            # sites adds at most n sites with records, so chunks the limit
+            # cannot reach are never fetched, and the pipeline stops once
+            # every sink is full. Chunks are still taken in order, so the
+            # output is that of fetching everything and truncating.
+            def needed():
+                return max(sink.missing() for sink in sinks)
+
+            # Over Config.memory_budget_bytes of RSS, the budget spills the
+            # persisters, then makes smaller requests, then fetches fewer
+            # chunks at once (see backend/memory.py). None of it changes the
+            # output, only how much of it is in memory at a time.
+            budget = _memory_budget(config, persisters, adaptive, depth if workers > 1 or stage is not None else 1)
+
+            # what this run fetches, kept as fetch history for the planner
+            fetch_before = dict(parameter_source.fetch_stats)
+            fetched_chunks = fetched_sites = 0
+
+            pipeline = _iter_chunk_results(
+                specs,
+                _fetch,
+                workers,
+                depth,
+                finish=_finish if stage is not None else None,
+                needed=needed if site_limit else None,
+                size=_chunk_site_count,
+                limit=(lambda: budget.in_flight) if budget is not None else None,
+            )
+            try:
+                with closing(pipeline), _memory_stage(sampler, "fetch"):
+                    for k, results in enumerate(pipeline):
+                        records = chunk_specs[k][0]
+                        if not (restorable and chunk_key(records) in restorable):
+                            fetched_chunks += 1
+                            fetched_sites += len(_chunk_sites(records))
+                        packed = None
+                        if shard is not None:
+                            packed = pack_results(results, _chunk_sites(records), use_summarize, combined)
+                            shard.add(k, records, packed)
+                        elif combined:
+                            sinks[0].add(results[0])
+                            sinks[1].add(results[1])
                         else:
-                            continue
-                    else:
-                        # no records are returned if there is no site record for parameter
-                        # or if the record isn't clean (doesn't have the correct fields)
-                        # don't count these sites to apply to site_limit
-                        if results is None or len(results) == 0:
-                            continue
-                        else:
-                            sites_with_records_count += len(results)
-
-                        for site, records in results:
-                            persister.timeseries.append(records)
-                            persister.sites.append(site)
-
-                    if site_limit:
-                        if sites_with_records_count >= site_limit:
-                            # remove any extra sites that were gathered. removes 0 if site_limit is not exceeded
-                            num_sites_to_remove = sites_with_records_count - site_limit
-
-                            # if sites_with_records_count == sit_limit then num_sites_to_remove = 0
-                            # and calling list[:0] will retur an empty list, so subtract
-                            # num_sites_to_remove from the length of the list
-                            # to remove the last num_sites_to_remove sites
-                            if use_summarize:
-                                persister.records = persister.records[
-                                    : len(persister.records) - num_sites_to_remove
-                                ]
-                            else:
-                                persister.timeseries = persister.timeseries[
-                                    : len(persister.timeseries) - num_sites_to_remove
-                                ]
-                                persister.sites = persister.sites[
-                                    : len(persister.sites) - num_sites_to_remove
-                                ]
+                            sinks[0].add(results)
+                        if checkpoints is not None:
+                            key = chunk_key(records)
+                            if key not in restorable:
+                                if packed is None:
+                                    packed = pack_results(results, _chunk_sites(records), use_summarize, combined)
+                                checkpoints.save(key, packed)
+                        if budget is not None:
+                            budget.check()
+                        if all(sink.done for sink in sinks):
                             break
+            except (USGSRateLimitError, PartialOrNoDataError):
+                # the chunks persisted so far stay checkpointed for the next
+                # attempt, which plans its chunks at the same size to use them
+                _rollback()
+                if shard is not None:
+                    shard.abort()
+                config.warn(incomplete_sites_record_msg if discovery["failed"] else incomplete_parameter_record_msg)
+                if adaptive is not None and checkpoints is None:
+                    _save_chunk_size(adaptive, site_source, config)
+            except Exception:
+                _rollback()
+                if shard is not None:
+                    shard.abort()
+                raise
+            else:
+                if checkpoints is not None:
+                    # a shard leaves the other shards' checkpoints alone
+                    checkpoints.clear(
+                        [chunk_key(spec[0]) for spec in chunk_specs] if shard is not None else None
+                    )
+                if adaptive is not None:
+                    _save_chunk_size(adaptive, site_source, config)
+                record_run(config, parameter_source, fetched_sites, fetched_chunks, fetch_before)
+                completed = True
+            finally:
+                if stage is not None:
+                    stage.shutdown()
+                if pages is not None:
+                    # a run stopped early (site_limit, an error) stops discovery
+                    specs.close()
+                    pages.close()
 
     except Exception:
         import traceback
@@ -149,6 +360,307 @@ def _site_wrapper(site_source, parameter_source, persister, config, raise_errors
         config.warn(f"Failed to unify {site_source}")
         if raise_errors:
             raise
+    finally:
+        _report_memory(sampler, budget, persisters)
+    return completed
+
+
+def _indexed_chunks(plan):
+    """``(site_records, start_ind, end_ind)`` for each chunk of *plan*, with
+    the chunk's advisory log indices."""
+    start_ind = 0
+    end_ind = 0
+    first_flag = True
+    for site_records in plan:
+        if type(site_records) == list:
+            n = len(site_records)
+            if first_flag:
+                first_flag = False
+            else:
+                start_ind = end_ind + 1
+            end_ind += n
+        yield site_records, start_ind, end_ind
+
+
+def plan_chunk_specs(config, site_source, parameter_source, persister) -> list:
+    """The chunk specs _site_wrapper would read for a run: the sites
+    discovered, pre-filtered (its stats go to *persister*) or taken from a
+    fetch plan, and chunked at the source's chunk_size. Discovery errors
+    propagate."""
+    sites = site_source.read() or []
+    if not sites:
+        return []
+    plan = _planned_chunks(config, site_source, parameter_source, sites)
+    if plan is None:
+        if getattr(config, "prefilter_sites", False):
+            sites = _prefilter_sites(site_source, parameter_source, sites, persister, config)
+        plan = site_source.chunks(sites)
+    return list(_indexed_chunks(plan))
+
+
+def _streams_sites(config, shard) -> bool:
+    """Config.stream_sites, unless the run needs every site before its first
+    chunk: sites_only, a pre-filter, a fetch plan or a shard's selection."""
+    return (
+        bool(getattr(config, "stream_sites", False))
+        and shard is None
+        and not config.sites_only
+        and not getattr(config, "prefilter_sites", False)
+        and not getattr(config, "fetch_plan", None)
+    )
+
+
+def _streamed_chunks(sites, pages, size, as_lists, discovery):
+    """*sites* and the site pages still to come from *pages*, as chunks of
+    *size* — those ``site_source.chunks`` (or AdaptiveChunks.plan, with
+    *as_lists*) makes of the sites concatenated. A failed discovery is noted
+    in *discovery* ``["failed"]``."""
+    if not as_lists:
+        size = 1
+    buffered = list(sites)
+    while True:
+        full = len(buffered) - len(buffered) % size
+        for i in range(0, full, size):
+            yield buffered[i:i + size] if as_lists else buffered[i]
+        del buffered[:full]
+        try:
+            page = next(pages, None)
+        except (USGSRateLimitError, PartialOrNoDataError):
+            discovery["failed"] = True
+            raise
+        if page is None:
+            break
+        buffered.extend(page)
+    if buffered:
+        yield buffered
+
+
+def _memory_sampler(config):
+    """A started MemorySampler when Config.memory_sample_seconds is set."""
+    interval = float(getattr(config, "memory_sample_seconds", 0) or 0)
+    if interval <= 0:
+        return None
+    return MemorySampler(interval, bool(getattr(config, "memory_tracemalloc", False))).start()
+
+
+def _memory_stage(sampler, name):
+    return sampler.stage(name) if sampler is not None else nullcontext()
+
+
+def _memory_budget(config, persisters, adaptive, in_flight):
+    limit = int(getattr(config, "memory_budget_bytes", 0) or 0)
+    if limit <= 0:
+        return None
+    return MemoryBudget(limit, persisters, adaptive, in_flight, log=config.warn)
+
+
+def _report_memory(sampler, budget, persisters):
+    """Put the run's memory report and budget steps in the persisters'
+    stats["memory"]."""
+    if sampler is None and not (budget is not None and budget.events):
+        return
+    report = {}
+    if sampler is not None:
+        sampler.stop()
+        report = sampler.report()
+    if budget is not None:
+        report["budget"] = {"limit": budget.limit, "events": budget.events}
+    for p in persisters:
+        p.stats["memory"] = report
+
+
+def _iter_chunk_results(chunk_specs, fetch, workers, depth, finish=None, needed=None, size=None, limit=None):
+    """Yield ``fetch(spec)`` for each chunk spec, in chunk order.
+
+    Up to *workers* chunks are fetched at once on a thread pool, and at most
+    *depth* are in flight or finished but not yet taken: a chunk that finishes
+    ahead of an earlier one waits in the queue (the reorder buffer), and the
+    next chunk is started only when the consumer takes the head. Fetching
+    therefore overlaps with the consumer's transform/persist work while only
+    *depth* chunks' results are alive at once. *finish*, if given, runs on the
+    consumer's thread on each head result before it is yielded (e.g. waiting
+    for TransformStage's worker process).
+
+    *needed*, if given, is asked before each chunk is started how many more
+    units (sites, for the unifier's site_limit) the consumer still wants; a
+    chunk is started only while the chunks in flight hold fewer, counting
+    ``size(spec)`` units per chunk. Once it returns 0 nothing more is started.
+
+    *limit*, if given, is asked before each chunk is started for a lower
+    depth (at least 1), e.g. a memory budget's (memory.MemoryBudget).
+    """
+    if needed is None:
+        def allowed(in_flight):
+            return True
+    else:
+        def allowed(in_flight):
+            return in_flight < needed()
+
+    if workers <= 1 and finish is None:
+        for spec in chunk_specs:
+            if not allowed(0):
+                return
+            yield fetch(spec)
+        return
+
+    depth = max(depth, 1)
+    specs = iter(chunk_specs)
+    queue: deque = deque()
+    in_flight = 0
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _refill():
+        nonlocal in_flight
+        while len(queue) < (depth if limit is None else max(min(depth, limit()), 1)) and allowed(in_flight):
+            spec = next(specs, _NO_SPEC)
+            if spec is _NO_SPEC:
+                return
+            n = size(spec) if size is not None else 1
+            queue.append((executor.submit(fetch, spec), n))
+            in_flight += n
+
+    try:
+        _refill()
+        while queue:
+            future, n = queue.popleft()
+            result = future.result()
+            in_flight -= n
+            if needed is None:
+                _refill()
+            yield finish(result) if finish is not None else result
+            # with a budget, refill only after the consumer has taken the
+            # head, so a limit it just reached is seen before anything else
+            # is started
+            _refill()
+    finally:
+        # an abort leaves queued chunks unstarted
+        for future, _n in queue:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+_NO_SPEC = object()
+
+
+def _chunk_site_count(spec) -> int:
+    return len(_chunk_sites(spec[0]))
+
+
+def _chunk_sites(site_records) -> list:
+    return site_records if isinstance(site_records, list) else [site_records]
+
+
+def _plan_key(config, site_source, parameter_source) -> str:
+    """The fetch plan entry of a source's run: the chunks do not depend on
+    the output mode."""
+    return run_key(config, site_source, parameter_source, True, True)
+
+
+def _planned_chunks(config, site_source, parameter_source, sites):
+    """The chunks of *sites* Config.fetch_plan planned for this run (see
+    backend/planner.py), or None without a plan entry for it. A plan whose
+    sites are no longer all discovered is stale and not used."""
+    plan = getattr(config, "fetch_plan", None)
+    if not plan:
+        return None
+    key = _plan_key(config, site_source, parameter_source)
+    entry = next((e for e in plan.get("sources", ()) if e.get("key") == key), None)
+    if entry is None or "chunks" not in entry:
+        return None
+
+    by_id: dict = {}
+    for site in sites:
+        by_id.setdefault(str(site.id), deque()).append(site)
+    chunks = []
+    try:
+        for ids in entry["chunks"]:
+            # a chunk planned as a single site record is a str
+            if isinstance(ids, str):
+                chunks.append(by_id[ids].popleft())
+            else:
+                chunks.append([by_id[i].popleft() for i in ids])
+    except (KeyError, IndexError):
+        config.warn(f"{site_source}: fetch plan is stale (planned sites not discovered); planning again")
+        return None
+    config.log(f"{site_source}: fetching {len(chunks)} planned chunks")
+    return chunks
+
+
+def _adaptive_chunks(config, site_source, parameter_source):
+    """The source's AdaptiveChunks with Config.adaptive_chunks, else None. A
+    source that fetches one site at a time has nothing to split."""
+    if not getattr(config, "adaptive_chunks", False) or site_source.chunk_size <= 1:
+        return None
+    return AdaptiveChunks(config, site_source, parameter_source)
+
+
+def _save_chunk_size(adaptive, site_source, config) -> None:
+    adaptive.save()
+    stats = adaptive.stats
+    config.log(
+        f"{site_source} sites per request {adaptive.default}->{adaptive.size} "
+        f"({stats['requests']} requests, {stats['timeouts']} timed out)"
+    )
+
+
+class _ChunkSink:
+    """Adds chunk read results to a persister in chunk order, until
+    *site_limit* sites have records."""
+
+    def __init__(self, persister, use_summarize, site_limit):
+        self.persister = persister
+        self.use_summarize = use_summarize
+        self.site_limit = site_limit
+        self.sites_with_records_count = 0
+        self.done = False
+
+    def missing(self) -> int:
+        """Sites with records still needed to reach site_limit."""
+        if self.done:
+            return 0
+        return max(self.site_limit - self.sites_with_records_count, 0)
+
+    def add(self, results) -> None:
+        if self.done:
+            return
+        persister = self.persister
+        if self.use_summarize:
+            if not results:
+                return
+            persister.records.extend(results)
+            self.sites_with_records_count += len(results)
+        else:
+            # no records are returned if there is no site record for parameter
+            # or if the record isn't clean (doesn't have the correct fields)
+            # don't count these sites to apply to site_limit
+            if results is None or len(results) == 0:
+                return
+            self.sites_with_records_count += len(results)
+
+            for site, records in results:
+                persister.timeseries.append(records)
+                persister.sites.append(site)
+
+        if self.site_limit and self.sites_with_records_count >= self.site_limit:
+            # remove any extra sites that were gathered. removes 0 if site_limit is not exceeded
+            num_sites_to_remove = self.sites_with_records_count - self.site_limit
+
+            # if sites_with_records_count == sit_limit then num_sites_to_remove = 0
+            # and calling list[:0] will retur an empty list, so subtract
+            # num_sites_to_remove from the length of the list
+            # to remove the last num_sites_to_remove sites
+            if self.use_summarize:
+                persister.records = persister.records[
+                    : len(persister.records) - num_sites_to_remove
+                ]
+            else:
+                persister.timeseries = persister.timeseries[
+                    : len(persister.timeseries) - num_sites_to_remove
+                ]
+                persister.sites = persister.sites[
+                    : len(persister.sites) - num_sites_to_remove
+                ]
+            self.done = True
 
 
 def unify_source(config, source_key):
@@ -187,11 +699,18 @@ def unify_source_both(config, source_key):
     therefore hit the API twice for identical data. This driver instead enables
     the source's shared-fetch cache and runs the two transform passes over one
     fetch, so a source needed by both a summary and a timeseries product is
-    pulled once.
+    pulled once. Both outputs come from one read of each chunk
+    (BaseParameterSource.read_both); a source with ``summary_from_timeseries``
+    also transforms each observation only once, summarizing the converted
+    timeseries values instead of converting them again.
 
     Output is identical to calling ``unify_source`` twice (once per mode); only
-    the underlying fetch is shared. Returns ``(summary_persister,
+    the underlying fetch (and transform) is shared. Returns ``(summary_persister,
     timeseries_persister)``. Used by the orchestration shared source asset.
+
+    With ``config.latest_only`` every consumer reads latest summary values only,
+    so the timeseries pass is skipped (its persister is returned empty) and the
+    summary pass uses the sources' latest-only fetch plan.
     """
     config.validate()
 
@@ -203,30 +722,98 @@ def unify_source_both(config, source_key):
         return make_persister(config), make_persister(config)
 
     site_source, parameter_source = pair
-    # Share the site list and observation fetch across the two passes. The
-    # passes issue identical requests (same parameter/scope/dates), so the
-    # second reuses the first's cached fetch instead of re-querying.
+    # Share the site list and observation fetch across the two outputs. A
+    # single read produces both (see _site_wrapper's summary_persister), so a
+    # source that summarizes its timeseries rows needs no observation cache; any
+    # other source reads each chunk once per mode and the second read reuses
+    # the first's cached fetch instead of re-querying.
     site_source._fetch_cache_enabled = True
-    parameter_source._fetch_cache_enabled = True
+    parameter_source._fetch_cache_enabled = config.latest_only or not parameter_source.summary_from_timeseries
+
+    if config.latest_only:
+        timeseries_persister = make_persister(config)
+        config.output_summary = True
+        summary_persister = make_persister(config)
+        config._persister = summary_persister
+        _site_wrapper(
+            site_source, parameter_source, summary_persister, config, raise_errors=True
+        )
+        return summary_persister, timeseries_persister
 
-    # Timeseries pass first so its fetch primes the cache; the summary pass then
-    # transforms the same cached observations. output_summary is read live by
-    # the transformer, so toggling it here switches the record klass/fields per
-    # pass without rebuilding the source.
-    config.output_summary = False
     timeseries_persister = make_persister(config)
-    config._persister = timeseries_persister
+    summary_persister = make_persister(config)
+    config._persister = summary_persister
     _site_wrapper(
-        site_source, parameter_source, timeseries_persister, config, raise_errors=True
+        site_source,
+        parameter_source,
+        timeseries_persister,
+        config,
+        raise_errors=True,
+        summary_persister=summary_persister,
     )
-
+    # the summary pass used to run last; callers read the mode afterwards
     config.output_summary = True
+
+    return summary_persister, timeseries_persister
+
+
+def unify_source_incremental(config, source_key):
+    """unify_source_both, continued from the previous run's snapshot in
+    ``config.snapshot_dir`` instead of rebuilt from a full fetch.
+
+    Each chunk is fetched only from its sites' watermark and merged into the
+    snapshot (see backend/incremental.py); the output, and the snapshot left
+    for the next run, are those of a full run. Without a snapshot (or with a
+    different source, parameter, scope, window or units) every site is read in
+    full. Chunks go through _site_wrapper like any other run, read by an
+    IncrementalRead. Sources that cannot resume a read, latest-only and
+    site_limit runs go through unify_source_both. A rate-limit / partial-data
+    abort returns empty persisters and keeps the previous snapshot.
+    """
+    config.validate()
+
+    pair = config.source_pair(source_key)
+    if pair is None:
+        config.warn(
+            f"Source {source_key!r} does not provide parameter {config.parameter!r}"
+        )
+        return make_persister(config), make_persister(config)
+
+    site_source, parameter_source = pair
+    if not config.snapshot_dir or not supports_incremental(config, parameter_source):
+        config.log(f"{parameter_source}: no incremental run, unifying in full")
+        return unify_source_both(config, source_key)
+
+    site_source._fetch_cache_enabled = True
+    # the fetch window differs per chunk, so nothing is cached by site ids
+    parameter_source._fetch_cache_enabled = False
+    os.makedirs(config.snapshot_dir, exist_ok=True)
+    path = os.path.join(
+        config.snapshot_dir,
+        f"{run_key(config, site_source, parameter_source, True, True)}.snapshot",
+    )
+    reader = IncrementalRead(parameter_source, Snapshot.load(path))
+
+    timeseries_persister = make_persister(config)
     summary_persister = make_persister(config)
     config._persister = summary_persister
-    _site_wrapper(
-        site_source, parameter_source, summary_persister, config, raise_errors=True
+    completed = _site_wrapper(
+        site_source,
+        parameter_source,
+        timeseries_persister,
+        config,
+        raise_errors=True,
+        summary_persister=summary_persister,
+        read=reader.read,
     )
-
+    config.output_summary = True
+    if completed:
+        # chunks restored from checkpoints were not read, so their sites
+        # are read in full next time
+        reader.snapshot().save(path)
+        config.log(
+            f"{parameter_source}: incremental run touched {reader.touched} of {len(reader.sites)} sites with data"
+        )
     return summary_persister, timeseries_persister
 
 
@@ -295,22 +882,22 @@ def unify_source_multi(config, source_key, parameters):
     for p in parameters:
         config.parameter = p
 
-        config.output_summary = False
         ts_persister = make_persister(config)
-        config._persister = ts_persister
-        _site_wrapper(
-            site_source, parameter_source, ts_persister, config, raise_errors=True
-        )
-
-        config.output_summary = True
         summary_persister = make_persister(config)
         config._persister = summary_persister
         _site_wrapper(
-            site_source, parameter_source, summary_persister, config, raise_errors=True
+            site_source,
+            parameter_source,
+            ts_persister,
+            config,
+            raise_errors=True,
+            summary_persister=summary_persister,
         )
 
         result[p] = (summary_persister, ts_persister)
 
+    config.output_summary = True
+
     return result
 
 
@@ -324,6 +911,11 @@ def collect_sites(config):
     ``all_site_sources()`` so a source that provides no parameter (e.g. the OSE
     POD source) still contributes its sites. Errors on individual sources are
     swallowed by ``_site_wrapper`` so one dead source does not abort the sweep.
+
+    The sources are discovered concurrently (``config.site_source_workers``),
+    each into its own persister, so one source's failure or rate limit rolls
+    back only its own sites; the sites are then concatenated in source order.
+    Per-source timings land on ``persister.stats["site_sources"]``.
     """
     config.validate()
 
@@ -331,8 +923,41 @@ def collect_sites(config):
     persister = make_persister(config)
     config._persister = persister
 
-    for site_source, _ in config.all_site_sources():
-        _site_wrapper(site_source, None, persister, config)
+    sources = [site_source for site_source, _ in config.all_site_sources()]
+
+    def _collect(site_source):
+        source_persister = make_persister(config)
+        started = time.monotonic()
+        ok = True
+        try:
+            _site_wrapper(site_source, None, source_persister, config, raise_errors=True)
+        except Exception:
+            # _site_wrapper has warned; the other sources carry on
+            ok = False
+        return source_persister.sites if ok else [], {
+            "source": str(site_source),
+            "sites": len(source_persister.sites) if ok else 0,
+            "seconds": round(time.monotonic() - started, 3),
+            "ok": ok,
+        }
+
+    workers = max(int(getattr(config, "site_source_workers", 1) or 1), 1)
+    workers = min(workers, len(sources)) if sources else 1
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            collected = list(executor.map(_collect, sources))
+    else:
+        collected = [_collect(site_source) for site_source in sources]
+
+    timings = []
+    for sites, timing in collected:
+        persister.sites.extend(sites)
+        timings.append(timing)
+        config.log(
+            f"{timing['source']} sites={timing['sites']} in {timing['seconds']:.1f}s"
+            + ("" if timing["ok"] else " (failed)")
+        )
+    persister.stats["site_sources"] = timings
 
     return [s._payload for s in persister.sites]
 
@@ -103,7 +103,8 @@ from backend.persisters.ogc_features import (
 )
 from backend.persisters.geodataframe import geojson_to_geopackage
 from backend.record import ParameterRecord, SiteRecord, SummaryRecord
-from backend.unifier import collect_sites, unify_source_both
+from backend.sharding import unify_source_sharded
+from backend.unifier import collect_sites
 from orchestration.logging_bridge import forward_die_logs
 from orchestration.resources.die_config import DIEConfigResource
 from orchestration.resources.gcs import GCSResource
@@ -216,6 +217,26 @@ _STANDALONE_OUTPUT_TYPES = {
 }
 
 
+# Products that read only each well's latest summary value (latest_value/
+# latest_units/latest_date via the per-well pivot). A shared source consumed
+# only by these can use the sources' latest-only fetch plan and skip its
+# timeseries pass (see backend/unifier.py:unify_source_both).
+_LATEST_ONLY_OUTPUT_TYPES = {
+    "ogc_major_chemistry",
+    "ogc_mcl_exceedance",
+    "ogc_hardness",
+    "ogc_water_type",
+    "ogc_sar",
+    "ogc_ion_balance",
+    "ogc_wqi",
+}
+
+
+def needs_latest_only(product: dict) -> bool:
+    """True for products whose combine reads only latest summary values."""
+    return product.get("output_type") in _LATEST_ONLY_OUTPUT_TYPES
+
+
 def is_standalone(product: dict) -> bool:
     """True for products whose combine gathers its own data (no shared source
     assets, no parameter cohort)."""
@@ -252,7 +273,9 @@ def _in_name(spec: SourceSpec) -> str:
     return raw.replace("-", "_")
 
 
-def build_shared_source_asset(spec: SourceSpec) -> dg.AssetsDefinition:
+def build_shared_source_asset(
+    spec: SourceSpec, latest_only: bool = False
+) -> dg.AssetsDefinition:
     """Build the shared asset that unifies one source for one (parameter, scope)
     — keyed product-independently so every product needing it shares it.
 
@@ -261,6 +284,10 @@ def build_shared_source_asset(spec: SourceSpec) -> dg.AssetsDefinition:
     sites/timeseries together; summary and timeseries products over the same
     (parameter, scope, source) share this one asset and one fetch.
 
+    *latest_only* is set when every consuming product reads only latest summary
+    values (see :func:`needs_latest_only`): the source then uses its latest-only
+    fetch plan and the asset carries summary records only.
+
     The asset never raises: on failure it records the traceback and fails its
     ``returned_data`` check (WARN) instead, so a broken source does not block any
     product's combine asset. Output ships as plain ``_payload`` dicts for
@@ -296,13 +323,17 @@ def build_shared_source_asset(spec: SourceSpec) -> dg.AssetsDefinition:
         records: list[dict] = []
         sites: list[dict] = []
         timeseries: list[list[dict]] = []
+        peak_rss = None
         try:
             # A source that doesn't provide this parameter is skipped by
             # unify_source_both (source_pair → None).
             with forward_die_logs(context):
                 config = die_config.get_config(synth_product, parameter=spec.parameter)
+                config.latest_only = latest_only
                 # One fetch, both modes: summary records + timeseries sites/obs.
-                summary_persister, timeseries_persister = unify_source_both(
+                # With Config.shards the source is read in that many processes
+                # (same output).
+                summary_persister, timeseries_persister = unify_source_sharded(
                     config, spec.source_key
                 )
                 # Ship plain scalar dicts across the IO manager; rebuild in
@@ -318,6 +349,7 @@ def build_shared_source_asset(spec: SourceSpec) -> dg.AssetsDefinition:
                     [_schema_dict(o) for o in site_ts]
                     for site_ts in timeseries_persister.timeseries
                 )
+                peak_rss = _peak_rss(summary_persister.stats)
         except Exception:
             error = traceback.format_exc()
             context.log.error(f"Source {spec.source_key} failed:\n{error}")
@@ -328,18 +360,19 @@ def build_shared_source_asset(spec: SourceSpec) -> dg.AssetsDefinition:
         has_data = bool(records or sites or timeseries)
         passed = error == "" and has_data
 
-        yield dg.Output(
-            payload,
-            metadata={
-                "source": spec.source_key,
-                "parameter": spec.parameter,
-                "scope": spec.scope,
-                "record_count": len(records),
-                "site_count": len(sites),
-                "observation_count": obs_count,
-                "error": error,
-            },
-        )
+        metadata = {
+            "source": spec.source_key,
+            "parameter": spec.parameter,
+            "scope": spec.scope,
+            "record_count": len(records),
+            "site_count": len(sites),
+            "observation_count": obs_count,
+            "error": error,
+        }
+        # with Config.memory_sample_seconds set
+        if peak_rss is not None:
+            metadata["peak_rss_bytes"] = peak_rss
+        yield dg.Output(payload, metadata=metadata)
         yield dg.AssetCheckResult(
             asset_key=src_key,
             check_name=_CHECK_NAME,
@@ -355,6 +388,14 @@ def build_shared_source_asset(spec: SourceSpec) -> dg.AssetsDefinition:
     return _source_asset
 
 
+def _peak_rss(stats: dict) -> int | None:
+    """A unified source's sampled peak RSS; a sharded one's largest shard's."""
+    peak = stats.get("memory", {}).get("peak_rss")
+    if peak:
+        return peak
+    return max((s["peak_rss"] for s in stats.get("shards", []) if s.get("peak_rss")), default=None)
+
+
 def _build_combine_asset(
     product: dict, specs: list[SourceSpec], group: str
 ) -> dg.AssetsDefinition:
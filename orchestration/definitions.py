@@ -13,6 +13,7 @@ from orchestration.assets.products import (
     build_product_pipeline_assets,
     build_shared_source_asset,
     is_standalone,
+    needs_latest_only,
     product_source_specs,
     shared_source_key,
 )
@@ -68,18 +69,29 @@ def _build_graph(products_config: dict):
     unified for both summary and timeseries, so a source two products both need
     (in either mode) is fetched once, not twice.
 
+    A source asset uses the latest-only fetch plan when *every* product that
+    consumes it reads only latest summary values; one timeseries or full-summary
+    consumer keeps the full fetch for everyone.
+
     Returns ``(source_assets, pipeline_assets, specs_by_pid, all_specs)`` where
     ``specs_by_pid`` maps a product id to the source specs its combine consumes
     and ``all_specs`` is the deduped set of source specs."""
     specs_by_pid: dict[str, list] = {}
     all_specs: dict = {}  # SourceSpec -> SourceSpec (dedup; namedtuple is hashable)
+    latest_only: dict = {}  # SourceSpec -> all consumers latest-only
     for product in _products(products_config):
         specs = product_source_specs(product)
         specs_by_pid[product["id"]] = specs
         for spec in specs:
             all_specs.setdefault(spec, spec)
+            latest_only[spec] = latest_only.get(spec, True) and needs_latest_only(
+                product
+            )
 
-    source_assets = [build_shared_source_asset(spec) for spec in all_specs]
+    source_assets = [
+        build_shared_source_asset(spec, latest_only=latest_only[spec])
+        for spec in all_specs
+    ]
 
     pipeline_assets: list[dg.AssetsDefinition] = []
     for product in _products(products_config):
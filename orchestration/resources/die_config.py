@@ -14,6 +14,11 @@ class DIEConfigResource(dg.ConfigurableResource):
     # time — picks it up.
     usgs_api_key: Optional[str] = None
 
+    # Directory of incremental-run snapshots (see backend/incremental.py).
+    # Unset, every run unifies each source in full; set, a shared source
+    # asset fetches only what is newer than its previous run's snapshot.
+    snapshot_dir: Optional[str] = None
+
     def get_config(self, product: dict, parameter: Optional[str] = None) -> Config:
         """Translate a products.yaml entry into a finalized DIE ``Config``.
 
@@ -26,6 +31,10 @@ class DIEConfigResource(dg.ConfigurableResource):
           ``wkt = None`` (statewide; DIE applies the NM extent downstream).
         - ``sources.include`` → enable only those sources (all others off).
           ``sources.exclude`` → disable those, leave the rest at their defaults.
+        - ``fetch.prefilter_sites`` → ``prefilter_sites`` and
+          ``fetch.site_tiles`` → ``site_tiles`` (both off unless the product
+          asks for them).
+        - the resource's ``snapshot_dir`` → ``snapshot_dir``.
         - ``parameter`` is set on the Config, then ``finalize()`` resolves the
           parameter-dependent output units.
 
@@ -72,5 +81,15 @@ class DIEConfigResource(dg.ConfigurableResource):
         # An empty parameter is valid for sites-only flows (e.g. the well
         # correlation product), so fall back to "" when the product has none.
         config.parameter = parameter or product.get("parameter", "")
+        # Fetch optimizations are opt-in per product: a product sweeping a
+        # whole county/the state, where many discovered sites have nothing in
+        # range, can probe counts first and skip them.
+        fetch = product.get("fetch") or {}
+        config.prefilter_sites = bool(fetch.get("prefilter_sites", False))
+        # ...and tile site discovery into an N x N grid of concurrent bbox
+        # queries rather than one long paginated stream per provider.
+        config.site_tiles = int(fetch.get("site_tiles", 0) or 0)
+        if self.snapshot_dir:
+            config.snapshot_dir = self.snapshot_dir
         config.finalize()
         return config
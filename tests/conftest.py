@@ -0,0 +1,11 @@
+import pytest
+
+from backend.fetch_cache import shared_fetch_cache
+
+
+@pytest.fixture(autouse=True)
+def _empty_fetch_cache():
+    # fakes of the same class serve different data from test to test
+    shared_fetch_cache().clear()
+    yield
+    shared_fetch_cache().clear()
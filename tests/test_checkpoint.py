@@ -0,0 +1,194 @@
+"""Chunk checkpoints (Config.checkpoint_dir, backend/checkpoint.py).
+
+A source aborted by a rate limit mid-run is rolled back as before, but the
+chunks it persisted are checkpointed: the next run fetches only from the
+first incomplete chunk and its output is that of an uninterrupted run. A run
+with a different key (date window, mode) or past expiry fetches everything,
+and a finished source leaves no checkpoints behind.
+"""
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.checkpoint import ChunkCheckpoints, chunk_key, expires_at
+from backend.config import Config
+from backend.exceptions import USGSRateLimitError
+from backend.persister import BasePersister
+from backend.record import ParameterRecord, SiteRecord, SummaryRecord
+from backend.source import BaseParameterSource, BaseSiteSource, BaseTransformer
+from backend.transform_stage import TransformStage, pack_results
+from backend.unifier import _site_wrapper
+
+N_SITES = 20
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": f"W{i:02d}"} for i in range(N_SITES)]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"]})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+def _summaries(sites):
+    # W05 has no records
+    return [SummaryRecord({"source": "fake", "id": s.id, "nrecords": int(s.id[1:])}) for s in sites if s.id != "W05"]
+
+
+def _timeseries(sites):
+    return [(s, [ParameterRecord({"source": "fake", "id": s.id, "parameter_value": float(s.id[1:])})]) for s in sites if s.id != "W05"]
+
+
+class _FakeParamSource(BaseParameterSource):
+    def __init__(self, fail_at=None):
+        super().__init__(transformer=BaseTransformer())
+        self.fail_at = fail_at
+        self.fetched = []
+
+    def _fetch(self, site_record):
+        self.fetched.append(site_record[0].id)
+        if site_record[0].id == self.fail_at:
+            raise USGSRateLimitError("429")
+
+    def read(self, site_record, use_summarize, start_ind, end_ind):
+        self._fetch(site_record)
+        return _summaries(site_record) if use_summarize else _timeseries(site_record)
+
+    def read_both(self, site_record, start_ind, end_ind, pages=None):
+        self._fetch(site_record)
+        return _summaries(site_record), _timeseries(site_record)
+
+
+def _config(directory, output_summary=True, end_date="", workers=1):
+    cfg = Config(payload={"yes": True})
+    cfg.checkpoint_dir = str(directory)
+    cfg.output_summary = output_summary
+    cfg.end_date = end_date
+    cfg.fetch_workers = workers
+    return cfg
+
+
+def _run(cfg, fail_at=None, combined=False):
+    persister = BasePersister(cfg)
+    summary_persister = BasePersister(cfg) if combined else None
+    source = _FakeParamSource(fail_at)
+    _site_wrapper(_FakeSiteSource(), source, persister, cfg, raise_errors=True, summary_persister=summary_persister)
+    return persister, summary_persister, source
+
+
+def _output(persister):
+    return (
+        [r.to_dict() for r in persister.records],
+        [s.id for s in persister.sites],
+        [[r.to_dict() for r in t] for t in persister.timeseries],
+    )
+
+
+def _live_rows(directory):
+    conn = sqlite3.connect(str(directory / "checkpoints.sqlite"))
+    try:
+        return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestResume:
+    @pytest.mark.parametrize("output_summary", [True, False])
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_resumes_from_first_incomplete_chunk(self, tmp_path, output_summary, workers):
+        expected = _output(_run(_config(tmp_path / "fresh", output_summary))[0])
+
+        aborted, _, _ = _run(_config(tmp_path, output_summary, workers=workers), fail_at="W12")
+        # the abort still contributes nothing
+        assert _output(aborted) == ([], [], [])
+
+        resumed, _, source = _run(_config(tmp_path, output_summary, workers=workers))
+        assert sorted(source.fetched) == [f"W{i:02d}" for i in range(12, N_SITES, 2)]
+        assert _output(resumed) == expected
+        # a finished source drops its checkpoints
+        assert _live_rows(tmp_path) == 0
+
+    def test_combined(self, tmp_path):
+        fresh_ts, fresh_summary, _ = _run(_config(tmp_path / "fresh"), combined=True)
+        _run(_config(tmp_path), fail_at="W08", combined=True)
+        timeseries, summary, source = _run(_config(tmp_path), combined=True)
+        assert source.fetched[0] == "W08"
+        assert _output(summary) == _output(fresh_summary)
+        assert _output(timeseries) == _output(fresh_ts)
+
+    def test_other_mode_does_not_resume(self, tmp_path):
+        _run(_config(tmp_path, output_summary=True), fail_at="W12")
+        _, _, source = _run(_config(tmp_path, output_summary=False))
+        assert source.fetched[0] == "W00"
+
+    def test_other_window_does_not_resume(self, tmp_path):
+        _run(_config(tmp_path, end_date="2020-01-01"), fail_at="W12")
+        _, _, source = _run(_config(tmp_path, end_date="2021-01-01"))
+        assert source.fetched[0] == "W00"
+
+    def test_off_by_default(self, tmp_path):
+        cfg = _config(tmp_path)
+        cfg.checkpoint_dir = ""
+        _run(cfg, fail_at="W12")
+        assert not (tmp_path / "checkpoints.sqlite").exists()
+
+
+class TestExpiry:
+    def test_open_window_expires_at_midnight(self):
+        cfg = Config()
+        now = datetime(2024, 5, 1, 15, 30).timestamp()
+        assert expires_at(cfg, now) == datetime(2024, 5, 2).timestamp()
+        cfg.end_date = "2024-05-01"
+        assert expires_at(cfg, now) == datetime(2024, 5, 2).timestamp()
+
+    def test_closed_window_lasts_max_age(self):
+        cfg = Config()
+        cfg.end_date = "2020-01-01"
+        cfg.checkpoint_max_age_hours = 10
+        now = datetime(2024, 5, 1, 15, 30).timestamp()
+        assert expires_at(cfg, now) == now + 10 * 3600
+
+    def test_expired_chunks_are_not_restored(self, tmp_path):
+        store = ChunkCheckpoints(str(tmp_path), "run", time.time() - 1)
+        store.save("a", ["packed"])
+        assert store.completed() == set()
+        with pytest.raises(KeyError):
+            store.load("a")
+        # and are dropped when the file is next opened
+        ChunkCheckpoints(str(tmp_path), "other", time.time() + 60)
+        assert _live_rows(tmp_path) == 0
+
+    def test_round_trip(self, tmp_path):
+        store = ChunkCheckpoints(str(tmp_path), "run", (datetime.now() + timedelta(hours=1)).timestamp())
+        store.save("a", {"x": [1.5, None]})
+        assert store.completed() == {"a"} and store.load("a") == {"x": [1.5, None]}
+
+
+class TestTransformStageRestore:
+    def test_restored_chunk_unpacks_like_a_transformed_one(self):
+        sites = [SiteRecord({"source": "fake", "id": f"W{i:02d}"}) for i in range(4, 7)]
+        stage = TransformStage(_FakeParamSource(), workers=1, combined=True)
+        try:
+            packed = pack_results((_summaries(sites), _timeseries(sites)), sites, True, True)
+            summaries, timeseries = stage.result(stage.restore(sites, True, packed))
+        finally:
+            stage.shutdown()
+        assert [r.to_dict() for r in summaries] == [r.to_dict() for r in _summaries(sites)]
+        assert [site for site, _ in timeseries] == [s for s in sites if s.id != "W05"]
+
+    def test_chunk_key_is_site_ids(self):
+        a = [SiteRecord({"id": "1"}), SiteRecord({"id": "2"})]
+        assert chunk_key(a) == chunk_key([SiteRecord({"id": "1"}), SiteRecord({"id": "2"})])
+        assert chunk_key(a) != chunk_key(a[::-1])
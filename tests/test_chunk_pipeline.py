@@ -0,0 +1,155 @@
+"""Bounded fetch -> transform -> persist pipeline in _site_wrapper.
+
+Chunks finish out of order on purpose; they must still be persisted in chunk
+order, while later chunks are being fetched, with no more than
+``pipeline_depth`` chunks in flight, and an abort must stop queued chunks and
+leave nothing persisted.
+"""
+import random
+import threading
+import time
+
+import pytest
+
+from backend.config import Config
+from backend.exceptions import PartialOrNoDataError
+from backend.persister import BasePersister
+from backend.record import ParameterRecord, SiteRecord, SummaryRecord
+from backend.source import BaseParameterSource, BaseSiteSource, BaseTransformer
+from backend.unifier import _iter_chunk_results, _site_wrapper
+
+N_SITES = 24
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": f"W{i:02d}"} for i in range(N_SITES)]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"]})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _FakeParamSource(BaseParameterSource):
+    """Reads take a random time, so chunks complete out of order. Records
+    which chunks started and how many were read but not yet persisted."""
+
+    def __init__(self, fail_at=None):
+        super().__init__(transformer=BaseTransformer())
+        self.fail_at = fail_at
+        self.rng = random.Random(4)
+        self.lock = threading.Lock()
+        self.started = []
+        self.unpersisted = 0
+        self.max_unpersisted = 0
+
+    def read(self, site_record, use_summarize, start_ind, end_ind):
+        with self.lock:
+            self.started.append(site_record[0].id)
+            delay = self.rng.uniform(0, 0.01)
+        time.sleep(delay)
+        if self.fail_at is not None and site_record[0].id == self.fail_at:
+            raise PartialOrNoDataError("dropped")
+        with self.lock:
+            self.unpersisted += 1
+            self.max_unpersisted = max(self.max_unpersisted, self.unpersisted)
+        if use_summarize:
+            return [SummaryRecord({"source": "fake", "id": s.id}) for s in site_record]
+        return [(s, [ParameterRecord({"source": "fake", "id": s.id})]) for s in site_record]
+
+
+def _run(depth=0, workers=4, fail_at=None, site_limit=0, output_summary=True):
+    cfg = Config(payload={"yes": True})
+    cfg.fetch_workers = workers
+    cfg.pipeline_depth = depth
+    cfg.site_limit = site_limit
+    cfg.output_summary = output_summary
+    persister = BasePersister(cfg)
+    source = _FakeParamSource(fail_at)
+
+    # count a chunk as persisted when its records reach the persister
+    class _Records(list):
+        def extend(self, items):
+            items = list(items)
+            with source.lock:
+                source.unpersisted -= 1
+            super().extend(items)
+
+    persister.records = _Records()
+    _site_wrapper(_FakeSiteSource(), source, persister, cfg)
+    return persister, source
+
+
+def _ids():
+    return [f"W{i:02d}" for i in range(N_SITES)]
+
+
+class TestPipeline:
+    def test_records_in_chunk_order(self):
+        persister, source = _run()
+        assert [r.id for r in persister.records] == _ids()
+        # every chunk read once
+        assert sorted(source.started) == [f"W{i:02d}" for i in range(0, N_SITES, 2)]
+
+    def test_timeseries_in_chunk_order(self):
+        persister, _ = _run(output_summary=False)
+        assert [s.id for s in persister.sites] == _ids()
+
+    @pytest.mark.parametrize("depth", [1, 2, 5])
+    def test_in_flight_bounded_by_depth(self, depth):
+        _persister, source = _run(depth=depth)
+        assert source.max_unpersisted <= depth
+
+    def test_abort_skips_queued_chunks_and_rolls_back(self):
+        persister, source = _run(depth=2, workers=2, fail_at="W04")
+        assert persister.records == []
+        # chunks past the failure plus the depth were never started
+        assert len(source.started) <= 3 + 2
+
+    def test_site_limit_unchanged(self):
+        persister, _ = _run(site_limit=5)
+        assert [r.id for r in persister.records] == _ids()[:5]
+
+
+class TestIterChunkResults:
+    def test_persists_before_last_fetch_starts(self):
+        events = []
+        lock = threading.Lock()
+
+        def fetch(i):
+            with lock:
+                events.append(("fetch", i))
+            time.sleep(0.002)
+            return i
+
+        for i in _iter_chunk_results(range(10), fetch, workers=2, depth=2):
+            with lock:
+                events.append(("persist", i))
+        assert events.index(("persist", 0)) < events.index(("fetch", 9))
+        assert [e[1] for e in events if e[0] == "persist"] == list(range(10))
+
+    def test_finish_runs_on_consumer_thread(self):
+        consumer = threading.get_ident()
+        threads = set()
+
+        def finish(result):
+            threads.add(threading.get_ident())
+            return result * 10
+
+        out = list(_iter_chunk_results(range(5), lambda i: i, workers=1, depth=3, finish=finish))
+        assert out == [0, 10, 20, 30, 40] and threads == {consumer}
+
+    def test_serial_without_threads(self):
+        consumer = threading.get_ident()
+        seen = []
+        list(_iter_chunk_results(range(3), lambda i: seen.append(threading.get_ident()), workers=1, depth=4))
+        assert set(seen) == {consumer}
@@ -0,0 +1,227 @@
+"""Adaptive chunk sizing (Config.adaptive_chunks, backend/chunk_sizing.py).
+
+A request that times out is split in half and retried, so a source whose
+chunk_size is too large for its provider still finishes — with the output of
+a run that never timed out — and the next run starts from the smaller size.
+Sizes grow run over run while requests stay fast and small, up to the
+ceiling, and stop growing when the payload is too large. A single site that
+still times out aborts the source as before. Summary means are compared to
+within their rounding, which depends on how a site's records fall into pages.
+"""
+import json
+import random
+
+import pytest
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from backend.chunk_sizing import MAX_GROWTH, ChunkSizes, size_key
+from backend.config import Config
+from backend.connectors import _dlt
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.exceptions import ChunkTimeoutError, PartialOrNoDataError
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.unifier import unify_source_both
+
+IDS = [f"USGS-{i:09d}" for i in range(60)]
+CHUNK_SIZE = 4
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _Provider:
+    """NWIS measurements; a request for more than *max_sites* sites, or for
+    a *slow* site, times out."""
+
+    def __init__(self, max_sites=None, slow=()):
+        rng = random.Random(5)
+        self.features = []
+        for site in IDS[:-2]:
+            for _ in range(rng.randint(2, 6)):
+                self.features.append({
+                    "properties": {
+                        "monitoring_location_id": site,
+                        "value": f"{rng.uniform(10, 200):.2f}",
+                        "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                        "unit_of_measure": "ft",
+                        "approval_status": "Approved",
+                        "qualifier": None,
+                    }
+                })
+        self.max_sites = max_sites
+        self.slow = set(slow)
+        self.requests = []  # (sites requested, answered)
+
+    def pages(self, url, json_data=None, **kw):
+        wanted = json_data["args"][1]
+        if (self.max_sites and len(wanted) > self.max_sites) or self.slow & set(wanted):
+            self.requests.append((len(wanted), False))
+            raise ChunkTimeoutError("Read timed out")
+        self.requests.append((len(wanted), True))
+        mine = [f for f in self.features if f["properties"]["monitoring_location_id"] in wanted]
+        for i in range(0, len(mine), 7):
+            yield mine[i:i + 7]
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture
+def run(monkeypatch, tmp_path):
+    path = tmp_path / "chunk_sizes.json"
+
+    def _run(provider, adaptive=True, **settings):
+        monkeypatch.setattr(usgs_source, "iter_json_pages", provider.pages)
+
+        def fake_pair(self, source_key):
+            site, param = _FakeSiteSource(), NWISWaterLevelSource()
+            for s in (site, param):
+                s.set_config(self)
+                s.log = s.warn = _quiet
+            param.transformer.warn = _quiet
+            return site, param
+
+        monkeypatch.setattr(Config, "source_pair", fake_pair)
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = "waterlevels"
+        cfg.fetch_workers = 1
+        cfg.fetch_cache_bytes = 0
+        cfg.adaptive_chunks = adaptive
+        cfg.chunk_sizes_path = str(path)
+        for name, value in settings.items():
+            setattr(cfg, name, value)
+        provider.requests.clear()
+        summary, timeseries = unify_source_both(cfg, "fake")
+        summaries = [r.to_dict() for r in summary.records]
+        means = [r.pop("mean") for r in summaries]
+        return (
+            summaries,
+            [s.id for s in timeseries.sites],
+            [[r.to_dict() for r in t] for t in timeseries.timeseries],
+            means,
+        )
+
+    def learned():
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())[size_key(Config(payload={"yes": True, "parameter": "waterlevels"}), NWISWaterLevelSource())]
+
+    _run.learned = learned
+    return _run
+
+
+def _same(got, expected):
+    return got[:3] == expected[:3] and got[3] == pytest.approx(expected[3], abs=0.011)
+
+
+def _timeouts(provider):
+    return sum(not ok for _n, ok in provider.requests)
+
+
+class TestBisection:
+    @pytest.mark.parametrize("layout", ["threads", "processes"])
+    def test_split_on_timeout_matches_untimed_run(self, run, layout):
+        expected = run(_Provider(), adaptive=False)
+        provider = _Provider(max_sites=1)
+        assert _same(run(provider, transform_layout=layout, transform_workers=2), expected) and expected[0]
+        assert all(n <= 1 for n, ok in provider.requests if ok)
+        # one timeout at 4 sites, one at 2, then requests of one site
+        assert _timeouts(provider) == 2
+        assert run.learned() == 1
+
+    def test_next_run_starts_from_learned_size(self, run):
+        provider = _Provider(max_sites=2)
+        run(provider)
+        first = _timeouts(provider)
+        run(provider)
+        assert first and _timeouts(provider) < first
+
+    def test_workers(self, run):
+        expected = run(_Provider(), adaptive=False)
+        provider = _Provider(max_sites=2)
+        assert _same(run(provider, fetch_workers=3), expected)
+        assert all(n <= 2 for n, ok in provider.requests if ok)
+
+    def test_single_slow_site_aborts_source(self, run):
+        provider = _Provider(slow=[IDS[5]])
+        assert run(provider) [:3] == ([], [], [])
+        assert (1, False) in provider.requests
+
+    def test_off_by_default(self, run):
+        provider = _Provider(max_sites=2)
+        assert run(provider, adaptive=False) [:3] == ([], [], [])
+        assert run.learned() is None
+        assert provider.requests == [(CHUNK_SIZE, False)]
+
+
+class TestGrowth:
+    def test_grows_run_over_run_to_ceiling(self, run):
+        provider = _Provider()
+        expected = run(provider, adaptive=False)
+        sizes = []
+        for _ in range(6):
+            assert _same(run(provider), expected)
+            sizes.append(run.learned())
+        assert sizes == sorted(sizes) and sizes[0] > CHUNK_SIZE
+        assert sizes[-1] == CHUNK_SIZE * MAX_GROWTH
+        assert max(n for n, _ok in provider.requests) == CHUNK_SIZE * MAX_GROWTH
+
+    def test_large_payload_does_not_grow(self, run):
+        provider = _Provider()
+        run(provider, chunk_target_records=20)
+        assert run.learned() == CHUNK_SIZE
+
+    def test_slow_requests_do_not_grow(self, run):
+        provider = _Provider()
+        run(provider, chunk_target_seconds=0)
+        assert run.learned() == CHUNK_SIZE
+
+
+class TestChunkSizes:
+    def test_file_keeps_other_keys(self, tmp_path):
+        path = str(tmp_path / "sizes.json")
+        ChunkSizes(path).save("a", 3)
+        ChunkSizes(path).save("b", 7)
+        assert ChunkSizes(path).sizes == {"a": 3, "b": 7}
+
+    def test_unreadable_file_is_ignored(self, tmp_path):
+        path = tmp_path / "sizes.json"
+        path.write_text("{not json")
+        assert ChunkSizes(str(path)).sizes == {}
+
+    def test_save_drops_invalid_entries(self, tmp_path):
+        path = tmp_path / "sizes.json"
+        path.write_text('{"a": 0, "b": "x", "c": 4}')
+        ChunkSizes(str(path)).save("d", 2)
+        assert json.loads(path.read_text()) == {"c": 4, "d": 2}
+
+
+class TestTimeoutError:
+    def test_timeouts_are_chunk_timeouts(self):
+        assert isinstance(_dlt._request_error("u", requests.ReadTimeout("slow")), ChunkTimeoutError)
+        # a read timeout while streaming a body
+        streamed = requests.ConnectionError(ReadTimeoutError(None, "u", "Read timed out."))
+        assert isinstance(_dlt._request_error("u", streamed), ChunkTimeoutError)
+
+    def test_other_failures_are_not(self):
+        error = _dlt._request_error("u", requests.ConnectionError("reset"))
+        assert isinstance(error, PartialOrNoDataError) and not isinstance(error, ChunkTimeoutError)
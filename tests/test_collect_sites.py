@@ -0,0 +1,128 @@
+"""Concurrent cross-source site collection (collect_sites).
+
+Site sources are discovered at the same time (all of them meet at a barrier
+inside discovery), so the sweep takes about as long as the slowest source
+rather than the sum. The sites still come back in
+source order, a source that fails or is rate limited contributes nothing
+without affecting the others, and each source's timing is reported.
+"""
+import threading
+import time
+
+import pytest
+
+from backend.config import Config
+from backend.exceptions import USGSRateLimitError
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.unifier import collect_sites
+
+DELAY = 0.05
+
+
+class _Overlap:
+    """How many sources are discovering at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.met = []
+
+    def __enter__(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.active -= 1
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+class _FakeSiteSource(BaseSiteSource):
+    def __init__(self, name, n=3, error=None, barrier=None, overlap=None):
+        super().__init__(transformer=BaseTransformer())
+        self.name = name
+        self.n = n
+        self.error = error
+        self.barrier = barrier
+        self.overlap = overlap or _Overlap()
+
+    def __repr__(self):
+        return self.name
+
+    def get_records(self, *a, **k):
+        with self.overlap:
+            if self.barrier is not None:
+                # everyone waits here until all sources are discovering at
+                # once; a serial sweep breaks the barrier on its timeout
+                self.barrier.wait(timeout=5)
+                self.overlap.met.append(self.name)
+            time.sleep(DELAY)
+        if self.error is not None:
+            raise self.error
+        return [{"id": f"{self.name}-{i}"} for i in range(self.n)]
+
+    def _transform_sites(self, records):
+        return [SiteRecord({"source": self.name, "id": r["id"]}) for r in records]
+
+
+@pytest.fixture
+def collect(monkeypatch):
+    def _collect(sources, workers=8):
+        def fake_sources(self):
+            for s in sources:
+                s.set_config(self)
+                s.log = s.warn = _quiet
+            return [(s, None) for s in sources]
+
+        monkeypatch.setattr(Config, "all_site_sources", fake_sources)
+        cfg = Config(payload={"yes": True})
+        cfg.site_source_workers = workers
+        cfg.log = cfg.warn = _quiet
+        payloads = collect_sites(cfg)
+        return payloads, cfg._persister.stats["site_sources"]
+
+    return _collect
+
+
+def _sources(barrier=None, overlap=None):
+    kw = {"barrier": barrier, "overlap": overlap}
+    return [
+        _FakeSiteSource("a", **kw),
+        _FakeSiteSource("b", error=RuntimeError("boom"), **kw),
+        _FakeSiteSource("c", n=2, **kw),
+        _FakeSiteSource("d", error=USGSRateLimitError("429"), **kw),
+        _FakeSiteSource("e", n=1, **kw),
+    ]
+
+
+class TestCollectSites:
+    def test_concurrent_in_source_order(self, collect):
+        overlap = _Overlap()
+        sources = _sources(threading.Barrier(5), overlap)
+        payloads, timings = collect(sources)
+        assert [p["id"] for p in payloads] == ["a-0", "a-1", "a-2", "c-0", "c-1", "e-0"]
+        # every source got past the barrier: all five were discovering at once
+        assert sorted(overlap.met) == ["a", "b", "c", "d", "e"]
+        assert overlap.peak == len(sources)
+
+    def test_failures_are_isolated_and_reported(self, collect):
+        _, timings = collect(_sources())
+        assert [t["source"] for t in timings] == ["a", "b", "c", "d", "e"]
+        assert [t["ok"] for t in timings] == [True, False, True, True, True]
+        # the rate-limited source is skipped by _site_wrapper itself
+        assert [t["sites"] for t in timings] == [3, 0, 2, 0, 1]
+        # each source's own discovery time, which sleeps DELAY
+        assert all(t["seconds"] >= DELAY for t in timings)
+
+    def test_serial_same_output(self, collect):
+        concurrent, _ = collect(_sources())
+        overlap = _Overlap()
+        serial, _ = collect(_sources(overlap=overlap), workers=1)
+        assert serial == concurrent
+        assert overlap.peak == 1
@@ -0,0 +1,218 @@
+"""Process-wide fetch cache (backend/fetch_cache.py, Config.fetch_cache_bytes).
+
+Fresh source pairs unified in one process share the site list and chunk
+fetches of an earlier pair with the same query settings — including the state
+a fetch sets for the transform — and get identical output. A different date
+window or query state fetches again. The cache itself evicts least recently
+used entries by retained size, expires old ones and fetches a key in flight
+only once.
+"""
+import threading
+import time
+
+import pytest
+
+from backend.config import Config
+from backend.constants import (
+    DT_MEASURED,
+    PARAMETER_NAME,
+    PARAMETER_UNITS,
+    PARAMETER_VALUE,
+    SOURCE_PARAMETER_NAME,
+    SOURCE_PARAMETER_UNITS,
+)
+from backend.fetch_cache import FetchCache, shared_fetch_cache
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer, BaseWaterLevelSource, get_terminal_record
+from backend.transformer import WaterLevelTransformer
+from backend.unifier import unify_source_both
+
+IDS = [f"W{i}" for i in range(5)]
+CALLS = {"sites": 0, "records": 0}
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        CALLS["sites"] += 1
+        return [{"id": i} for i in IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _FakeTransformer(WaterLevelTransformer):
+    source_tag = "fake"
+
+
+class _FakeParamSource(BaseWaterLevelSource):
+    """Names its source parameter from the fetch, like BOR and ISC do."""
+
+    site_id_field = "site"
+    terminal_key = "date"
+    transform_state = ("_source_parameter_name",)
+    fetch_state = ("_query",)
+    _source_parameter_name = None
+    _query = "all"
+
+    def __init__(self):
+        super().__init__(transformer=_FakeTransformer())
+
+    def get_records(self, site_record):
+        CALLS["records"] += 1
+        self._source_parameter_name = f"depth ({self._query})"
+        return [
+            {"site": s.id, "date": f"2020-01-{d:02d}", "value": str(d + i)}
+            for i, s in enumerate(site_record)
+            for d in range(1, 4)
+        ]
+
+    def _extract_parameter_record(self, record):
+        record[PARAMETER_NAME] = "waterlevels"
+        record[PARAMETER_VALUE] = float(record["value"])
+        record[PARAMETER_UNITS] = "ft"
+        record[DT_MEASURED] = record["date"]
+        record[SOURCE_PARAMETER_NAME] = self._source_parameter_name
+        record[SOURCE_PARAMETER_UNITS] = "ft"
+        return record
+
+    def _extract_source_parameter_results(self, records):
+        return [r["value"] for r in records]
+
+    def _extract_parameter_dates(self, records):
+        return [r["date"] for r in records]
+
+    def _extract_source_parameter_names(self, records):
+        return [self._source_parameter_name for r in records]
+
+    def _extract_source_parameter_units(self, records):
+        return ["ft" for r in records]
+
+    def _extract_terminal_record(self, records, position):
+        record = get_terminal_record(records, self.terminal_key, position)
+        return {
+            "value": float(record["value"]),
+            "datetime": record["date"],
+            "source_parameter_units": "ft",
+            "source_parameter_name": self._source_parameter_name,
+        }
+
+
+@pytest.fixture
+def unify(monkeypatch):
+    def _run(end_date="", query="all", cache_bytes=None):
+        def fake_pair(self, source_key):
+            site, param = _FakeSiteSource(), _FakeParamSource()
+            param._query = query
+            for s in (site, param):
+                s.set_config(self)
+                s.log = s.warn = _quiet
+            param.transformer.warn = _quiet
+            return site, param
+
+        monkeypatch.setattr(Config, "source_pair", fake_pair)
+        cfg = Config(payload={"yes": True, "end_date": end_date})
+        cfg.parameter = "waterlevels"
+        if cache_bytes is not None:
+            cfg.fetch_cache_bytes = cache_bytes
+        CALLS.update(sites=0, records=0)
+        summary, timeseries = unify_source_both(cfg, "fake")
+        return (
+            [r.to_dict() for r in summary.records],
+            [[r.to_dict() for r in t] for t in timeseries.timeseries],
+        ), dict(CALLS)
+
+    return _run
+
+
+class TestSharedAcrossInstances:
+    def test_second_pair_fetches_nothing(self, unify):
+        first, calls = unify()
+        assert calls == {"sites": 1, "records": 3}
+        second, calls = unify()
+        assert calls == {"sites": 0, "records": 0}
+        assert second == first and first[0]
+
+    def test_fetch_state_reaches_the_second_pair(self, unify):
+        unify()
+        (_, timeseries), _ = unify()
+        assert {r["source_parameter_name"] for t in timeseries for r in t} == {"depth (all)"}
+
+    def test_other_window_fetches_again(self, unify):
+        unify(end_date="2021-01-01")
+        _, calls = unify(end_date="2022-01-01")
+        assert calls == {"sites": 1, "records": 3}
+
+    def test_other_query_state_fetches_again(self, unify):
+        unify(query="all")
+        (_, timeseries), calls = unify(query="some")
+        assert calls["records"] == 3 and calls["sites"] == 0
+        assert {r["source_parameter_name"] for t in timeseries for r in t} == {"depth (some)"}
+
+    def test_off(self, unify):
+        unify(cache_bytes=0)
+        _, calls = unify(cache_bytes=0)
+        assert calls == {"sites": 1, "records": 3}
+        assert len(shared_fetch_cache()) == 0
+
+
+class TestFetchCache:
+    def test_evicts_least_recently_used_by_size(self):
+        cache = FetchCache(max_bytes=10_000)
+        for key in "abc":
+            cache.get_or_fetch(key, lambda: ["x" * 3000])
+        cache.get_or_fetch("a", lambda: pytest.fail("a was evicted"))
+        cache.get_or_fetch("d", lambda: ["y" * 3000])
+        assert set(cache._entries) == {"a", "c", "d"}
+        assert cache.nbytes <= cache.max_bytes
+
+    def test_larger_than_budget_not_kept(self):
+        cache = FetchCache(max_bytes=1000)
+        assert cache.get_or_fetch("big", lambda: "z" * 5000) == "z" * 5000
+        assert len(cache) == 0 and cache.nbytes == 0
+
+    def test_old_entries_fetched_again(self):
+        cache = FetchCache(max_bytes=10_000, max_age=0.01)
+        cache.get_or_fetch("a", lambda: 1)
+        time.sleep(0.02)
+        assert cache.get_or_fetch("a", lambda: 2) == 2
+
+    def test_key_in_flight_fetched_once(self):
+        cache = FetchCache(max_bytes=10_000)
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.05)
+            return "v"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("k", slow))) for _ in range(4)]
+        threads[0].start()
+        started.wait()
+        for t in threads[1:]:
+            t.start()
+        for t in threads:
+            t.join()
+        assert calls == [1] and results == ["v"] * 4
+
+    def test_failed_fetch_is_retried_by_waiter(self):
+        cache = FetchCache(max_bytes=10_000)
+        with pytest.raises(RuntimeError):
+            cache.get_or_fetch("k", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+        assert cache.get_or_fetch("k", lambda: "ok") == "ok"
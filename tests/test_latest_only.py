@@ -0,0 +1,262 @@
+"""Gate for the latest-only fetch plan (Config.latest_only).
+
+The plan must leave each well's latest summary value unchanged while fetching
+less: fake sources return a full history from get_records and only the newest
+rows from get_latest_records, so the test can compare the two plans and check
+the fallback to a full fetch when the newest reading is unusable.
+"""
+import random
+from collections import namedtuple
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.st2 import source as st2_source
+from backend.connectors.st2.source import PVACDWaterLevelSource
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.record import SiteRecord, SummaryRecord
+from backend.source import LATEST_ONLY_BLANK, BaseParameterSource, BaseSiteSource, BaseTransformer
+from backend.unifier import unify_source, unify_source_both
+
+HISTORY = {
+    "W1": [("2001-01-01", "1.0"), ("2010-06-01", "2.0"), ("2020-03-01", "3.0")],
+    # newest reading is blank, so the latest usable one is older
+    "W2": [("2005-01-01", "5.0"), ("2021-01-01", "")],
+}
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in HISTORY]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _FakeParamSource(BaseParameterSource):
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+        self.calls = []
+
+    def _rows(self, sites, latest):
+        rows = []
+        for s in sites:
+            history = HISTORY[s.id][-1:] if latest else HISTORY[s.id]
+            rows.extend({"site": s.id, "date": d, "value": v} for d, v in history)
+        return rows
+
+    def get_records(self, site_record):
+        self.calls.append(("full", [s.id for s in site_record]))
+        return self._rows(site_record, False)
+
+    def get_latest_records(self, site_record):
+        self.calls.append(("latest", [s.id for s in site_record]))
+        return self._rows(site_record, True)
+
+    def _extract_site_records(self, records, site_record):
+        return [r for r in records if r["site"] == site_record.id]
+
+    def _clean_records(self, records):
+        return [r for r in records if r["value"]]
+
+    def _summarize_records(self, site, cleaned):
+        latest = max(cleaned, key=lambda r: r["date"])
+        return {"id": site.id, "latest_date": latest["date"], "latest_value": latest["value"]}
+
+    def read_timeseries(self, site_record):
+        self.calls.append(("timeseries", [s.id for s in site_record]))
+        return []
+
+
+@pytest.fixture
+def run(monkeypatch):
+    holder = {}
+
+    def fake_pair(self, source_key):
+        site, param = _FakeSiteSource(), _FakeParamSource()
+        site.set_config(self)
+        param.set_config(self)
+        holder["param"] = param
+        return site, param
+
+    monkeypatch.setattr(Config, "source_pair", fake_pair)
+
+    def _run(latest_only, both=False):
+        cfg = Config()
+        cfg.parameter = "waterlevels"
+        cfg.output_summary = True
+        cfg.fetch_workers = 1
+        cfg.latest_only = latest_only
+        if both:
+            return unify_source_both(cfg, "fake"), holder["param"]
+        return unify_source(cfg, "fake"), holder["param"]
+
+    return _run
+
+
+class TestLatestOnly:
+    def test_latest_values_match_full_fetch(self, run):
+        full, _ = run(False)
+        latest, _ = run(True)
+        assert latest.records == full.records
+        assert [r["latest_value"] for r in latest.records] == ["3.0", "5.0"]
+
+    def test_uses_latest_plan_and_falls_back_per_site(self, run):
+        _, param = run(True)
+        # one latest-only fetch for the chunk; only W2, whose newest reading
+        # is blank, is refetched in full
+        assert param.calls == [("latest", ["W1", "W2"]), ("full", ["W2"])]
+
+    def test_off_by_default(self, run):
+        _, param = run(Config.latest_only)
+        assert param.calls == [("full", ["W1", "W2"])]
+
+    def test_dual_unify_skips_timeseries_pass(self, run):
+        (summary, timeseries), param = run(True, both=True)
+        assert len(summary.records) == 2
+        assert timeseries.sites == [] and timeseries.timeseries == []
+        assert all(kind != "timeseries" for kind, _ in param.calls)
+
+    def test_window_fields_blank(self):
+        # the window's nrecords/min/max/mean/earliest_* are not the site's
+        src = _RecordParamSource()
+        cfg = Config()
+        cfg.parameter = "waterlevels"
+        cfg.latest_only = True
+        src.set_config(cfg)
+        sites = _FakeSiteSource()._transform_sites([{"id": i} for i in HISTORY])
+        records = src.read_summary(sites, 0, 1)
+        assert [r.latest_value for r in records] == ["3.0", "5.0"]
+        for r in records:
+            assert all(getattr(r, k) is None for k in LATEST_ONLY_BLANK)
+
+        cfg.latest_only = False
+        full = src.read_summary(sites, 0, 1)
+        assert [r.nrecords for r in full] == [3, 1]
+
+
+class _RecordParamSource(_FakeParamSource):
+    def _summarize_records(self, site, cleaned):
+        values = [float(r["value"]) for r in cleaned]
+        latest = max(cleaned, key=lambda r: r["date"])
+        earliest = min(cleaned, key=lambda r: r["date"])
+        return SummaryRecord({
+            "id": site.id,
+            "nrecords": len(values),
+            "min": min(values),
+            "max": max(values),
+            "mean": sum(values) / len(values),
+            "earliest_date": earliest["date"],
+            "earliest_value": earliest["value"],
+            "latest_date": latest["date"],
+            "latest_value": latest["value"],
+        })
+
+
+
+_Site = namedtuple("_Site", "id")
+
+
+class TestSensorThingsLatestPlan:
+    def _source(self, monkeypatch, observations):
+        calls = []
+
+        def fake_sta_query(url, path, **kw):
+            calls.append(kw)
+            obs = observations[path]
+            return obs[:1] if kw.get("top") == 1 else obs
+
+        monkeypatch.setattr(st2_source, "sta_query", fake_sta_query)
+        src = PVACDWaterLevelSource()
+        cfg = Config()
+        cfg.parameter = "waterlevels"
+        src.set_config(cfg)
+        thing = {"name": "Water Well", "Datastreams": [{"@iot.id": 7, "name": "dtw"}]}
+        monkeypatch.setattr(src.client, "_get_things", lambda site: [thing])
+        return src, calls
+
+    def test_newest_observation_per_datastream(self, monkeypatch):
+        obs = [{"phenomenonTime": "2020", "result": 3}, {"phenomenonTime": "2010", "result": 2}]
+        src, calls = self._source(monkeypatch, {"Datastreams(7)/Observations": obs})
+        records = src.get_latest_records(_Site(1))
+        assert [r["observation"]["result"] for r in records] == [3]
+        assert calls == [{"filter": None, "orderby": "phenomenonTime desc", "top": 1}]
+
+    def test_null_newest_result_pages_datastream(self, monkeypatch):
+        obs = [{"phenomenonTime": "2020", "result": None}, {"phenomenonTime": "2010", "result": 2}]
+        src, calls = self._source(monkeypatch, {"Datastreams(7)/Observations": obs})
+        records = src.get_latest_records(_Site(1))
+        assert [r["observation"]["result"] for r in records] == [None, 2]
+        assert len(calls) == 2
+
+
+class TestNWISLatestPlan:
+    def _source(self, monkeypatch, n_sites, page_rows=100):
+        rng = random.Random(5)
+        ids = [f"USGS-{i:09d}" for i in range(n_sites)]
+        features = [
+            {
+                "properties": {
+                    "monitoring_location_id": site,
+                    "value": f"{rng.uniform(10, 200):.2f}",
+                    "time": f"{2024 - year}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                    "unit_of_measure": "ft",
+                    "approval_status": "Approved",
+                    "qualifier": None,
+                }
+            }
+            for site in ids
+            # an active well: read about once a year up to last year
+            for year in range(rng.randint(1, 12))
+        ]
+        requests = []
+
+        def fake_pages(url, params=None, json_data=None, method="GET", **kw):
+            wanted = set(json_data["args"][1])
+            mine = [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+            if params.get("sortby") == "-time":
+                mine.sort(key=lambda f: f["properties"]["time"], reverse=True)
+            for i in range(0, len(mine), page_rows):
+                # each page is a request of its own
+                requests.append((method, len(wanted)))
+                yield mine[i:i + page_rows]
+
+        monkeypatch.setattr(usgs_source, "iter_json_pages", fake_pages)
+        src = NWISWaterLevelSource()
+        cfg = Config()
+        cfg.parameter = "waterlevels"
+        src.set_config(cfg)
+        src.log = lambda *a, **k: None
+        sites = [SiteRecord({"id": i}) for i in ids]
+        return src, sites, features, requests
+
+    def test_batched_requests_per_chunk(self, monkeypatch):
+        # a full USGS site chunk: two batches of num_sites
+        src, sites, features, requests = self._source(monkeypatch, 500)
+        latest = src.get_latest_records(sites)
+        assert [m for m, _n in requests] == ["POST"] * len(requests)
+        assert sorted({n for _m, n in requests}) == [250]
+        full = len(requests)
+        requests.clear()
+        src.get_records(sites)
+        # newest first, the batch stops once every site has its latest row
+        assert len(requests) > 2 * full
+        assert full >= 2
+
+        newest: dict = {}
+        for f in features:
+            p = f["properties"]
+            if p["time"] > newest.get(p["monitoring_location_id"], ("",))[0]:
+                newest[p["monitoring_location_id"]] = (p["time"], p["value"])
+        assert {r["site_id"]: (r["datetime_measured"], r["value"]) for r in latest} == newest
@@ -0,0 +1,255 @@
+"""Memory accounting and budgets (backend/memory.py, Config.memory_*).
+
+A sampled run reports each stage's peak and steady-state memory in the
+persisters' stats. Over Config.memory_budget_bytes a run spills, then makes
+smaller requests, then fetches fewer chunks at once — with the output of an
+unconstrained run. Memory pressure is simulated by patching rss_bytes.
+"""
+import random
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from backend import memory
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.memory import MemoryBudget, MemorySampler, rss_bytes
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.unifier import _iter_chunk_results, unify_source_both
+
+IDS = [f"USGS-{i:09d}" for i in range(24)]
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 3
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+def _nwis_pages(url, json_data=None, **kw):
+    rng = random.Random(7)
+    features = []
+    for site in IDS:
+        for _ in range(rng.randint(2, 8)):
+            features.append({
+                "properties": {
+                    "monitoring_location_id": site,
+                    "value": f"{rng.uniform(10, 200):.2f}",
+                    "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                    "unit_of_measure": "ft",
+                    "approval_status": "Approved",
+                    "qualifier": None,
+                }
+            })
+    wanted = set(json_data["args"][1])
+    _Requests.sizes.append(len(wanted))
+    yield [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+
+
+class _Requests:
+    sizes: list = []
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture
+def unify(monkeypatch):
+    monkeypatch.setattr(usgs_source, "iter_json_pages", _nwis_pages)
+    _Requests.sizes = []
+
+    def fake_pair(self, source_key):
+        site, param = _FakeSiteSource(), NWISWaterLevelSource()
+        for s in (site, param):
+            s.set_config(self)
+            s.log = s.warn = _quiet
+        param.transformer.warn = _quiet
+        return site, param
+
+    monkeypatch.setattr(Config, "source_pair", fake_pair)
+
+    def run(**settings):
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = "waterlevels"
+        cfg.fetch_cache_bytes = 0
+        cfg.log = cfg.warn = _quiet
+        for name, value in settings.items():
+            setattr(cfg, name, value)
+        summary, timeseries = unify_source_both(cfg, "fake")
+        output = (
+            [r.to_dict() for r in summary.records],
+            [s.to_dict() for s in timeseries.sites],
+            [[r.to_dict() for r in t] for t in timeseries.timeseries],
+        )
+        return output, summary, timeseries
+
+    return run
+
+
+class _Persister:
+    def __init__(self):
+        self.memory_bytes = 100
+        self.spills = 0
+
+    def spill(self):
+        self.spills += 1
+        self.memory_bytes = 0
+
+
+class _Adaptive:
+    def __init__(self, size):
+        self.size = size
+
+    def shrink(self):
+        self.size = max(self.size // 2, 1)
+
+
+class TestSampler:
+    def test_stages(self):
+        sampler = MemorySampler(0.01).start()
+        with sampler.stage("discover"):
+            time.sleep(0.03)
+        with sampler.stage("fetch"):
+            held = bytearray(8 << 20)
+            time.sleep(0.03)
+        sampler.stop()
+        report = sampler.report()
+        del held
+        assert set(report["stages"]) == {"discover", "fetch"}
+        fetch = report["stages"]["fetch"]
+        assert fetch["samples"] >= 2 and fetch["peak_rss"] >= fetch["steady_rss"] > 0
+        assert report["peak_rss"] == max(s["peak_rss"] for s in report["stages"].values())
+        assert "peak_traced" not in fetch
+
+    def test_traced(self):
+        was_tracing = tracemalloc.is_tracing()
+        sampler = MemorySampler(0.01, trace=True).start()
+        with sampler.stage("fetch"):
+            held = [str(i) * 10 for i in range(50000)]
+        sampler.stop()
+        del held
+        fetch = sampler.report()["stages"]["fetch"]
+        assert fetch["peak_traced"] > 1 << 20
+        # tracing is left as it was found
+        assert tracemalloc.is_tracing() == was_tracing
+
+    def test_tracing_started_elsewhere_is_kept(self):
+        tracemalloc.start()
+        try:
+            sampler = MemorySampler(0.01, trace=True).start()
+            sampler.stop()
+            assert tracemalloc.is_tracing()
+        finally:
+            tracemalloc.stop()
+
+    def test_rss(self):
+        assert rss_bytes() > 0
+
+
+class TestBudget:
+    def test_steps_cheapest_first(self, monkeypatch):
+        monkeypatch.setattr(memory, "rss_bytes", lambda: 1000)
+        persister, adaptive = _Persister(), _Adaptive(4)
+        budget = MemoryBudget(500, [persister, object()], adaptive, in_flight=4)
+        for _ in range(20):
+            budget.check()
+        actions = [(e["action"], e["value"]) for e in budget.events]
+        assert actions == [
+            ("spill", None),
+            ("smaller_requests", 2),
+            ("smaller_requests", 1),
+            ("fewer_in_flight", 2),
+            ("fewer_in_flight", 1),
+        ]
+        assert persister.spills == 1
+
+    def test_under_budget_does_nothing(self, monkeypatch):
+        monkeypatch.setattr(memory, "rss_bytes", lambda: 100)
+        persister, adaptive = _Persister(), _Adaptive(4)
+        budget = MemoryBudget(500, [persister], adaptive, in_flight=4)
+        budget.check()
+        assert budget.events == [] and adaptive.size == 4 and budget.in_flight == 4
+
+    def test_persister_spills_on_demand(self):
+        pytest.importorskip("pyarrow")
+        from backend.persisters.factory import make_persister
+        from backend.persisters.spill import SpillingPersister
+
+        cfg = Config(payload={"yes": True})
+        cfg.memory_budget_bytes = 1 << 30
+        persister = make_persister(cfg)
+        assert isinstance(persister, SpillingPersister)
+        try:
+            persister.sites.extend(_FakeSiteSource()._transform_sites([{"id": i} for i in IDS]))
+            assert persister.memory_bytes > 0 and "spill" not in persister.stats
+            persister.spill()
+            assert persister.memory_bytes == 0 and persister.stats["spill"]["items"] == len(IDS)
+            assert [s.id for s in persister.sites] == IDS
+        finally:
+            persister.close()
+
+    def test_pipeline_limit(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+        limit = [3]
+
+        def fetch(spec):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return spec
+
+        got = list(_iter_chunk_results(list(range(30)), fetch, 6, 6, limit=lambda: limit[0]))
+        assert got == list(range(30))
+        assert peak[0] <= 3
+
+
+class TestUnify:
+    def test_no_report_by_default(self, unify):
+        _, summary, _ = unify()
+        assert "memory" not in summary.stats
+
+    def test_sampled_report(self, unify):
+        _, summary, timeseries = unify(memory_sample_seconds=0.01, prefilter_sites=True)
+        report = summary.stats["memory"]
+        assert report is timeseries.stats["memory"]
+        assert set(report["stages"]) == {"discover", "prefilter", "fetch"}
+        assert report["peak_rss"] > 0
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_same_output_over_budget(self, unify, monkeypatch, workers):
+        pytest.importorskip("pyarrow")
+        settings = {"fetch_workers": workers, "pipeline_depth": 2}
+        expected, _, _ = unify(**settings)
+        _Requests.sizes = []
+        monkeypatch.setattr(memory, "rss_bytes", lambda: 1 << 40)
+        got, summary, timeseries = unify(**settings, memory_budget_bytes=1 << 30, adaptive_chunks=True)
+        assert got == expected and expected[0]
+        budget = summary.stats["memory"]["budget"]
+        actions = [e["action"] for e in budget["events"]]
+        assert actions[0] == "spill" and "smaller_requests" in actions
+        assert timeseries.stats["spill"]["files"] > 0
+        # requests shrank to single sites
+        assert _Requests.sizes[-1] == 1
+        if workers > 1:
+            assert "fewer_in_flight" in actions
@@ -0,0 +1,212 @@
+"""Tests for the spill-to-disk persister (backend/persisters/spill.py,
+Config.spill_bytes).
+
+Records spilled to Arrow IPC files come back with exactly the payloads (and
+record classes) they were written with — including the mixed-type and nested
+values a native column cannot hold — and the lists behave like the in-memory
+ones for everything the unifier does with them: append/extend, rollback and
+site_limit truncation by ``lst[:n]``. A unify run through make_persister with a
+tiny budget equals the in-memory run.
+"""
+import os
+import random
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from backend.config import Config  # noqa: E402
+from backend.connectors.usgs import source as usgs_source  # noqa: E402
+from backend.connectors.usgs.source import NWISWaterLevelSource  # noqa: E402
+from backend.persister import BasePersister  # noqa: E402
+from backend.persisters.factory import make_persister  # noqa: E402
+from backend.persisters.spill import SpillingPersister  # noqa: E402
+from backend.record import ParameterRecord, SiteRecord, SummaryRecord  # noqa: E402
+from backend.source import BaseSiteSource, BaseTransformer  # noqa: E402
+from backend.unifier import unify_source_both  # noqa: E402
+
+
+def _summary(i):
+    payload = {
+        "source": "fake",
+        "id": f"W{i}",
+        "nrecords": i,
+        "min": 1.5 * i,
+        # a float column with the non-detect marker in it
+        "latest_value": "ND" if i % 5 == 0 else float(i),
+        # ints and floats mixed must not come back as floats
+        "mean": i if i % 2 else i + 0.25,
+        "flag": bool(i % 3),
+        "big": 2 ** 70 if i == 7 else i,
+        "extra": {"links": [i, str(i)]} if i % 4 == 0 else None,
+    }
+    if i % 6 == 0:
+        del payload["min"]
+    return SummaryRecord(payload)
+
+
+def _site(i):
+    site = SiteRecord({"source": "fake", "id": f"W{i}", "latitude": 34.0 + i / 100, "longitude": -106.0})
+    site.chunk_size = 10
+    return site
+
+
+def _rows(i):
+    return [ParameterRecord({"id": f"W{i}", "parameter_value": j * 1.1, "date_measured": f"2020-01-{j + 1:02d}"}) for j in range(i % 4)]
+
+
+def _payloads(items):
+    return [(type(r), r._payload) for r in items]
+
+
+class TestSpillList:
+    def test_round_trip(self, tmp_path):
+        persister = SpillingPersister(spill_bytes=2000, directory=str(tmp_path))
+        summaries = [_summary(i) for i in range(40)]
+        for r in summaries:
+            persister.records.append(r)
+        assert persister.stats["spill"]["files"] > 1
+        assert _payloads(persister.records) == _payloads(summaries)
+        assert len(persister.records) == 40
+        assert persister.records[7].big == 2 ** 70 and persister.records[-1].id == "W39"
+
+    def test_nested_and_sites(self, tmp_path):
+        persister = SpillingPersister(spill_bytes=2000, directory=str(tmp_path))
+        for i in range(30):
+            persister.sites.append(_site(i))
+            persister.timeseries.append(_rows(i))
+        assert persister.stats["spill"]["items"] > 0
+        assert [[r._payload for r in rows] for rows in persister.timeseries] == [[r._payload for r in _rows(i)] for i in range(30)]
+        assert [s.chunk_size for s in persister.sites] == [10] * 30
+        assert _payloads(persister.sites) == _payloads([_site(i) for i in range(30)])
+
+    def test_batches_are_files_then_memory(self, tmp_path):
+        persister = SpillingPersister(spill_bytes=2000, directory=str(tmp_path))
+        persister.records.extend(_summary(i) for i in range(40))
+        persister.records.append(_summary(40))
+        batches = list(persister.records.batches())
+        assert len(batches) == len(os.listdir(persister.directory)) + bool(persister.records._tail)
+        assert sum(len(b) for b in batches) == 41
+        assert persister.records.memory_bytes <= 2000
+
+    @pytest.mark.parametrize("n", [0, 5, 17, 33, 40])
+    def test_prefix_then_append(self, tmp_path, n):
+        persister = SpillingPersister(spill_bytes=2000, directory=str(tmp_path))
+        persister.records.extend(_summary(i) for i in range(40))
+        persister.records = persister.records[:n]
+        persister.records.append(_summary(99))
+        expected = [_summary(i) for i in range(n)] + [_summary(99)]
+        assert _payloads(persister.records) == _payloads(expected)
+
+    def test_plain_list_assigned(self, tmp_path):
+        persister = SpillingPersister(spill_bytes=2000, directory=str(tmp_path))
+        persister.records = [_summary(1)]
+        persister.records.append(_summary(2))
+        assert [r.id for r in persister.records] == ["W1", "W2"]
+        persister.timeseries = []
+        assert persister.timeseries == [] and not persister.timeseries
+
+    def test_close_removes_files(self, tmp_path):
+        persister = SpillingPersister(spill_bytes=100, directory=str(tmp_path))
+        persister.records.extend(_summary(i) for i in range(10))
+        assert os.listdir(persister.directory)
+        persister.close()
+        assert not os.path.exists(persister.directory)
+
+
+class TestMakePersister:
+    def test_off_by_default(self):
+        assert type(make_persister(Config())) is BasePersister
+
+    def test_spill_bytes(self, tmp_path):
+        cfg = Config()
+        cfg.spill_bytes = 1000
+        cfg.spill_dir = str(tmp_path)
+        persister = make_persister(cfg)
+        assert isinstance(persister, SpillingPersister)
+        assert os.path.dirname(persister.directory) == str(tmp_path)
+
+
+IDS = [f"USGS-{i:09d}" for i in range(30)]
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 4
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+def _nwis_pages(url, json_data=None, **kw):
+    rng = random.Random(9)
+    features = []
+    for site in IDS[:-3]:
+        for _ in range(rng.randint(1, 8)):
+            features.append({
+                "properties": {
+                    "monitoring_location_id": site,
+                    "value": rng.choice([None, f"{rng.uniform(10, 200):.2f}", "-999999"]),
+                    "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                    "unit_of_measure": rng.choice(["ft", "m"]),
+                    "approval_status": "Approved",
+                    "qualifier": None,
+                }
+            })
+    wanted = set(json_data["args"][1])
+    yield [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture
+def unify(monkeypatch, tmp_path):
+    monkeypatch.setattr(usgs_source, "iter_json_pages", _nwis_pages)
+
+    def fake_pair(self, source_key):
+        site, param = _FakeSiteSource(), NWISWaterLevelSource()
+        for s in (site, param):
+            s.set_config(self)
+            s.log = s.warn = _quiet
+        param.transformer.warn = _quiet
+        return site, param
+
+    monkeypatch.setattr(Config, "source_pair", fake_pair)
+
+    def _unify(spill_bytes=0, site_limit=0):
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = "waterlevels"
+        cfg.fetch_cache_bytes = 0
+        cfg.spill_bytes = spill_bytes
+        cfg.spill_dir = str(tmp_path)
+        cfg.site_limit = site_limit
+        summary, timeseries = unify_source_both(cfg, "fake")
+        return (
+            [r.to_dict() for r in summary.records],
+            [s.id for s in timeseries.sites],
+            [[r.to_dict() for r in t] for t in timeseries.timeseries],
+        ), (summary, timeseries)
+
+    return _unify
+
+
+class TestUnify:
+    @pytest.mark.parametrize("site_limit", [0, 9])
+    def test_same_as_in_memory(self, unify, site_limit):
+        expected, _ = unify(site_limit=site_limit)
+        got, (summary, timeseries) = unify(spill_bytes=3000, site_limit=site_limit)
+        assert got == expected and expected[0]
+        assert isinstance(timeseries, SpillingPersister)
+        assert timeseries.stats["spill"]["files"] > 0
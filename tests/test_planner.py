@@ -0,0 +1,223 @@
+"""Dry-run fetch planning (backend/planner.py, Config.fetch_plan).
+
+A plan resolves discovery, the pre-filter and chunking without fetching any
+observations, and estimates the run's requests, pages, records and bytes —
+from the count probe and from the source's last run when there is one. Set
+as Config.fetch_plan, the unifier fetches exactly the planned chunks, with
+the output of an unplanned run; a stale plan is planned afresh.
+"""
+import json
+import random
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.fetch_history import FetchHistory
+from backend.planner import estimate, load_plan, plan_fetch, save_plan
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.unifier import unify_source_both
+
+IDS = [f"USGS-{i:09d}" for i in range(30)]
+EMPTY = set(IDS[::4])
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 4
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _Provider:
+    def __init__(self):
+        rng = random.Random(11)
+        self.features = []
+        for site in IDS:
+            if site in EMPTY:
+                continue
+            for _ in range(rng.randint(3, 12)):
+                self.features.append({
+                    "properties": {
+                        "monitoring_location_id": site,
+                        "value": f"{rng.uniform(10, 200):.2f}",
+                        "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                        "unit_of_measure": "ft",
+                        "approval_status": "Approved",
+                        "qualifier": None,
+                    }
+                })
+        self.requests = []
+        self.probes = 0
+
+    def pages(self, url, json_data=None, **kw):
+        wanted = json_data["args"][1]
+        self.requests.append(list(wanted))
+        mine = [f for f in self.features if f["properties"]["monitoring_location_id"] in wanted]
+        for i in range(0, len(mine), 10):
+            yield mine[i:i + 10]
+
+    def counts(self, site_records):
+        self.probes += 1
+        counts = {}
+        for f in self.features:
+            site = f["properties"]["monitoring_location_id"]
+            counts[site] = counts.get(site, 0) + 1
+        return counts
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = _Provider()
+    monkeypatch.setattr(usgs_source, "iter_json_pages", provider.pages)
+
+    class _ProbedSource(NWISWaterLevelSource):
+        def count_records(self, site_records):
+            self.count_requests += 1
+            return provider.counts(site_records)
+
+    def fake_pair(self, source_key):
+        if source_key == "other":
+            return None
+        site, param = _FakeSiteSource(), _ProbedSource()
+        for s in (site, param):
+            s.set_config(self)
+            s.log = s.warn = _quiet
+        param.transformer.warn = _quiet
+        return site, param
+
+    monkeypatch.setattr(Config, "source_pair", fake_pair)
+    return provider
+
+
+def _config(**settings):
+    cfg = Config(payload={"yes": True})
+    cfg.parameter = "waterlevels"
+    cfg.fetch_workers = 1
+    cfg.fetch_cache_bytes = 0
+    cfg.log = cfg.warn = _quiet
+    for name, value in settings.items():
+        setattr(cfg, name, value)
+    return cfg
+
+
+def _output(persisters):
+    summary, timeseries = persisters
+    return (
+        [r.to_dict() for r in summary.records],
+        [s.id for s in timeseries.sites],
+        [[r.to_dict() for r in t] for t in timeseries.timeseries],
+    )
+
+
+def _entry(plan):
+    (entry,) = plan["sources"]
+    return entry
+
+
+class TestPlan:
+    def test_no_observations_fetched(self, provider):
+        plan = plan_fetch(_config(), ["fake", "other"])
+        entry = _entry(plan)
+        assert provider.requests == []
+        assert entry["sites"] == entry["sites_kept"] == len(IDS)
+        assert entry["chunks"] == [IDS[i:i + 4] for i in range(0, len(IDS), 4)]
+
+    def test_without_history_one_request_per_chunk(self, provider):
+        e = _entry(plan_fetch(_config(), ["fake"]))["estimate"]
+        assert e["requests"] == e["pages"] == 8
+        assert e["records"] == len(provider.features)
+        assert e["bytes"] is None and e["basis"] == ["probe", "chunks"]
+
+    def test_prefilter(self, provider):
+        entry = _entry(plan_fetch(_config(prefilter_sites=True), ["fake"]))
+        assert entry["sites_kept"] == len(IDS) - len(EMPTY)
+        assert not EMPTY & {i for chunk in entry["chunks"] for i in chunk}
+        assert entry["probe_requests"] == 1
+
+    def test_history_estimates_the_run(self, provider, tmp_path):
+        history = str(tmp_path / "history.json")
+        unify_source_both(_config(fetch_history_path=history), "fake")
+        (first,) = FetchHistory(history).runs.values()
+        e = _entry(plan_fetch(_config(fetch_history_path=history, prefilter_sites=True), ["fake"]))["estimate"]
+        assert e["basis"] == ["probe", "history"]
+
+        provider.requests.clear()
+        unify_source_both(_config(fetch_history_path=history, prefilter_sites=True), "fake")
+        (run,) = FetchHistory(history).runs.values()
+        assert run["requests"] == len(provider.requests)
+        # requests scale with chunks, pages/bytes with records
+        assert e["requests"] == pytest.approx(run["requests"], abs=1)
+        assert e["records"] == run["records"]
+        assert e["pages"] == pytest.approx(run["pages"], rel=0.15)
+        assert e["bytes"] == pytest.approx(run["bytes"], rel=0.15)
+        assert first["chunks"] == 8 and run["chunks"] == 6
+
+    def test_estimate(self):
+        history = {"sites": 10, "chunks": 5, "requests": 10, "pages": 40, "records": 400, "bytes": 40000}
+        assert estimate(3, 6, history) == {
+            "requests": 6, "pages": 24, "records": 240, "bytes": 24000, "basis": ["history"],
+        }
+        assert estimate(3, 6, history, records=100)["pages"] == 10
+
+
+class TestExecute:
+    def test_fetches_planned_chunks_with_same_output(self, provider):
+        expected = _output(unify_source_both(_config(prefilter_sites=True), "fake"))
+        plan = plan_fetch(_config(prefilter_sites=True), ["fake"])
+        provider.requests.clear()
+        probes = provider.probes
+        got = _output(unify_source_both(_config(prefilter_sites=True, fetch_plan=plan), "fake"))
+        assert got == expected and expected[0]
+        assert provider.requests == _entry(plan)["chunks"]
+        # the plan was pre-filtered already
+        assert provider.probes == probes
+
+    def test_edited_plan_is_followed(self, provider):
+        plan = plan_fetch(_config(), ["fake"])
+        _entry(plan)["chunks"] = [IDS[:10], IDS[10]] + [IDS[i:i + 5] for i in range(11, len(IDS), 5)]
+        provider.requests.clear()
+        got = _output(unify_source_both(_config(fetch_plan=plan), "fake"))
+        assert provider.requests == [IDS[:10], [IDS[10]]] + [IDS[i:i + 5] for i in range(11, len(IDS), 5)]
+        assert got == _output(unify_source_both(_config(), "fake"))
+
+    def test_other_window_is_not_planned(self, provider):
+        plan = plan_fetch(_config(), ["fake"])
+        _entry(plan)["chunks"] = [IDS]
+        provider.requests.clear()
+        unify_source_both(_config(fetch_plan=plan, start_date="2015-01-01"), "fake")
+        assert len(provider.requests) == 8
+
+    def test_stale_plan_is_replanned(self, provider):
+        plan = plan_fetch(_config(), ["fake"])
+        _entry(plan)["chunks"][0].append("USGS-gone")
+        provider.requests.clear()
+        got = _output(unify_source_both(_config(fetch_plan=plan), "fake"))
+        assert len(provider.requests) == 8
+        assert got == _output(unify_source_both(_config(), "fake"))
+
+    def test_round_trip(self, provider, tmp_path):
+        plan = plan_fetch(_config(), ["fake"])
+        path = str(tmp_path / "plan.json")
+        save_plan(plan, path)
+        assert load_plan(path) == plan
+        (tmp_path / "old.json").write_text(json.dumps({"format": 0}))
+        with pytest.raises(ValueError):
+            load_plan(str(tmp_path / "old.json"))
@@ -0,0 +1,179 @@
+"""Gate for the count-probe site pre-filter (Config.prefilter_sites).
+
+Fake sources keep the test offline: the parameter source reports per-site
+counts and records which chunks it was asked to fetch, so the test can prove
+empty sites are never fetched, the output is unchanged, and the savings are
+recorded on the persister. The connector probes are checked against stubbed
+transports.
+"""
+import pytest
+
+from backend.config import Config
+from backend.connectors import _sensorthings
+from backend.connectors.wqp import source as wqp_source
+from backend.connectors.wqp.source import WQPAnalyteSource
+from backend.exceptions import PartialOrNoDataError
+from backend.record import SiteRecord, SummaryRecord
+from backend.source import BaseParameterSource, BaseSiteSource, BaseTransformer
+from backend.unifier import unify_source
+
+SITE_IDS = [f"W{i}" for i in range(10)]
+WITH_DATA = {"W1", "W7"}
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in SITE_IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _FakeParamSource(BaseParameterSource):
+    counts = {i: 3 for i in WITH_DATA}
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+        self.fetched = []
+
+    def count_records(self, site_records):
+        self.count_requests += 1
+        return dict(self.counts)
+
+    def read_summary(self, site_record, start_ind, end_ind):
+        self.fetched.append([s.id for s in site_record])
+        return [
+            SummaryRecord({"source": "fake", "id": s.id, "nrecords": 3})
+            for s in site_record
+            if s.id in WITH_DATA
+        ]
+
+
+class _NoProbeParamSource(_FakeParamSource):
+    def count_records(self, site_records):
+        return None
+
+
+class _FailingProbeParamSource(_FakeParamSource):
+    def count_records(self, site_records):
+        raise PartialOrNoDataError("probe failed")
+
+
+class _BrokenProbeParamSource(_FakeParamSource):
+    def count_records(self, site_records):
+        # e.g. a summary response that does not parse
+        raise ValueError("unexpected probe response")
+
+
+def _run(monkeypatch, param_klass, prefilter):
+    holder = {}
+
+    def fake_pair(self, source_key):
+        site, param = _FakeSiteSource(), param_klass()
+        site.set_config(self)
+        param.set_config(self)
+        holder["param"] = param
+        return site, param
+
+    monkeypatch.setattr(Config, "source_pair", fake_pair)
+    cfg = Config()
+    cfg.parameter = "waterlevels"
+    cfg.output_summary = True
+    cfg.fetch_workers = 1
+    cfg.prefilter_sites = prefilter
+    persister = unify_source(cfg, "fake")
+    return persister, holder["param"]
+
+
+class TestPrefilter:
+    def test_empty_sites_are_not_fetched(self, monkeypatch):
+        persister, param = _run(monkeypatch, _FakeParamSource, True)
+        # 10 sites in chunks of 2 -> 5 fetches without the pre-filter; the two
+        # sites with data now share a single chunk
+        assert param.fetched == [["W1", "W7"]]
+        assert [r.id for r in persister.records] == ["W1", "W7"]
+
+    def test_output_matches_unfiltered_run(self, monkeypatch):
+        filtered, _ = _run(monkeypatch, _FakeParamSource, True)
+        unfiltered, param = _run(monkeypatch, _FakeParamSource, False)
+        assert len(param.fetched) == 5
+        assert [r._payload for r in filtered.records] == [
+            r._payload for r in unfiltered.records
+        ]
+
+    def test_savings_recorded(self, monkeypatch):
+        persister, _ = _run(monkeypatch, _FakeParamSource, True)
+        assert persister.stats["prefilter"] == {
+            "sites_in": 10,
+            "sites_kept": 2,
+            "chunks_in": 5,
+            "chunks_kept": 1,
+            "chunks_saved": 4,
+            "probe_requests": 1,
+            "requests_saved": 3,
+        }
+
+    def test_disabled_by_default(self, monkeypatch):
+        persister, param = _run(monkeypatch, _FakeParamSource, Config.prefilter_sites)
+        assert len(param.fetched) == 5
+        assert "prefilter" not in persister.stats
+
+    @pytest.mark.parametrize("klass", [_NoProbeParamSource, _FailingProbeParamSource, _BrokenProbeParamSource])
+    def test_sources_without_probe_fetch_everything(self, monkeypatch, klass):
+        persister, param = _run(monkeypatch, klass, True)
+        assert len(param.fetched) == 5
+        assert [r.id for r in persister.records] == ["W1", "W7"]
+
+
+class TestConnectorProbes:
+    def test_sta_count_requests_no_entities(self, monkeypatch):
+        calls = []
+
+        def fake_fetch_json(url, params=None, **kw):
+            calls.append((url, params))
+            return {"@iot.count": 42, "value": []}
+
+        monkeypatch.setattr(_sensorthings, "fetch_json", fake_fetch_json)
+        n = _sensorthings.sta_count("https://x/v1.1/", "Observations", filter="a eq 1")
+        assert n == 42
+        assert calls == [
+            (
+                "https://x/v1.1/Observations",
+                {"$count": "true", "$top": 0, "$filter": "a eq 1"},
+            )
+        ]
+
+    def _wqp(self, monkeypatch, text):
+        monkeypatch.setattr(wqp_source, "fetch_text", lambda *a, **k: text)
+        cfg = Config()
+        cfg.parameter = "arsenic"
+        cfg.start_date = "2015-01-01"
+        src = WQPAnalyteSource()
+        src.set_config(cfg)
+        return src
+
+    def test_wqp_summary_counts_in_window(self, monkeypatch):
+        text = (
+            "MonitoringLocationIdentifier,YearSummarized,CharacteristicName,ResultCount\n"
+            "USGS-1,2010,Arsenic,4\n"
+            "USGS-2,2016,Arsenic,2\n"
+            "USGS-2,2018,Arsenic,1\n"
+            "USGS-3,2019,Chloride,9\n"
+        )
+        src = self._wqp(monkeypatch, text)
+        assert src.count_records([]) == {"USGS-2": 3}
+        assert src.count_requests == 1
+
+    def test_wqp_unrecognized_summary_disables_prefilter(self, monkeypatch):
+        src = self._wqp(monkeypatch, "<html>maintenance</html>")
+        assert src.count_records([]) is None
@@ -0,0 +1,237 @@
+"""Record slimming: raw provider payloads are projected to the fields the
+connector reads right after the fetch (BaseParameterSource.record_fields).
+
+Network-free. Also a small memory benchmark: bytes retained per observation
+for WQP rows and ST2 observations, before and after slimming (the numbers are
+in the assertion messages).
+"""
+import tracemalloc
+
+from backend.config import Config
+from backend.connectors.st2.source import PVACDWaterLevelSource
+from backend.connectors.wqp import source as wqp_source
+from backend.connectors.wqp.source import WQPAnalyteSource, parse_tsv
+from backend.memory import _start_tracing, _stop_tracing, deep_sizeof
+from backend.source import slim_records
+
+# The Result TSV's columns (WQP "resultPhysChem"-style profile, abridged to the
+# ones seen in NM results); only a handful are read by the connector.
+WQP_COLUMNS = [
+    "OrganizationIdentifier", "OrganizationFormalName", "ActivityIdentifier",
+    "ActivityTypeCode", "ActivityMediaName", "ActivityMediaSubdivisionName",
+    "ActivityStartDate", "ActivityStartTime/Time", "ActivityStartTime/TimeZoneCode",
+    "ActivityEndDate", "ActivityEndTime/Time", "ActivityEndTime/TimeZoneCode",
+    "ActivityDepthHeightMeasure/MeasureValue", "ActivityDepthHeightMeasure/MeasureUnitCode",
+    "ActivityDepthAltitudeReferencePointText", "ActivityTopDepthHeightMeasure/MeasureValue",
+    "ActivityTopDepthHeightMeasure/MeasureUnitCode", "ActivityBottomDepthHeightMeasure/MeasureValue",
+    "ActivityBottomDepthHeightMeasure/MeasureUnitCode", "ProjectIdentifier",
+    "ActivityConductingOrganizationText", "MonitoringLocationIdentifier",
+    "ActivityCommentText", "SampleAquifer", "HydrologicCondition", "HydrologicEvent",
+    "SampleCollectionMethod/MethodIdentifier", "SampleCollectionMethod/MethodIdentifierContext",
+    "SampleCollectionMethod/MethodName", "SampleCollectionEquipmentName",
+    "ResultDetectionConditionText", "CharacteristicName", "ResultSampleFractionText",
+    "ResultMeasureValue", "ResultMeasure/MeasureUnitCode", "MeasureQualifierCode",
+    "ResultStatusIdentifier", "StatisticalBaseCode", "ResultValueTypeName",
+    "ResultWeightBasisText", "ResultTimeBasisText", "ResultTemperatureBasisText",
+    "ResultParticleSizeBasisText", "PrecisionValue", "ResultCommentText", "USGSPCode",
+    "ResultDepthHeightMeasure/MeasureValue", "ResultDepthHeightMeasure/MeasureUnitCode",
+    "ResultDepthAltitudeReferencePointText", "SubjectTaxonomicName", "SampleTissueAnatomyName",
+    "ResultAnalyticalMethod/MethodIdentifier", "ResultAnalyticalMethod/MethodIdentifierContext",
+    "ResultAnalyticalMethod/MethodName", "MethodDescriptionText", "LaboratoryName",
+    "AnalysisStartDate", "ResultLaboratoryCommentText",
+    "DetectionQuantitationLimitTypeName", "DetectionQuantitationLimitMeasure/MeasureValue",
+    "DetectionQuantitationLimitMeasure/MeasureUnitCode", "PreparationStartDate",
+    "ProviderName",
+]
+
+
+def _wqp_tsv(n_sites=20, per_site=25):
+    rows = ["\t".join(WQP_COLUMNS)]
+    for s in range(n_sites):
+        for i in range(per_site):
+            row = {c: f"{c}-value" for c in WQP_COLUMNS}
+            row.update({
+                "OrganizationIdentifier": "USGS-NM",
+                "OrganizationFormalName": "USGS New Mexico Water Science Center",
+                "MonitoringLocationIdentifier": f"USGS-{s:015d}",
+                "ActivityIdentifier": f"nwisnm.01.{s:05d}{i:05d}",
+                "ActivityStartDate": f"{1990 + i}-0{1 + i % 9}-15",
+                "ActivityStartTime/Time": "10:30:00",
+                "CharacteristicName": "Arsenic",
+                "USGSPCode": "01000",
+                "ResultMeasureValue": f"{i * 0.5 + 1:.1f}",
+                "ResultMeasure/MeasureUnitCode": "ug/L",
+                "ResultTemperatureBasisText": "",
+                "ResultStatusIdentifier": "Accepted",
+                "MeasureQualifierCode": "",
+                "ResultCommentText": f"Sample {i} collected after purging three casing volumes.",
+                "ProviderName": "NWIS",
+            })
+            rows.append("\t".join(row[c] for c in WQP_COLUMNS))
+    return "\n".join(rows)
+
+
+class _Site:
+    def __init__(self, sid):
+        self.id = sid
+        self.chunk_size = 20
+
+
+def _wqp_source(monkeypatch, slim=True):
+    text = _wqp_tsv()
+    # parse per call, like a real fetch
+    monkeypatch.setattr(wqp_source, "fetch_text", lambda *a, **k: text)
+    monkeypatch.setattr(wqp_source, "iter_text", lambda *a, **k: iter([text]))
+    src = WQPAnalyteSource()
+    if not slim:
+        src.record_fields = None
+    cfg = Config()
+    cfg.parameter = "arsenic"
+    src.set_config(cfg)
+    return src
+
+
+def _st2_records(n_datastreams=5, per_datastream=100):
+    """ST2 records as get_records builds them: every observation references its
+    thing/location/datastream."""
+    site = _Site(1)
+    site.chunk_size = 1  # ST2 sites are fetched one at a time
+    records = []
+    for d in range(n_datastreams):
+        thing = {
+            "@iot.id": d,
+            "@iot.selfLink": f"https://st2.newmexicowaterdata.org/FROST-Server/v1.1/Things({d})",
+            "name": "Water Well",
+            "description": "Water well monitored by the agency",
+            "properties": {f"prop{k}": f"value {k}" for k in range(25)},
+            "Datastreams": [],
+        }
+        ds = {
+            "@iot.id": 100 + d,
+            "@iot.selfLink": f"https://st2.newmexicowaterdata.org/FROST-Server/v1.1/Datastreams({100 + d})",
+            "name": "Groundwater Levels",
+            "description": "Depth to water below ground surface",
+            "observationType": "http://www.opengis.net/def/observationType/OGC-OM/2.0/OM_Measurement",
+            "unitOfMeasurement": {"name": "Foot", "symbol": "ft", "definition": "http://www.qudt.org/qudt/owl/1.0.0/unit/Instances.html#Foot"},
+            "properties": {"agency": "PVACD", "topic": "Water Quantity"},
+        }
+        thing["Datastreams"].append(ds)
+        for i in range(per_datastream):
+            obs = {
+                "@iot.id": d * 100000 + i,
+                "@iot.selfLink": f"https://st2.newmexicowaterdata.org/FROST-Server/v1.1/Observations({d * 100000 + i})",
+                "phenomenonTime": f"20{10 + i % 10}-01-{1 + i % 28:02d}T00:00:00.000Z",
+                "resultTime": f"20{10 + i % 10}-01-{1 + i % 28:02d}T00:00:00.000Z",
+                "result": 100.0 + i,
+                "parameters": {"source": "transducer"},
+                "Datastream@iot.navigationLink": f"https://st2.newmexicowaterdata.org/FROST-Server/v1.1/Observations({d * 100000 + i})/Datastream",
+                "FeatureOfInterest@iot.navigationLink": f"https://st2.newmexicowaterdata.org/FROST-Server/v1.1/Observations({d * 100000 + i})/FeatureOfInterest",
+            }
+            records.append({"thing": thing, "location": site, "datastream": ds, "observation": obs})
+    return records
+
+
+def _downstream_view(src, records, sites):
+    """What the extract/clean/parameter steps produce from *records*."""
+    out = []
+    for site in sites:
+        cleaned = src._clean_records(src._extract_site_records(records, site))
+        for r in cleaned:
+            rec = src._extract_parameter(dict(r))
+            out.append({k: rec.get(k) for k in (
+                "parameter_name", "parameter_value", "parameter_units", "date_measured",
+                "source_parameter_name", "source_parameter_units", "approval_status",
+                "qualifier", "approval_status_normalized",
+            )})
+        out.append((
+            src._extract_source_parameter_results(cleaned),
+            src._extract_source_parameter_units(cleaned),
+            src._extract_parameter_dates(cleaned),
+            src._extract_terminal_record(cleaned, "latest"),
+        ))
+    return out
+
+
+class TestSlimRecords:
+    def test_projects_to_declared_fields(self):
+        recs = [{"a": "x", "b": 1, "junk": "y" * 50}]
+        assert slim_records(recs, ("a", "b", "missing")) == [{"a": "x", "b": 1}]
+
+    def test_nested_dicts_stay_shared(self):
+        ds = {"name": "dtw", "big": list(range(100))}
+        recs = [{"ds": ds, "v": i} for i in range(3)]
+        out = slim_records(recs, {"ds": ("name",), "v": None})
+        assert out[0]["ds"] == {"name": "dtw"}
+        assert out[0]["ds"] is out[1]["ds"] is out[2]["ds"]
+
+    def test_equal_strings_collapse(self):
+        recs = [{"u": "".join(["mg", "/L"])} for _ in range(3)]
+        out = slim_records(recs, ("u",))
+        assert out[0]["u"] is out[1]["u"] is out[2]["u"]
+
+    def test_none_spec_keeps_value_by_reference(self):
+        site = object()
+        out = slim_records([{"location": site}], {"location": None})
+        assert out[0]["location"] is site
+
+
+class TestConnectorSlimming:
+    def test_wqp_downstream_unchanged(self, monkeypatch):
+        sites = [_Site(f"USGS-{s:015d}") for s in range(20)]
+        slim = _wqp_source(monkeypatch)
+        raw = _wqp_source(monkeypatch, slim=False)
+        slim_recs = slim._fetch_records(sites)
+        raw_recs = raw._fetch_records(sites)
+        assert len(slim_recs[0]) == len(WQPAnalyteSource.record_fields)
+        assert _downstream_view(slim, slim_recs, sites) == _downstream_view(raw, raw_recs, sites)
+
+    def test_st2_downstream_unchanged(self):
+        src = PVACDWaterLevelSource()
+        cfg = Config()
+        cfg.parameter = "waterlevels"
+        src.set_config(cfg)
+        raw = _st2_records()
+        slim = src._slim_records(raw)
+        assert "thing" not in slim[0]
+        # one projected datastream per original, shared by its observations
+        assert len({id(r["datastream"]) for r in slim}) == 5
+        site = raw[0]["location"]
+        assert _downstream_view(src, slim, [site]) == _downstream_view(src, raw, [site])
+
+
+def _bytes_per_obs(records):
+    return deep_sizeof(records) / len(records)
+
+
+class TestMemoryBenchmark:
+    def test_wqp_bytes_per_observation(self, monkeypatch):
+        raw = parse_tsv(_wqp_tsv())
+        before = _bytes_per_obs(raw)
+        after = _bytes_per_obs(slim_records(raw, WQPAnalyteSource.record_fields))
+        assert after < before / 4, f"WQP bytes/observation: before={before:.0f} after={after:.0f}"
+
+    def test_st2_bytes_per_observation(self):
+        raw = _st2_records()
+        before = _bytes_per_obs(raw)
+        after = _bytes_per_obs(slim_records(raw, PVACDWaterLevelSource.record_fields))
+        assert after < before / 2, f"ST2 bytes/observation: before={before:.0f} after={after:.0f}"
+
+    def test_wqp_retained_allocation(self, monkeypatch):
+        # Same comparison measured by the allocator: what stays allocated once
+        # the fetch returns (the parsed TSV text itself is released).
+        def retained(slim):
+            src = _wqp_source(monkeypatch, slim=slim)
+            sites = [_Site("x")]
+            # tracing may already be on (python -X tracemalloc): leave it be
+            # and count from where it stands
+            _start_tracing()
+            try:
+                base, _peak = tracemalloc.get_traced_memory()
+                recs = src._fetch_records(sites)
+                size, _peak = tracemalloc.get_traced_memory()
+            finally:
+                _stop_tracing()
+            return (size - base) / len(recs)
+
+        before, after = retained(False), retained(True)
+        assert after < before / 3, f"WQP retained bytes/observation: before={before:.0f} after={after:.0f}"
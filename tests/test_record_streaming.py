@@ -0,0 +1,307 @@
+"""Page-streaming record reads (BaseSource.iter_records / streams_records).
+
+A streamed chunk must summarize and build timeseries exactly like the same
+records fetched as one list, warnings included. Checked for NWIS (CQL pages),
+WQP (a TSV parsed while it downloads, with TDS cleaning that spans pages) and
+a page-counting fake that shows pages are processed as they arrive. The
+transports are stubbed, so nothing touches the network.
+"""
+import random
+
+import pytest
+import requests
+
+from backend.config import Config
+from backend.connectors import _dlt
+from backend.connectors import _sensorthings
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.connectors.wqp import source as wqp_source
+from backend.connectors.wqp.source import WQPAnalyteSource, iter_tsv_pages, parse_tsv
+from backend.exceptions import PartialOrNoDataError
+from backend.record import SiteRecord
+from backend.source import BaseParameterSource, BaseTransformer
+
+
+def _sites(ids, chunk_size):
+    sites = []
+    for sid in ids:
+        s = SiteRecord({"source": "test", "id": sid, "latitude": 34.0, "longitude": -106.0})
+        s.chunk_size = chunk_size
+        sites.append(s)
+    return sites
+
+
+def _rows(records):
+    return [r.to_dict() for r in records]
+
+
+def _chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestTsvPages:
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "a\tb\n1\t2\n3\t4",
+            "a\tb\n1\t2\n3\t4\n",
+            "a\tb\n\n1\t2\n",
+            "a\tb",
+            "a\tb\n",
+        ],
+    )
+    @pytest.mark.parametrize("size", [1, 2, 5, 1000])
+    def test_same_rows_as_parse_tsv(self, text, size):
+        rows = [r for page in iter_tsv_pages(_chunked(text, size), 2) for r in page]
+        assert rows == parse_tsv(text)
+
+    def test_empty_body_yields_nothing(self):
+        assert list(iter_tsv_pages([])) == []
+
+    def test_page_size(self):
+        text = "a\n" + "\n".join(str(i) for i in range(7))
+        pages = list(iter_tsv_pages(_chunked(text, 3), 3))
+        assert [len(p) for p in pages] == [3, 3, 1]
+
+
+# -- NWIS ---------------------------------------------------------------------
+
+NWIS_IDS = [f"USGS-{i:09d}" for i in range(6)]
+
+
+def _nwis_features():
+    rng = random.Random(7)
+    features = []
+    for i in range(300):
+        sid = rng.choice(NWIS_IDS[:4])  # the last two sites have no records
+        value = rng.choice([None, f"{rng.uniform(10, 200):.2f}", "-999999"])
+        features.append({
+            "properties": {
+                "monitoring_location_id": sid,
+                "value": value,
+                "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-01T00:00:00Z",
+                "unit_of_measure": "ft",
+                "approval_status": "Approved",
+                "qualifier": None,
+            }
+        })
+    # a site whose every value is unusable
+    features.append({"properties": {
+        "monitoring_location_id": NWIS_IDS[4], "value": None,
+        "time": "2020-01-01T00:00:00Z", "unit_of_measure": "ft",
+    }})
+    return features
+
+
+def _nwis(monkeypatch, streams, page_size=17):
+    features = _nwis_features()
+    fetched = []
+
+    def fake_pages(url, json_data=None, **kw):
+        wanted = set(json_data["args"][1])
+        mine = [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+        for i in range(0, len(mine), page_size):
+            fetched.append(i)
+            yield mine[i:i + page_size]
+
+    monkeypatch.setattr(usgs_source, "iter_json_pages", fake_pages)
+    src = NWISWaterLevelSource()
+    cfg = Config()
+    cfg.parameter = "waterlevels"
+    src.set_config(cfg)
+    src.streams_records = streams
+    warnings = []
+    src.warn = warnings.append
+    return src, warnings, fetched
+
+
+class TestNWISStreaming:
+    def test_summary_matches_materialized(self, monkeypatch):
+        sites = _sites(NWIS_IDS, 6)
+        src, w_stream, fetched = _nwis(monkeypatch, True)
+        streamed = src.read_summary(sites, 0, 6)
+        assert len(fetched) > 1
+        src, w_list, _ = _nwis(monkeypatch, False)
+        listed = src.read_summary(sites, 0, 6)
+        assert _rows(streamed) == _rows(listed)
+        assert w_stream == w_list
+        assert len(streamed) == 4
+
+    def test_timeseries_matches_materialized(self, monkeypatch):
+        sites = _sites(NWIS_IDS, 6)
+        src, w_stream, _ = _nwis(monkeypatch, True)
+        streamed = src.read_timeseries(sites)
+        src, w_list, _ = _nwis(monkeypatch, False)
+        listed = src.read_timeseries(sites)
+        assert [(s.id, _rows(rs)) for s, rs in streamed] == [(s.id, _rows(rs)) for s, rs in listed]
+        assert w_stream == w_list
+
+    def test_batches_stream_in_order(self, monkeypatch):
+        src, _, _ = _nwis(monkeypatch, True)
+        src.num_sites = 2
+        sites = _sites(NWIS_IDS, 6)
+        pages = list(src.iter_records(sites))
+        assert [r for p in pages for r in p] == src.get_records(sites)
+
+    def test_no_records_warns_once(self, monkeypatch):
+        src, warnings, _ = _nwis(monkeypatch, True)
+        assert src.read_summary(_sites(["USGS-x", "USGS-y"], 2), 0, 2) is None
+        assert warnings == ["USGS-x,USGS-y: No records found"]
+
+
+# -- WQP ----------------------------------------------------------------------
+
+WQP_HEADER = [
+    "MonitoringLocationIdentifier", "ActivityIdentifier", "ActivityStartDate",
+    "ActivityStartTime/Time", "CharacteristicName", "USGSPCode", "ResultMeasureValue",
+    "ResultMeasure/MeasureUnitCode", "ResultTemperatureBasisText",
+    "ResultStatusIdentifier", "MeasureQualifierCode",
+]
+
+
+def _wqp_tds_tsv():
+    rows = ["\t".join(WQP_HEADER)]
+    for s in range(3):
+        for a in range(8):
+            # every activity reports TDS twice; cleaning keeps the 70300 one, so
+            # the pair must be seen together even when it straddles a page
+            for pcode, value in (("70301", f"{100 + a}"), ("70300", f"{200 + a}")):
+                rows.append("\t".join([
+                    f"USGS-{s}", f"act-{s}-{a}", f"20{10 + a}-01-01", "10:00:00",
+                    "Total dissolved solids", pcode, value, "mg/L", "", "Accepted", "",
+                ]))
+    return "\n".join(rows)
+
+
+def _wqp(monkeypatch, streams):
+    text = _wqp_tds_tsv()
+    monkeypatch.setattr(wqp_source, "iter_text", lambda *a, **k: iter(_chunked(text, 97)))
+    # odd page size: activity pairs straddle page boundaries
+    monkeypatch.setattr(wqp_source, "TSV_PAGE_ROWS", 5)
+    src = WQPAnalyteSource()
+    cfg = Config()
+    cfg.parameter = "tds"
+    src.set_config(cfg)
+    src.streams_records = streams
+    src.log = lambda *a, **k: None
+    return src
+
+
+class TestWQPStreaming:
+    def test_tds_dedupe_across_pages(self, monkeypatch):
+        sites = _sites(["USGS-0", "USGS-1", "USGS-2"], 3)
+        streamed = _wqp(monkeypatch, True).read_summary(sites, 0, 3)
+        listed = _wqp(monkeypatch, False).read_summary(sites, 0, 3)
+        assert _rows(streamed) == _rows(listed)
+        # only the 70300 values survive
+        assert [(r.nrecords, r.min, r.max) for r in streamed] == [(8, 200.0, 207.0)] * 3
+
+    def test_get_records_is_pages_concatenated(self, monkeypatch):
+        src = _wqp(monkeypatch, True)
+        sites = _sites(["USGS-0"], 3)
+        assert src.get_records(sites) == parse_tsv(_wqp_tds_tsv())
+
+
+# -- page-by-page processing --------------------------------------------------
+
+
+class _PagedSource(BaseParameterSource):
+    streams_records = True
+    site_id_field = "site"
+
+    def __init__(self, pages):
+        super().__init__(transformer=BaseTransformer())
+        self.pages = pages
+        self.events = []
+
+    def iter_records(self, site_record, latest=False):
+        for n, page in enumerate(self.pages):
+            self.events.append(("fetch", n))
+            yield page
+
+    def get_records(self, site_record):
+        return [r for page in self.iter_records(site_record) for r in page]
+
+    def _clean_records(self, records):
+        self.events.append(("clean", len(records)))
+        return [r for r in records if r["value"] is not None]
+
+    def _transform_parameter_records(self, site, cleaned):
+        return [(r["date"], r["value"]) for r in cleaned]
+
+    def _sort_func(self, record):
+        return record[0]
+
+
+class TestPageProcessing:
+    PAGES = [
+        [{"site": "A", "date": 3, "value": 1}, {"site": "B", "date": 1, "value": None}],
+        [{"site": "A", "date": 1, "value": 2}],
+        [{"site": "A", "date": 2, "value": 3}],
+    ]
+
+    def test_each_page_cleaned_before_next_fetch(self):
+        src = _PagedSource(self.PAGES)
+        src.set_config(Config())
+        src.read_timeseries(_sites(["A", "B"], 2))
+        assert src.events == [
+            ("fetch", 0), ("clean", 1), ("clean", 1),
+            ("fetch", 1), ("clean", 1),
+            ("fetch", 2), ("clean", 1),
+        ]
+
+    def test_timeseries_sorted_across_pages(self):
+        src = _PagedSource(self.PAGES)
+        src.set_config(Config())
+        warnings = []
+        src.warn = warnings.append
+        (site, rows), = src.read_timeseries(_sites(["A", "B"], 2))
+        assert site.id == "A" and rows == [(1, 2), (2, 3), (3, 1)]
+        assert warnings == ["B No clean records found"]
+
+    def test_shared_fetch_cache_materializes(self):
+        src = _PagedSource(self.PAGES)
+        src.set_config(Config())
+        src._fetch_cache_enabled = True
+        src.read_timeseries(_sites(["A", "B"], 2))
+        # one list for the whole chunk, cleaned once per site
+        assert [e for e in src.events if e[0] == "clean"] == [("clean", 3), ("clean", 1)]
+
+
+# -- transports ---------------------------------------------------------------
+
+
+class TestTransports:
+    def test_sta_query_flattens_pages(self, monkeypatch):
+        monkeypatch.setattr(_sensorthings, "iter_json_pages", lambda url, **kw: iter([[1, 2], [3]]))
+        assert list(_sensorthings.sta_pages("https://x/v1.1", "Things")) == [[1, 2], [3]]
+        assert _sensorthings.sta_query("https://x/v1.1", "Things") == [1, 2, 3]
+
+    def test_iter_text_maps_dropped_connection(self, monkeypatch):
+        class _Resp:
+            encoding = None
+
+            def raise_for_status(self):
+                pass
+
+            def iter_content(self, chunk_size, decode_unicode):
+                yield "a\tb\n"
+                raise requests.ConnectionError("reset")
+
+            def close(self):
+                pass
+
+        class _Client:
+            def __init__(self, base_url):
+                pass
+
+            def get(self, url, **kw):
+                assert kw["stream"] is True
+                return _Resp()
+
+        monkeypatch.setattr(_dlt, "RESTClient", _Client)
+        stream = _dlt.iter_text("https://x")
+        assert next(stream) == "a\tb\n"
+        with pytest.raises(PartialOrNoDataError):
+            next(stream)
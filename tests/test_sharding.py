@@ -0,0 +1,246 @@
+"""Sharded unification of one source (Config.shards, backend/sharding.py).
+
+The chunk plan is split across shards by a stable hash of each chunk's site
+ids, each shard reads only its chunks, and the merge puts them back in plan
+order — so the merged output is exactly the single-process output, with a
+site_limit or latest_only too, however many shards and whichever process
+runs them. A repeated shard output is taken once; an aborted, missing or
+differently planned shard saves nothing for the source, as an abort does.
+"""
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from backend import sharding
+from backend.checkpoint import ChunkCheckpoints
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.exceptions import PartialOrNoDataError
+from backend.record import SiteRecord
+from backend.sharding import Shard, merge_shards, shard_of, unify_shard, unify_source_sharded
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.unifier import unify_source_both
+
+IDS = [f"USGS-{i:09d}" for i in range(40)]
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 3
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        CALLS.append("discover")
+        return [{"id": i} for i in IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+FAILING: set = set()
+CALLS: list = []
+
+
+def _features():
+    rng = random.Random(3)
+    features = []
+    for site in IDS[:-4]:
+        for _ in range(rng.randint(1, 7)):
+            features.append({
+                "properties": {
+                    "monitoring_location_id": site,
+                    "value": rng.choice([None, f"{rng.uniform(10, 200):.2f}", f"{rng.uniform(10, 200):.2f}"]),
+                    "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                    "unit_of_measure": rng.choice(["ft", "m"]),
+                    "approval_status": "Approved",
+                    "qualifier": None,
+                }
+            })
+    return features
+
+
+def _nwis_pages(url, params=None, json_data=None, **kw):
+    features = _features()
+    wanted = json_data["args"][1]
+    if FAILING & set(wanted):
+        raise PartialOrNoDataError("provider error")
+    mine = [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+    if (params or {}).get("sortby") == "-time":
+        mine.sort(key=lambda f: f["properties"]["time"], reverse=True)
+    # pages split the chunk's records, as the provider does
+    for i in range(0, len(mine), 5):
+        yield mine[i:i + 5]
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+def _fake_pair(self, source_key):
+    site, param = _FakeSiteSource(), NWISWaterLevelSource()
+    for s in (site, param):
+        s.set_config(self)
+        s.log = s.warn = _quiet
+    param.transformer.warn = _quiet
+    return site, param
+
+
+@pytest.fixture(autouse=True)
+def fakes(monkeypatch):
+    monkeypatch.setattr(usgs_source, "iter_json_pages", _nwis_pages)
+    monkeypatch.setattr(Config, "source_pair", _fake_pair)
+    FAILING.clear()
+    CALLS.clear()
+    yield
+    FAILING.clear()
+
+
+def _config(**settings):
+    cfg = Config(payload={"yes": True})
+    cfg.parameter = "waterlevels"
+    cfg.fetch_cache_bytes = 0
+    cfg.log = cfg.warn = _quiet
+    for name, value in settings.items():
+        setattr(cfg, name, value)
+    return cfg
+
+
+def _output(persisters):
+    summary, timeseries = persisters
+    return (
+        [r.to_dict() for r in summary.records],
+        [s.to_dict() for s in timeseries.sites],
+        [[r.to_dict() for r in t] for t in timeseries.timeseries],
+    )
+
+
+def _shards(count, **settings):
+    return [unify_shard(_config(**settings), "fake", i, count) for i in range(count)]
+
+
+def _merged(outputs, **settings):
+    return _output(merge_shards(_config(**settings), "fake", outputs))
+
+
+class TestShardOf:
+    def test_stable_and_spread(self):
+        sites = [SiteRecord({"id": i}) for i in IDS]
+        chunks = [sites[i:i + 3] for i in range(0, len(sites), 3)]
+        assigned = [shard_of(c, 4) for c in chunks]
+        assert assigned == [shard_of(c, 4) for c in chunks]
+        assert set(assigned) == {0, 1, 2, 3}
+        # a chunk's shard depends on its site ids only
+        assert shard_of([SiteRecord({"id": IDS[0]})], 7) == shard_of(SiteRecord({"id": IDS[0]}), 7)
+
+    def test_select_partitions_the_plan(self):
+        specs = [([SiteRecord({"id": i})], 0, 0) for i in IDS]
+        selected = [Shard(i, 3).select(specs) for i in range(3)]
+        assert sorted(id(s) for part in selected for s in part) == sorted(id(s) for s in specs)
+
+    def test_bad_index(self):
+        with pytest.raises(ValueError):
+            Shard(3, 3)
+
+
+class TestMerge:
+    @pytest.mark.parametrize("count", [2, 3, 5])
+    @pytest.mark.parametrize("site_limit", [0, 7])
+    def test_same_as_single_process(self, count, site_limit):
+        expected = _output(unify_source_both(_config(site_limit=site_limit), "fake"))
+        outputs = _shards(count)
+        assert _merged(outputs, site_limit=site_limit) == expected and expected[0]
+        assert sum(len(o["chunks"]) for o in outputs) == len(range(0, len(IDS), 3))
+
+    def test_latest_only(self):
+        expected = _output(unify_source_both(_config(latest_only=True), "fake"))
+        assert _merged(_shards(3, latest_only=True), latest_only=True) == expected and expected[0]
+
+    def test_repeated_shard_taken_once(self):
+        expected = _output(unify_source_both(_config(), "fake"))
+        outputs = _shards(3)
+        assert _merged(outputs + outputs[1:2]) == expected
+
+    def test_stats(self):
+        cfg = _config()
+        summary, _ = merge_shards(cfg, "fake", _shards(3))
+        assert [s["index"] for s in summary.stats["shards"]] == [0, 1, 2]
+        assert all(s["complete"] for s in summary.stats["shards"])
+
+
+class TestIncomplete:
+    def test_aborted_shard_saves_nothing(self):
+        FAILING.add(IDS[10])
+        assert _output(unify_source_both(_config(), "fake")) == ([], [], [])
+        outputs = _shards(3)
+        assert not all(o["complete"] for o in outputs)
+        assert _merged(outputs) == ([], [], [])
+
+    def test_missing_shard_saves_nothing(self):
+        assert _merged(_shards(3)[:2]) == ([], [], [])
+
+    def test_different_plans_save_nothing(self):
+        outputs = _shards(2)
+        # e.g. a shard that discovered a different site list
+        outputs[1]["plan_key"] = "different"
+        assert _merged(outputs) == ([], [], [])
+
+    def test_retried_shard_completes(self):
+        FAILING.add(IDS[10])
+        outputs = _shards(3)
+        FAILING.clear()
+        expected = _output(unify_source_both(_config(), "fake"))
+        assert _merged(outputs + _shards(3)) == expected
+
+
+class TestProcesses:
+    def test_sharded_run_in_processes(self, monkeypatch):
+        # the fakes are monkeypatched into this process; forked workers keep them
+        context = multiprocessing.get_context("fork")
+        monkeypatch.setattr(sharding, "_executor", lambda workers: ProcessPoolExecutor(workers, mp_context=context))
+        expected = _output(unify_source_both(_config(), "fake"))
+        assert _output(unify_source_sharded(_config(shards=3, shard_workers=2), "fake")) == expected
+
+    @pytest.mark.parametrize("prefilter", [False, True])
+    def test_discovered_once(self, monkeypatch, prefilter):
+        def probe(self, sites):
+            CALLS.append("probe")
+            return {s.id: 1 for s in sites[:-4]}
+
+        monkeypatch.setattr(NWISWaterLevelSource, "count_records", probe)
+        monkeypatch.setattr(sharding, "_executor", lambda workers: ThreadPoolExecutor(workers))
+        expected = _output(unify_source_both(_config(prefilter_sites=prefilter), "fake"))
+        single = list(CALLS)
+        CALLS.clear()
+        sharded = unify_source_sharded(_config(shards=3, prefilter_sites=prefilter), "fake")
+        assert _output(sharded) == expected
+        # the parent discovers and probes; the shards only read their chunks
+        assert CALLS == single == ["discover"] + ["probe"] * prefilter
+        assert ("prefilter" in sharded[0].stats) is prefilter
+
+    def test_one_shard_is_single_process(self, monkeypatch):
+        def _no_processes(workers):
+            raise AssertionError("no worker processes for one shard")
+
+        monkeypatch.setattr(sharding, "_executor", _no_processes)
+        expected = _output(unify_source_both(_config(), "fake"))
+        assert _output(unify_source_sharded(_config(shards=1), "fake")) == expected
+
+
+class TestCheckpoints:
+    def test_shard_clears_only_its_chunks(self, tmp_path):
+        checkpoints = ChunkCheckpoints(str(tmp_path), "run", expires=2 ** 40)
+        for key in "abc":
+            checkpoints.save(key, [key])
+        checkpoints.clear(["a", "c"])
+        assert checkpoints.completed() == {"b"}
+        checkpoints.clear()
+        assert checkpoints.completed() == set()
@@ -0,0 +1,229 @@
+"""Persistent site catalog (Config.site_catalog_dir, backend/site_catalog.py).
+
+A site query read again within the TTL comes from the catalog — the same
+sites, in the same order — without discovering them, also for another
+parameter when the source's query does not depend on it. A different scope
+or transform is discovered on its own. Past the TTL the query is discovered
+again and the sites added, changed and removed are reported.
+"""
+import os
+import random
+import sqlite3
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.record import SiteRecord
+from backend import site_catalog
+from backend.site_catalog import FILENAME
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.unifier import unify_source_both
+
+IDS = [f"USGS-{i:09d}" for i in range(12)]
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 5
+    ids = list(IDS)
+    names: dict = {}
+    calls = 0
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+        self.log = self.warn = _quiet
+
+    def get_records(self, *a, **k):
+        _FakeSiteSource.calls += 1
+        return [{"id": i} for i in self.ids]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({
+                "source": "fake",
+                "id": r["id"],
+                "name": self.names.get(r["id"], r["id"]),
+                "latitude": 34.0,
+                "longitude": -106.0,
+                "elevation_units": self.config.output_elevation_units,
+            })
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _ByParameter(_FakeSiteSource):
+    sites_by_parameter = True
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    _FakeSiteSource.ids = list(IDS)
+    _FakeSiteSource.names = {}
+    _FakeSiteSource.calls = 0
+
+
+def _read(tmp_path, klass=_FakeSiteSource, **settings):
+    cfg = Config(payload={"yes": True})
+    cfg.parameter = "waterlevels"
+    cfg.site_catalog_dir = str(tmp_path)
+    for name, value in settings.items():
+        setattr(cfg, name, value)
+    source = klass()
+    source.set_config(cfg)
+    return source, source.read()
+
+
+def _sites(sites):
+    return [(type(s), s._payload, s.chunk_size) for s in sites]
+
+
+class TestCatalog:
+    def test_second_read_skips_discovery(self, tmp_path):
+        first, expected = _read(tmp_path)
+        source, sites = _read(tmp_path)
+        assert _FakeSiteSource.calls == 1
+        assert _sites(sites) == _sites(expected)
+        assert first.catalog_stats == {"hit": False, "sites": 12, "added": 12, "changed": 0, "removed": 0}
+        assert source.catalog_stats == {"hit": True, "sites": 12}
+
+    def test_chunk_size_is_the_sources(self, tmp_path):
+        _read(tmp_path)
+        _FakeSiteSource.chunk_size = 3
+        try:
+            _, sites = _read(tmp_path)
+        finally:
+            _FakeSiteSource.chunk_size = 5
+        assert {s.chunk_size for s in sites} == {3}
+
+    def test_shared_across_parameters(self, tmp_path):
+        _read(tmp_path, parameter="waterlevels")
+        _read(tmp_path, parameter="arsenic")
+        assert _FakeSiteSource.calls == 1
+
+    def test_query_by_parameter(self, tmp_path):
+        _read(tmp_path, klass=_ByParameter, parameter="waterlevels")
+        _read(tmp_path, klass=_ByParameter, parameter="arsenic")
+        _read(tmp_path, klass=_ByParameter, parameter="arsenic")
+        assert _FakeSiteSource.calls == 2
+
+    @pytest.mark.parametrize("setting", [{"county": "bernalillo"}, {"start_date": "2020-01-01"}, {"output_elevation_units": "meters"}])
+    def test_other_query_or_transform_is_discovered(self, tmp_path, setting):
+        _read(tmp_path)
+        _, sites = _read(tmp_path, **setting)
+        assert _FakeSiteSource.calls == 2
+        if "output_elevation_units" in setting:
+            assert {s.elevation_units for s in sites} == {"meters"}
+
+    def test_expired_is_rediscovered_with_changes(self, tmp_path):
+        _read(tmp_path)
+        _FakeSiteSource.ids = IDS[1:] + ["USGS-new"]
+        _FakeSiteSource.names = {IDS[3]: "renamed"}
+        source, sites = _read(tmp_path, site_catalog_ttl_hours=0)
+        assert _FakeSiteSource.calls == 2
+        assert source.catalog_stats == {"hit": False, "sites": 12, "added": 1, "changed": 1, "removed": 1}
+        _, again = _read(tmp_path)
+        assert _sites(again) == _sites(sites)
+        assert again[2].name == "renamed"
+
+    def test_repeated_ids_are_not_kept(self, tmp_path):
+        _FakeSiteSource.ids = IDS + IDS[:1]
+        _read(tmp_path)
+        _, sites = _read(tmp_path)
+        assert _FakeSiteSource.calls == 2 and len(sites) == 13
+
+    def test_reads_only_the_discovered_rows(self, monkeypatch, tmp_path):
+        # a wide discovery, then a narrower query of the same source's wells
+        _read(tmp_path)
+        _FakeSiteSource.ids = IDS[:7]
+        _read(tmp_path, county="bernalillo")
+        monkeypatch.setattr(site_catalog, "ID_BATCH", 3)
+        statements = []
+        connect = sqlite3.connect
+
+        def traced(*args, **kw):
+            conn = connect(*args, **kw)
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        monkeypatch.setattr(site_catalog.sqlite3, "connect", traced)
+        _, sites = _read(tmp_path, county="bernalillo")
+        assert _FakeSiteSource.calls == 2
+        assert [s.id for s in sites] == IDS[:7]
+        reads = [q for q in statements if "FROM sites" in q]
+        # the seven ids by primary key, three at a time; never the whole source
+        assert len(reads) == 3
+        assert all("site_id IN (" in q for q in reads)
+
+    def test_missing_row_is_rediscovered(self, tmp_path):
+        _read(tmp_path)
+        conn = sqlite3.connect(tmp_path / FILENAME)
+        with conn:
+            conn.execute("DELETE FROM sites WHERE site_id = ?", (IDS[4],))
+        conn.close()
+        _, sites = _read(tmp_path)
+        assert _FakeSiteSource.calls == 2 and len(sites) == 12
+
+    def test_off_by_default(self, tmp_path):
+        _read(tmp_path, site_catalog_dir="")
+        _read(tmp_path, site_catalog_dir="")
+        assert _FakeSiteSource.calls == 2
+        assert not os.path.exists(tmp_path / FILENAME)
+
+
+def _nwis_pages(url, json_data=None, **kw):
+    rng = random.Random(4)
+    features = []
+    for site in IDS:
+        for _ in range(rng.randint(1, 6)):
+            features.append({
+                "properties": {
+                    "monitoring_location_id": site,
+                    "value": f"{rng.uniform(10, 200):.2f}",
+                    "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                    "unit_of_measure": "ft",
+                    "approval_status": "Approved",
+                    "qualifier": None,
+                }
+            })
+    wanted = set(json_data["args"][1])
+    yield [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+
+
+class TestUnify:
+    def test_same_output_from_catalog(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(usgs_source, "iter_json_pages", _nwis_pages)
+
+        def fake_pair(self, source_key):
+            site, param = _FakeSiteSource(), NWISWaterLevelSource()
+            for s in (site, param):
+                s.set_config(self)
+                s.log = s.warn = _quiet
+            param.transformer.warn = _quiet
+            return site, param
+
+        monkeypatch.setattr(Config, "source_pair", fake_pair)
+
+        def unify(catalog):
+            cfg = Config(payload={"yes": True})
+            cfg.parameter = "waterlevels"
+            cfg.fetch_cache_bytes = 0
+            cfg.site_catalog_dir = str(tmp_path) if catalog else ""
+            summary, timeseries = unify_source_both(cfg, "fake")
+            return (
+                [r.to_dict() for r in summary.records],
+                [s.to_dict() for s in timeseries.sites],
+                [[r.to_dict() for r in t] for t in timeseries.timeseries],
+            )
+
+        expected = unify(False)
+        unify(True)
+        calls = _FakeSiteSource.calls
+        assert unify(True) == expected and expected[0]
+        assert _FakeSiteSource.calls == calls
@@ -0,0 +1,104 @@
+"""Per-chunk site grouping (BaseParameterSource.site_id_field / _group_records).
+
+A multi-site chunk is split into per-site lists in one pass instead of one
+scan per site. Checks the grouped lists equal the old scans, the index is
+built once per chunk and per thread, and that a chunk at the NWIS statewide
+chunk size (500 sites) is read in one pass.
+"""
+import threading
+
+from backend.config import Config
+from backend.connectors.bor.source import BORAnalyteSource
+from backend.connectors.usgs.source import NWISSiteSource, NWISWaterLevelSource
+
+N_SITES = NWISSiteSource.chunk_size
+PER_SITE = 40
+
+
+class _Site:
+    def __init__(self, sid, chunk_size=N_SITES):
+        self.id = sid
+        self.chunk_size = chunk_size
+
+
+def _nwis_records(n_sites=N_SITES, per_site=PER_SITE):
+    # interleaved, as a batched fetch returns them
+    return [
+        {"site_id": f"USGS-{s:09d}", "value": str(i), "datetime_measured": f"2000-01-{1 + i % 28:02d}"}
+        for i in range(per_site)
+        for s in range(n_sites)
+    ]
+
+
+def _source():
+    src = NWISWaterLevelSource()
+    src.set_config(Config())
+    return src
+
+
+def _scan(records, site):
+    # the per-site scan _extract_site_records used to do
+    return [r for r in records if r["site_id"] == site.id]
+
+
+class TestGrouping:
+    def test_matches_per_site_scan(self):
+        src = _source()
+        records = _nwis_records(50, 5)
+        sites = [_Site(f"USGS-{s:09d}") for s in range(50)] + [_Site("missing")]
+        for site in sites:
+            assert src._extract_site_records(records, site) == _scan(records, site)
+
+    def test_index_built_once_per_chunk(self):
+        calls = []
+        src = _source()
+        src.site_id_field = lambda r: calls.append(1) or r["site_id"]
+        records = _nwis_records(10, 3)
+        for s in range(10):
+            src._extract_site_records(records, _Site(f"USGS-{s:09d}"))
+        assert len(calls) == len(records)
+        # a new chunk rebuilds
+        src._extract_site_records(list(records), _Site("x"))
+        assert len(calls) == 2 * len(records)
+
+    def test_callable_site_id(self):
+        src = BORAnalyteSource()
+        src.set_config(Config())
+        records = [{"attributes": {"locationId": k}} for k in (1, 2, 1)]
+        assert len(src._extract_site_records(records, _Site(1))) == 2
+
+    def test_threads_group_their_own_chunk(self):
+        src = _source()
+        chunks = [_nwis_records(3, 2) for _ in range(4)]
+        for n, chunk in enumerate(chunks):
+            for r in chunk:
+                r["site_id"] += f"-{n}"
+        errors = []
+
+        def work(n):
+            for _ in range(200):
+                got = src._extract_site_records(chunks[n], _Site(f"USGS-{0:09d}-{n}"))
+                if [r["site_id"] for r in got] != [f"USGS-{0:09d}-{n}"] * 2:
+                    errors.append(n)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors
+
+
+class TestStatewideChunk:
+    def test_one_pass_over_the_chunk(self):
+        # the scans read every record once per site (500 x 20000 reads); the
+        # grouping reads each record's site id once for the whole chunk
+        records = _nwis_records()
+        sites = [_Site(f"USGS-{s:09d}") for s in range(N_SITES)]
+        reads = []
+        src = _source()
+        src.site_id_field = lambda r: reads.append(1) or r["site_id"]
+
+        grouped = [src._extract_site_records(records, site) for site in sites]
+        assert grouped == [_scan(records, site) for site in sites]
+        assert len(reads) == len(records)
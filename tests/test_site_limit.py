@@ -0,0 +1,162 @@
+"""Early stop once Config.site_limit sites have records.
+
+Chunks the limit cannot reach must not be fetched, and the output must be the
+same as reading every chunk and truncating, whatever the worker count and
+however the chunks' reads interleave. Some sites have no records, so the limit
+needs more chunks than ``site_limit / chunk_size``.
+"""
+import random
+import threading
+import time
+
+import pytest
+
+from backend.config import Config
+from backend.persister import BasePersister
+from backend.record import ParameterRecord, SiteRecord, SummaryRecord
+from backend.source import BaseParameterSource, BaseSiteSource, BaseTransformer
+from backend.unifier import _iter_chunk_results, _site_wrapper
+
+N_SITES = 40
+CHUNK_SIZE = 3
+
+
+def _has_records(site_id):
+    # every third site has no records
+    return int(site_id[1:]) % 3 != 1
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": f"W{i:02d}"} for i in range(N_SITES)]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"]})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _FakeParamSource(BaseParameterSource):
+    def __init__(self, seed):
+        super().__init__(transformer=BaseTransformer())
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.fetched = []
+
+    def _records(self, site_record):
+        with self.lock:
+            self.fetched.append(site_record[0].id)
+            delay = self.rng.uniform(0, 0.005)
+        time.sleep(delay)
+        return [s for s in site_record if _has_records(s.id)]
+
+    def read(self, site_record, use_summarize, start_ind, end_ind):
+        sites = self._records(site_record)
+        if use_summarize:
+            return [SummaryRecord({"source": "fake", "id": s.id}) for s in sites]
+        return [(s, [ParameterRecord({"source": "fake", "id": s.id})]) for s in sites]
+
+    def read_both(self, site_record, start_ind, end_ind, pages=None):
+        sites = self._records(site_record)
+        return (
+            [SummaryRecord({"source": "fake", "id": s.id}) for s in sites],
+            [(s, [ParameterRecord({"source": "fake", "id": s.id})]) for s in sites],
+        )
+
+
+def _run(site_limit, workers=4, output_summary=True, combined=False, seed=0):
+    cfg = Config(payload={"yes": True})
+    cfg.fetch_workers = workers
+    cfg.site_limit = site_limit
+    cfg.output_summary = output_summary
+    persister = BasePersister(cfg)
+    summary_persister = BasePersister(cfg) if combined else None
+    source = _FakeParamSource(seed)
+    _site_wrapper(_FakeSiteSource(), source, persister, cfg, raise_errors=True, summary_persister=summary_persister)
+    return persister, summary_persister, source
+
+
+def _with_records():
+    return [f"W{i:02d}" for i in range(N_SITES) if _has_records(f"W{i:02d}")]
+
+
+def _chunks_needed(site_limit):
+    # chunks, in order, until site_limit sites have records
+    count = 0
+    for n, start in enumerate(range(0, N_SITES, CHUNK_SIZE), 1):
+        count += sum(_has_records(f"W{i:02d}") for i in range(start, min(start + CHUNK_SIZE, N_SITES)))
+        if count >= site_limit:
+            return n
+    return n
+
+
+class TestEarlyStop:
+    @pytest.mark.parametrize("site_limit", [1, 5, 7, 20])
+    @pytest.mark.parametrize("workers", [1, 2, 4])
+    def test_summary_matches_truncated_full_run(self, site_limit, workers):
+        persister, _, source = _run(site_limit, workers=workers)
+        assert [r.id for r in persister.records] == _with_records()[:site_limit]
+        # only the chunks the limit reaches are fetched
+        assert len(source.fetched) == _chunks_needed(site_limit)
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_timeseries_matches_truncated_full_run(self, workers):
+        persister, _, source = _run(7, workers=workers, output_summary=False)
+        assert [s.id for s in persister.sites] == _with_records()[:7]
+        assert [t[0].id for t in persister.timeseries] == _with_records()[:7]
+        assert len(source.fetched) == _chunks_needed(7)
+
+    def test_combined_stops_when_both_full(self):
+        timeseries, summary, source = _run(5, combined=True)
+        assert [r.id for r in summary.records] == _with_records()[:5]
+        assert [s.id for s in timeseries.sites] == _with_records()[:5]
+        assert len(source.fetched) == _chunks_needed(5)
+
+    def test_deterministic_across_interleavings(self):
+        outputs = {tuple(r.id for r in _run(9, seed=seed)[0].records) for seed in range(6)}
+        assert outputs == {tuple(_with_records()[:9])}
+
+    def test_limit_beyond_sites_reads_everything(self):
+        persister, _, source = _run(N_SITES * 2)
+        assert [r.id for r in persister.records] == _with_records()
+        assert len(source.fetched) == len(range(0, N_SITES, CHUNK_SIZE))
+
+    def test_no_limit_unchanged(self):
+        persister, _, source = _run(0)
+        assert [r.id for r in persister.records] == _with_records()
+        assert len(source.fetched) == len(range(0, N_SITES, CHUNK_SIZE))
+
+
+class TestBudget:
+    def test_starts_only_what_is_needed(self):
+        started = []
+        remaining = [5]
+
+        def fetch(i):
+            started.append(i)
+            return i
+
+        for i in _iter_chunk_results(range(20), fetch, workers=4, depth=8, needed=lambda: remaining[0], size=lambda i: 2):
+            remaining[0] = max(remaining[0] - 2, 0)
+        # 5 units at 2 per chunk: three chunks, never a fourth
+        assert sorted(started) == [0, 1, 2]
+
+    def test_serial_stops_when_nothing_needed(self):
+        started = []
+        remaining = [3]
+
+        def fetch(i):
+            started.append(i)
+            remaining[0] -= 1
+            return i
+
+        assert list(_iter_chunk_results(range(10), fetch, workers=1, depth=1, needed=lambda: remaining[0])) == [0, 1, 2]
+        assert started == [0, 1, 2]
@@ -0,0 +1,232 @@
+"""Site discovery streamed into the chunk planner (Config.stream_sites).
+
+A site source with streams_sites hands each page of its site query to
+_site_wrapper as it arrives, and the first chunks are fetched before the
+last page is downloaded. The chunks, and the output, are those of planning
+after full discovery; a site_limit stops discovery once it is met.
+"""
+import random
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISSiteSource, NWISWaterLevelSource
+from backend.connectors.wqp import source as wqp_source
+from backend.connectors.wqp.source import WQPSiteSource
+from backend.exceptions import PartialOrNoDataError
+from backend.fetch_cache import shared_fetch_cache
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.unifier import unify_source_both
+
+IDS = [f"USGS-{i:09d}" for i in range(14)]
+PAGE = 4
+
+
+class _Events:
+    log: list = []
+    fail_page = None
+
+
+class _PagedSiteSource(BaseSiteSource):
+    chunk_size = 3
+    streams_sites = True
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [r for page in self.iter_site_records() for r in page]
+
+    def iter_site_records(self, tile=None):
+        for k in range(0, len(IDS), PAGE):
+            if k // PAGE == _Events.fail_page:
+                raise PartialOrNoDataError("site page dropped")
+            _Events.log.append(("page", k // PAGE))
+            yield [{"id": i} for i in IDS[k:k + PAGE]]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+def _nwis_pages(url, json_data=None, **kw):
+    rng = random.Random(3)
+    features = []
+    for site in IDS:
+        for _ in range(rng.randint(1, 6)):
+            features.append({
+                "properties": {
+                    "monitoring_location_id": site,
+                    "value": f"{rng.uniform(10, 200):.2f}",
+                    "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T10:15:00Z",
+                    "unit_of_measure": "ft",
+                    "approval_status": "Approved",
+                    "qualifier": None,
+                }
+            })
+    wanted = json_data["args"][1]
+    _Events.log.append(("chunk", tuple(wanted)))
+    yield [f for f in features if f["properties"]["monitoring_location_id"] in set(wanted)]
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture
+def unify(monkeypatch):
+    monkeypatch.setattr(usgs_source, "iter_json_pages", _nwis_pages)
+    _Events.log = []
+    _Events.fail_page = None
+    warnings = []
+
+    def fake_pair(self, source_key):
+        site, param = _PagedSiteSource(), NWISWaterLevelSource()
+        for s in (site, param):
+            s.set_config(self)
+            s.log = s.warn = _quiet
+        param.transformer.warn = _quiet
+        return site, param
+
+    monkeypatch.setattr(Config, "source_pair", fake_pair)
+
+    def run(**settings):
+        _Events.log = []
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = "waterlevels"
+        cfg.fetch_cache_bytes = 0
+        cfg.log = _quiet
+        cfg.warn = warnings.append
+        for name, value in settings.items():
+            setattr(cfg, name, value)
+        summary, timeseries = unify_source_both(cfg, "fake")
+        return (
+            [r.to_dict() for r in summary.records],
+            [s.to_dict() for s in timeseries.sites],
+            [[r.to_dict() for r in t] for t in timeseries.timeseries],
+        )
+
+    run.warnings = warnings
+    return run
+
+
+def _chunks():
+    return [e[1] for e in _Events.log if e[0] == "chunk"]
+
+
+class TestUnify:
+    @pytest.mark.parametrize("workers", [1, 3])
+    @pytest.mark.parametrize("adaptive", [False, True])
+    def test_same_output_and_chunks(self, unify, workers, adaptive):
+        settings = {"fetch_workers": workers, "adaptive_chunks": adaptive}
+        expected = unify(**settings)
+        expected_chunks = sorted(_chunks())
+        got = unify(stream_sites=True, **settings)
+        assert got == expected and expected[0]
+        assert sorted(_chunks()) == expected_chunks
+        # chunks of the source's size, across page boundaries
+        assert [len(c) for c in expected_chunks if len(c) != 3] == [2]
+
+    def test_first_chunk_before_last_page(self, unify):
+        unify(stream_sites=True)
+        kinds = [e[0] for e in _Events.log]
+        last_page = len(kinds) - 1 - kinds[::-1].index("page")
+        assert kinds.index("chunk") < last_page
+        assert _chunks()[0] == tuple(IDS[:3])
+
+    def test_site_limit_stops_discovery(self, unify):
+        expected = unify(site_limit=2)
+        got = unify(stream_sites=True, site_limit=2)
+        assert got == expected and len(got[1]) == 2
+        assert len([e for e in _Events.log if e[0] == "page"]) < len(range(0, len(IDS), PAGE))
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_discovery_error_keeps_nothing(self, unify, workers):
+        _Events.fail_page = 2
+        got = unify(stream_sites=True, fetch_workers=workers)
+        assert got == ([], [], [])
+        # chunks from the first pages were fetched, and rolled back
+        assert _chunks()
+        assert any("Failed to retrieve complete site records" in w for w in unify.warnings)
+
+    def test_prefilter_reads_every_site_first(self, unify):
+        unify(stream_sites=True, prefilter_sites=True)
+        kinds = [e[0] for e in _Events.log]
+        assert kinds.index("chunk") > len(kinds) - 1 - kinds[::-1].index("page")
+
+
+class TestIterSites:
+    def _source(self, **settings):
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = "waterlevels"
+        for name, value in settings.items():
+            setattr(cfg, name, value)
+        source = _PagedSiteSource()
+        source.set_config(cfg)
+        source.log = source.warn = _quiet
+        return source
+
+    def test_pages(self):
+        _Events.log = []
+        pages = list(self._source().iter_sites())
+        assert [len(p) for p in pages] == [4, 4, 4, 2]
+        assert [s.id for p in pages for s in p] == IDS
+
+    def test_catalog_reads_whole(self, tmp_path):
+        pages = list(self._source(site_catalog_dir=str(tmp_path)).iter_sites())
+        assert [len(p) for p in pages] == [len(IDS)]
+
+    def test_full_discovery_is_shared(self):
+        shared_fetch_cache().clear()
+        try:
+            source = self._source()
+            source._fetch_cache_enabled = True
+            list(source.iter_sites())
+            assert [s.id for s in source.read()] == IDS
+            _Events.log = []
+            again = self._source()
+            again._fetch_cache_enabled = True
+            assert [s.id for p in again.iter_sites() for s in p] == IDS
+            assert _Events.log == []
+        finally:
+            shared_fetch_cache().clear()
+
+
+class TestConnectors:
+    def test_nwis_pages_match_get_records(self, monkeypatch):
+        def feature(site, series):
+            return {"properties": {"monitoring_location_id": site, "data_type": series}}
+
+        pages = [
+            [feature("A", 1), feature("B", 1), feature("A", 2)],
+            [feature("B", 2), feature("C", 1)],
+            [feature("A", 3)],
+        ]
+        monkeypatch.setattr(usgs_source, "iter_json_pages", lambda *a, **k: iter(pages))
+        monkeypatch.setattr(usgs_source, "fetch_json_records", lambda *a, **k: [f for p in pages for f in p])
+        source = NWISSiteSource()
+        source.set_config(Config(payload={"yes": True}))
+        source.log = source.warn = _quiet
+        streamed = list(source.iter_site_records())
+        assert [f for p in streamed for f in p] == source.get_records()
+        assert len(streamed) == 2
+
+    def test_wqp_pages_match_get_records(self, monkeypatch):
+        rows = [f"USGS-{i}\tsite {i}" for i in range(12)]
+        text = "MonitoringLocationIdentifier\tMonitoringLocationName\n" + "\n".join(rows) + "\n"
+        monkeypatch.setattr(wqp_source, "fetch_text", lambda *a, **k: text)
+        monkeypatch.setattr(wqp_source, "iter_text", lambda *a, **k: iter([text[i:i + 17] for i in range(0, len(text), 17)]))
+        monkeypatch.setattr(wqp_source, "TSV_PAGE_ROWS", 5)
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = "arsenic"
+        source = WQPSiteSource()
+        source.set_config(cfg)
+        streamed = list(source.iter_site_records())
+        assert [r for p in streamed for r in p] == source.get_records()
+        assert len(streamed) > 1
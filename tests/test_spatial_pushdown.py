@@ -0,0 +1,129 @@
+"""Spatial filter pushdown (backend/spatial_pushdown.py, Config.pushdown_wkt).
+
+A county-sized scope with thousands of boundary vertices must reach the server
+as a small covering polygon, and the exact scope must still decide which sites
+are kept (BaseTransformer.contained), tested against one prepared copy of it.
+Network-free.
+"""
+import math
+import random
+
+import shapely.wkt
+from shapely.geometry import Point, Polygon
+
+from backend.config import Config
+from backend.connectors import st_connector
+from backend.connectors.st2.source import NMOSERoswellSiteSource
+from backend.spatial_pushdown import PRECISION, plan_pushdown, prepared
+from backend.transformer import BaseTransformer
+
+
+def _detailed_polygon(n=6000, seed=7):
+    """A county-like scope: ~1 degree across, with a jagged boundary of *n*
+    full-precision vertices."""
+    rng = random.Random(seed)
+    pts = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        r = 0.5 + 0.03 * math.sin(40 * a) + rng.uniform(-0.004, 0.004)
+        pts.append((-106.0 + r * math.cos(a), 34.5 + r * math.sin(a)))
+    return Polygon(pts)
+
+
+def _config(geom, budget=2000):
+    cfg = Config()
+    cfg.wkt = geom.wkt
+    cfg.pushdown_wkt_chars = budget
+    return cfg
+
+
+class TestPlanPushdown:
+    def test_simplified_covering_fits_budget(self):
+        geom = _detailed_polygon()
+        wkt, kind = plan_pushdown(geom, 2000)
+        assert kind == "simplified"
+        assert len(wkt) <= 2000 < len(geom.wkt)
+        # the covering, as the server parses it, contains every exact vertex
+        assert shapely.wkt.loads(wkt).covers(geom)
+
+    def test_small_scope_sent_exactly(self):
+        cfg = Config()
+        cfg.bbox = "-106.5 34.0, -105.5 35.0"
+        wkt, kind = plan_pushdown(cfg.bounding_wkt(), 2000)
+        assert kind == "exact"
+        assert wkt == shapely.wkt.loads(cfg.bounding_wkt()).wkt
+
+    def test_envelope_fallback(self):
+        geom = _detailed_polygon()
+        wkt, kind = plan_pushdown(geom, 120)
+        assert kind == "envelope"
+        assert shapely.wkt.loads(wkt).covers(geom)
+
+    def test_coordinates_rounded(self):
+        wkt, _ = plan_pushdown(_detailed_polygon(), 2000)
+        decimals = [len(c.split(".")[1]) for c in wkt.replace("(", " ").replace(")", " ").replace(",", " ").split() if "." in c]
+        assert max(decimals) <= PRECISION
+
+
+class TestConnectorPushdown:
+    def _sites(self, monkeypatch, cfg, locations):
+        calls = []
+
+        def fake_sta_query(url, path, **kw):
+            calls.append(kw["filter"])
+            return locations
+
+        monkeypatch.setattr(st_connector, "sta_query", fake_sta_query)
+        src = NMOSERoswellSiteSource()
+        src.set_config(cfg)
+        return src.read(), calls
+
+    def test_sensorthings_filter_uses_covering(self, monkeypatch):
+        geom = _detailed_polygon()
+        cfg = _config(geom)
+        _, calls = self._sites(monkeypatch, cfg, [])
+        sent = calls[0].split("geography'")[1].split("'")[0]
+        assert sent == cfg.pushdown_wkt()
+        assert len(calls[0]) < 2100
+
+    def test_exact_scope_refined_locally(self, monkeypatch):
+        geom = _detailed_polygon()
+        cfg = _config(geom)
+        covering = shapely.wkt.loads(cfg.pushdown_wkt())
+        # a point the covering lets through but the exact scope excludes
+        outside = next(
+            p for p in (Point(-106.0 + 0.5 * math.cos(a / 100), 34.5 + 0.5 * math.sin(a / 100)) for a in range(628))
+            if covering.contains(p) and not geom.contains(p)
+        )
+
+        def loc(i, p):
+            return {"@iot.id": i, "name": f"W{i}", "location": {"coordinates": [p.x, p.y]}}
+
+        sites, _ = self._sites(monkeypatch, cfg, [loc(1, Point(-106.0, 34.5)), loc(2, outside)])
+        assert [s.id for s in sites] == [1]
+
+
+class TestLocalContainment:
+    def test_scope_is_prepared_once(self):
+        geom = _detailed_polygon()
+        cfg = _config(geom)
+        transformer = BaseTransformer()
+        transformer.config = cfg
+        BaseTransformer._polygon_cache.pop(cfg.bounding_wkt(), None)
+        rng = random.Random(1)
+        points = [(-106.0 + rng.uniform(-0.6, 0.6), 34.5 + rng.uniform(-0.6, 0.6)) for _ in range(200)]
+        got = [transformer.contained(x, y) for x, y in points]
+        assert got == [geom.contains(Point(x, y)) for x, y in points]
+        # every site is tested against one prepared copy of the exact scope
+        poly = BaseTransformer._polygon_cache[cfg.bounding_wkt()]
+        assert shapely.is_prepared(poly)
+        transformer.contained(-106.0, 34.5)
+        assert BaseTransformer._polygon_cache[cfg.bounding_wkt()] is poly
+
+    def test_prepared_gives_same_answers(self):
+        geom = _detailed_polygon()
+        rng = random.Random(2)
+        points = [Point(-106.0 + rng.uniform(-0.6, 0.6), 34.5 + rng.uniform(-0.6, 0.6)) for _ in range(500)]
+        fast = prepared(shapely.wkt.loads(geom.wkt))
+        assert shapely.is_prepared(fast)
+        assert [fast.contains(p) for p in points] == [geom.contains(p) for p in points]
@@ -0,0 +1,189 @@
+"""Streaming summary accumulators (SummaryAccumulator, terminal_key).
+
+Feeding a series page by page, or merging accumulators of consecutive parts,
+must give the list kernel's count/min/max and earliest/latest picks (ties
+included) and its mean: exactly for pages (sum_mean), to within rounding for
+merged parts. A summary read of a streamed chunk
+holds one accumulator per site instead of the site's records; the memory
+benchmark compares peak allocation of both.
+"""
+import math
+import random
+import tracemalloc
+
+import pytest
+
+from backend.config import Config
+from backend.constants import EARLIEST, LATEST
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.memory import _start_tracing, _stop_tracing
+from backend.record import SiteRecord
+from backend.source import get_terminal_record
+from backend.summary_kernel import SummaryAccumulator, series_stats
+
+
+def _split(items, rng):
+    cuts = sorted(rng.sample(range(1, len(items)), min(5, len(items) - 1)))
+    return [items[a:b] for a, b in zip([0] + cuts, cuts + [len(items)])]
+
+
+def _records(n, seed):
+    rng = random.Random(seed)
+    # few distinct dates, so earliest/latest ties straddle page boundaries
+    return [{"d": rng.randint(0, 4), "v": rng.choice([0.0, -0.0, rng.uniform(-50, 50)]), "i": i} for i in range(n)]
+
+
+def _fed(records, pages):
+    acc = SummaryAccumulator("d")
+    for page in pages:
+        acc.add_values([r["v"] for r in page])
+        acc.add_records(page)
+    return acc
+
+
+def _check(acc, records):
+    values = [r["v"] for r in records]
+    n, lo, hi, mean = series_stats(values)
+    assert (acc.n, repr(acc.min), repr(acc.max)) == (n, repr(lo), repr(hi))
+    assert math.isclose(acc.mean, mean, rel_tol=1e-12, abs_tol=1e-12)
+    assert acc.earliest is get_terminal_record(records, "d", EARLIEST)
+    assert acc.latest is get_terminal_record(records, "d", LATEST)
+
+
+class TestAccumulator:
+    @pytest.mark.parametrize("seed", range(5))
+    def test_pages_match_list_kernel(self, seed):
+        records = _records(300, seed)
+        _check(_fed(records, _split(records, random.Random(seed))), records)
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_merge_matches_single_pass(self, seed):
+        records = _records(300, seed)
+        parts = _split(records, random.Random(seed))
+        merged = SummaryAccumulator("d")
+        for part in parts:
+            merged.merge(_fed(part, [part]))
+        _check(merged, records)
+
+    def test_single_page_mean_is_exact(self):
+        records = _records(50, 9)
+        acc = _fed(records, [records])
+        assert repr(acc.mean) == repr(series_stats([r["v"] for r in records])[3])
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_paged_mean_is_exact(self, seed):
+        rng = random.Random(seed)
+        # magnitudes far apart, so a compensated sum's carry matters
+        values = [rng.uniform(-1e6, 1e6) * 10 ** rng.randint(-8, 10) for _ in range(200)]
+        values[rng.randrange(200)] = 3
+        acc = SummaryAccumulator("d")
+        for page in _split(values, rng):
+            acc.add_values(page)
+        assert repr(acc.sum_mean) == repr(series_stats(values)[3])
+
+    def test_mean_stable_on_large_offset(self):
+        acc = SummaryAccumulator("d")
+        for _ in range(1000):
+            acc.add_values([1e9 + 0.1, 1e9 + 0.3])
+        assert acc.mean == pytest.approx(1e9 + 0.2, abs=1e-6)
+
+    def test_records_without_values_still_pick_terminals(self):
+        acc = SummaryAccumulator("d")
+        acc.add_records([{"d": 2}, {"d": 1}])
+        assert acc.n == 0 and acc.earliest == {"d": 1} and acc.latest == {"d": 2}
+
+
+# -- summary reads -------------------------------------------------------------
+
+
+def _site(sid="USGS-1"):
+    s = SiteRecord({"source": "test", "id": sid, "latitude": 34.0, "longitude": -106.0})
+    s.chunk_size = 1
+    return s
+
+
+class _PagedNWIS(NWISWaterLevelSource):
+    """NWIS with a synthetic paged fetch: *n_pages* pages of *per_page*
+    standardized records, generated as they are requested."""
+
+    streams_records = True
+
+    def __init__(self, n_pages, per_page, seed=1):
+        super().__init__()
+        self.n_pages, self.per_page, self.seed = n_pages, per_page, seed
+        cfg = Config()
+        cfg.parameter = "waterlevels"
+        self.set_config(cfg)
+        self.warn = lambda *a, **k: None
+        self.log = lambda *a, **k: None
+
+    def iter_records(self, site_record, latest=False):
+        rng = random.Random(self.seed)
+        for p in range(self.n_pages):
+            yield [
+                {
+                    "site_id": "USGS-1",
+                    "source_parameter_name": "Water level, depth LSD",
+                    "value": rng.choice([f"{rng.uniform(0, 300):.2f}", "", "12.5"]),
+                    "datetime_measured": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-01T00:00:00Z",
+                    "source_parameter_units": rng.choice(["ft", "m"]),
+                    "approval_status": "Approved",
+                    "qualifier": None,
+                }
+                for _ in range(self.per_page)
+            ]
+
+    def get_records(self, site_record):
+        return [r for page in self.iter_records(site_record) for r in page]
+
+
+class _ListNWIS(_PagedNWIS):
+    """The same source summarized the list way (no terminal_key)."""
+
+    terminal_key = None
+
+    def _extract_terminal_record(self, records, position):
+        record = get_terminal_record(records, "datetime_measured", position)
+        return {
+            "value": float(record["value"]),
+            "datetime": record["datetime_measured"],
+            "source_parameter_units": record["source_parameter_units"],
+            "source_parameter_name": record["source_parameter_name"],
+        }
+
+
+def _summary(src):
+    (rec,) = src.read_summary(_site(), 0, 1)
+    return rec.to_dict()
+
+
+class TestAccumulatedSummary:
+    def test_matches_list_summarizer(self):
+        assert _summary(_PagedNWIS(20, 50)) == _summary(_ListNWIS(20, 50))
+
+    def test_matches_with_shared_fetch(self):
+        src = _PagedNWIS(5, 40)
+        src._fetch_cache_enabled = True
+        streamed = _PagedNWIS(5, 40)
+        assert _summary(src) == _summary(streamed)
+
+
+class TestAccumulatorMemory:
+    def test_peak_scales_with_sites_not_observations(self):
+        def peak(klass):
+            src = klass(40, 2500)
+            # tracing may already be on (python -X tracemalloc): leave it be
+            # and measure the peak above where it stands
+            _start_tracing()
+            try:
+                tracemalloc.reset_peak()
+                base, _top = tracemalloc.get_traced_memory()
+                _summary(src)
+                _size, top = tracemalloc.get_traced_memory()
+            finally:
+                _stop_tracing()
+            return top - base
+
+        held = peak(_ListNWIS)
+        folded = peak(_PagedNWIS)
+        assert folded < held / 4, f"summary peak: list={held / 1e6:.1f}MB accumulated={folded / 1e6:.1f}MB"
@@ -0,0 +1,146 @@
+"""Summary kernel (backend/summary_kernel.py) and the O(n) RecordSummarizer.
+
+The summary record must be byte-identical to what the sort-based summarizer
+produced, so the old implementation is kept here as the reference and both are
+run over the same NWIS series — ties in dates, -0.0/0.0 ties, NaN, values that
+fail to convert — for short series and long ones.
+"""
+import math
+import random
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.constants import EARLIEST, LATEST
+from backend.source import get_terminal_record
+from backend.summary_kernel import series_stats
+
+
+def _sorted_terminal_record(records, tag, position):
+    # get_terminal_record before the kernel: a stable sort per call
+    func = tag if callable(tag) else (lambda x: x[tag])
+    if position == EARLIEST:
+        return sorted(records, key=func)[0]
+    return sorted(records, key=func)[-1]
+
+
+def _legacy_summarize(s, site, cleaned):
+    source_results = s._extract_source_parameter_results(cleaned)
+    source_units = s._extract_source_parameter_units(cleaned)
+    dates = s._extract_parameter_dates(cleaned)
+    source_names = s._extract_source_parameter_names(cleaned)
+    kept_items = []
+    skipped_items = []
+    for source_result, source_unit, date, source_name in zip(source_results, source_units, dates, source_names):
+        try:
+            converted_result, _factor, warning_msg = s.transformer.converter.convert(
+                float(source_result), source_unit, s._get_output_units(), source_name, s.config.parameter, date
+            )
+            if warning_msg == "":
+                kept_items.append(converted_result)
+            else:
+                s.warn(f"{warning_msg} for {site.id}")
+        except (TypeError, ValueError):
+            skipped_items.append((site.id, source_result, source_unit))
+    if skipped_items:
+        s.warn(f"Skipped results because of formatting: {skipped_items}")
+    if not kept_items:
+        return None
+    n = len(kept_items)
+    earliest_result = s._extract_earliest_record(cleaned)
+    latest_result = s._extract_latest_record(cleaned)
+    rec = {
+        "nrecords": n,
+        "min": min(kept_items),
+        "max": max(kept_items),
+        "mean": sum(kept_items) / n,
+        "earliest_datetime": earliest_result["datetime"],
+        "earliest_value": earliest_result["value"],
+        "earliest_source_units": earliest_result["source_parameter_units"],
+        "earliest_source_name": earliest_result["source_parameter_name"],
+        "latest_datetime": latest_result["datetime"],
+        "latest_value": latest_result["value"],
+        "latest_source_units": latest_result["source_parameter_units"],
+        "latest_source_name": latest_result["source_parameter_name"],
+    }
+    rec.update(s._summary_extra(cleaned))
+    return s.transformer.do_transform(rec, site)
+
+
+class _Site:
+    id = "USGS-1"
+
+
+def _series(n, seed):
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        value = rng.choice([
+            f"{rng.uniform(0, 300):.2f}", "0.0", "-0.0", "nan", f"{rng.uniform(0, 90):.3f}",
+        ])
+        unit = rng.choice(["ft", "ft", "m", "furlongs"])
+        records.append({
+            "site_id": "USGS-1",
+            "source_parameter_name": "Water level, depth LSD",
+            "value": value,
+            # few distinct dates, so earliest/latest ties are common
+            "datetime_measured": f"20{rng.randint(10, 14)}-01-01T00:00:00Z",
+            "source_parameter_units": unit,
+            "approval_status": None,
+            "qualifier": None,
+        })
+    return records
+
+
+def _summaries(monkeypatch, records):
+    src = NWISWaterLevelSource()
+    cfg = Config()
+    cfg.parameter = "waterlevels"
+    src.set_config(cfg)
+    src.warn = lambda *a, **k: None
+    # compare the record handed to the transformer: everything the kernel affects
+    monkeypatch.setattr(src.transformer, "do_transform", lambda rec, site: rec)
+    new = src._summarize_records(_Site(), records)
+    with monkeypatch.context() as m:
+        m.setattr(usgs_source, "get_terminal_record", _sorted_terminal_record)
+        old = _legacy_summarize(src, _Site(), records)
+    return new, old
+
+
+class TestSeriesStats:
+    @pytest.mark.parametrize("n", [1, 10, 5001])
+    def test_matches_builtins(self, n):
+        rng = random.Random(n)
+        values = [rng.choice([0.0, -0.0, rng.uniform(-5, 5)]) for _ in range(n)]
+        got = series_stats(values)
+        expected = (n, min(values), max(values), sum(values) / n)
+        assert repr(got) == repr(expected)
+        assert [math.copysign(1, v) for v in got[1:3]] == [math.copysign(1, v) for v in expected[1:3]]
+
+    def test_nan_matches_builtins(self):
+        values = [1.0] * 5000 + [float("nan"), 0.5]
+        assert repr(series_stats(values)) == repr((len(values), min(values), max(values), sum(values) / len(values)))
+
+
+class TestTerminalRecord:
+    def test_ties_match_stable_sort(self):
+        rng = random.Random(5)
+        records = [{"d": rng.randint(0, 5), "i": i} for i in range(200)]
+        for position in (EARLIEST, LATEST):
+            assert get_terminal_record(records, "d", position) is _sorted_terminal_record(records, "d", position)
+
+
+class TestSummarizerParity:
+    @pytest.mark.parametrize("n,seed", [(1, 1), (7, 2), (200, 3), (5500, 4), (50000, 11)])
+    def test_byte_identical(self, monkeypatch, n, seed):
+        new, old = _summaries(monkeypatch, _series(n, seed))
+        assert repr(new) == repr(old)
+
+    def test_all_unconvertible(self, monkeypatch):
+        records = _series(20, 9)
+        for r in records:
+            r["source_parameter_units"] = "furlongs"
+        new, old = _summaries(monkeypatch, records)
+        assert new is None and old is None
@@ -0,0 +1,153 @@
+"""Tiled site discovery (backend/tiling.py, Config.site_tiles).
+
+A fake site source serves synthetic sites from an in-memory point set, so the
+test can check that a tiled read finds exactly the sites of a single query,
+dedupes sites on shared tile edges, adapts tile sizes to density, and is
+deterministic regardless of how many fetch workers run. The connector tile
+queries are checked against stubbed transports.
+"""
+import random
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.nmenv import source as nmenv_source
+from backend.connectors.nmenv.source import DWBSiteSource
+from backend.connectors.nmose.source import NMOSEPODSiteSource
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISSiteSource
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.tiling import grid_tiles, plan_tiles
+
+BOUNDS = (-109.0, 31.0, -103.0, 37.0)
+
+
+def _points():
+    rng = random.Random(3)
+    pts = [(rng.uniform(-109, -103), rng.uniform(31, 37)) for _ in range(300)]
+    # a dense "city" in the middle, plus sites exactly on grid lines
+    pts += [(rng.uniform(-106.8, -106.4), rng.uniform(35.0, 35.2)) for _ in range(400)]
+    pts += [(-107.0, 33.5), (-105.0, 35.0), (-106.0, 34.0)]
+    return {f"S{i}": p for i, p in enumerate(pts)}
+
+
+POINTS = _points()
+
+
+def _in(tile, p):
+    x1, y1, x2, y2 = tile
+    return x1 <= p[0] <= x2 and y1 <= p[1] <= y2
+
+
+class _FakeTiledSiteSource(BaseSiteSource):
+    supports_tiles = True
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+        self.tiles = []
+        self.probes = 0
+
+    def _tile_bounds(self):
+        return BOUNDS
+
+    def count_tile_records(self, tile):
+        self.probes += 1
+        return sum(_in(tile, p) for p in POINTS.values())
+
+    def get_records(self, tile=None):
+        self.tiles.append(tile)
+        return [{"id": k} for k, p in POINTS.items() if tile is None or _in(tile, p)]
+
+    def _transform_sites(self, records):
+        return [SiteRecord({"source": "fake", "id": r["id"]}) for r in records]
+
+
+def _read(tiles, workers=1, max_sites=150):
+    cfg = Config()
+    cfg.site_tiles = tiles
+    cfg.fetch_workers = workers
+    cfg.tile_max_sites = max_sites
+    src = _FakeTiledSiteSource()
+    src.set_config(cfg)
+    return [s.id for s in src.read()], src
+
+
+class TestPlanTiles:
+    def test_grid_covers_bounds(self):
+        tiles = grid_tiles(BOUNDS, 3)
+        assert len(tiles) == 9
+        assert tiles[0][:2] == BOUNDS[:2] and tiles[-1][2:] == BOUNDS[2:]
+
+    def test_dense_tiles_split_and_empty_tiles_dropped(self):
+        def count(tile):
+            return sum(_in(tile, p) for p in POINTS.values())
+
+        tiles, stats = plan_tiles(BOUNDS, 2, count=count, max_count=150)
+        assert stats["depth"] > 1 and stats["tiles"] > 4
+        assert all(count(t) <= 150 or stats["depth"] > 3 for t in tiles)
+        assert all(count(t) > 0 for t in tiles)
+        # density-adaptive: tiles over the dense cluster are smaller than
+        # those over sparse country
+        def area_at(p):
+            t = next(t for t in tiles if _in(t, p))
+            return (t[2] - t[0]) * (t[3] - t[1])
+
+        assert area_at((-106.6, 35.1)) < area_at((-108.9, 31.1))
+
+    def test_without_probe_keeps_grid(self):
+        tiles, stats = plan_tiles(BOUNDS, 3)
+        assert tiles == grid_tiles(BOUNDS, 3)
+        assert stats["probes"] == 0
+
+
+class TestTiledRead:
+    def test_same_sites_as_single_query(self):
+        single, src = _read(0)
+        assert src.tiles == [None]
+        tiled, src = _read(3)
+        assert len(src.tiles) > 1
+        assert sorted(tiled) == sorted(single)
+
+    def test_edge_sites_deduped(self):
+        tiled, _ = _read(3)
+        assert len(tiled) == len(set(tiled)) == len(POINTS)
+
+    @pytest.mark.parametrize("workers", [2, 8])
+    def test_deterministic_with_concurrency(self, workers):
+        assert _read(3, workers)[0] == _read(3, 1)[0]
+
+
+class TestConnectorTiles:
+    TILE = (-107.0, 33.0, -106.0, 34.0)
+
+    def test_nwis_tile_keeps_state_scope(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(usgs_source, "fetch_json_records", lambda url, params=None, **kw: calls.append(params) or [])
+        src = NWISSiteSource()
+        cfg = Config()
+        cfg.sites_only = True
+        src.set_config(cfg)
+        src.get_records(tile=self.TILE)
+        assert calls[0]["bbox"] == "-107.0,33.0,-106.0,34.0"
+        assert calls[0]["state_code"] == "35"
+
+    def test_nmose_count_probe(self, monkeypatch):
+        calls = []
+        src = NMOSEPODSiteSource()
+        src.set_config(Config())
+        monkeypatch.setattr(src, "_execute_json_request", lambda url, params, **kw: calls.append(params) or {"count": 12})
+        assert src.count_tile_records(self.TILE) == 12
+        assert calls[0]["returnCountOnly"] == "true"
+        assert calls[0]["geometryType"] == "esriGeometryEnvelope"
+        assert "resultOffset" not in calls[0]
+
+    def test_dwb_tile_filter_includes_edges(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(nmenv_source, "sta_query", lambda url, path, **kw: calls.append(kw["filter"]) or [])
+        src = DWBSiteSource()
+        cfg = Config()
+        cfg.parameter = "arsenic"
+        src.set_config(cfg)
+        src.get_records(tile=self.TILE)
+        assert "st_intersects(Thing/Location/location, geography'POLYGON((-107.0 33.0," in calls[0]
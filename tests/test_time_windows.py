@@ -0,0 +1,246 @@
+"""Temporal fan-out of a chunk's fetch (backend/time_windows.py).
+
+A run with Config.time_window_records keeps each source's records per year in
+the fetch history; the next run fetches a chunk expected to hold more records
+than that as date windows sized from that density, concurrently, and hands
+their pages on in time order — with the records of a single query, records
+repeated across a window edge dropped.
+"""
+import random
+from datetime import datetime
+
+import pytest
+
+from backend.chunk_sizing import size_key
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.fetch_history import FetchHistory
+from backend.incremental import fetch_start_dt, fetch_until
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.time_windows import iter_windowed_pages, plan_windows
+from backend.unifier import unify_source_both
+
+IDS = [f"USGS-{i:09d}" for i in range(6)]
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 3
+
+    def __init__(self):
+        super().__init__(transformer=BaseTransformer())
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in IDS]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+class _Provider:
+    """Field measurements from 1990 to 2024, denser in recent years."""
+
+    def __init__(self):
+        rng = random.Random(5)
+        self.features = []
+        for site in IDS:
+            times = set()
+            for _ in range(rng.randint(40, 80)):
+                year = int(1990 + 34 * rng.random() ** 0.5)
+                times.add(datetime(year, rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59)))
+            for t in sorted(times):
+                self.features.append({
+                    "properties": {
+                        "monitoring_location_id": site,
+                        "value": f"{rng.uniform(10, 200):.2f}",
+                        "time": t.strftime("%Y-%m-%dT%H:%M:00Z"),
+                        "unit_of_measure": "ft",
+                        "approval_status": "Approved",
+                        "qualifier": None,
+                    }
+                })
+        self.requests = []
+
+    def pages(self, url, params=None, json_data=None, **kw):
+        wanted = set(json_data["args"][1])
+        begin, end = (params.get("datetime") or "../..").split("/")
+        self.requests.append((begin, end))
+        mine = [
+            f for f in self.features
+            if f["properties"]["monitoring_location_id"] in wanted
+            and (begin == ".." or f["properties"]["time"] >= begin)
+            and (end == ".." or f["properties"]["time"] <= end)
+        ]
+        for i in range(0, len(mine), 25):
+            yield mine[i:i + 25]
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = _Provider()
+    monkeypatch.setattr(usgs_source, "iter_json_pages", provider.pages)
+
+    def fake_pair(self, source_key):
+        site, param = _FakeSiteSource(), NWISWaterLevelSource()
+        for s in (site, param):
+            s.set_config(self)
+            s.log = s.warn = _quiet
+        param.transformer.warn = _quiet
+        return site, param
+
+    monkeypatch.setattr(Config, "source_pair", fake_pair)
+    return provider
+
+
+def _config(**settings):
+    cfg = Config(payload={"yes": True})
+    cfg.parameter = "waterlevels"
+    cfg.fetch_cache_bytes = 0
+    cfg.log = cfg.warn = _quiet
+    for name, value in settings.items():
+        setattr(cfg, name, value)
+    return cfg
+
+
+def _rounded(d):
+    return {k: round(v, 9) if isinstance(v, float) else v for k, v in d.items()}
+
+
+def _output(persisters):
+    summary, timeseries = persisters
+    return (
+        [_rounded(r.to_dict()) for r in summary.records],
+        [s.id for s in timeseries.sites],
+        [[r.to_dict() for r in t] for t in timeseries.timeseries],
+    )
+
+
+class TestUnify:
+    def test_first_run_learns_density(self, provider, tmp_path):
+        history = str(tmp_path / "history.json")
+        unify_source_both(_config(fetch_history_path=history, time_window_records=50), "fake")
+        assert provider.requests == [("..", "..")] * 2
+        (run,) = FetchHistory(history).runs.values()
+        assert sum(run["years"].values()) == len(provider.features)
+
+    @pytest.mark.parametrize("settings", [{}, {"start_date": "2005-01-01", "end_date": "2020-06-30"}])
+    def test_windows_match_single_query(self, provider, tmp_path, settings):
+        history = str(tmp_path / "history.json")
+        expected = _output(unify_source_both(_config(fetch_history_path=history, time_window_records=50), "fake"))
+        if settings:
+            expected = _output(unify_source_both(_config(**settings), "fake"))
+        provider.requests.clear()
+        got = _output(
+            unify_source_both(_config(fetch_history_path=history, time_window_records=50, **settings), "fake")
+        )
+        assert got == expected and expected[0]
+        assert len(provider.requests) > 2
+        # both chunks are fetched in the same windows, each starting the day
+        # after the previous one ends
+        windows = sorted(set(provider.requests), key=lambda w: "" if w[0] == ".." else w[0])
+        assert len(windows) * 2 == len(provider.requests)
+        for (_b0, e0), (b1, _e1) in zip(windows, windows[1:]):
+            assert e0[:10] < b1[:10]
+
+    def test_small_chunks_are_not_split(self, provider, tmp_path):
+        history = str(tmp_path / "history.json")
+        unify_source_both(_config(fetch_history_path=history, time_window_records=10_000), "fake")
+        provider.requests.clear()
+        unify_source_both(_config(fetch_history_path=history, time_window_records=10_000), "fake")
+        assert len(provider.requests) == 2
+
+
+class TestPlan:
+    def _source(self, tmp_path, years, **settings):
+        history = str(tmp_path / "history.json")
+        source = NWISWaterLevelSource()
+        source.set_config(_config(fetch_history_path=history, time_window_records=100, **settings))
+        run = {"sites": 10, "chunks": 1, "requests": 1, "pages": 1, "records": sum(years.values()), "bytes": 0}
+        FetchHistory(history).save(size_key(source.config, source), dict(run, years=years))
+        return source
+
+    def test_no_history(self, tmp_path):
+        source = NWISWaterLevelSource()
+        source.set_config(_config(time_window_records=100))
+        assert plan_windows(source, [object()] * 10) is None
+
+    def test_windows_follow_density(self, tmp_path):
+        source = self._source(tmp_path, {"2000": 100, "2010": 100, "2020": 200})
+        windows = plan_windows(source, [object()] * 10)
+        # 400 records over 4 windows: one at each quantile of the density
+        assert windows == [
+            (None, datetime(2001, 1, 1)),
+            (datetime(2001, 1, 1), datetime(2011, 1, 1)),
+            (datetime(2011, 1, 1), datetime(2020, 7, 2)),
+            (datetime(2020, 7, 2), None),
+        ]
+
+    def test_capped(self, tmp_path):
+        source = self._source(tmp_path, {"2000": 1000, "2010": 1000}, time_window_max=3)
+        assert len(plan_windows(source, [object()] * 10)) == 3
+
+    def test_dates_bound_the_windows(self, tmp_path):
+        source = self._source(tmp_path, {str(y): 50 for y in range(1990, 2020)}, start_date="2000-01-01", end_date="2004-12-31")
+        windows = plan_windows(source, [object()] * 10)
+        assert windows[0][0] == datetime(2000, 1, 1) and windows[-1][1] is None
+        assert all(datetime(2000, 1, 1) < w[1] < datetime(2005, 1, 1) for w in windows[:-1])
+
+
+class _OverlappingSource:
+    """A provider whose window filter includes both ends, like
+    SensorThings' overlaps()."""
+
+    def __init__(self, records, workers=2):
+        self.config = _config(time_window_workers=workers)
+        self.records = records
+        self.requests = 0
+
+    def iter_records(self, site_record):
+        start, until = fetch_start_dt(self.config), fetch_until()
+        start = start.strftime("%Y-%m-%d") if start else ""
+        until = until.strftime("%Y-%m-%d") if until else "9999"
+        mine = [r for r in self.records if start <= r["t"] <= until]
+        yield mine[:2]
+        yield mine[2:]
+
+    def _extract_parameter_dates(self, records):
+        return [r["t"] for r in records]
+
+    def _note_requests(self, n):
+        self.requests += n
+
+
+class TestEdges:
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_duplicates_at_edges_dropped(self, workers):
+        records = [
+            {"t": "2000-01-01", "v": 1},
+            {"t": "2000-12-31", "v": 2},
+            {"t": "2001-01-01", "v": 3},
+            {"t": "2001-01-01", "v": 4},
+            {"t": "2001-06-01", "v": 5},
+            {"t": "2002-01-01", "v": 6},
+            {"t": "2002-03-01", "v": 6},
+        ]
+        source = _OverlappingSource(records, workers)
+        windows = [(None, datetime(2001, 1, 1)), (datetime(2001, 1, 1), datetime(2002, 1, 1)), (datetime(2002, 1, 1), None)]
+        got = [r for page in iter_windowed_pages(source, [], windows) for r in page]
+        assert got == records
+        assert source.requests == 2
+
+    def test_equal_records_inside_a_window_kept(self):
+        records = [{"t": "2000-06-01", "v": 1}, {"t": "2000-06-01", "v": 1}, {"t": "2001-06-01", "v": 1}]
+        source = _OverlappingSource(records)
+        windows = [(None, datetime(2001, 1, 1)), (datetime(2001, 1, 1), None)]
+        got = [r for page in iter_windowed_pages(source, [], windows) for r in page]
+        assert got == records
@@ -0,0 +1,220 @@
+"""Process-pool transform stage (Config.transform_layout = "processes").
+
+Fetch threads only fetch and worker processes transform, so the output must
+be exactly what the threaded layout produces — summaries, timeseries and the
+combined unify_source_both read — with sources that carry fetch-time state
+into the transform (transform_state). The transports are stubbed in the parent
+process, where the fetches run.
+"""
+import pickle
+import random
+
+import pytest
+
+from backend.config import ANALYTE_SOURCE_PAIRS, WATERLEVEL_SOURCE_PAIRS, Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.constants import (
+    DT_MEASURED,
+    PARAMETER_NAME,
+    PARAMETER_UNITS,
+    PARAMETER_VALUE,
+    SOURCE_PARAMETER_NAME,
+    SOURCE_PARAMETER_UNITS,
+)
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer, BaseWaterLevelSource, get_terminal_record
+from backend.transformer import WaterLevelTransformer
+from backend.unifier import unify_source, unify_source_both
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self, ids):
+        super().__init__(transformer=BaseTransformer())
+        self.ids = ids
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in self.ids]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+def _nwis_pages(ids, per_site, seed=3):
+    rng = random.Random(seed)
+    features = []
+    for _ in range(per_site * len(ids)):
+        features.append({
+            "properties": {
+                # the last site has no records
+                "monitoring_location_id": rng.choice(ids[:-1]),
+                "value": rng.choice([None, f"{rng.uniform(10, 200):.2f}", "-999999"]),
+                "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T0{rng.randint(0, 9)}:15:00Z",
+                "unit_of_measure": rng.choice(["ft", "m"]),
+                "approval_status": "Approved",
+                "qualifier": None,
+            }
+        })
+
+    def fake_pages(url, json_data=None, **kw):
+        wanted = set(json_data["args"][1])
+        mine = [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+        for i in range(0, len(mine), 50):
+            yield mine[i:i + 50]
+
+    return fake_pages
+
+
+class _StatefulTransformer(WaterLevelTransformer):
+    source_tag = "stateful"
+
+
+class _StatefulSource(BaseWaterLevelSource):
+    """Names its source parameter from the fetch, like BOR and ISC do."""
+
+    site_id_field = "site"
+    terminal_key = "date"
+    transform_state = ("_source_parameter_name",)
+    _source_parameter_name = None
+
+    def __init__(self):
+        super().__init__(transformer=_StatefulTransformer())
+
+    def get_records(self, site_record):
+        self._source_parameter_name = "depth from fetch"
+        return [
+            {"site": s.id, "date": f"2020-01-{d:02d}", "value": str(d + i)}
+            for i, s in enumerate(site_record)
+            for d in range(1, 6)
+        ]
+
+    def _extract_parameter_record(self, record):
+        record[PARAMETER_NAME] = "waterlevels"
+        record[PARAMETER_VALUE] = float(record["value"])
+        record[PARAMETER_UNITS] = "ft"
+        record[DT_MEASURED] = record["date"]
+        record[SOURCE_PARAMETER_NAME] = self._source_parameter_name
+        record[SOURCE_PARAMETER_UNITS] = "ft"
+        return record
+
+    def _extract_source_parameter_results(self, records):
+        return [r["value"] for r in records]
+
+    def _extract_parameter_dates(self, records):
+        return [r["date"] for r in records]
+
+    def _extract_source_parameter_names(self, records):
+        return [self._source_parameter_name for r in records]
+
+    def _extract_source_parameter_units(self, records):
+        return ["ft" for r in records]
+
+    def _extract_terminal_record(self, records, position):
+        record = get_terminal_record(records, self.terminal_key, position)
+        return {
+            "value": float(record["value"]),
+            "datetime": record["date"],
+            "source_parameter_units": "ft",
+            "source_parameter_name": self._source_parameter_name,
+        }
+
+
+IDS = [f"USGS-{i:09d}" for i in range(7)]
+
+
+@pytest.fixture
+def unify(monkeypatch):
+    def _run(make_param, ids, layout, both=False, output_summary=False, transform_workers=2, fetch_workers=2):
+        def fake_pair(self, source_key):
+            site, param = _FakeSiteSource(ids), make_param()
+            site.set_config(self)
+            param.set_config(self)
+            param.log = param.warn = _quiet
+            param.transformer.warn = _quiet
+            return site, param
+
+        monkeypatch.setattr(Config, "source_pair", fake_pair)
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = "waterlevels"
+        cfg.transform_layout = layout
+        cfg.transform_workers = transform_workers
+        cfg.fetch_workers = fetch_workers
+        cfg.output_summary = output_summary
+        if both:
+            return unify_source_both(cfg, "fake")
+        return unify_source(cfg, "fake")
+
+    return _run
+
+
+def _rows(records):
+    return [r.to_dict() for r in records]
+
+
+def _output(persister):
+    return (
+        _rows(persister.records),
+        [s.id for s in persister.sites],
+        [_rows(t) for t in persister.timeseries],
+    )
+
+
+@pytest.fixture
+def nwis(monkeypatch):
+    monkeypatch.setattr(usgs_source, "iter_json_pages", _nwis_pages(IDS, 40))
+    return NWISWaterLevelSource
+
+
+class TestProcessLayout:
+    @pytest.mark.parametrize("output_summary", [True, False])
+    def test_matches_threads(self, unify, nwis, output_summary):
+        threads = unify(nwis, IDS, "threads", output_summary=output_summary)
+        processes = unify(nwis, IDS, "processes", output_summary=output_summary)
+        assert _output(processes) == _output(threads)
+        assert processes.records or processes.timeseries
+
+    def test_combined_matches_threads(self, unify, nwis):
+        threads = unify(nwis, IDS, "threads", both=True)
+        processes = unify(nwis, IDS, "processes", both=True)
+        assert [_output(p) for p in processes] == [_output(p) for p in threads]
+
+    def test_sites_are_the_callers_records(self, unify, nwis):
+        persister = unify(nwis, IDS, "processes")
+        assert all(type(s) is SiteRecord and s.chunk_size == 2 for s in persister.sites)
+
+    def test_fetch_state_reaches_workers(self, unify):
+        persister = unify(_StatefulSource, IDS, "processes", both=True)[1]
+        names = {r.source_parameter_name for t in persister.timeseries for r in t}
+        assert names == {"depth from fetch"}
+
+
+class TestSourcePickling:
+    @pytest.mark.parametrize(
+        "klass", [k for table in (ANALYTE_SOURCE_PAIRS, WATERLEVEL_SOURCE_PAIRS) for _, k in table.values()]
+    )
+    def test_parameter_sources_round_trip(self, klass):
+        cfg = Config()
+        cfg.parameter = "waterlevels" if klass in [k for _, k in WATERLEVEL_SOURCE_PAIRS.values()] else "tds"
+        cfg._persister = object()
+        src = klass()
+        src.set_config(cfg)
+        src._fetch_cache_enabled = True
+        src._records_cache[("x",)] = [{"big": "payload"}]
+        copy = pickle.loads(pickle.dumps(src))
+        assert type(copy) is klass and copy.config.parameter == cfg.parameter
+        assert copy._records_cache == {} and copy._http_client is not None
+        assert not hasattr(copy.config, "_persister")
+        # the copy starts with its own per-thread index
+        assert copy._groups is not src._groups
+
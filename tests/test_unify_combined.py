@@ -0,0 +1,242 @@
+"""Combined summary + timeseries reads (BaseParameterSource.read_both).
+
+For a source with ``summary_from_timeseries`` unify_source_both transforms
+each observation once and summarizes the transformed timeseries values; its
+output must equal two unify_source runs, one per mode, for NWIS (every value
+parses) and WQP (TDS duplicates and values that do not parse). Other sources
+read each chunk once per mode.
+"""
+import random
+import threading
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.connectors.wqp import source as wqp_source
+from backend.connectors.wqp.source import WQPAnalyteSource
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.transformer import is_summary_output, output_mode
+from backend.unifier import unify_source, unify_source_both
+
+NWIS_IDS = [f"USGS-{i:09d}" for i in range(6)]
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self, ids):
+        super().__init__(transformer=BaseTransformer())
+        self.ids = ids
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in self.ids]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+def _nwis_features(n, seed=7):
+    rng = random.Random(seed)
+    features = []
+    for _ in range(n):
+        features.append({
+            "properties": {
+                # the last two sites have no records
+                "monitoring_location_id": rng.choice(NWIS_IDS[:4]),
+                "value": rng.choice([None, f"{rng.uniform(10, 200):.2f}", "-999999", "0.0"]),
+                "time": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-01T00:00:00Z",
+                "unit_of_measure": rng.choice(["ft", "ft", "m", "furlongs"]),
+                "approval_status": "Approved",
+                "qualifier": None,
+            }
+        })
+    return features
+
+
+def _nwis_source(monkeypatch, n=300):
+    features = _nwis_features(n)
+
+    def fake_pages(url, json_data=None, **kw):
+        wanted = set(json_data["args"][1])
+        mine = [f for f in features if f["properties"]["monitoring_location_id"] in wanted]
+        for i in range(0, len(mine), 17):
+            yield mine[i:i + 17]
+
+    monkeypatch.setattr(usgs_source, "iter_json_pages", fake_pages)
+    return NWISWaterLevelSource(), NWIS_IDS, "waterlevels"
+
+
+WQP_HEADER = [
+    "MonitoringLocationIdentifier", "ActivityIdentifier", "ActivityStartDate",
+    "ActivityStartTime/Time", "CharacteristicName", "USGSPCode", "ResultMeasureValue",
+    "ResultMeasure/MeasureUnitCode", "ResultTemperatureBasisText",
+    "ResultStatusIdentifier", "MeasureQualifierCode",
+]
+
+
+def _wqp_source(monkeypatch):
+    rows = ["\t".join(WQP_HEADER)]
+    for s in range(3):
+        for a in range(8):
+            for pcode, value in (("70301", f"{100 + a}"), ("70300", "<5" if a == 3 else f"{200 + a}")):
+                rows.append("\t".join([
+                    f"USGS-{s}", f"act-{s}-{a}", f"20{10 + a}-01-01", "10:00:00",
+                    "Total dissolved solids", pcode, value, "mg/L", "", "Accepted", "",
+                ]))
+    text = "\n".join(rows)
+    monkeypatch.setattr(wqp_source, "iter_text", lambda *a, **k: iter([text[i:i + 97] for i in range(0, len(text), 97)]))
+    monkeypatch.setattr(wqp_source, "TSV_PAGE_ROWS", 5)
+    src = WQPAnalyteSource()
+    # no site catalog to look up the period of record in
+    src.count_records = lambda sites: None
+    return src, ["USGS-0", "USGS-1", "USGS-2", "USGS-3"], "tds"
+
+
+@pytest.fixture
+def unify(monkeypatch):
+    holder = {}
+
+    def _run(make_source, both, output_summary=False, workers=1):
+        def fake_pair(self, source_key):
+            param, ids, _ = make_source(monkeypatch)
+            site = _FakeSiteSource(ids)
+            site.set_config(self)
+            param.set_config(self)
+            param.log = lambda *a, **k: None
+            warnings = holder["warnings"] = []
+            param.warn = warnings.append
+            param.transformer.warn = lambda *a, **k: None
+            holder["param"] = param
+            return site, param
+
+        monkeypatch.setattr(Config, "source_pair", fake_pair)
+        cfg = Config(payload={"yes": True})
+        cfg.parameter = make_source(monkeypatch)[2]
+        cfg.fetch_workers = workers
+        cfg.output_summary = output_summary
+        if both:
+            return unify_source_both(cfg, "fake"), holder
+        return unify_source(cfg, "fake"), holder
+
+    return _run
+
+
+def _rows(records):
+    return [r.to_dict() for r in records]
+
+
+def _two_runs(unify, make_source):
+    summary, _ = unify(make_source, False, output_summary=True)
+    timeseries, _ = unify(make_source, False, output_summary=False)
+    return summary, timeseries
+
+
+@pytest.mark.parametrize("make_source", [_nwis_source, _wqp_source], ids=["nwis", "wqp"])
+class TestCombinedOutput:
+    def test_identical_to_two_runs(self, unify, make_source):
+        (summary, timeseries), _ = unify(make_source, True)
+        single_summary, single_timeseries = _two_runs(unify, make_source)
+        assert summary.records and timeseries.timeseries
+        assert _rows(summary.records) == _rows(single_summary.records)
+        assert [s.id for s in timeseries.sites] == [s.id for s in single_timeseries.sites]
+        assert [_rows(t) for t in timeseries.timeseries] == [_rows(t) for t in single_timeseries.timeseries]
+
+    def test_identical_with_fetch_workers(self, unify, make_source):
+        (summary, timeseries), _ = unify(make_source, True, workers=3)
+        (serial_summary, serial_timeseries), _ = unify(make_source, True)
+        assert _rows(summary.records) == _rows(serial_summary.records)
+        assert [_rows(t) for t in timeseries.timeseries] == [_rows(t) for t in serial_timeseries.timeseries]
+
+    def test_transforms_each_record_once(self, unify, make_source, monkeypatch):
+        calls = []
+        source_klass = type(make_source(monkeypatch)[0])
+        original = source_klass._clean_records
+
+        def counting(self, records):
+            calls.append(len(records))
+            return original(self, records)
+
+        monkeypatch.setattr(source_klass, "_clean_records", counting)
+        unify(make_source, True)
+        combined = sum(calls)
+        calls.clear()
+        _two_runs(unify, make_source)
+        assert combined and sum(calls) == 2 * combined
+
+
+class TestWQPSkippedValues:
+    def test_unparsed_value_kept_in_timeseries_skipped_in_summary(self, unify):
+        (summary, timeseries), holder = unify(_wqp_source, True)
+        assert [(r.nrecords, r.min) for r in summary.records] == [(7, 200.0)] * 3
+        assert all(len(t) == 8 for t in timeseries.timeseries)
+        assert any(w.startswith("Skipped results because of formatting") for w in holder["warnings"])
+
+
+class TestOutputMode:
+    def test_overrides_config_on_this_thread_only(self):
+        cfg = Config()
+        cfg.output_summary = False
+        seen = []
+        with output_mode(True):
+            other = threading.Thread(target=lambda: seen.append(is_summary_output(cfg)))
+            other.start()
+            other.join()
+            assert is_summary_output(cfg)
+            with output_mode(False):
+                assert not is_summary_output(cfg)
+            assert is_summary_output(cfg)
+        assert seen == [False]
+        assert not is_summary_output(cfg)
+
+    def test_both_leaves_config_in_summary_mode(self, unify):
+        (_summary, _timeseries), holder = unify(_nwis_source, True)
+        assert holder["param"].config.output_summary is True
+        assert not holder["param"]._fetch_cache_enabled
+
+
+class TestCombinedCalls:
+    def test_one_fetch_and_transform_per_record(self, unify, monkeypatch):
+        fetches, cleaned, transformed = [], [], []
+
+        def counted_source(mp):
+            src, ids, parameter = _nwis_source(mp)
+            pages = usgs_source.iter_json_pages
+
+            def counting_pages(url, json_data=None, **kw):
+                fetches.append(tuple(json_data["args"][1]))
+                return pages(url, json_data=json_data, **kw)
+
+            mp.setattr(usgs_source, "iter_json_pages", counting_pages)
+            return src, ids, parameter
+
+        clean = NWISWaterLevelSource._clean_records
+        transform = NWISWaterLevelSource._transform_parameter_records
+
+        def counting_clean(self, records):
+            ret = clean(self, records)
+            cleaned.append(len(ret))
+            return ret
+
+        def counting_transform(self, site, records):
+            transformed.append(len(records))
+            return transform(self, site, records)
+
+        monkeypatch.setattr(NWISWaterLevelSource, "_clean_records", counting_clean)
+        monkeypatch.setattr(NWISWaterLevelSource, "_transform_parameter_records", counting_transform)
+        (summary, _), _ = unify(counted_source, True)
+        combined = sorted(fetches)
+        assert sum(transformed) == sum(cleaned) > 0
+        fetches.clear()
+        single_summary, _ = _two_runs(unify, counted_source)
+        assert _rows(summary.records) == _rows(single_summary.records)
+        # each chunk is fetched once, where two runs fetch it once per mode
+        assert sorted(fetches) == sorted(combined * 2)
+        assert len(set(combined)) == len(combined)
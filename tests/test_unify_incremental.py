@@ -0,0 +1,242 @@
+"""Incremental unification (unify_source_incremental, Config.snapshot_dir).
+
+Day two continues from day one's snapshot: only observations from each
+chunk's watermark on are fetched, the ones already in the snapshot are
+dropped, and summaries and timeseries equal a full rebuild over day two's data
+— including a new site, a site with nothing new, and new observations on the
+watermark date itself, also with a terminal key that only holds the date.
+The chunks go through the usual chunk loop, so its settings still apply.
+Sources that cannot resume fall back to a full run.
+"""
+import os
+import random
+
+import pytest
+
+from backend.config import Config
+from backend.connectors.usgs import source as usgs_source
+from backend.connectors.usgs.source import NWISWaterLevelSource
+from backend.exceptions import USGSRateLimitError
+from backend.record import SiteRecord
+from backend.source import BaseSiteSource, BaseTransformer
+from backend.sharding import unify_source_sharded
+from backend.unifier import unify_source_both, unify_source_incremental
+
+IDS = [f"USGS-{i:09d}" for i in range(7)]
+
+
+class _FakeSiteSource(BaseSiteSource):
+    chunk_size = 2
+
+    def __init__(self, ids):
+        super().__init__(transformer=BaseTransformer())
+        self.ids = ids
+
+    def get_records(self, *a, **k):
+        return [{"id": i} for i in self.ids]
+
+    def _transform_sites(self, records):
+        sites = []
+        for r in records:
+            s = SiteRecord({"source": "fake", "id": r["id"], "name": r["id"], "latitude": 34.0, "longitude": -106.0})
+            s.chunk_size = self.chunk_size
+            sites.append(s)
+        return sites
+
+
+def _feature(rng, site, day):
+    value = f"{rng.uniform(10, 200):.2f}"
+    if rng.random() < 0.15:
+        value = rng.choice([None, "-999999"])
+    return {
+        "properties": {
+            "monitoring_location_id": site,
+            "value": value,
+            "time": f"{day}T{rng.randint(10, 23)}:15:00Z",
+            "unit_of_measure": rng.choice(["ft", "m"]),
+            "approval_status": "Approved",
+            "qualifier": None,
+        }
+    }
+
+
+class _Provider:
+    """NWIS field measurements in time order, honoring the datetime filter."""
+
+    def __init__(self):
+        rng = random.Random(11)
+        self.features = []
+        for year in range(2015, 2024):
+            for month in (3, 9):
+                # the last two sites have no records yet
+                for site in IDS[:5]:
+                    if rng.random() < 0.8:
+                        self.features.append(_feature(rng, site, f"{year}-{month:02d}-14"))
+        self.rng = rng
+        self.returned = 0
+        self.fail = False
+
+    def add_day(self, day):
+        rng = self.rng
+        last = max(f["properties"]["time"] for f in self.features)
+        # a later reading on the last day already read
+        self.features.append(_feature(rng, self.features[-1]["properties"]["monitoring_location_id"], last[:10]))
+        self.features[-1]["properties"]["time"] = f"{last[:10]}T23:59:00Z"
+        self.features[-1]["properties"]["value"] = "42.0"
+        # sites 0-2 get new readings, site 3 and 4 nothing, site 5 is new
+        for site in IDS[:3] + [IDS[5]]:
+            self.features.append(_feature(rng, site, day))
+            self.features[-1]["properties"]["value"] = f"{rng.uniform(10, 200):.2f}"
+
+    def pages(self, url, params=None, json_data=None, **kw):
+        if self.fail:
+            raise USGSRateLimitError("429")
+        wanted = set(json_data["args"][1])
+        begin = (params or {}).get("datetime", "../..").split("/")[0]
+        mine = [
+            f for f in self.features
+            if f["properties"]["monitoring_location_id"] in wanted and (begin == ".." or f["properties"]["time"] >= begin)
+        ]
+        if (params or {}).get("sortby") == "-time":
+            mine.sort(key=lambda f: f["properties"]["time"], reverse=True)
+        self.returned += len(mine)
+        for i in range(0, len(mine), 17):
+            yield mine[i:i + 17]
+
+
+class _DateKeyNWIS(NWISWaterLevelSource):
+    """NWIS with a terminal key that only holds the date, like WQP's."""
+
+    @staticmethod
+    def terminal_key(record):
+        return record["datetime_measured"][:10]
+
+
+def _quiet(*args, **kw):
+    pass
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    p = _Provider()
+    monkeypatch.setattr(usgs_source, "iter_json_pages", p.pages)
+    return p
+
+
+@pytest.fixture
+def run(monkeypatch, tmp_path):
+    def _run(incremental=True, snapshot_dir=tmp_path, latest_only=False, end_date="", klass=NWISWaterLevelSource, driver=unify_source_incremental, **settings):
+        def fake_pair(self, source_key):
+            site, param = _FakeSiteSource(IDS), klass()
+            for s in (site, param):
+                s.set_config(self)
+                s.log = s.warn = _quiet
+            param.transformer.warn = _quiet
+            return site, param
+
+        monkeypatch.setattr(Config, "source_pair", fake_pair)
+        cfg = Config(payload={"yes": True, "end_date": end_date})
+        cfg.parameter = "waterlevels"
+        cfg.snapshot_dir = str(snapshot_dir)
+        cfg.latest_only = latest_only
+        for name, value in settings.items():
+            setattr(cfg, name, value)
+        if incremental:
+            return driver(cfg, "fake")
+        return unify_source_both(cfg, "fake")
+
+    return _run
+
+
+def _summaries(persister):
+    # unrounded, as the accumulated mean must be the full run's to the bit
+    return [r.to_dict() for r in persister.records], [repr(r.mean) for r in persister.records]
+
+
+def _timeseries(persister):
+    return [s.id for s in persister.sites], [[r.to_dict() for r in t] for t in persister.timeseries]
+
+
+def _assert_same(incremental, full):
+    (inc_summary, inc_ts), (full_summary, full_ts) = incremental, full
+    rows, means = _summaries(inc_summary)
+    full_rows, full_means = _summaries(full_summary)
+    assert rows == full_rows
+    assert means == full_means
+    assert _timeseries(inc_ts) == _timeseries(full_ts)
+
+
+class TestIncremental:
+    def test_first_run_is_a_full_run(self, run, provider):
+        _assert_same(run(), run(incremental=False))
+
+    def test_second_day_matches_full_rebuild(self, run, provider):
+        run()
+        full_fetch = provider.returned
+        provider.add_day("2024-01-05")
+        provider.returned = 0
+        incremental = run()
+        fetched = provider.returned
+        full = run(incremental=False)
+
+        _assert_same(incremental, full)
+        assert [s.id for s in incremental[1].sites] == IDS[:6]
+        # only the chunk with the new site is fetched in full
+        assert fetched < full_fetch / 2
+
+    def test_date_only_key_keeps_same_day_records(self, run, provider):
+        run(klass=_DateKeyNWIS)
+        provider.add_day("2024-01-05")
+        _assert_same(run(klass=_DateKeyNWIS), run(incremental=False, klass=_DateKeyNWIS))
+
+    @pytest.mark.parametrize(
+        "settings",
+        [{"fetch_workers": 3}, {"adaptive_chunks": True}, {"stream_sites": True}, {"prefilter_sites": True}],
+        ids=["workers", "adaptive", "stream", "prefilter"],
+    )
+    def test_chunk_loop_settings_apply(self, run, provider, settings):
+        run(**settings)
+        provider.add_day("2024-01-05")
+        _assert_same(run(**settings), run(incremental=False))
+
+    def test_snapshot_carries_to_a_third_day(self, run, provider):
+        run()
+        provider.add_day("2024-01-05")
+        run()
+        provider.add_day("2024-02-05")
+        _assert_same(run(), run(incremental=False))
+
+    def test_other_window_starts_over(self, run, provider, tmp_path):
+        run(end_date="2030-01-01")
+        full_fetch = provider.returned
+        provider.returned = 0
+        run(end_date="2031-01-01")
+        assert provider.returned == full_fetch
+        assert len(os.listdir(tmp_path)) == 2
+
+    def test_abort_keeps_previous_snapshot(self, run, provider, tmp_path):
+        run()
+        (path,) = os.listdir(tmp_path)
+        before = (tmp_path / path).read_bytes()
+        provider.add_day("2024-01-05")
+        provider.fail = True
+        summary, timeseries = run()
+        assert summary.records == [] and timeseries.timeseries == []
+        assert (tmp_path / path).read_bytes() == before
+        provider.fail = False
+        _assert_same(run(), run(incremental=False))
+
+    def test_unsharded_runs_are_incremental(self, run, provider, tmp_path):
+        run(driver=unify_source_sharded)
+        assert len(os.listdir(tmp_path)) == 1
+        full_fetch = provider.returned
+        provider.returned = 0
+        provider.add_day("2024-01-05")
+        incremental = run(driver=unify_source_sharded)
+        assert provider.returned < full_fetch / 2
+        _assert_same(incremental, run(incremental=False))
+
+    def test_latest_only_runs_in_full(self, run, provider, tmp_path):
+        incremental = run(latest_only=True)
+        assert os.listdir(tmp_path) == []
+        _assert_same(incremental, run(incremental=False, latest_only=True))